@@ -0,0 +1,18 @@
+"""
+Benchmarks for the enrichment pipeline.
+
+Run them from the `src` directory, e.g. `python -m benchmarks.shared_tokenization`.
+"""
+
+import time
+from collections.abc import Callable
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> list[float]:
+    """The wall-clock time in seconds of each of `repeat` calls of `func`."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
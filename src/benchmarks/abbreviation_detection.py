@@ -0,0 +1,133 @@
+"""
+Benchmark detecting the abbreviations of a judgment with many definitions, finding the bracketed definitions
+in a single scan and every occurrence of them with one phrase matcher built for the judgment, against the
+previous approach, which matched brackets with a token pattern per length and added, ran and removed a rule
+of a shared matcher for every definition.
+
+    python -m benchmarks.abbreviation_detection [--definitions N [N ...]] [--repeat N]
+"""
+
+import argparse
+import random
+import statistics
+import string
+from collections import defaultdict
+from functools import partial
+
+import spacy
+from spacy.language import Language
+from spacy.matcher import Matcher
+from spacy.tokens import Doc, Span
+
+from benchmarks import time_calls
+from enrichment.abbreviation_extraction.abbreviations import (
+    MAX_PARENTHESIS_TOKENS,
+    AbbreviationDetector,
+    filter_matches,
+    find_abbreviation,
+    verify_match_format,
+)
+
+DEFAULT_DEFINITIONS = [100, 500]
+
+FILLER = "The parties agree that the question before the court turns on the construction of the contract."
+
+
+def synthetic_judgment(definitions: int, seed: int = 0) -> str:
+    """A judgment defining many abbreviations, each used again in later paragraphs."""
+    rng = random.Random(seed)  # noqa: S311
+    short_forms = sorted({"".join(rng.choices(string.ascii_uppercase, k=4)) for _ in range(definitions * 2)})
+    short_forms = rng.sample(short_forms, definitions)
+    paragraphs = []
+    for number, short_form in enumerate(short_forms):
+        long_form = " ".join(letter + "".join(rng.choices(string.ascii_lowercase, k=6)) for letter in short_form)
+        paragraphs.append(f'{number + 1}. {FILLER} In this judgment the {long_form} ("{short_form}") is relevant.')
+        used = rng.sample(short_forms[: number + 1], min(number + 1, 3))
+        paragraphs.append(f"{FILLER} " + " ".join(f"The {short_form} (see above) applies." for short_form in used))
+    return "\n".join(paragraphs)
+
+
+class PreviousAbbreviationDetector:
+    """
+    The previous definition and occurrence phases of `AbbreviationDetector`. The previous `verify_match_format`
+    returned nothing, so the detector found no abbreviations, and the one it is fixed to is used here instead.
+    """
+
+    def __init__(self, nlp: Language) -> None:
+        self.matcher = Matcher(nlp.vocab)
+        patterns = [
+            [{"ORTH": "("}, *[{} for _ in range(length)], {"ORTH": ")"}]
+            for length in range(1, MAX_PARENTHESIS_TOKENS + 1)
+        ]
+        self.matcher.add("parenthesis", patterns)
+        self.global_matcher = Matcher(nlp.vocab)
+
+    def __call__(self, doc: Doc) -> list[Span]:
+        matches_brackets = [(x[0], x[1], x[2]) for x in self.matcher(doc)]
+        matcher_output = verify_match_format(matches_brackets, doc)
+        matches_no_brackets = [(x[0], x[1] + 1, x[2] - 1) for x in matcher_output]
+        abbreviations = []
+        for long_form, short_forms in self.find_matches_for(filter_matches(matches_no_brackets, doc), doc):
+            for short in short_forms:
+                short._.long_form = long_form
+                abbreviations.append(short)
+        return abbreviations
+
+    def find_matches_for(self, filtered: list[tuple[Span, Span]], doc: Doc) -> list[tuple[Span, set[Span]]]:
+        rules = {}
+        all_occurences: dict[Span, set[Span]] = defaultdict(set)
+        already_seen_long: set[str] = set()
+        already_seen_short: set[str] = set()
+        for long_candidate, short_candidate in filtered:
+            short, long = find_abbreviation(long_candidate, short_candidate)
+            new_long = long.text not in already_seen_long if long else False
+            new_short = short.text not in already_seen_short
+            if long is not None and new_long and new_short:
+                already_seen_long.add(long.text)
+                already_seen_short.add(short.text)
+                all_occurences[long].add(short)
+                rules[long.text] = long
+                self.global_matcher.add(long.text, [[{"ORTH": x.text} for x in short]])
+        to_remove = set()
+        for match, start, end in self.global_matcher(doc):
+            string_key = doc.vocab.strings[match]
+            to_remove.add(string_key)
+            all_occurences[rules[string_key]].add(doc[start:end])
+        for key in to_remove:
+            self.global_matcher.remove(key)
+        return list(all_occurences.items())
+
+
+def detected(abbreviations: list[Span]) -> list[tuple[int, int, str]]:
+    return sorted(
+        (abbreviation.start, abbreviation.end, str(abbreviation._.long_form)) for abbreviation in abbreviations
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--definitions", type=int, nargs="+", default=DEFAULT_DEFINITIONS, help="numbers defined")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    nlp = spacy.blank("en")
+    detector = AbbreviationDetector(nlp)
+    previous_detector = PreviousAbbreviationDetector(nlp)
+
+    for definitions in args.definitions:
+        doc = nlp.make_doc(synthetic_judgment(definitions))
+        abbreviations = detector(doc)._.abbreviations
+        if detected(abbreviations) != detected(previous_detector(doc)):
+            msg = "The abbreviations detected differ from the previous approach"
+            raise RuntimeError(msg)
+        print(f"{definitions} definitions, {len(doc)} tokens, {len(abbreviations)} abbreviations detected")
+
+        scanning = statistics.median(time_calls(partial(detector, doc), args.repeat))
+        print(f"{'scanning':>10}: median {scanning:.3f}s over {args.repeat} runs")
+        previous = statistics.median(time_calls(partial(previous_detector, doc), args.repeat))
+        print(f"{'previous':>10}: median {previous:.3f}s over {args.repeat} runs")
+        print(f"{'speed-up':>10}: {previous / scanning:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark the peak memory of taking a judgment from the API response to the patch request body, parsing and
+serializing it UTF-8 encoded, against the previous approach, which decoded the response, encoded it again for
+lxml, serialized a string and encoded that for the request.
+
+Each approach runs in a fresh process, and the peak resident set size it grows by past reading the response
+body is reported, from `/proc`, so on Linux. Only the XML round trip is measured: the enrichment steps in between are the same for both.
+
+    python -m benchmarks.judgment_payload_memory [--xml PATH] [--megabytes N [N ...]]
+"""
+
+import argparse
+import copy
+import multiprocessing
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+
+import lxml.etree
+
+from utils.judgment_document import DEFAULT_XML_DECLARATION, JudgmentDocument, split_xml_declaration
+from utils.proper_xml import qualified_name
+
+REPO_ROOT = Path(__file__).parent.parent.parent.resolve()
+DEFAULT_XML = REPO_ROOT / "test_files" / "ewca_civ_2025_673-original.xml"
+DEFAULT_MEGABYTES = [1, 5, 20]
+
+
+def synthetic_judgment(xml: Path, megabytes: int) -> bytes:
+    """The judgment with the paragraphs of its body repeated until it is at least `megabytes` long."""
+    root = lxml.etree.fromstring(xml.read_bytes())
+    body = next(element for element in root.iter(lxml.etree.Element) if qualified_name(element) == "judgmentBody")
+    # the element of the body with the most children, usually the one holding the numbered paragraphs
+    container = max(body.iter(lxml.etree.Element), key=len)
+    children = list(container)
+    children_size = sum(len(lxml.etree.tostring(child, encoding="utf-8")) for child in children)
+    missing = megabytes * 1024 * 1024 - len(lxml.etree.tostring(root, encoding="utf-8"))
+    for _ in range(max(0, missing // children_size + 1)):
+        container.extend(copy.deepcopy(child) for child in children)
+    return f"{DEFAULT_XML_DECLARATION}\n".encode() + lxml.etree.tostring(root, encoding="utf-8")
+
+
+def previous_round_trip(response_body: bytes) -> bytes:
+    """The previous approach: decoded by `fetch_judgment`, encoded again to parse and encoded for the patch."""
+    xml = response_body.decode()
+    xml_declaration, _ = split_xml_declaration(xml)
+    root = lxml.etree.fromstring(xml.encode("utf-8"))
+    enriched_xml = f"{xml_declaration or DEFAULT_XML_DECLARATION}\n{lxml.etree.tostring(root, encoding='unicode')}"
+    return enriched_xml.encode()
+
+
+def encoded_round_trip(response_body: bytes) -> bytes:
+    """The judgment parsed from the response body and serialized UTF-8 encoded for the patch."""
+    return JudgmentDocument.parse(response_body).serialize_bytes()
+
+
+APPROACHES: dict[str, Callable[[bytes], bytes]] = {"encoded": encoded_round_trip, "previous": previous_round_trip}
+
+
+def _peak_rss() -> int:
+    # the peak resident set size of this process in kilobytes, which, unlike `ru_maxrss`, is not carried over
+    # from the parent process
+    status = Path("/proc/self/status").read_text()
+    return int(next(line for line in status.splitlines() if line.startswith("VmHWM:")).split()[1])
+
+
+def _peak_growth(approach: str, path: str) -> int:
+    response_body = Path(path).read_bytes()
+    baseline = _peak_rss()
+    APPROACHES[approach](response_body)
+    return _peak_rss() - baseline
+
+
+def _measure(approach: str, path: str) -> int:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_peak_growth, (approach, path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--xml", type=Path, default=DEFAULT_XML, help="judgment to repeat the paragraphs of")
+    parser.add_argument("--megabytes", type=int, nargs="+", default=DEFAULT_MEGABYTES, help="judgment sizes")
+    args = parser.parse_args()
+
+    for megabytes in args.megabytes:
+        judgment = synthetic_judgment(args.xml, megabytes)
+        if encoded_round_trip(judgment) != previous_round_trip(judgment):
+            msg = "The serialized judgment differs from the previous approach"
+            raise RuntimeError(msg)
+        with tempfile.NamedTemporaryFile(suffix=".xml") as response_body:
+            response_body.write(judgment)
+            response_body.flush()
+            print(f"{len(judgment) / 1024 / 1024:.1f}MB judgment")
+            peaks = {approach: _measure(approach, response_body.name) for approach in APPROACHES}
+        for approach, peak in peaks.items():
+            print(f"{approach:>10}: peak RSS grew by {peak / 1024:.1f}MB")
+        print(f"{'saving':>10}: {(peaks['previous'] - peaks['encoded']) / 1024:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
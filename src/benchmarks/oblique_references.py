@@ -0,0 +1,106 @@
+"""
+Benchmark matching oblique references against an index of the legislation references of a judgment, read
+from their parsed elements, against the previous approach, which parsed every legislation reference again
+with BeautifulSoup and scanned all the references before it for every oblique reference.
+
+    python -m benchmarks.oblique_references [--paragraphs N [N ...]] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+from functools import partial
+
+from benchmarks import time_calls
+from benchmarks.paragraph_patching import synthetic_judgment
+from enrichment.oblique_references.oblique_references import (
+    LegislationDict,
+    LegislationReference,
+    create_legislation_dict,
+    detect_reference,
+    get_oblique_reference_replacements,
+)
+from utils.judgment_document import JudgmentDocument, MarkupMap, markup_map
+
+DEFAULT_PARAGRAPHS = [1_000, 5_000]
+
+
+def previous_match_act(
+    oblique_act: LegislationReference,
+    legislation_dicts: list[LegislationDict],
+    paragraph_number: int,
+) -> LegislationDict | None:
+    """The previous `match_act`, which filtered every legislation reference found so far."""
+    eligible_legislation = [
+        leg_dict
+        for leg_dict in legislation_dicts
+        if (
+            leg_dict["para"] < paragraph_number
+            or (leg_dict["para"] == paragraph_number and leg_dict["para_pos"][0] < oblique_act[0][0])
+        )
+    ]
+    if not eligible_legislation:
+        return None
+    legislation_to_match_position = eligible_legislation[-1]["para_pos"][0]
+    return next(
+        legislation
+        for legislation in eligible_legislation
+        if legislation["para_pos"][0] == legislation_to_match_position
+    )
+
+
+def previous_match_numbered_act(
+    detected_numbered_act: LegislationReference,
+    legislation_dicts: list[LegislationDict],
+) -> LegislationDict | None:
+    """The previous `match_numbered_act`, which scanned every legislation reference found so far."""
+    act_year = detected_numbered_act[1].split()[1]
+    return next((leg_dict for leg_dict in legislation_dicts if leg_dict["year"] == act_year), None)
+
+
+def previous_matches(paragraphs: list[MarkupMap]) -> list[LegislationDict | None]:
+    """The legislation matched to every oblique reference, as the previous approach matched it."""
+    matches: list[LegislationDict | None] = []
+    all_legislation_dicts: list[LegislationDict] = []
+    for paragraph_number, paragraph in enumerate(paragraphs):
+        detected_legislation = detect_reference(paragraph.markup, "legislation")
+        all_legislation_dicts.extend(create_legislation_dict(detected_legislation, paragraph_number))
+        matches.extend(
+            previous_match_act(detected_act, all_legislation_dicts, paragraph_number)
+            for detected_act in detect_reference(paragraph.markup, "act")
+        )
+        matches.extend(
+            previous_match_numbered_act(detected_act, all_legislation_dicts)
+            for detected_act in detect_reference(paragraph.markup, "numbered_act")
+        )
+    return matches
+
+
+def indexed_matches(paragraphs: list[MarkupMap]) -> None:
+    """The oblique references matched with the legislation index."""
+    # the extractor prints every reference it resolves
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_oblique_reference_replacements(paragraphs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=DEFAULT_PARAGRAPHS, help="numbers of paragraphs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    for paragraphs in args.paragraphs:
+        document = JudgmentDocument.parse(synthetic_judgment(paragraphs))
+        paragraph_markup = [markup_map(paragraph) for paragraph in document.paragraphs()]
+        print(f"{paragraphs} paragraphs, {len(previous_matches(paragraph_markup))} oblique references")
+
+        indexed = statistics.median(time_calls(partial(indexed_matches, paragraph_markup), args.repeat))
+        print(f"{'indexed':>10}: median {indexed:.3f}s over {args.repeat} runs")
+        scanning = statistics.median(time_calls(partial(previous_matches, paragraph_markup), args.repeat))
+        print(f"{'scanning':>10}: median {scanning:.3f}s over {args.repeat} runs")
+        print(f"{'speed-up':>10}: {scanning / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark the sweep-based resolution of overlapping legislation references against the previous
+pandas implementation, which built a quadratic containment mask of every pair of references.
+
+    python -m benchmarks.overlap_resolution [--sizes N [N ...]] [--max-pairwise N] [--repeat N]
+"""
+
+import argparse
+import random
+import statistics
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import time_calls
+from enrichment.legislation_extraction.legislation_matcher_hybrid import keys, resolve_overlap
+
+DEFAULT_SIZES = [10_000, 100_000]
+# the pairwise mask of the previous implementation needs n² bytes of memory
+DEFAULT_MAX_PAIRWISE = 20_000
+
+
+def resolve_overlap_pairwise(results_dict: dict) -> dict:
+    """The previous approach: a pandas DataFrame and an n x n numpy mask of contained references."""
+    qq = pd.DataFrame([results_dict])
+    qq = qq.T.explode([0])[0].apply(pd.Series)
+    qq.columns = pd.Index(keys)
+
+    mask = (qq.start.values[:, None] >= qq.start.values) & (qq.end.values[:, None] <= qq.end.values)
+    np.fill_diagonal(mask, 0)
+    mask = np.triu(mask, 0)
+    r, c = np.where(mask)
+
+    removals = set()
+    qq = qq.reset_index()
+    for ol_index in zip(r, c, strict=False):
+        overlap_rows = qq.iloc[list(map(int, ol_index))]
+        removals.add(overlap_rows.confidence.idxmin())
+    qq = qq.drop(index=list(removals))
+
+    return qq.set_index("index").apply(tuple, axis=1).groupby("index").apply(list).T.to_dict()
+
+
+def synthetic_matches(size: int, seed: int = 0) -> dict[str, list[tuple]]:
+    """
+    Detected references as returned by the fuzzy and exact matchers: a few titles matched around every
+    candidate reference, all ending at its year, plus shorter exact matches inside them.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    titles = [f"Synthetic Title {number} Act {rng.randrange(1950, 2025)}" for number in range(max(size // 20, 1))]
+    results: dict[str, list[tuple]] = {}
+    end = 0
+    for _ in range(size):
+        if rng.random() < 0.3:
+            # move on to the next candidate reference
+            end += rng.randrange(10, 40)
+        start = max(end - rng.randrange(2, 9), 0)
+        title = rng.choice(titles)
+        match = (title, start, end, rng.randrange(80, 101), f"http://www.legislation.gov.uk/{title}", title)
+        results.setdefault(title, []).append(match)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of references")
+    parser.add_argument(
+        "--max-pairwise",
+        type=int,
+        default=DEFAULT_MAX_PAIRWISE,
+        help="largest number of references to run the previous implementation on",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        results = synthetic_matches(size)
+        kept = sum(len(matches) for matches in resolve_overlap(results).values())
+        print(f"{size} references, {len(results)} titles, {kept} kept")
+
+        sweep = statistics.median(time_calls(partial(resolve_overlap, results), args.repeat))
+        print(f"{'sweep':>10}: median {sweep:.3f}s over {args.repeat} runs")
+        if size > args.max_pairwise:
+            print(f"{'pairwise':>10}: skipped, above --max-pairwise {args.max_pairwise}")
+            continue
+        pairwise = statistics.median(time_calls(partial(resolve_overlap_pairwise, results), args.repeat))
+        print(f"{'pairwise':>10}: median {pairwise:.3f}s over {args.repeat} runs")
+        print(f"{'speed-up':>10}: {pairwise / sweep:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark detecting the first-stage references of a republished judgment with the paragraph memo, which only
+runs the extractors on the edited paragraphs, against running them over the whole judgment as before.
+
+The lookup tables are held in memory rather than read from the database: the legislation table holds the
+titles of the acts the judgment mentions, and every citation rule resolves to the same URI template.
+
+    python -m benchmarks.paragraph_memo [--xml PATH] [--model NAME] [--edits N [N ...]] [--repeat N]
+"""
+
+import argparse
+import json
+import re
+import statistics
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+from unittest.mock import patch
+
+import lxml.etree
+import pandas as pd
+
+from benchmarks import time_calls
+from database.db_connection import MatchedRule
+from database.legislation_index import LegislationIndex
+from lambdas.enrichment_lambda import enrich_xml, lookup_tables, steps
+from lambdas.enrichment_lambda.lookup_tables import LocalLookupTables
+from lambdas.enrichment_lambda.nlp_models import NLPModelRegistry
+from lambdas.enrichment_lambda.paragraph_memo import ParagraphMemo
+from utils.custom_types import DocumentAsXMLBytes
+from utils.proper_xml import qualified_name
+
+REPO_ROOT = Path(__file__).parent.parent.parent.resolve()
+DEFAULT_XML = REPO_ROOT / "test_files" / "ewca_civ_2025_673-original.xml"
+RULES_FILE = REPO_ROOT / "src" / "enrichment" / "caselaw_extraction" / "rules" / "citation_patterns.jsonl"
+DEFAULT_EDITS = [1, 5, 25]
+
+
+class Manifest(dict):
+    def __missing__(self, rule_id: str) -> MatchedRule:
+        return MatchedRule(rule_id, "https://example.com/d1", False, True, "Number", None)
+
+
+def legislation_index(xml: bytes) -> LegislationIndex:
+    titles = sorted(set(re.findall(rb"[A-Z][a-z]+(?: [A-Z][a-z]+)* Act \d{4}", xml)))
+    rows = [
+        (title.decode(), f"ukpga/{title[-4:].decode()}/{position}", "", int(title[-4:]), for_fuzzy)
+        for position, title in enumerate(titles)
+        for for_fuzzy in (True, False)
+    ]
+    columns = ["candidate_titles", "ref", "citation", "year", "for_fuzzy"]
+    return LegislationIndex.from_dataframe(pd.DataFrame(rows, columns=columns), signature=("benchmark",))
+
+
+def edited_judgment(xml: DocumentAsXMLBytes, edits: int) -> DocumentAsXMLBytes:
+    """The judgment with a sentence added to `edits` of its paragraphs, spread across it."""
+    document = steps.parse_judgment(xml)
+    contents = [element for element in document.root.iter(lxml.etree.Element) if qualified_name(element) == "content"]
+    texts = []
+    for content in contents:
+        text = next((element for element in content.iter() if element.text and element.text.strip()), None)
+        if text is not None:
+            texts.append(text)
+    for position in range(0, len(texts), max(1, len(texts) // edits))[:edits]:
+        texts[position].text = f"{texts[position].text} This was corrected after the hand-down."
+    return document.serialize_bytes()
+
+
+def whole_judgment(xml: DocumentAsXMLBytes, pattern_list: list[dict]) -> None:
+    """The previous approach: every extractor run over the whole judgment."""
+    doc = steps.tokenize_judgment(steps.map_judgment_content(steps.parse_judgment(xml)).text)
+    steps.determine_caselaw_replacements(doc, pattern_list, "rules")
+    steps.determine_legislation_replacements(doc)
+    steps.determine_abbreviation_replacements(doc)
+
+
+def by_paragraph(xml: DocumentAsXMLBytes, pattern_list: list[dict]) -> None:
+    """The extractors run on the paragraphs missing from the memo only."""
+    source_map = steps.map_judgment_content(steps.parse_judgment(xml))
+    enrich_xml.determine_replacements_by_paragraph(source_map, pattern_list, "rules", "tables")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--xml", type=Path, default=DEFAULT_XML, help="judgment XML to republish")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model, e.g. blank:en")
+    parser.add_argument("--edits", type=int, nargs="+", default=DEFAULT_EDITS, help="numbers of edited paragraphs")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    xml = DocumentAsXMLBytes(args.xml.read_bytes())
+    pattern_list = [json.loads(line) for line in RULES_FILE.read_text(encoding="utf-8").splitlines()]
+    registry = NLPModelRegistry(model_name=args.model)
+    registry.warm_up(pattern_list, "rules")
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(steps, "MODEL_REGISTRY", registry))
+        tables = LocalLookupTables(Manifest(), legislation_index(xml), "tables")
+        stack.enter_context(patch.object(lookup_tables, "LOOKUP_TABLES", tables))
+
+        timings = time_calls(lambda: whole_judgment(xml, pattern_list), args.repeat)
+        whole = statistics.median(timings)
+        print(f"{args.xml.name}: {len(xml)} bytes, model {args.model}")
+        print(f"{'whole judgment':>20}: median {whole:.3f}s, min {min(timings):.3f}s over {args.repeat} runs")
+
+        for edits in args.edits:
+            edited = edited_judgment(xml, edits)
+            timings = []
+            for _ in range(args.repeat):
+                # the memo holds the paragraphs of the judgment as published before
+                memo = ParagraphMemo(100000)
+                stack.enter_context(patch.object(enrich_xml, "PARAGRAPH_MEMO", memo))
+                by_paragraph(xml, pattern_list)
+                timings += time_calls(partial(by_paragraph, edited, pattern_list), 1)
+            republish = statistics.median(timings)
+            print(
+                f"{f'{edits} edited paragraphs':>20}: median {republish:.3f}s, min {min(timings):.3f}s, "
+                f"speed-up {whole / republish:.1f}x",
+            )
+
+
+if __name__ == "__main__":
+    main()
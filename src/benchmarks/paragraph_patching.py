@@ -0,0 +1,105 @@
+"""
+Benchmark patching the paragraphs of a judgment in place with lxml, from the positions of the references
+replaced in them, against the previous BeautifulSoup approach, which rebuilt the markup of every paragraph
+with references replaced and parsed it again.
+
+    python -m benchmarks.paragraph_patching [--paragraphs N [N ...]] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+from collections.abc import Iterable
+from functools import partial
+from itertools import groupby
+
+from bs4 import BeautifulSoup
+
+from benchmarks import time_calls
+from enrichment.legislation_provisions_extraction.legislation_provisions import resolve_provisions
+from enrichment.oblique_references.oblique_references import get_oblique_reference_replacements
+from enrichment.replacer.second_stage_replacer import (
+    LegislationReferenceReplacement,
+    replace_references,
+    replace_references_in_document,
+)
+from utils.judgment_document import JudgmentDocument, markup_map
+
+DEFAULT_PARAGRAPHS = [5_000]
+
+PARAGRAPH = (
+    '<p class="ParaLevel1">Under <ref href="http://www.legislation.gov.uk/id/ukpga/{year}/12" '
+    'uk:canonical="{year} c. 12" uk:origin="TNA" uk:type="legislation">Finance Act {year}</ref>, section {number}(2) '
+    "of the {year} Act applies. <i>That Act</i> is the one relied on, and section {number} of that Act &amp; "
+    "the regulations made under it are not in dispute.</p>"
+)
+
+
+def synthetic_judgment(paragraphs: int) -> str:
+    """A judgment with a legislation reference, oblique references and provisions in every paragraph."""
+    body = "\n".join(PARAGRAPH.format(year=1990 + number % 30, number=number % 200 + 1) for number in range(paragraphs))
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" '
+        'xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">'
+        f"<judgment><judgmentBody><decision>{body}</decision></judgmentBody></judgment></akomaNtoso>"
+    )
+
+
+def detected_references(xml: str) -> list[LegislationReferenceReplacement]:
+    """The oblique references and provisions of the judgment, as the second stage detects them."""
+    paragraphs = [markup_map(paragraph) for paragraph in JudgmentDocument.parse(xml).paragraphs()]
+    # the extractors print every reference they resolve
+    with contextlib.redirect_stdout(io.StringIO()):
+        return get_oblique_reference_replacements(paragraphs) + resolve_provisions(
+            [paragraph.markup for paragraph in paragraphs],
+        )
+
+
+def replace_by_reparsing_paragraphs(xml: str, reference_replacements: Iterable[LegislationReferenceReplacement]) -> str:
+    """The previous approach: each paragraph with references is stringified, rebuilt and parsed again."""
+    soup = BeautifulSoup(xml, "xml")
+    paragraphs = soup.find_all("p")
+    for paragraph_number, paragraph_reference_replacements in groupby(
+        sorted(reference_replacements, key=lambda replacement: replacement["ref_para"]),
+        key=lambda replacement: replacement["ref_para"],
+    ):
+        paragraph_string = replace_references(str(paragraphs[paragraph_number]), list(paragraph_reference_replacements))
+        replacement_paragraph = BeautifulSoup(f'<xml xmlns:uk="placeholder">{paragraph_string}</xml>', "xml").p
+        if replacement_paragraph is None:
+            msg = f"No paragraphs found in {paragraph_string}"
+            raise RuntimeError(msg)
+        paragraphs[paragraph_number].replace_with(replacement_paragraph)
+    return str(soup)
+
+
+def replace_in_place(xml: str, reference_replacements: list[LegislationReferenceReplacement]) -> str:
+    """The paragraphs are patched in place in the parsed judgment."""
+    document = JudgmentDocument.parse(xml)
+    replace_references_in_document(document, reference_replacements)
+    return document.serialize()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=DEFAULT_PARAGRAPHS, help="numbers of paragraphs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    for paragraphs in args.paragraphs:
+        xml = synthetic_judgment(paragraphs)
+        reference_replacements = detected_references(xml)
+        print(f"{paragraphs} paragraphs, {len(xml) / 1e6:.1f} MB, {len(reference_replacements)} references replaced")
+
+        in_place = statistics.median(time_calls(partial(replace_in_place, xml, reference_replacements), args.repeat))
+        print(f"{'in place':>10}: median {in_place:.3f}s over {args.repeat} runs")
+        reparsing = statistics.median(
+            time_calls(partial(replace_by_reparsing_paragraphs, xml, reference_replacements), args.repeat),
+        )
+        print(f"{'reparsing':>10}: median {reparsing:.3f}s over {args.repeat} runs")
+        print(f"{'speed-up':>10}: {reparsing / in_place:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark resolving the legislation provisions of a judgment with heavy section cross-referencing, with an index
+of the definitions of each section and the attributes of legislation references read from their start tags,
+against the previous approach, which parsed every legislation reference matched to a section with BeautifulSoup
+and scanned every definition of a redefined section with numpy for every reference to it.
+
+    python -m benchmarks.section_cross_references [--paragraphs N [N ...]] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+import numpy as np
+from bs4 import BeautifulSoup, Tag
+
+from benchmarks import time_calls
+from enrichment.legislation_provisions_extraction.legislation_provisions import (
+    THR,
+    check_if_sub_section,
+    create_section_ref_tag,
+    create_sub_section_links,
+    detect_reference,
+    get_clean_section_number,
+    keys,
+    resolve_provisions,
+)
+
+DEFAULT_PARAGRAPHS = [500, 2_000]
+
+ACTS = [(1990, 1), (1996, 14), (2000, 8), (2004, 12), (2010, 7), (2020, 7)]
+
+LEGISLATION = (
+    '<ref href="http://www.legislation.gov.uk/id/ukpga/{year}/{chapter}" uk:canonical="{year} c. {chapter}" '
+    'uk:origin="TNA" uk:type="legislation">Finance Act {year}</ref>'
+)
+
+
+def synthetic_paragraphs(paragraphs: int) -> list[str]:
+    """Paragraphs which each define a few sections of an act and refer to many sections defined before."""
+    markup = []
+    for number in range(paragraphs):
+        year, chapter = ACTS[number % len(ACTS)]
+        defined = [number % 40 + offset for offset in range(3)]
+        referred = [(number * 7 + offset * 13) % 60 + 1 for offset in range(12)]
+        markup.append(
+            f'<p class="ParaLevel1">Sections {defined[0]}, section {defined[1]}(2) and s {defined[2]} of the '
+            f"{LEGISLATION.format(year=year, chapter=chapter)} are engaged. "
+            + " ".join(f"As to section {section}({number % 5 + 1}), see above." for section in referred)
+            + "</p>",
+        )
+    return markup
+
+
+def previous_find_closest_legislation(legislations: list, sections: list, thr: int = THR) -> list:
+    """The previous `find_closest_legislation`, which computed the distances with numpy in every paragraph."""
+    sec_pos = np.asarray([x[0] for x in sections])
+    leg_pos = np.asarray([x[0] for x in legislations])
+    dist1 = sec_pos[:, 0][:, None] - leg_pos[:, 1]
+    dist2 = leg_pos[:, 0] - sec_pos[:, 1][:, None]
+    dist = dist1 * (dist1 > 0) + dist2 * (dist2 > 0)
+    return [
+        (sections[section_idx][1], legislations[legislation_idx][1], sections[section_idx][0][0])
+        for section_idx, legislation_idx in np.argwhere(dist < thr).tolist()
+    ]
+
+
+def previous_save_section_to_dict(section_dict: list, para_number: int, clean_section_dict: dict) -> dict:
+    """The previous `save_section_to_dict`, which parsed every legislation reference with BeautifulSoup."""
+    for section, full_ref, pos in section_dict:
+        section_number = get_clean_section_number(section)
+        ref = BeautifulSoup(full_ref, "xml").find("ref")
+        if not isinstance(ref, Tag):
+            msg = "Did not successfully get <ref> tag"
+            raise TypeError(msg)
+        canonical = ref.get("canonical")
+        leg_href = ref.get("href")
+        clean_section_dict.setdefault("section " + str(section_number), []).append(
+            {
+                "para_number": para_number,
+                "section_position": pos,
+                "section_href": str(leg_href) + "/section/" + str(section_number),
+                "section_canonical": f"{canonical} s. {section_number}" if canonical else "",
+                "ref": ref,
+                "leg_href": leg_href,
+                "canonical": canonical,
+            },
+        )
+    return clean_section_dict
+
+
+def previous_get_correct_section_def(section_matches: list, cur_para_number: int, cur_pos: int) -> dict:
+    """The previous `get_correct_section_def`, which scanned every definition of the section with numpy."""
+    pos_refs = np.asarray([(match["para_number"], match["section_position"]) for match in section_matches])
+    para_numbers = pos_refs[:, 0]
+    idx = (np.abs(para_numbers - cur_para_number)).argmin()
+    candidates = [match for match in section_matches if match["para_number"] == para_numbers[idx]]
+    if len(candidates) == 1:
+        return candidates[0]
+    positions = pos_refs[:, 1]
+    idx = (np.abs(positions - cur_pos)).argmin()
+    return next(match for match in section_matches if match["section_position"] == positions[idx])
+
+
+def previous_resolve_provisions(paragraphs: list[str]) -> list[dict[str, Any]]:
+    """The previous `resolve_provisions`."""
+    section_dict: dict = {}
+    resolved_refs = []
+    for para_number, line in enumerate(paragraphs):
+        sections = detect_reference(line, "section")
+        if not sections:
+            continue
+        legislations = detect_reference(line)
+        if legislations:
+            matches = previous_find_closest_legislation(legislations, sections)
+            section_dict = previous_save_section_to_dict(matches, para_number, section_dict)
+        for pos, match in sections:
+            values = section_dict.get("section " + get_clean_section_number(match))
+            if not values or para_number < values[0]["para_number"]:
+                continue
+            correct_reference = (
+                previous_get_correct_section_def(values, para_number, pos[0]) if len(values) > 1 else values[0]
+            )
+            if check_if_sub_section(match):
+                correct_reference = create_sub_section_links(correct_reference, match)
+            correct_reference["section_ref"] = create_section_ref_tag(correct_reference, match)
+            resolved_refs.append(
+                dict(zip(keys, [match, para_number, pos[0], correct_reference["section_ref"]], strict=False)),
+            )
+    return resolved_refs
+
+
+def _quietly(func: Callable[[list[str]], list], paragraphs: list[str]) -> list:
+    # the resolver prints every provision it resolves
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(paragraphs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=DEFAULT_PARAGRAPHS, help="numbers of paragraphs")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    for paragraphs in args.paragraphs:
+        markup = synthetic_paragraphs(paragraphs)
+        resolved = _quietly(resolve_provisions, markup)
+        if resolved != _quietly(previous_resolve_provisions, markup):
+            msg = "The provisions resolved differ from the previous approach"
+            raise RuntimeError(msg)
+        print(f"{paragraphs} paragraphs, {len(resolved)} provisions resolved")
+
+        indexed = statistics.median(time_calls(partial(_quietly, resolve_provisions, markup), args.repeat))
+        print(f"{'indexed':>10}: median {indexed:.3f}s over {args.repeat} runs")
+        previous = statistics.median(time_calls(partial(_quietly, previous_resolve_provisions, markup), args.repeat))
+        print(f"{'previous':>10}: median {previous:.3f}s over {args.repeat} runs")
+        print(f"{'speed-up':>10}: {previous / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark tokenizing a judgment once and sharing the Doc between the first-stage extractors,
+against the previous approach of running the full pipeline separately for each extractor.
+
+    python -m benchmarks.shared_tokenization [--xml PATH] [--model NAME] [--repeat N]
+"""
+
+import argparse
+import json
+import statistics
+from functools import partial
+from pathlib import Path
+
+from spacy.tokens import Doc, Span
+
+from benchmarks import time_calls
+from lambdas.enrichment_lambda.nlp_models import NLPModelRegistry
+from utils.custom_types import DocumentAsXMLString
+from utils.helper import parse_file
+
+REPO_ROOT = Path(__file__).parent.parent.parent.resolve()
+DEFAULT_XML = REPO_ROOT / "test_files" / "ewca_civ_2025_673-original.xml"
+RULES_FILE = REPO_ROOT / "src" / "enrichment" / "caselaw_extraction" / "rules" / "citation_patterns.jsonl"
+
+
+def previous_chunks(docobj: Doc) -> list[Span]:
+    """The five chunks the abbreviation detector previously ran over, one at a time."""
+    k, m = divmod(len(docobj), 5)
+    return [docobj[i * k + min(i, m) : (i + 1) * k + min(i + 1, m)] for i in range(5)]
+
+
+def tokenize_per_extractor(registry: NLPModelRegistry, text: str, pattern_list: list[dict]) -> None:
+    """The previous approach: a full pipeline run per extractor, and again per abbreviation chunk."""
+    nlp = registry.base
+    citation_ruler = registry.citation_ruler(pattern_list)
+    detector = registry.abbreviation_detector()
+
+    citation_ruler(nlp(text))
+    nlp(text)
+    docobj = nlp(text)
+    for chunk in previous_chunks(docobj):
+        detector(nlp(chunk.text))
+
+
+def tokenize_once(registry: NLPModelRegistry, text: str, pattern_list: list[dict]) -> None:
+    """The shared tokenization stage: one Doc, reused by every extractor."""
+    citation_ruler = registry.citation_ruler(pattern_list)
+    detector = registry.abbreviation_detector()
+
+    doc = registry.tokenize(text)
+    citation_ruler(doc)
+    detector(doc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--xml", type=Path, default=DEFAULT_XML, help="judgment XML to tokenize")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model, e.g. blank:en")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each approach")
+    args = parser.parse_args()
+
+    text = parse_file(DocumentAsXMLString(args.xml.read_text(encoding="utf-8")))
+    pattern_list = [json.loads(line) for line in RULES_FILE.read_text(encoding="utf-8").splitlines()]
+
+    registry = NLPModelRegistry(model_name=args.model)
+    registry.warm_up(pattern_list)
+
+    print(f"{args.xml.name}: {len(text)} characters, {len(registry.tokenize(text))} tokens, model {args.model}")
+    results = {}
+    for name, approach in (("per extractor", tokenize_per_extractor), ("shared Doc", tokenize_once)):
+        timings = time_calls(partial(approach, registry, text, pattern_list), args.repeat)
+        results[name] = statistics.median(timings)
+        print(f"{name:>14}: median {results[name]:.3f}s, min {min(timings):.3f}s over {args.repeat} runs")
+    print(f"speed-up: {results['per extractor'] / results['shared Doc']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
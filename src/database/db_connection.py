@@ -1,5 +1,6 @@
 """Handles the database connection"""
 
+from collections.abc import Mapping
 from typing import Any, NamedTuple
 
 import pandas as pd
@@ -48,6 +49,22 @@ def get_manifest_row(conn: Connection, rule_id: str) -> pd.DataFrame:
     return matched_rule
 
 
+def _matched_rule_from_row(row: pd.Series | Mapping[Any, Any]) -> MatchedRule:
+    """
+    Build a MatchedRule from a row of the manifest table
+    :param row: mapping of manifest column names to values
+    :return: the MatchedRule for the row
+    """
+    return MatchedRule(
+        row["family"].lower(),
+        row["uri_template"],
+        bool(row["is_neutral"]),
+        bool(row["is_canonical"]),
+        row["citation_type"],
+        row["canonical_form"],
+    )
+
+
 def get_matched_rule(conn: Connection, rule_id: str) -> MatchedRule:
     """
     Uses database connection to select fields/rows of interest from manifest that match the rule id
@@ -56,47 +73,44 @@ def get_matched_rule(conn: Connection, rule_id: str) -> MatchedRule:
     :return: variables family, URItemplate, is_neutral, is_canonical, citation_type, canonical_form
     """
     matched_rule = get_manifest_row(conn, rule_id)
-    family = matched_rule["family"].iloc[0].lower()
-    URItemplate = matched_rule["uri_template"].iloc[0]
-    is_neutral = bool(matched_rule["is_neutral"].iloc[0])
-    is_canonical = bool(matched_rule["is_canonical"].iloc[0])
-    citation_type = matched_rule["citation_type"].iloc[0]
-    canonical_form = matched_rule["canonical_form"].iloc[0]
-    return MatchedRule(family, URItemplate, is_neutral, is_canonical, citation_type, canonical_form)
+    return _matched_rule_from_row(matched_rule.iloc[0])
 
 
-def get_legtitles(conn: Connection) -> pd.DataFrame:
+def get_matched_rules(conn: Connection) -> dict[str, MatchedRule]:
     """
-    Retrieves legislation titles from legislation lookup table
+    Bulk loads every rule of the manifest in a single query
     :param conn: database connection, required
-    :return: DataFrame of legislation titles
+    :return: dictionary of MatchedRule keyed by rule id; the first row wins if an id is repeated
     """
-    leg_titles = pd.read_sql("SELECT candidate_titles, year, for_fuzzy FROM ukpga_lookup", conn)
-    return leg_titles
+    manifest = pd.read_sql("SELECT * FROM manifest", conn)
+    matched_rules: dict[str, MatchedRule] = {}
+    for row in manifest.to_dict("records"):
+        matched_rules.setdefault(row["id"], _matched_rule_from_row(row))
+    return matched_rules
 
 
-def get_hrefs(conn: Connection, title: str):
+def get_table_signature(conn: Connection, table: str) -> tuple:
     """
-    Retrieves link to legislation title
+    Cheap signature of the contents of a table, used to detect when a cached copy is stale.
+    It is read from the statistics Postgres keeps of every table, without reading the table itself: the table
+    oid changes whenever the table is replaced, and its counts of inserted, updated and deleted rows on any
+    change to its rows. The counts only ever grow, or are reset, as on a crash, which is read as a change.
     :param conn: database connection, required
-    :param title: legislation title, required
-    :return: link to legislation title
+    :param table: name of the table, required
+    :return: tuple of (table oid, rows inserted, rows updated, rows deleted)
     """
-    href_query = """SELECT ref FROM ukpga_lookup WHERE candidate_titles= %(title)s"""
-    test = pd.read_sql_query(href_query, conn, params={"title": f"{title}"})
-    return test.ref.values[0]
+    signature_query = "SELECT relid AS oid, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables WHERE relid = %(table)s::regclass"
+    signature = pd.read_sql(signature_query, conn, params={"table": table})
+    return tuple(signature.iloc[0].tolist())
 
 
-def get_canonical_leg(conn, title: str):
+def get_legislation_lookup(conn: Connection) -> pd.DataFrame:
     """
-    Retrieves canonical form of legislation title
+    Retrieves every row of the legislation lookup table in a single query
     :param conn: database connection, required
-    :param title: legislation title, required
-    :return: canoncial form of legislation title
+    :return: DataFrame of legislation titles with their link, canonical citation, year and for_fuzzy flag
     """
-    canonical_query = """SELECT citation FROM ukpga_lookup WHERE candidate_titles= %(title)s"""
-    canonical_leg = pd.read_sql(canonical_query, conn, params={"title": f"{title}"})
-    return canonical_leg.citation.values[0]
+    return pd.read_sql("SELECT candidate_titles, ref, citation, year, for_fuzzy FROM ukpga_lookup", conn)
 
 
 def close_connection(conn: Connection) -> None:
@@ -0,0 +1,359 @@
+"""
+Compact signatures of what the enrichment of each judgment depended on, and the planner listing the judgments
+a change to the lookup tables could affect, so that only those are enriched again.
+
+The signature of a judgment holds:
+- the ids of the citation rules that fired in it: a rule whose URI template, canonical form or pattern
+  changes, or which is removed, can only change the citations it detected;
+- the candidate tokens of its text, the capitalised words of the citation patterns it holds: a rule whose
+  pattern is added or changed can only detect citations in a judgment holding every capitalised word of its
+  pattern, such as "UKSC";
+- the years mentioned in its text: the legislation matchers only try the titles of the years a judgment
+  mentions (see `detect_year_span`), so a title added, removed or changed in `ukpga_lookup` can only change
+  the judgments mentioning its year;
+- the short forms of the abbreviations used in it.
+
+Signatures are recorded by the enrichment when `ENRICHMENT_JUDGMENT_SIGNATURES` is "true", in a table of the
+Postgres database keyed by judgment URI, and read by the lambdas updating the manifest and `ukpga_lookup`,
+which add the judgments a change could affect to the `reenrichment_plan` table.
+"""
+
+import json
+import logging
+import os
+import re
+from collections.abc import Callable, Iterable
+from typing import Any, NamedTuple
+
+import pandas as pd
+
+from utils.custom_types import DetectedReference
+from utils.initialise_db import init_db_connection
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+JUDGMENT_SIGNATURES_VARIABLE = "ENRICHMENT_JUDGMENT_SIGNATURES"
+SIGNATURES_TABLE = "judgment_signatures"
+REENRICHMENT_PLAN_TABLE = "reenrichment_plan"
+
+# the columns of the manifest a detected citation is resolved from, see `_matched_rule_from_row`
+RULE_COLUMNS = ("family", "uri_template", "is_neutral", "is_canonical", "citation_type", "canonical_form")
+# the columns of the legislation lookup table the legislation matchers read, see `get_legislation_lookup`
+TITLE_COLUMNS = ("candidate_titles", "ref", "citation", "year", "for_fuzzy")
+
+# the tokenizer splits words at spaces and punctuation, so the words of a token are words of the text
+WORD = re.compile(r"\w+")
+# a token of four digits, as matched by `detect_year_span`, is four digits between two non-digits
+YEAR = re.compile(r"(?<!\d)\d{4}(?!\d)")
+
+
+def candidate_tokens(text: str) -> set[str]:
+    """
+    The words of a text with a capital letter, which the literal tokens of citation patterns are made of
+    :param text: the text
+    :return: the distinct capitalised words
+    """
+    return {word for word in WORD.findall(text) if any(character.isupper() for character in word)}
+
+
+class JudgmentSignature(NamedTuple):
+    """What the enrichment of a judgment depended on."""
+
+    rule_ids: frozenset[str]
+    years: frozenset[int]
+    tokens: frozenset[str]
+    abbreviations: frozenset[str]
+
+    @classmethod
+    def from_replacements(
+        cls,
+        text: str,
+        caselaw: Iterable[DetectedReference],
+        abbreviation: Iterable[DetectedReference],
+        vocabulary: frozenset[str],
+    ) -> "JudgmentSignature":
+        """
+        The signature of a judgment, from the references the first stage of its enrichment detected
+        :param text: judgment content text, from its source map
+        :param caselaw: the case law references detected in the text
+        :param abbreviation: the abbreviation references detected in the text
+        :param vocabulary: the capitalised words of the citation patterns, from `patterns_vocabulary`
+        :return: the signature
+        """
+        return cls(
+            frozenset(reference.replacement.rule_id for reference in caselaw if reference.replacement.rule_id),
+            frozenset(int(year) for year in YEAR.findall(text)),
+            frozenset(candidate_tokens(text) & vocabulary),
+            frozenset(reference.replacement.abb_match for reference in abbreviation),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps([sorted(values) for values in self])
+
+    @classmethod
+    def from_json(cls, signature: str | bytes) -> "JudgmentSignature":
+        return cls(*(frozenset(values) for values in json.loads(signature)))
+
+    def affected_by(self, change: "SignatureChange") -> bool:
+        """
+        Whether a change to the lookup tables could change the enrichment of the judgment
+        :param change: the change, from `manifest_change` or `legislation_change`
+        :return: True if the judgment is to be enriched again
+        """
+        return (
+            change.whole_corpus
+            or not self.rule_ids.isdisjoint(change.rule_ids)
+            or not self.years.isdisjoint(change.years)
+            or any(tokens <= self.tokens for tokens in change.token_sets)
+        )
+
+
+class SignatureChange(NamedTuple):
+    """
+    What a change to the lookup tables could alter: the judgments where one of the rules fired, holding every
+    token of one of the token sets, or mentioning one of the years, or the whole corpus.
+    """
+
+    rule_ids: frozenset[str] = frozenset()
+    token_sets: tuple[frozenset[str], ...] = ()
+    years: frozenset[int] = frozenset()
+    whole_corpus: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.whole_corpus or self.rule_ids or self.token_sets or self.years)
+
+
+def _value(value: Any) -> Any:
+    # empty cells are NaN in a CSV file and NULL in the database
+    return None if pd.isna(value) else value
+
+
+def _rules_by_id(manifest: pd.DataFrame) -> dict[str, tuple]:
+    """The pattern and resolution columns of every rule of a manifest; the first row wins if an id is repeated."""
+    rules: dict[str, tuple] = {}
+    for row in manifest.to_dict("records"):
+        pattern = json.loads(row["pattern"])
+        resolution = tuple(str(_value(row[column])) for column in RULE_COLUMNS)
+        rules.setdefault(row["id"], (json.dumps(pattern["pattern"], sort_keys=True), resolution))
+    return rules
+
+
+def _vocabulary(rules: dict[str, tuple]) -> frozenset[str]:
+    return patterns_vocabulary(json.loads(pattern) for pattern, _ in rules.values())
+
+
+def pattern_tokens(pattern: str | list[dict]) -> frozenset[str]:
+    """
+    The capitalised words a judgment must hold for a citation pattern to match in it
+    :param pattern: the pattern of an entity ruler rule, a phrase or a list of token patterns
+    :return: the words of its literal tokens, empty if none has a capital letter
+    """
+    if isinstance(pattern, str):
+        return frozenset(candidate_tokens(pattern))
+    tokens: set[str] = set()
+    for token in pattern:
+        for attribute in ("ORTH", "TEXT"):
+            # a set of alternatives, such as {"IN": [...]}, or a regular expression requires no given word
+            if isinstance(token.get(attribute), str):
+                tokens.update(candidate_tokens(token[attribute]))
+    return frozenset(tokens)
+
+
+def patterns_vocabulary(patterns: Iterable[str | list[dict]]) -> frozenset[str]:
+    """
+    The capitalised words of citation patterns, the only words of a judgment its signature keeps
+    :param patterns: the patterns of entity ruler rules
+    :return: the words of their literal tokens
+    """
+    return frozenset(word for pattern in patterns for word in pattern_tokens(pattern))
+
+
+def manifest_change(old_manifest: pd.DataFrame | None, new_manifest: pd.DataFrame) -> SignatureChange:
+    """
+    What replacing the rules of the manifest could alter
+    :param old_manifest: the rules of the manifest table, None if there was no manifest
+    :param new_manifest: the rules replacing them, with the columns of the manifest CSV file
+    :return: the rules whose detections could change, and the tokens of the patterns that could match anew
+    """
+    if old_manifest is None:
+        return SignatureChange(whole_corpus=True)
+    old_rules = _rules_by_id(old_manifest)
+    new_rules = _rules_by_id(new_manifest)
+    new_words = _vocabulary(new_rules) - _vocabulary(old_rules)
+    if new_words:
+        # the signatures recorded so far could not keep words no pattern held
+        LOGGER.warning("The patterns hold new words %s; every judgment is to be enriched again", sorted(new_words))
+        return SignatureChange(whole_corpus=True)
+
+    rule_ids = set()
+    token_sets = set()
+    for rule_id in old_rules.keys() | new_rules.keys():
+        old_rule, new_rule = old_rules.get(rule_id), new_rules.get(rule_id)
+        if old_rule == new_rule:
+            continue
+        if old_rule is not None:
+            # the citations the rule detected are removed or resolved differently
+            rule_ids.add(rule_id)
+        if new_rule is not None and (old_rule is None or old_rule[0] != new_rule[0]):
+            # the rule can detect citations it did not detect before
+            tokens = pattern_tokens(json.loads(new_rule[0]))
+            if not tokens:
+                LOGGER.warning("Rule %s can match in any judgment; every judgment is to be enriched again", rule_id)
+                return SignatureChange(whole_corpus=True)
+            token_sets.add(tokens)
+    return SignatureChange(frozenset(rule_ids), tuple(sorted(token_sets, key=sorted)))
+
+
+def _title_rows(legislation: pd.DataFrame) -> set[tuple]:
+    return {
+        (str(title), str(ref), str(_value(citation)), int(year), bool(for_fuzzy))
+        for title, ref, citation, year, for_fuzzy in legislation[list(TITLE_COLUMNS)].itertuples(index=False)
+    }
+
+
+def legislation_change(old_legislation: pd.DataFrame | None, new_legislation: pd.DataFrame) -> SignatureChange:
+    """
+    What updating the legislation lookup table could alter
+    :param old_legislation: the rows of `ukpga_lookup` before the update, None if there was no table
+    :param new_legislation: the rows of `ukpga_lookup` after the update
+    :return: the years of the titles added, removed or changed
+    """
+    if old_legislation is None:
+        return SignatureChange(whole_corpus=True)
+    changed_rows = _title_rows(old_legislation) ^ _title_rows(new_legislation)
+    return SignatureChange(years=frozenset(row[3] for row in changed_rows))
+
+
+class JudgmentSignatureStore:
+    """
+    Judgment signatures stored in a table of the Postgres database keyed by judgment URI, created on first use.
+
+    The store never fails an enrichment or an update of the lookup tables: a signature that cannot be written,
+    or a change that cannot be planned, is logged and left.
+    """
+
+    def __init__(self, connect: Callable[[], Any] | None = None) -> None:
+        self.connect = connect
+        self._tables_created = False
+
+    @classmethod
+    def from_environment(cls, connect: Callable[[], Any] = init_db_connection) -> "JudgmentSignatureStore":
+        """
+        The store of the database `connect` connects to if `ENRICHMENT_JUDGMENT_SIGNATURES` is "true", off otherwise
+        :param connect: connects to the database, by default the enrichment database
+        """
+        enabled = os.environ.get(JUDGMENT_SIGNATURES_VARIABLE, "").lower() == "true"
+        return cls(connect if enabled else None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.connect is not None
+
+    def _execute(self, query: str, params: dict | tuple) -> list[tuple]:
+        if self.connect is None:
+            return []
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                if not self._tables_created:
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {SIGNATURES_TABLE} (uri TEXT PRIMARY KEY, "
+                        "rule_ids TEXT[] NOT NULL, years INTEGER[] NOT NULL, tokens TEXT[] NOT NULL, "
+                        "abbreviations TEXT[] NOT NULL, recorded_at TIMESTAMPTZ NOT NULL DEFAULT now())",
+                    )
+                    # the planner looks for the signatures overlapping or containing arrays
+                    for column in ("rule_ids", "years", "tokens"):
+                        cursor.execute(
+                            f"CREATE INDEX IF NOT EXISTS {SIGNATURES_TABLE}_{column} "
+                            f"ON {SIGNATURES_TABLE} USING GIN ({column})",
+                        )
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {REENRICHMENT_PLAN_TABLE} "
+                        "(uri TEXT PRIMARY KEY, reason TEXT NOT NULL, planned_at TIMESTAMPTZ NOT NULL DEFAULT now())",
+                    )
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if cursor.description else []
+            conn.commit()
+            self._tables_created = True
+            return rows
+        finally:
+            conn.close()
+
+    def put(self, uri: str, signature: JudgmentSignature) -> None:
+        """
+        Record the signature of a judgment, replacing the one of its previous enrichment
+        :param uri: URI of the judgment
+        :param signature: signature of its enrichment
+        """
+        try:
+            self._execute(
+                f"INSERT INTO {SIGNATURES_TABLE} (uri, rule_ids, years, tokens, abbreviations) "  # noqa: S608
+                "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (uri) DO UPDATE SET rule_ids = EXCLUDED.rule_ids, "
+                "years = EXCLUDED.years, tokens = EXCLUDED.tokens, abbreviations = EXCLUDED.abbreviations, "
+                "recorded_at = now()",
+                (uri, *(sorted(values) for values in signature)),
+            )
+        except Exception as exception:  # noqa: BLE001
+            LOGGER.warning("Could not record the signature of %s: %s", uri, exception)
+
+    def get(self, uri: str) -> JudgmentSignature | None:
+        rows = self._execute(
+            f"SELECT rule_ids, years, tokens, abbreviations FROM {SIGNATURES_TABLE} WHERE uri = %s",  # noqa: S608
+            (uri,),
+        )
+        return JudgmentSignature(*(frozenset(values) for values in rows[0])) if rows else None
+
+    @staticmethod
+    def _affected_condition(change: SignatureChange) -> tuple[str, dict]:
+        """The condition on the signatures that `JudgmentSignature.affected_by` tests, and its parameters."""
+        if change.whole_corpus:
+            return "TRUE", {}
+        conditions = ["rule_ids && %(rule_ids)s::TEXT[]", "years && %(years)s::INTEGER[]"]
+        params: dict[str, Any] = {"rule_ids": sorted(change.rule_ids), "years": sorted(change.years)}
+        for position, tokens in enumerate(change.token_sets):
+            conditions.append(f"tokens @> %(tokens_{position})s::TEXT[]")
+            params[f"tokens_{position}"] = sorted(tokens)
+        return " OR ".join(conditions), params
+
+    def affected_uris(self, change: SignatureChange) -> list[str]:
+        """
+        The judgments a change to the lookup tables could affect
+        :param change: the change, from `manifest_change` or `legislation_change`
+        :return: the URIs of the judgments, in order
+        """
+        if not change:
+            return []
+        condition, params = self._affected_condition(change)
+        rows = self._execute(f"SELECT uri FROM {SIGNATURES_TABLE} WHERE {condition} ORDER BY uri", params)  # noqa: S608
+        return [uri for (uri,) in rows]
+
+    def plan_reenrichment(self, change: SignatureChange, reason: str) -> int:
+        """
+        Add the judgments a change to the lookup tables could affect to the re-enrichment plan
+        :param change: the change, from `manifest_change` or `legislation_change`
+        :param reason: what changed, such as "manifest"
+        :return: the number of judgments planned, none if the store is off or the plan could not be written
+        """
+        if not self.enabled:
+            return 0
+        if not change:
+            LOGGER.info("No judgment is affected by the %s change", reason)
+            return 0
+        condition, params = self._affected_condition(change)
+        try:
+            rows = self._execute(
+                f"WITH planned AS (INSERT INTO {REENRICHMENT_PLAN_TABLE} (uri, reason) "  # noqa: S608
+                f"SELECT uri, %(reason)s FROM {SIGNATURES_TABLE} WHERE {condition} "
+                "ON CONFLICT (uri) DO UPDATE SET reason = EXCLUDED.reason, planned_at = now() RETURNING uri) "
+                f"SELECT (SELECT count(*) FROM planned), (SELECT count(*) FROM {SIGNATURES_TABLE})",
+                {**params, "reason": reason},
+            )
+        except Exception:
+            LOGGER.exception("Could not plan the judgments affected by the %s change", reason)
+            return 0
+        planned, recorded = rows[0]
+        if not recorded:
+            LOGGER.warning("No judgment signature is recorded, so no judgment is planned after the %s change", reason)
+        LOGGER.info("Planned %s of %s judgments to be enriched again after the %s change", planned, recorded, reason)
+        return planned
@@ -0,0 +1,178 @@
+"""
+In-memory index of the legislation lookup table (`ukpga_lookup`).
+
+The legislation matchers only ever need the titles of the years mentioned in a judgment, split by whether
+they are matched fuzzily or exactly, plus the link and canonical citation of the titles that matched. The
+`LegislationIndex` holds the table bucketed by (year, for_fuzzy) with the link and citation inline, so the
+legislation pipeline needs no database round trips. It is loaded once per container, revalidated against a
+cheap table signature, and persisted to `/tmp` as gzipped JSON for fast restarts.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+from sqlalchemy import Connection
+
+from database.db_connection import get_legislation_lookup, get_table_signature
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+LEGISLATION_TABLE = "ukpga_lookup"
+DEFAULT_CACHE_PATH = Path("/tmp/legislation_index.json.gz")  # noqa: S108
+
+
+class LegislationTitle(NamedTuple):
+    title: str
+    ref: str
+    citation: str
+
+
+class LegislationIndex:
+    """
+    The legislation lookup table, bucketed by year and `for_fuzzy`.
+
+    Titles keep the order of the table, so the matchers see them in the same order as a query would return them.
+    """
+
+    def __init__(
+        self,
+        titles: list[str],
+        refs: list[str],
+        citations: list[str],
+        years: list[int],
+        for_fuzzy: list[bool],
+        signature: tuple | None = None,
+    ) -> None:
+        self.signature = signature
+        self._columns = (titles, refs, citations, years, for_fuzzy)
+        self._buckets: dict[tuple[int, bool], list[int]] = {}
+        self._titles: dict[str, LegislationTitle] = {}
+        for position, (title, ref, citation, year, fuzzy) in enumerate(zip(*self._columns, strict=True)):
+            self._buckets.setdefault((int(year), bool(fuzzy)), []).append(position)
+            # a title listed more than once resolves to its first row
+            self._titles.setdefault(title, LegislationTitle(title, ref, citation))
+
+    @classmethod
+    def from_dataframe(cls, legislation: pd.DataFrame, signature: tuple | None = None) -> "LegislationIndex":
+        """
+        Build the index from the rows of the legislation lookup table
+        :param legislation: DataFrame with candidate_titles, ref, citation, year and for_fuzzy columns
+        :param signature: signature of the table the rows were read from
+        :return: the legislation index
+        """
+        return cls(
+            legislation.candidate_titles.tolist(),
+            legislation.ref.tolist(),
+            legislation.citation.tolist(),
+            [int(year) for year in legislation.year],
+            [bool(fuzzy) for fuzzy in legislation.for_fuzzy],
+            signature,
+        )
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def __getitem__(self, title: str) -> LegislationTitle:
+        return self._titles[title]
+
+    def candidate_titles(self, years: Iterable[int], for_fuzzy: bool) -> list[str]:
+        """
+        Titles of the given years matched by the given approach, without duplicates and in table order
+        :param years: years detected in the judgment
+        :param for_fuzzy: True for the titles to fuzzy match, False for the titles to match exactly
+        :return: list of legislation titles
+        """
+        positions = sorted(
+            position for year in set(years) for position in self._buckets.get((int(year), for_fuzzy), [])
+        )
+        titles = self._columns[0]
+        return list(dict.fromkeys(titles[position] for position in positions))
+
+    def exact_titles(self) -> list[str]:
+        """
+        Titles of every year matched exactly, without duplicates and in table order
+        :return: list of legislation titles
+        """
+        years = {year for year, fuzzy in self._buckets if not fuzzy}
+        return self.candidate_titles(years, for_fuzzy=False)
+
+    def fuzzy_titles(self) -> list[str]:
+        """
+        Titles of every year fuzzy matched, without duplicates and in table order
+        :return: list of legislation titles
+        """
+        years = {year for year, fuzzy in self._buckets if fuzzy}
+        return self.candidate_titles(years, for_fuzzy=True)
+
+    def to_file(self, path: Path) -> None:
+        """
+        Persist the index as gzipped JSON, replacing any previous file atomically
+        :param path: file to write the index to
+        """
+        temporary_path = path.with_name(path.name + ".tmp")
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as index_file:
+            json.dump({"signature": self.signature, "columns": self._columns}, index_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def from_file(cls, path: Path) -> "LegislationIndex":
+        """
+        Load an index persisted with `to_file`
+        :param path: file to read the index from
+        :return: the legislation index
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as index_file:
+            persisted = json.load(index_file)
+        titles, refs, citations, years, for_fuzzy = persisted["columns"]
+        signature = tuple(persisted["signature"]) if persisted["signature"] is not None else None
+        return cls(titles, refs, citations, years, for_fuzzy, signature)
+
+
+class LegislationIndexCache:
+    """
+    Keeps the latest `LegislationIndex` in memory and on disk, reloading it only when the table changes.
+    """
+
+    def __init__(self, cache_path: Path = DEFAULT_CACHE_PATH) -> None:
+        self.cache_path = cache_path
+        self._index: LegislationIndex | None = None
+        # records enriched in threads share the cache, and only one of them may reload it and write the file
+        self._lock = threading.Lock()
+
+    def _load_from_disk(self) -> LegislationIndex | None:
+        try:
+            return LegislationIndex.from_file(self.cache_path)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            LOGGER.info("No usable legislation index at %s: %s", self.cache_path, exc)
+            return None
+
+    def get(self, conn: Connection) -> LegislationIndex:
+        """
+        Return the legislation index, reloading it from the database only if the lookup table has changed.
+        :param conn: database connection, required
+        :return: the legislation index
+        """
+        signature = get_table_signature(conn, LEGISLATION_TABLE)
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_from_disk()
+
+            if self._index is None or self._index.signature != signature:
+                self._index = LegislationIndex.from_dataframe(get_legislation_lookup(conn), signature)
+                LOGGER.info("Loaded %s titles from the legislation lookup table", len(self._index))
+                try:
+                    self._index.to_file(self.cache_path)
+                except OSError as exc:
+                    LOGGER.warning("Could not persist the legislation index to %s: %s", self.cache_path, exc)
+            return self._index
+
+
+LEGISLATION_INDEX_CACHE = LegislationIndexCache()
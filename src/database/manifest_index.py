@@ -0,0 +1,60 @@
+"""
+In-memory index of the citation rules manifest.
+
+The manifest is small and changes rarely (only when the rules are updated by the update_rules_processor
+lambda), so rather than querying it for every detected citation it is bulk-loaded once into an immutable
+mapping of `MatchedRule` records keyed by rule id. The cached index is revalidated against a cheap table
+signature, and only reloaded when the table has actually changed.
+"""
+
+import logging
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from sqlalchemy import Connection
+
+from database.db_connection import MatchedRule, get_matched_rules, get_table_signature
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+MANIFEST_TABLE = "manifest"
+
+
+class ManifestIndex:
+    """
+    Caches the manifest as a read-only mapping of rule id to `MatchedRule`.
+    """
+
+    def __init__(self) -> None:
+        self._rules: Mapping[str, MatchedRule] | None = None
+        self._signature: tuple | None = None
+        # records enriched in threads share the index, and must not see the rules of one version with the signature of another
+        self._lock = threading.Lock()
+
+    def get(self, conn: Connection) -> Mapping[str, MatchedRule]:
+        """
+        Return the manifest rules, reloading them only if the manifest table has changed.
+        :param conn: database connection, required
+        :return: read-only mapping of rule id to MatchedRule
+        """
+        return self.get_with_signature(conn)[0]
+
+    def get_with_signature(self, conn: Connection) -> tuple[Mapping[str, MatchedRule], tuple]:
+        """
+        Return the manifest rules, reloading them only if the manifest table has changed, with the signature
+        of the table they were read from.
+        :param conn: database connection, required
+        :return: read-only mapping of rule id to MatchedRule, and the signature of the manifest table
+        """
+        signature = get_table_signature(conn, MANIFEST_TABLE)
+        with self._lock:
+            if self._rules is None or signature != self._signature:
+                self._rules = MappingProxyType(get_matched_rules(conn))
+                self._signature = signature
+                LOGGER.info("Loaded %s rules from the manifest", len(self._rules))
+            return self._rules, signature
+
+
+MANIFEST_INDEX = ManifestIndex()
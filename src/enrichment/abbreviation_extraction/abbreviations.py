@@ -14,9 +14,18 @@ from collections import defaultdict
 from collections.abc import Iterable
 
 from spacy.language import Language
-from spacy.matcher import Matcher
+from spacy.matcher import PhraseMatcher
 from spacy.tokens import Doc, Span
 
+# Longest content of the parentheses around a definition, in tokens: quotes plus up to five words.
+# `verify_match_format` drops anything longer, so the scan never looks further than this.
+MAX_PARENTHESIS_TOKENS = 7
+
+# Furthest the long form of a definition is looked for before its short form, in tokens: the window of
+# min(|A| + 5, 2|A|) words of Schwartz & Hearst for a short form of up to 10 characters, the opening
+# parenthesis and the quote.
+LONG_FORM_LOOKBACK = 17
+
 
 def find_abbreviation(long_form_candidate: Span, short_form_candidate: Span) -> tuple[Span, Span | None]:
     """
@@ -198,7 +207,32 @@ def short_form_filter(span: Span) -> bool:
     return any(x.is_alpha for x in span)
 
 
-def verify_match_format(matcher_output: list[tuple[int, int, int]], doc: Doc) -> list[tuple[Span, Span]]:
+def find_parentheses(doc: Doc) -> list[tuple[int, int, int]]:
+    """
+    Find the spans enclosed in brackets in a single scan of the Doc, pairing each closing bracket
+    with the nearest opening bracket before it
+    Parameters
+    ----------
+    doc: Doc, required.
+        Doc object of the judgment content.
+    Returns
+    -------
+    List[Tuple[int, int, int]], match number, start and end position of each span, brackets included,
+    with no more than MAX_PARENTHESIS_TOKENS tokens inside the brackets
+    """
+    matches = []
+    opening = None
+    for token in doc:
+        if token.text == "(":
+            opening = token.i
+        elif token.text == ")" and opening is not None:
+            if token.i - opening - 1 <= MAX_PARENTHESIS_TOKENS:
+                matches.append((-1, opening, token.i + 1))
+            opening = None
+    return matches
+
+
+def verify_match_format(matcher_output: list[tuple[int, int, int]], doc: Doc) -> list[tuple[int, int, int]]:
     """
     Verify that the matches appear in a form where such as ("abbrv") or ("long_form") with quotes
     and brackets as the first two and final two characters
@@ -211,31 +245,25 @@ def verify_match_format(matcher_output: list[tuple[int, int, int]], doc: Doc) ->
         Doc object of the judgment content.
     Returns
     -------
-    List[Tuple[Span, Span]], List of match start and end position
+    List[Tuple[int, int, int]], the matches wrapped in quotes and brackets
     """
+    QUOTES = ['"', "'", "‘", "’", "“", "”"]
+    BRACKETS = ["(", ")"]
+    verified = []
     for match in matcher_output:
-        QUOTES = ['"', "'", "‘", "’", "“", "”"]
-        BRACKETS = ["(", ")"]
         start = match[1]
         end = match[2] - 1
 
-        if end - start > 8:
-            matcher_output.remove(match)
-
-        # verify that the match is wrapped in quotes and brackets
-        elif (
-            not contains(str(doc[start + 1]), QUOTES)
-            or not contains(str(doc[end - 1]), QUOTES)
-            or not contains(str(doc[start]), BRACKETS)
-            or not contains(str(doc[end]), BRACKETS)
+        # keep matches that are short enough, and that are wrapped in quotes and brackets
+        if (
+            end - start <= 8
+            and contains(str(doc[start + 1]), QUOTES)
+            and contains(str(doc[end - 1]), QUOTES)
+            and contains(str(doc[start]), BRACKETS)
+            and contains(str(doc[end]), BRACKETS)
         ):
-            print(str(doc[start:end]))
-            matcher_output.remove(match)
-    return None  # type:ignore
-    # This return value is depended on elsewhere in the code, but previously
-    # it did not exist at all. Understanding how the abbreviation code is
-    # meant to work is a task for the future.
-    # TODO: https://trello.com/c/horD3P3F/693-enrichment-pipeline-abbreviations-not-functional
+            verified.append(match)
+    return verified
 
 
 class AbbreviationDetector:
@@ -250,7 +278,8 @@ class AbbreviationDetector:
 
     def __init__(self, nlp: Language) -> None:
         """
-        Initialises the patterns and vocabulary to be used by spaCy's matcher
+        Registers the extensions set on the spaCy Doc and Spans, and keeps the vocabulary
+        used by the matcher built for each Doc
         Parameters
         ----------
         nlp: construct a Doc object via spaCy's nlp object
@@ -258,10 +287,7 @@ class AbbreviationDetector:
         Doc.set_extension("abbreviations", default=[], force=True)
         Span.set_extension("long_form", default=None, force=True)
 
-        self.matcher = Matcher(nlp.vocab)
-        patterns = [[{"ORTH": "("}, {"OP": "+"}, {"ORTH": ")"}]]
-        self.matcher.add("parenthesis", patterns)
-        self.global_matcher = Matcher(nlp.vocab)
+        self.vocab = nlp.vocab
 
     def find(self, span: Span, doc: Doc) -> tuple[Span, set[Span]]:
         """
@@ -299,19 +325,11 @@ class AbbreviationDetector:
         -------
         Doc, Doc object of the judgment content.
         """
-        matches = self.matcher(doc)
-
-        matches_brackets = [(x[0], x[1], x[2]) for x in matches]
-
-        matcher_output = verify_match_format(matches_brackets, doc)
-        # verify_match_format returns None, which is incorrect and means this section can not
-        # have been run in it's current format.
-        print(matcher_output)
+        # a fresh list for every Doc, rather than the list shared by the extension default
+        doc._.abbreviations = []
+        matcher_output = verify_match_format(find_parentheses(doc), doc)
         if matcher_output:
-            matches_no_brackets = [
-                (x[0], x[1] + 1, x[2] - 1)  # type:ignore
-                for x in matcher_output
-            ]
+            matches_no_brackets = [(x[0], x[1] + 1, x[2] - 1) for x in matcher_output]
             filtered = filter_matches(matches_no_brackets, doc)
             occurrences = self.find_matches_for(filtered, doc)
 
@@ -319,9 +337,32 @@ class AbbreviationDetector:
                 for short in short_forms:
                     short._.long_form = long_form
                     doc._.abbreviations.append(short)
+            # the occurrences are sets, so list them in document order for the same result in every process
+            doc._.abbreviations.sort(key=lambda span: (span.start, span.end))
 
         return doc
 
+    def find_definitions(self, doc: Doc) -> list[tuple[Span, Span]]:
+        """
+        Finds the abbreviations defined in the Doc, without looking for their occurrences.
+        Parameters
+        ----------
+        doc: Doc, required
+            Doc object of the judgment content.
+        Returns
+        -------
+        List[Tuple[Span, Span]], the short form and long form of every definition found, in document order,
+        including definitions of an abbreviation or long form defined before, which `find_matches_for` drops
+        """
+        matcher_output = verify_match_format(find_parentheses(doc), doc)
+        matches_no_brackets = [(x[0], x[1] + 1, x[2] - 1) for x in matcher_output]
+        definitions = []
+        for long_candidate, short_candidate in filter_matches(matches_no_brackets, doc):
+            short, long = find_abbreviation(long_candidate, short_candidate)
+            if long:
+                definitions.append((short, long))
+        return definitions
+
     def find_matches_for(self, filtered: list[tuple[Span, Span]], doc: Doc) -> list[tuple[Span, set[Span]]]:
         """
         Function to return all start and end positions of an abbreviation found in the judgment content.
@@ -337,6 +378,8 @@ class AbbreviationDetector:
         list of the match and every occurance of the match in the judgment body
         """
         rules = {}
+        # every short form found is matched in a single pass, by one automaton built for this Doc
+        matcher = PhraseMatcher(self.vocab)
         all_occurences: dict[Span, set[Span]] = defaultdict(set)
         already_seen_long: set[str] = set()
         already_seen_short: set[str] = set()
@@ -347,7 +390,7 @@ class AbbreviationDetector:
             # pathalogical case also, as it would mean an abbreviation had been
             # defined twice in a document. There's not much we can do about this,
             # but at least the case which is discarded will be picked up below by
-            # the global matcher. So it's likely that things will work out ok most of the time.
+            # the matcher. So it's likely that things will work out ok most of the time.
             new_long = long.text not in already_seen_long if long else False
             new_short = short.text not in already_seen_short
             if long is not None and new_long and new_short:
@@ -355,16 +398,15 @@ class AbbreviationDetector:
                 already_seen_short.add(short.text)
                 all_occurences[long].add(short)
                 rules[long.text] = long
-                # Add a rule to a matcher to find exactly this substring.
-                self.global_matcher.add(long.text, [[{"ORTH": x.text} for x in short]])
-        to_remove = set()
-        global_matches = self.global_matcher(doc)
-        for match, start, end in global_matches:
-            string_key = self.global_matcher.vocab.strings[match]
-            to_remove.add(string_key)
+                # Add a rule to the matcher to find exactly this substring.
+                matcher.add(long.text, [Doc(self.vocab, words=[x.text for x in short])])
+        for match, start, end in matcher(doc):
+            string_key = self.vocab.strings[match]
             all_occurences[rules[string_key]].add(doc[start:end])
-        for key in to_remove:
-            # Clean up the global matcher.
-            self.global_matcher.remove(key)
 
         return list(all_occurences.items())
+
+
+@Language.factory("abbreviation_detector")
+def create_abbreviation_detector(nlp: Language, name: str) -> AbbreviationDetector:
+    return AbbreviationDetector(nlp)
@@ -3,70 +3,127 @@ Main file that controls the abbreviation detection, including the creation of th
 AbbreviationDetector class and the pipeline.
 """
 
-from spacy.language import Language
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
 
 from enrichment.abbreviation_extraction.abbreviations import AbbreviationDetector
-from utils.custom_types import Abbreviation
+from utils.custom_types import Abbreviation, DetectedReference
+
+
+class AbbreviationDefinition(NamedTuple):
+    """An abbreviation defined in a judgment, with the words of its short form as tokenized, and its long form."""
+
+    short_form: str
+    short_form_words: tuple[str, ...]
+    long_form: str
 
 
-def chunking_mechanism(docobj, n, start, end):
+def abb_references(docobj: Doc, detector: AbbreviationDetector) -> list[DetectedReference]:
     """
-    Function to split the content into a list of chunks of size n,
-    taking into account the start and end position of abbreviations.
-    :param docobj: Doc object of the judgement content created in abb_pipeline
-    :param n: size of the chunks
-    :param start: starting position of detected abbreviation
-    :param end: ending position of detected abbreviation
+    Main controller of the abbreviation detection pipeline, keeping where each abbreviation was detected.
+    :param docobj: Doc object of the judgment content, tokenized once and shared with the other extractors
+    :param detector: AbbreviationDetector sharing the vocab of docobj
 
     Returns
     -------
-    List: Judgment split into chunks
+    List[DetectedReference]: character offsets of the abbreviation in docobj, and its Abbreviation tuple
     """
-    k, m = divmod(len(docobj), n)
-    pos = [[i * k + min(i, m), (i + 1) * k + min(i + 1, m)] for i in range(n)]
-    # If the abbreviation will be cut in two by the above split, adjust where
-    # the list is split
-    for p in range(len(pos)):
-        if start < pos[p][1] and end > pos[p][1]:
-            pos[p][1] = end
-            pos[p + 1][0] = end
-        else:
-            continue
-    judgment_chunks = [docobj[split[0] : split[1]] for split in pos]
-    return judgment_chunks
-
-
-def abb_pipeline(judgment_content_text: str, nlp) -> list[Abbreviation]:
+    REFERENCES_ABBR = []
+
+    # one pass over the whole judgment, so a definition applies to its occurrences anywhere in it
+    doc = detector(docobj)
+    for abrv in doc._.abbreviations:
+        abr_tuple = Abbreviation(str(abrv), str(abrv._.long_form))
+        REFERENCES_ABBR.append(DetectedReference(abrv.start_char, abrv.end_char, abr_tuple))
+
+    return REFERENCES_ABBR
+
+
+def abb_pipeline(docobj: Doc, detector: AbbreviationDetector) -> list[Abbreviation]:
     """
     Main controller of the abbreviation detection pipeline.
-    :param judgment_content_text: judgment content
-    :param nlp: previously created spaCy nlp component
+    :param docobj: Doc object of the judgment content, tokenized once and shared with the other extractors
+    :param detector: AbbreviationDetector sharing the vocab of docobj
 
     Returns
     -------
     List[Tuple[Str, Str]]: abbreviation and abbreviation long form
     """
+    return [reference.replacement for reference in abb_references(docobj, detector)]
 
-    # init the class - stateful pipeline component
-    @Language.factory("abbreviation_detector")
-    def create_abbreviation_detector(nlp, name: str) -> AbbreviationDetector:
-        return AbbreviationDetector(nlp)
 
-    nlp.add_pipe("abbreviation_detector", last=True)
-    print("added abbr pipeline")
+def abb_definitions(docobj: Doc, detector: AbbreviationDetector) -> list[DetectedReference]:
+    """
+    The abbreviations defined in part of a judgment, such as a paragraph, without their occurrences.
+    :param docobj: Doc object of the part of the judgment content
+    :param detector: AbbreviationDetector sharing the vocab of docobj
 
-    REPLACEMENTS_ABBR = []
+    Returns
+    -------
+    List[DetectedReference]: character offsets of the short form of every definition found in docobj,
+        in document order, and its AbbreviationDefinition tuple
+    """
+    return [
+        DetectedReference(
+            short.start_char,
+            short.end_char,
+            AbbreviationDefinition(short.text, tuple(token.text for token in short), long.text),
+        )
+        for short, long in detector.find_definitions(docobj)
+    ]
 
-    # new chunking mechanism
-    docobj = nlp(judgment_content_text)
-    judgment_chunks = chunking_mechanism(docobj, 5, 79, 83)
-    chunk_strings = [chunk.text for chunk in judgment_chunks]
 
-    # replace abbreviations in each chunk
-    for chunk in chunk_strings:
-        doc = nlp(chunk)
-        for abrv in doc._.abbreviations:
-            abr_tuple = Abbreviation(str(abrv), str(abrv._.long_form))
-            REPLACEMENTS_ABBR.append(abr_tuple)
+def unique_definitions(definitions: Iterable[AbbreviationDefinition]) -> list[AbbreviationDefinition]:
+    """
+    The definitions of a judgment that apply to it: only the first definition of a short form or of a long form
+    counts, as in `AbbreviationDetector.find_matches_for`.
+    :param definitions: the definitions found in every part of the judgment, in document order
 
-    return REPLACEMENTS_ABBR
+    Returns
+    -------
+    List[AbbreviationDefinition]: the definitions that apply, in document order
+    """
+    applying = []
+    already_seen_long: set[str] = set()
+    already_seen_short: set[str] = set()
+    for definition in definitions:
+        if definition.long_form not in already_seen_long and definition.short_form not in already_seen_short:
+            already_seen_long.add(definition.long_form)
+            already_seen_short.add(definition.short_form)
+            applying.append(definition)
+    return applying
+
+
+def build_definitions_matcher(vocab: Vocab, definitions: Iterable[AbbreviationDefinition]) -> PhraseMatcher:
+    """
+    A phrase matcher finding the short forms of the definitions, keyed by their long form.
+    :param vocab: vocab of the Docs to be matched
+    :param definitions: the definitions that apply to the judgment, from `unique_definitions`
+    """
+    matcher = PhraseMatcher(vocab)
+    for definition in definitions:
+        matcher.add(definition.long_form, [Doc(vocab, words=list(definition.short_form_words))])
+    return matcher
+
+
+def abb_occurrences(docobj: Doc, matcher: PhraseMatcher) -> list[DetectedReference]:
+    """
+    The occurrences of the abbreviations of a judgment in part of it, as `abb_references` finds them in
+    the whole judgment.
+    :param docobj: Doc object of the part of the judgment content
+    :param matcher: phrase matcher of the abbreviations, from `build_definitions_matcher`
+
+    Returns
+    -------
+    List[DetectedReference]: character offsets of the abbreviation in docobj, and its Abbreviation tuple
+    """
+    occurrences = [(docobj[start:end], docobj.vocab.strings[match_id]) for match_id, start, end in matcher(docobj)]
+    occurrences.sort(key=lambda occurrence: (occurrence[0].start, occurrence[0].end))
+    return [
+        DetectedReference(short.start_char, short.end_char, Abbreviation(short.text, long_form))
+        for short, long_form in occurrences
+    ]
@@ -8,23 +8,27 @@ This code builds the Case Law Annotator. The 3 main functionalities are:
 
 - The input to case_pipeline is a spacy Doc object.
 - The first step is to detect the entities based on the EntityRuler built into the nlp pipeline in a previous step.
-- Once the citation match and its corresponding ID have been detected, the code queries a 'Rules Manifest' in Postgres
-to retrieve associated metadata about the matched citation.
+- Once the citation match and its corresponding ID have been detected, the code looks up the 'Rules Manifest'
+(bulk-loaded from Postgres, see database.manifest_index) to retrieve associated metadata about the matched citation.
 - If the citation is well-formed, the pipeline retrieves additional metadata from the citation match, creates the corresponding URI
 and finally creates a replacement entry as a tuple.
 - If the citation match is malformed, the citation match and parts of the metadata are passed to a correction pipeline before following
 the same path as well-formed citation matches.
-- case_pipeline returns a list of tuples that hold the replacements.
+- case_pipeline returns a list of tuples that hold the replacements; case_references also returns where each
+citation was detected in the text.
 
 """
 
 import re
 from collections import namedtuple
+from collections.abc import Mapping
 
-from database.db_connection import get_matched_rule
+from database.db_connection import MatchedRule
 from enrichment.caselaw_extraction.correction_strategies import apply_correction_strategy
+from utils.custom_types import DetectedReference
 
-case = namedtuple("case", "citation_match corrected_citation year URI is_neutral")
+# the rule id is that of the manifest rule that detected the citation, recorded in the judgment signature
+case = namedtuple("case", "citation_match corrected_citation year URI is_neutral rule_id", defaults=(None,))
 
 
 def create_URI(uri_template, year, d1, d2):
@@ -45,57 +49,79 @@ def create_URI(uri_template, year, d1, d2):
     return URI
 
 
-def case_pipeline(doc, db_conn):
+def resolve_citation(citation_match, matched_rule):
+    """
+    Build the replacement entry for a detected citation.
+    :param citation_match: text of the detected citation
+    :param matched_rule: MatchedRule of the manifest rule that detected the citation
+    :returns: replacement tuple for the citation
+    """
+    (
+        _family,
+        URItemplate,
+        is_neutral,
+        is_canonical,
+        citation_type,
+        canonical_form,
+    ) = matched_rule
+    if is_canonical is False:
+        corrected_citation, year, d1, d2 = apply_correction_strategy(citation_type, citation_match, canonical_form)
+        if URItemplate is not None:
+            URI = create_URI(URItemplate, year, d1, d2)
+        else:
+            URI = "#"
+        return case(citation_match, corrected_citation, year, URI, is_neutral)
+
+    components = re.findall(r"\d+", citation_match)
+    if "Year" in citation_type:
+        year = components[0]
+        d1 = components[1]
+        if len(components) > 2:
+            d2 = components[2]
+        else:
+            d2 = ""
+    else:
+        year = ""
+        d1 = components[0]
+        if len(components) > 1:
+            d2 = components[1]
+        else:
+            d2 = ""
+    if URItemplate is not None:
+        URI = create_URI(URItemplate, year, d1, d2)
+    else:
+        URI = "#"
+    return case(citation_match, citation_match, year, URI, is_neutral)
+
+
+def case_references(doc, manifest: Mapping[str, MatchedRule]):
     """
     Loop through detected caselaw citations and build components for xref attribute.
     :param doc: judgment as spacy Doc object
-    :param db_conn: DB connection parameters to call Rules Manifest
-    :returns: list of tuples containing detected caselaw and associated attributes;
-        they're referred to as "replacements" in determine_replacements_caselaw
+    :param manifest: Rules Manifest, as a mapping of rule id to MatchedRule
+    :returns: list of DetectedReference holding the character offsets of each detected citation
+        and its replacement tuple
     """
 
-    REPLACEMENTS_CASELAW = []
+    REFERENCES_CASELAW = []
+    # judgments cite the same authorities many times over, so resolve each distinct citation only once
+    resolved: dict[tuple[str, str], case] = {}
 
     for ent in doc.ents:
-        rule_id = ent.ent_id_
-        citation_match = ent.text
-        (
-            _family,
-            URItemplate,
-            is_neutral,
-            is_canonical,
-            citation_type,
-            canonical_form,
-        ) = get_matched_rule(db_conn, rule_id)
-        if is_canonical is False:
-            corrected_citation, year, d1, d2 = apply_correction_strategy(citation_type, citation_match, canonical_form)
-            if URItemplate is not None:
-                URI = create_URI(URItemplate, year, d1, d2)
-            else:
-                URI = "#"
-            replacement_entry = case(citation_match, corrected_citation, year, URI, is_neutral)
-        else:
-            components = re.findall(r"\d+", citation_match)
-            if "Year" in citation_type:
-                year = components[0]
-                d1 = components[1]
-                if len(components) > 2:
-                    d2 = components[2]
-                else:
-                    d2 = ""
-            else:
-                year = ""
-                d1 = components[0]
-                if len(components) > 1:
-                    d2 = components[1]
-                else:
-                    d2 = ""
-            if URItemplate is not None:
-                URI = create_URI(URItemplate, year, d1, d2)
-            else:
-                URI = "#"
-            replacement_entry = case(citation_match, citation_match, year, URI, is_neutral)
-
-        REPLACEMENTS_CASELAW.append(replacement_entry)
-
-    return REPLACEMENTS_CASELAW
+        key = (ent.text, ent.ent_id_)
+        if key not in resolved:
+            resolved[key] = resolve_citation(ent.text, manifest[ent.ent_id_])._replace(rule_id=ent.ent_id_)
+        REFERENCES_CASELAW.append(DetectedReference(ent.start_char, ent.end_char, resolved[key]))
+
+    return REFERENCES_CASELAW
+
+
+def case_pipeline(doc, manifest: Mapping[str, MatchedRule]):
+    """
+    Loop through detected caselaw citations and build components for xref attribute.
+    :param doc: judgment as spacy Doc object
+    :param manifest: Rules Manifest, as a mapping of rule id to MatchedRule
+    :returns: list of tuples containing detected caselaw and associated attributes;
+        they're referred to as "replacements" in determine_replacements_caselaw
+    """
+    return [reference.replacement for reference in case_references(doc, manifest)]
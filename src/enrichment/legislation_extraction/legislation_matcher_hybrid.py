@@ -22,13 +22,15 @@ from collections import namedtuple
 from typing import Any
 
 import numpy as np
-import pandas as pd
+from rapidfuzz import fuzz, process
 from spacy.matcher import Matcher, PhraseMatcher
 from spaczz.matcher import FuzzyMatcher
 
-from database.db_connection import get_canonical_leg, get_hrefs
+from database.legislation_index import LegislationIndex
+from utils.custom_types import DetectedReference
 
 CUTOFF = 90
+MIN_R1 = 70
 PAD = 5
 
 keys = ["detected_ref", "start", "end", "confidence", "ref", "canonical"]
@@ -62,6 +64,9 @@ def resolve_overlap(results_dict):
     Resolves references that have been detected as legislation but overlap in the body of judgment to the most accurate legislation.
     This might occur due to the nature of the fuzzy matching where it matches two closely worded legislation to the same text in a judgement.
     This function ensures a 1-to-1 linkage between a legislation title and a detected reference.
+    The references are sorted by position once and swept in order, each one resolved against the reference kept so far:
+    a reference overlapping it is dropped, unless it has a higher confidence (or the same, listed later), in which case
+    it is kept instead. References that only overlap each other through a reference dropped in between are both kept.
     Parameters
     ----------
     results_dict : dict
@@ -69,45 +74,90 @@ def resolve_overlap(results_dict):
     Returns
     -------
     outout : dict
-        dictionary containing the detected references with overlapped references removed.
+        dictionary containing the detected references with overlapped references removed, ordered by title.
     """
-    qq = pd.DataFrame([results_dict])
-    qq = qq.T.explode([0])[0].apply(pd.Series)
+    matches = [(title, match) for title, title_matches in results_dict.items() for match in title_matches]
+    # sort the references by start position, longest first, so a reference is swept before those inside it
+    order = sorted(range(len(matches)), key=lambda i: (matches[i][1][1], -matches[i][1][2]))
+
+    kept = []
+    best = None
+    best_end = 0
+    for i in order:
+        _, (_, start, end, confidence, *_) = matches[i]
+        if best is not None and (start < best_end or end <= best_end):
+            # the reference overlaps the one kept so far, and replaces it if it is better
+            if (confidence, i) > best:
+                best = (confidence, i)
+                best_end = end
+        else:
+            if best is not None:
+                kept.append(best[1])
+            best = (confidence, i)
+            best_end = end
+    if best is not None:
+        kept.append(best[1])
+
+    resolved: dict[str, list[Any]] = {}
+    for i in sorted(kept):
+        title, match = matches[i]
+        resolved.setdefault(title, []).append(match)
+    return dict(sorted(resolved.items()))
 
-    qq.columns = pd.Index(keys)
 
-    # get refs that overlap in the text
-    mask = (qq.start.values[:, None] >= qq.start.values) & (qq.end.values[:, None] <= qq.end.values)  # type: ignore[call-overload]
-    np.fill_diagonal(mask, 0)  # omit 'pairs' that are the same thing twice
-    mask = np.triu(mask, 0)  # omit pairs where the first is after than the second
-    r, c = np.where(mask)
-    overlaps = list(map(list, zip(r, c, strict=False)))
-
-    removals = set()
-
-    qq = qq.reset_index()
-
-    # for every detected pair of refs that overlap
-    for ol_index in overlaps:
-        # mypy was complaining about ol_index being a `list[signedinteger[_32Bit | _64Bit]]`
-        # so just force it to be a regular list of ints
-        int_ol_index = list(map(int, ol_index))
-        # get those two rows
-        overlap_rows = qq.iloc[int_ol_index]
-        # get the worst of the two (or first, if they're equal)
-        worst_match_index = overlap_rows.confidence.idxmin()
-        # and mark its index for deletion
-        removals.add(worst_match_index)
+# EXACT MATCHING
 
-    # then drop all the removed entries at once
-    for removal in removals:
-        qq.drop(index=removal, inplace=True)
 
-    retval = qq.set_index("index").apply(tuple, axis=1).groupby("index").apply(list).T.to_dict()
-    return retval
+def build_exact_matcher(nlp, titles):
+    """
+    Builds a single phrase matcher holding every legislation title to be matched exactly, keyed by the title.
+    Parameters
+    ----------
+    nlp : spacy.English
+        English NLP module.
+    titles : list(string)
+        List of legislation titles.
+    Returns
+    -------
+    phrase_matcher : spacy.matcher.PhraseMatcher
+        Phrase matcher detecting all the titles in a single pass over the judgement.
+    """
+    phrase_matcher = PhraseMatcher(nlp.vocab)
+    for title in nlp.tokenizer.pipe(titles, batch_size=1000):
+        phrase_matcher.add(title.text, [title])
+    return phrase_matcher
 
 
-# EXACT MATCHING
+def exact_match_titles(titles, docobj, nlp, phrase_matcher=None):
+    """
+    Detects legislation in body of judgement by searching for the exact match of the titles in the text.
+    The judgement is scanned once, whatever the number of titles.
+    Parameters
+    ----------
+    titles : list(string)
+        List of legislation titles.
+    docobj : spacy.Doc
+        The body of the judgement.
+    nlp : spacy.English
+        English NLP module.
+    phrase_matcher : spacy.matcher.PhraseMatcher
+        Phrase matcher built with `build_exact_matcher`, holding at least `titles`. It is built from `titles` if omitted.
+    Returns
+    -------
+    matched_text : dict
+        Dictionary of title to list of tuples of the form ('detected reference', 'start position', 'end position', 100)
+    """
+    if phrase_matcher is None:
+        phrase_matcher = build_exact_matcher(nlp, titles)
+
+    matched_text: dict[str, list[tuple]] = {title: [] for title in titles}
+    for match_id, start, end in phrase_matcher(docobj):
+        # only keep the titles relevant to the judgement, e.g. of the years it mentions
+        matches = matched_text.get(nlp.vocab.strings[match_id])
+        if matches is not None:
+            span = docobj[start:end]
+            matches.append((span.text, start, end, 100))
+    return matched_text
 
 
 def exact_matcher(title, docobj, nlp, cutoff=None, candidates=None):
@@ -126,17 +176,7 @@ def exact_matcher(title, docobj, nlp, cutoff=None, candidates=None):
     matched_text : list(tuple)
         List of tuples of the form ('detected reference', 'start position', 'end position', 100)
     """
-    phrase_matcher = PhraseMatcher(nlp.vocab)
-    phrase_list = [nlp(title)]
-    phrase_matcher.add("Text Extractor", None, *phrase_list)
-
-    matched_items = phrase_matcher(docobj)
-
-    matched_text = []
-    for _, start, end in matched_items:
-        span = docobj[start:end]
-        matched_text.append((span.text, start, end, 100))
-    return matched_text
+    return exact_match_titles([title], docobj, nlp)[title]
 
 
 # FUZZY MATCHING
@@ -165,8 +205,8 @@ def search_for_act_fuzzy(title, docobj, nlp, cutoff, candidates=None):
     """
 
     fuzzy_matcher = FuzzyMatcher(nlp.vocab)
-    phrase_list = [nlp(title)]
-    options = {"fuzzy_func": "token_sort", "min_r1": 70, "min_r2": cutoff}
+    phrase_list = [nlp.make_doc(title)]
+    options = {"fuzzy_func": "token_sort", "min_r1": MIN_R1, "min_r2": cutoff}
     fuzzy_matcher.add("Text Extractor", phrase_list, kwargs=[options])
     matched_items = fuzzy_matcher(docobj)
     matched_text = []
@@ -176,9 +216,211 @@ def search_for_act_fuzzy(title, docobj, nlp, cutoff, candidates=None):
     return matched_text
 
 
+def _fuzzy_ratio(query, text, min_r):
+    """
+    Token sort ratio between two lower-cased strings, rounded, or 0 when it is below `min_r`.
+    """
+    return round(fuzz.token_sort_ratio(query, text, score_cutoff=min_r))
+
+
+def _optimize_fuzzy_match(query, query_len, segment, start, ratio, flex, thresh):
+    """
+    Flexes the boundaries of a potential match found by the scan of a candidate segment, keeping the best match.
+    The boundaries are flexed in the same order, and ties broken the same way, as by the spaczz fuzzy matcher.
+    Parameters
+    ----------
+    query : string
+        Lower-cased act title.
+    query_len : int
+        Number of tokens in the act title.
+    segment : spacy.Span
+        Candidate segment of the judgement.
+    start : int
+        Start position of the potential match in the segment.
+    ratio : int
+        Similarity of the potential match.
+    flex : int
+        Maximum number of tokens to move the match boundaries by.
+    thresh : int
+        Similarity at or above which the match is not optimised.
+    Returns
+    -------
+    output : tuple
+        Tuple of the form ('start position', 'end position', 'similarity').
+    """
+    segment_len = len(segment)
+    p_l, bp_l = start, start
+    p_r, bp_r = start + query_len, start + query_len
+    r = ratio
+    if flex and not r >= thresh:
+        optim_r = r
+        for f in range(1, flex + 1):
+            flexed = (
+                (p_l - f >= 0, p_l - f, p_r),
+                (p_l + f < p_r, p_l + f, p_r),
+                (p_r - f > p_l, p_l, p_r - f),
+                (p_r + f <= segment_len, p_l, p_r + f),
+                (p_l - f >= 0 and p_r + f <= segment_len, p_l - f, p_r + f),
+                (p_l + f < p_r and p_r - f > p_l, p_l + f, p_r - f),
+            )
+            for valid, new_l, new_r in flexed:
+                if valid:
+                    new_ratio = _fuzzy_ratio(query, segment[new_l:new_r].text.lower(), optim_r)
+                    if new_ratio:
+                        optim_r, bp_l, bp_r = new_ratio, new_l, new_r
+            if optim_r == r:
+                break
+            r = optim_r
+    return bp_l, bp_r, r
+
+
+def _filter_overlapping_matches(matches):
+    """
+    Keeps the best of the matches that share tokens, preferring the higher similarity and then the earlier match.
+    Parameters
+    ----------
+    matches : list(tuple)
+        List of tuples of the form ('start position', 'end position', 'similarity').
+    Returns
+    -------
+    output : list(tuple)
+        Non-overlapping matches, in order of their start position.
+    """
+    kept = []
+    taken: set[int] = set()
+    for start, end, ratio in sorted(matches, key=lambda match: (-match[2], match[0])):
+        if taken.isdisjoint(range(start, end)):
+            kept.append((start, end, ratio))
+            taken.update(range(start, end))
+    return sorted(kept)
+
+
+def _group_titles(titles, nlp):
+    """
+    Groups the titles by year and by the number of tokens in their act, as those share candidate segment chunks.
+    Parameters
+    ----------
+    titles : list(string)
+        List of legislation titles.
+    nlp : spacy.English
+        English NLP module.
+    Returns
+    -------
+    groups : dict
+        Dictionary of (year, act span, act length) to list of tuples of the form ('title', 'lower-cased act')
+    """
+    groups: dict[tuple[str, int, int], list[tuple[str, str]]] = {}
+    for title in titles:
+        # split the year refernce from the act title
+        act, year = title[:-4], title[-4:]
+        query = nlp.make_doc(act)
+        if len(query):
+            # get the span of the act title to be searched
+            act_span = len(nlp.make_doc(title)) + PAD
+            groups.setdefault((year, act_span, len(query)), []).append((title, query.text.lower()))
+    return groups
+
+
+def fuzzy_lookback(nlp, titles):
+    """
+    Furthest the fuzzy matcher reads before the end of a candidate segment, in tokens.
+    Parameters
+    ----------
+    nlp : spacy.English
+        English NLP module.
+    titles : list(string)
+        List of legislation titles to be fuzzy matched.
+    Returns
+    -------
+    lookback : int
+        Number of tokens of the segment of the longest title, 0 without titles.
+    """
+    return max((len(title) + PAD for title in nlp.tokenizer.pipe(titles, batch_size=1000)), default=0)
+
+
+def fuzzy_match_titles(titles, docobj, nlp, cutoff, candidates):
+    """
+    Detects legislation in body of judgement by fuzzy matching every title against the candidate segments of its year.
+    Rather than running a fuzzy matcher per title and per candidate, the titles are grouped by year and length,
+    and each group is scored in one batch against all the chunks of the candidate segments of that year.
+    Only the chunks scoring at least `MIN_R1` are then flexed to find the best matching span.
+    Parameters
+    ----------
+    titles : list(string)
+        List of legislation titles.
+    docobj : spacy.Doc
+        The body of the judgement.
+    nlp : spacy.English
+        English NLP module.
+    cutoff : int
+        Value to determine the level of similarity of matches to be returned by the fuzzy matcher.
+        Eg. a match between two string with a ratio of 90 and cutoff 95 would not be returned by the matcher.
+    candidates : list(tuple)
+        List of tuples in the form [(start_pos, end_pos)] indicating the position of the candidate segments in the text.
+    Returns
+    -------
+    matched_text : dict
+        Dictionary of title to list of tuples of the form ('detected reference', 'start position', 'end position', 'similarity')
+    """
+    groups = _group_titles(titles, nlp)
+
+    candidates_by_year: dict[str, list[tuple[int, int]]] = {}
+    for position, (_, end) in enumerate(candidates or []):
+        candidates_by_year.setdefault(docobj[end - 1 : end].text, []).append((position, end))
+
+    matches_by_candidate: dict[str, dict[int, list[tuple]]] = {title: {} for title in titles}
+    for (year, act_span, query_len), group in groups.items():
+        flex = query_len // 2
+        min_r1 = min(MIN_R1, cutoff) if flex else cutoff
+        thresh = max(100, cutoff)
+
+        # get every chunk of the segments in judgment that contain candidate references of that year
+        chunks = []
+        chunk_texts = []
+        for position, end in candidates_by_year.get(year, []):
+            # a negative start would wrap around to the end of the judgement
+            segment = docobj[max(end - act_span, 0) : end - 1]
+            for start in range(len(segment) - query_len + 1):
+                chunks.append((position, end, segment, start))
+                chunk_texts.append(segment[start : start + query_len].text.lower())
+        if not chunk_texts:
+            continue
+
+        # score every act of the group against every chunk at once
+        scores = process.cdist(
+            [query for _, query in group],
+            chunk_texts,
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=max(min_r1, 1),
+            dtype=np.float64,
+        )
+
+        for row, (title, query) in enumerate(group):
+            # potential matches of the act, by candidate, then by start position in its segment
+            potential_matches: dict[int, tuple[int, Any, dict[int, int]]] = {}
+            for column in np.flatnonzero(scores[row]):
+                position, end, segment, start = chunks[column]
+                potential_matches.setdefault(position, (end, segment, {}))[2][start] = round(float(scores[row, column]))
+
+            for position, (end, segment, starts) in potential_matches.items():
+                optimized = [
+                    _optimize_fuzzy_match(query, query_len, segment, start, ratio, flex, thresh)
+                    for start, ratio in starts.items()
+                ]
+                segment_matches = _filter_overlapping_matches([match for match in optimized if match[2] >= cutoff])
+                matches_by_candidate[title][position] = [
+                    (docobj[end - 1 - e + s : end].text, end - 1 - e + s, end, ratio) for s, e, ratio in segment_matches
+                ]
+
+    return {
+        title: [match for position in sorted(matches) for match in matches[position]]
+        for title, matches in matches_by_candidate.items()
+    }
+
+
 def fuzzy_matcher(title, docobj, nlp, cutoff, candidates=None):
     """
-    Detects legislation in body of judgement by searching the candidate segments for similar matches of the title by running a fuzzy matcher.
+    Detects legislation in body of judgement by searching the candidate segments for similar matches of the title.
     Parameters
     ----------
     title : string
@@ -197,22 +439,7 @@ def fuzzy_matcher(title, docobj, nlp, cutoff, candidates=None):
     matched_text : list(tuple)
         List of tuples of the form ('detected reference', 'start position', 'end position', 'similarity')
     """
-    # split the year refernce from the act title
-    act, year = title[:-4], title[-4:]
-    # get the span of the act title to be searched
-    act_span = len(nlp(title)) + PAD
-    all_matches = []
-    for _, end in candidates:
-        # get segment in judgment that contains candidate reference
-        segment = nlp(docobj[end - act_span : end - 1].text)
-        dyear = docobj[end - 1 : end].text
-        # fuzzy match act with segment
-        matches = search_for_act_fuzzy(act, segment, nlp, cutoff=cutoff)
-        if (len(matches) > 0) & (dyear == year):
-            all_matches.extend(
-                [(docobj[end - 1 - e + s : end].text, end - 1 - e + s, end, ratio) for text, s, e, ratio in matches],
-            )
-    return all_matches
+    return fuzzy_match_titles([title], docobj, nlp, cutoff, candidates)[title]
 
 
 def detect_candidates(nlp, docobj):
@@ -236,7 +463,7 @@ def detect_candidates(nlp, docobj):
     return [(start, end) for _, start, end in matches]
 
 
-def lookup_pipe(titles, docobj, nlp, method, conn, cutoff):
+def lookup_pipe(titles, docobj, nlp, method, legislation_index: LegislationIndex, cutoff, phrase_matcher=None):
     """
     Executes the 'method' matcher againt the judgement body to detect legislations.
     Parameters
@@ -249,11 +476,13 @@ def lookup_pipe(titles, docobj, nlp, method, conn, cutoff):
         English NLP module.
     method : function
         Function specifying which matcher to execute (fuzzy or exact).
-    conn : database connection
-        Database connection to the legislation look-up table.
+    legislation_index : LegislationIndex
+        In-memory index of the legislation look-up table.
     cutoff : int
         Value to determine the level of similarity of matches to be returned by the fuzzy matcher.
         Eg. a match between two string with a ratio of 90 and cutoff 95 would not be returned by the matcher.
+    phrase_matcher : spacy.matcher.PhraseMatcher
+        Prebuilt phrase matcher holding the titles to be matched exactly, see `build_exact_matcher`.
     Returns
     -------
     results : list(dict)
@@ -266,16 +495,23 @@ def lookup_pipe(titles, docobj, nlp, method, conn, cutoff):
             'confidence'(int): 'matching similarity between detected_ref and ref'}
     """
     results: dict[str, list[Any]] = {}
-    # get candidate segments matching the pattern [Act YYYY]
-    candidates = detect_candidates(nlp, docobj) if method.__name__ == "fuzzy_matcher" else None
+    if method.__name__ == "fuzzy_matcher":
+        # get candidate segments matching the pattern [Act YYYY], and match all the titles against them at once
+        candidates = detect_candidates(nlp, docobj)
+        matches_by_title = fuzzy_match_titles(titles, docobj, nlp, cutoff, candidates)
+    elif method.__name__ == "exact_matcher":
+        # scan the judgement once for all the titles
+        matches_by_title = exact_match_titles(titles, docobj, nlp, phrase_matcher)
+    else:
+        matches_by_title = {title: method(title, docobj, nlp, cutoff) for title in titles}
     # for every legislation title in the table
-    for title in nlp.pipe(titles, batch_size=100):
+    for title in titles:
         # detect legislation in the judgement body
-        matches = method(title.text, docobj, nlp, cutoff, candidates)
+        matches = matches_by_title[title]
         if matches:
-            # pull relevant information from database and append to detected reference
-            href = get_hrefs(conn, title.text)
-            canonical = get_canonical_leg(conn, title.text)
+            # pull relevant information from the look-up table and append to detected reference
+            legislation = legislation_index[title]
+            href, canonical = legislation.ref, legislation.citation
             matches_with_refs = []
             for match in matches:
                 match_list = list(match)
@@ -283,7 +519,7 @@ def lookup_pipe(titles, docobj, nlp, method, conn, cutoff):
                 match_list.append(canonical)
                 match = tuple(match_list)
                 matches_with_refs.append(match)
-            results[title.text] = results.get(title.text, []) + matches_with_refs
+            results[title] = results.get(title, []) + matches_with_refs
     return results
 
 
@@ -316,35 +552,50 @@ def detect_year_span(docobj, nlp):
 methods = {"exact": exact_matcher, "fuzzy": fuzzy_matcher}
 
 
-def leg_pipeline(leg_titles, nlp, docobj, conn):
+def leg_references(legislation_index: LegislationIndex, nlp, docobj, phrase_matcher=None):
     """
-    Merges dictionary results of fuzzy and exact matching functions
+    Merges dictionary results of fuzzy and exact matching functions, keeping where each reference was detected,
+    and reports how many were detected. See `detect_leg_references`.
+    """
+    references = detect_leg_references(legislation_index, nlp, docobj, phrase_matcher)
+    print(f"Found {len(references)} legislation replacements")
+    return references
+
+
+def detect_leg_references(legislation_index: LegislationIndex, nlp, docobj, phrase_matcher=None, dates=None):
+    """
+    Merges dictionary results of fuzzy and exact matching functions, keeping where each reference was detected
     Parameters
     ----------
-    leg_titles: list(string)
-        List of legislation titles.
+    legislation_index: LegislationIndex
+        In-memory index of the legislation look-up table.
     nlp : spacy.English
     English NLP module.
     docobj : spacy.Doc
         The body of the judgement.
-    conn : database connection
-        Database connection to the legislation look-up table.
+    phrase_matcher : spacy.matcher.PhraseMatcher
+        Prebuilt phrase matcher holding every title of the look-up table to be matched exactly.
+        If omitted, one is built for the titles of the years detected in the judgement.
+    dates : set(int)
+        Years whose titles are looked for, such as those of the whole judgement when `docobj` is a part of it.
+        If omitted, the years detected in `docobj`.
     Returns
     -------
-    List[Tuple[Str, Str, Str]], of merged results of both matchers to list of tupled references
+    List[DetectedReference], of the character offsets of every detected reference in the judgement body
+        and its replacement tuple of
         'detected_ref'(string): 'detected reference in the judgement body',
         'ref'(string): 'matched legislation title',
         'canonical'(string): 'canonical form of legislation act'
     """
     result_list = []
-    dates = detect_year_span(docobj, nlp)
-    # filter the legislation list down to the years detected above
-    titles = leg_titles[leg_titles.year.isin(dates)]
+    if dates is None:
+        dates = detect_year_span(docobj, nlp)
 
     for fuzzy, method in zip([True, False], ("fuzzy", "exact"), strict=False):
-        # select the titles relevant to the approach to be run using the 'for_fuzzy' flag already built into the look-up table
-        relevant_titles = titles[titles.for_fuzzy == fuzzy].candidate_titles.drop_duplicates().tolist()
-        res = lookup_pipe(relevant_titles, docobj, nlp, methods[method], conn, CUTOFF)
+        # select the titles of the years detected above relevant to the approach to be run,
+        # using the 'for_fuzzy' flag already built into the look-up table
+        relevant_titles = legislation_index.candidate_titles(dates, fuzzy)
+        res = lookup_pipe(relevant_titles, docobj, nlp, methods[method], legislation_index, CUTOFF, phrase_matcher)
         result_list.append(res)
 
     # merges the results of both matchers to return a single list of detected references
@@ -355,14 +606,35 @@ def leg_pipeline(leg_titles, nlp, docobj, conn):
     results = {k: [dict(zip(keys, j, strict=False)) for j in v] for k, v in results.items()}
     refs = [i for j in results.values() for i in j]
 
-    # keys_to_extract = {'detected_ref', 'ref'}
-    replacements = []
+    references = []
     for ref in refs:
-        detected_ref = ref["detected_ref"]
-        href = ref["ref"]
-        canonical_form = ref["canonical"]
-        replacement = leg(detected_ref, href, canonical_form)
-        replacements.append(replacement)
-    print(f"Found {len(replacements)} legislation replacements")
-
-    return replacements
+        # start and end are token positions, the replacer needs character offsets
+        span = docobj[ref["start"] : ref["end"]]
+        replacement = leg(ref["detected_ref"], ref["ref"], ref["canonical"])
+        references.append(DetectedReference(span.start_char, span.end_char, replacement))
+
+    return references
+
+
+def leg_pipeline(legislation_index: LegislationIndex, nlp, docobj, phrase_matcher=None):
+    """
+    Merges dictionary results of fuzzy and exact matching functions
+    Parameters
+    ----------
+    legislation_index: LegislationIndex
+        In-memory index of the legislation look-up table.
+    nlp : spacy.English
+    English NLP module.
+    docobj : spacy.Doc
+        The body of the judgement.
+    phrase_matcher : spacy.matcher.PhraseMatcher
+        Prebuilt phrase matcher holding every title of the look-up table to be matched exactly.
+        If omitted, one is built for the titles of the years detected in the judgement.
+    Returns
+    -------
+    List[Tuple[Str, Str, Str]], of merged results of both matchers to list of tupled references
+        'detected_ref'(string): 'detected reference in the judgement body',
+        'ref'(string): 'matched legislation title',
+        'canonical'(string): 'canonical form of legislation act'
+    """
+    return [reference.replacement for reference in leg_references(legislation_index, nlp, docobj, phrase_matcher)]
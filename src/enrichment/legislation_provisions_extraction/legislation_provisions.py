@@ -14,23 +14,97 @@ To do:
 """
 
 import re
-from typing import Any
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Sequence
+from typing import Any, overload
+from xml.sax.saxutils import unescape
 
 import numpy as np
 from bs4 import BeautifulSoup, Tag
 
 from utils.custom_types import DocumentAsXMLString
+from utils.judgment_document import JudgmentDocument, element_markup
 from utils.proper_xml import create_tag_string
 
-SectionDict = dict[str, list[Any]]  # this is a guess
-
 THR = 30
+# paragraphs with fewer section and legislation pairs than this are matched without numpy
+NUMPY_PAIRS = 64
 keys = ["detected_ref", "ref_para", "ref_position", "ref_tag"]
 patterns = {
     "legislation": r"<ref(((?!ref>).)*)type=\"legislation\"(.*?)ref>",
     "section": r"([sS]ection\W*[0-9]+(?=)|[sS]ections\W*[0-9]+(?=)|\b[sS]+\W*[0-9]+(?=))(\W*\([0-9]+\))?",
     "sub_section": r"\([0-9]+\)",
 }
+REF_START_TAG = re.compile(r"""<ref((?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*)\s*/?>""")
+ATTRIBUTE = re.compile(r"""([^\s=/>]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+UNREADABLE_ATTRIBUTE_VALUE = re.compile(r"[<\t\n\r]|&(?!(?:amp|lt|gt|quot|apos);)")
+
+
+class SectionDefinitions(Sequence[dict[str, Any]]):
+    """
+    The definitions of a section in a judgment, in the order they were found, indexed by paragraph
+    number and by position to find the correct one for a reference to the section without scanning them all.
+    """
+
+    def __init__(self, definitions: Iterable[dict[str, Any]] = ()) -> None:
+        self._definitions: list[dict[str, Any]] = []
+        # distinct paragraph numbers and positions, sorted, and the first definition and number of definitions of each
+        self._paragraph_numbers: list[int] = []
+        self._first_in_paragraph: dict[int, int] = {}
+        self._paragraph_counts: dict[int, int] = {}
+        self._positions: list[int] = []
+        self._first_at_position: dict[int, int] = {}
+        for definition in definitions:
+            self.append(definition)
+
+    @overload
+    def __getitem__(self, index: int) -> dict[str, Any]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[dict[str, Any]]: ...
+
+    def __getitem__(self, index: int | slice) -> dict[str, Any] | list[dict[str, Any]]:
+        return self._definitions[index]
+
+    def __len__(self) -> int:
+        return len(self._definitions)
+
+    def append(self, definition: dict[str, Any]) -> None:
+        index = len(self._definitions)
+        self._definitions.append(definition)
+        para_number = definition["para_number"]
+        position = definition["section_position"]
+        if para_number not in self._first_in_paragraph:
+            insort(self._paragraph_numbers, para_number)
+            self._first_in_paragraph[para_number] = index
+        self._paragraph_counts[para_number] = self._paragraph_counts.get(para_number, 0) + 1
+        if position not in self._first_at_position:
+            insort(self._positions, position)
+            self._first_at_position[position] = index
+
+    @staticmethod
+    def _closest(values: list[int], first_index: dict[int, int], target: int) -> int:
+        """The value closest to the target, or the one found first of two as close"""
+        index = bisect_left(values, target)
+        return min(values[max(index - 1, 0) : index + 1], key=lambda value: (abs(value - target), first_index[value]))
+
+    def closest(self, para_number: int, position: int) -> dict[str, Any]:
+        """
+        The definition in the closest paragraph to a reference to the section, or if there are several in that
+        paragraph, the definition closest to the position of the reference
+        :param para_number: the number of the paragraph of the reference
+        :param position: the position of the reference in its paragraph
+        :returns: the definition of the section
+        """
+        closest_para_number = self._closest(self._paragraph_numbers, self._first_in_paragraph, para_number)
+        if self._paragraph_counts[closest_para_number] == 1:
+            return self._definitions[self._first_in_paragraph[closest_para_number]]
+        # relies on position within a paragraph if the section is redefined within the paragraph.
+        closest_position = self._closest(self._positions, self._first_at_position, position)
+        return self._definitions[self._first_at_position[closest_position]]
+
+
+SectionDict = dict[str, SectionDefinitions | list[Any]]
 
 
 def detect_reference(text, etype="legislation"):
@@ -51,6 +125,14 @@ def find_closest_legislation(legislations, sections, thr=30):
     :param sections: list of section references found in the paragraph, and their location
     :returns sections_to_leg: (section, legislation, sect_starting_position)
     """
+    if len(sections) * len(legislations) < NUMPY_PAIRS:
+        return [
+            (section, legislation, section_position[0])
+            for section_position, section in sections
+            for legislation_position, legislation in legislations
+            if _distance(section_position, legislation_position) < thr
+        ]
+
     # gets positions of refs
     sec_pos = np.asarray([x[0] for x in sections])
     leg_pos = np.asarray([x[0] for x in legislations])
@@ -71,6 +153,41 @@ def find_closest_legislation(legislations, sections, thr=30):
     return section_to_leg
 
 
+def _distance(section_position: tuple[int, int], legislation_position: tuple[int, int]) -> int:
+    """The number of characters between a section and a legislation reference, 0 if they overlap"""
+    return max(section_position[0] - legislation_position[1], 0) + max(legislation_position[0] - section_position[1], 0)
+
+
+def read_ref_attributes(full_ref: str) -> dict[str, str] | None:
+    """
+    Reads the attributes of a <ref> tag from its start tag, as BeautifulSoup reads them from the tag on its own:
+    the prefix of an attribute is left out unless the ref declares it.
+    :param full_ref: the <ref> tag
+    :returns attributes: the attributes of the tag, or None if they cannot be read without parsing it
+    """
+    start_tag = REF_START_TAG.match(full_ref)
+    if not start_tag:
+        return None
+    attributes = [
+        (name, double_quoted or single_quoted)
+        for name, double_quoted, single_quoted in ATTRIBUTE.findall(start_tag.group(1))
+    ]
+    declarations = {name: value for name, value in attributes if name == "xmlns" or name.startswith("xmlns:")}
+    # BeautifulSoup names an attribute after one of the prefixes of its namespace
+    if len(set(declarations.values())) < len(declarations):
+        return None
+    declared = {"xml"} | {name.partition(":")[2] for name in declarations}
+    read_attributes: dict[str, str] = {}
+    for name, value in attributes:
+        prefix, _, local_name = name.rpartition(":")
+        key = name if not prefix or prefix in declared or prefix == "xmlns" else local_name
+        # attributes read under the same name, or values a parser would normalise or reject
+        if key in read_attributes or ":" in prefix or UNREADABLE_ATTRIBUTE_VALUE.search(value):
+            return None
+        read_attributes[key] = unescape(value, {"&quot;": '"', "&apos;": "'"})
+    return read_attributes
+
+
 def get_clean_section_number(section: str) -> str:
     """
     Cleans just the section number.
@@ -92,13 +209,16 @@ def save_section_to_dict(section_dict, para_number, clean_section_dict):
     # for each section found in the paragraph
     for section, full_ref, pos in section_dict:
         section_number = get_clean_section_number(section)
-        soup = BeautifulSoup(full_ref, "xml")
-        ref = soup.find("ref")
-        if not isinstance(ref, Tag):
-            msg = "Did not successfully get <ref> tag"
-            raise TypeError(msg)
-        canonical = ref.get("canonical")  # get the legislation canonical form
-        leg_href = ref.get("href")  # get the legislation href
+        attributes = read_ref_attributes(full_ref)
+        if attributes is None:
+            soup = BeautifulSoup(full_ref, "xml")
+            ref = soup.find("ref")
+            if not isinstance(ref, Tag):
+                msg = "Did not successfully get <ref> tag"
+                raise TypeError(msg)
+            attributes = {key: str(value) for key, value in ref.attrs.items()}
+        canonical = attributes.get("canonical")  # get the legislation canonical form
+        leg_href = attributes.get("href")  # get the legislation href
         section_href = str(leg_href) + "/section/" + str(section_number)  # creates the section href
         clean_section = "section " + str(section_number)
 
@@ -111,14 +231,14 @@ def save_section_to_dict(section_dict, para_number, clean_section_dict):
             "section_position": pos,
             "section_href": section_href,
             "section_canonical": sub_canonical,
-            "ref": ref,
+            "ref": full_ref,
             "leg_href": leg_href,
             "canonical": canonical,
         }
 
         # isn't currently in the master dictionary
         if clean_section not in clean_section_dict:
-            clean_section_dict[clean_section] = [new_definition]
+            clean_section_dict[clean_section] = SectionDefinitions([new_definition])
 
         else:
             # if it is, add the new definition to the list of definitions attached to the section. This means it has been re-defined at a later paragraph.
@@ -185,19 +305,10 @@ def get_correct_section_def(section_matches, cur_para_number, cur_pos):
     :param section_matches: list of dictionaries that include where that section has been redefined
     :param para_number: the number of the paragraph in the judgment
     """
-    pos_refs = np.asarray([(match["para_number"], match["section_position"]) for match in section_matches])
-    para_numbers = pos_refs[:, 0]
-
+    if not isinstance(section_matches, SectionDefinitions):
+        section_matches = SectionDefinitions(section_matches)
     # Get the closest paragraph with a previous mention of the match
-    idx = (np.abs(para_numbers - cur_para_number)).argmin()
-    candidates = [match for match in section_matches if match["para_number"] == para_numbers[idx]]
-    if len(candidates) == 1:
-        return candidates[0]
-    else:
-        # same as above; relies on position within a paragraph if the section is redefined within the paragraph.
-        positions = pos_refs[:, 1]
-        idx = (np.abs(positions - cur_pos)).argmin()
-        return next(match for match in section_matches if match["section_position"] == positions[idx])
+    return section_matches.closest(cur_para_number, cur_pos)
 
 
 def provision_resolver(section_dict, matches, para_number):
@@ -257,22 +368,53 @@ def provisions_pipeline(file_data: DocumentAsXMLString) -> list:
     :param file_data: file path of the judgment
     :returns resolved_refs: list of dictionaries with the information for the replacements in each section
     """
-    soup = BeautifulSoup(file_data, "xml")
-    text = soup.find_all("p")
-    section_dict: SectionDict = {}
-    resolved_refs = []
+    document = JudgmentDocument.parse(file_data)
+    return resolve_provisions([element_markup(paragraph) for paragraph in document.paragraphs()])
+
+
+class ProvisionResolver:
+    """
+    Matches the sections in a judgment to the correct legislation one paragraph at a time, in order, keeping
+    the sections defined in the paragraphs before.
+    """
+
+    def __init__(self) -> None:
+        self.section_dict: SectionDict = {}
+
+    def resolve(self, paragraph_number: int, line: str, legislations: list | None = None) -> list:
+        """
+        Matches the sections in the next paragraph of the judgment to the correct legislation and provides necessary information for the replacements.
+        :param paragraph_number: number of the paragraph in the judgment
+        :param line: markup of the paragraph
+        :param legislations: legislation references detected in the markup of the paragraph, if they have been already
+        :returns resolved_refs: list of dictionaries with the information for the replacements in each section
+        """
+        sections = detect_reference(line, "section")
+        if not sections:
+            return []
 
-    for cur_para_number, line in enumerate(text):
-        sections = detect_reference(str(line), "section")
-        if sections:
-            legislations = detect_reference(str(line))
-            if legislations:
-                section_to_leg_matches = find_closest_legislation(legislations, sections, THR)
+        if legislations is None:
+            legislations = detect_reference(line)
+        if legislations:
+            section_to_leg_matches = find_closest_legislation(legislations, sections, THR)
 
-                # create the master section dictionary with relevant leg links
-                section_dict = save_section_to_dict(section_to_leg_matches, cur_para_number, section_dict)
+            # create the master section dictionary with relevant leg links
+            self.section_dict = save_section_to_dict(section_to_leg_matches, paragraph_number, self.section_dict)
+
+        # resolve sections to legislations
+        return provision_resolver(self.section_dict, sections, paragraph_number)
+
+
+def resolve_provisions(paragraphs: list[str]) -> list:
+    """
+    Matches all sections in the paragraphs of a judgment to the correct legislation and provides necessary information for the replacements.
+    :param paragraphs: markup of every paragraph of the judgment, in order
+    :returns resolved_refs: list of dictionaries with the information for the replacements in each section
+    """
+    resolver = ProvisionResolver()
+    resolved_refs = []
 
-            # resolve sections to legislations
-            resolved_refs.extend(provision_resolver(section_dict, sections, cur_para_number))
+    for cur_para_number, line in enumerate(paragraphs):
+        resolved_refs.extend(resolver.resolve(cur_para_number, line))
 
     return resolved_refs
@@ -20,12 +20,15 @@ The pipeline returns a dictionary containing the detected oblique reference, its
 """
 
 import re
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Sequence
 from typing import TypedDict
 
 from bs4 import BeautifulSoup
 
 from enrichment.replacer.second_stage_replacer import LegislationReferenceReplacement
-from utils.proper_xml import create_tag_string
+from utils.judgment_document import JudgmentDocument, MarkupMap, element_text, markup_map, qualified_attributes
+from utils.proper_xml import create_tag_string, qualified_name
 
 LegislationReference = tuple[tuple[int, int], str]
 
@@ -63,28 +66,82 @@ def detect_reference(text: str, etype: str) -> list[LegislationReference]:
     return references
 
 
+class PrecedingLegislationIndex:
+    """
+    The legislation references detected so far in a judgment, ordered by position, to match oblique
+    references against without scanning all of them for every oblique reference.
+    """
+
+    def __init__(self, legislation_dicts: Iterable[LegislationDict] = ()) -> None:
+        self._positions: list[tuple[int, int]] = []
+        self._first_at_position: dict[int, LegislationDict] = {}
+        self._first_of_year: dict[str, LegislationDict] = {}
+        self.extend(legislation_dicts)
+
+    def extend(self, legislation_dicts: Iterable[LegislationDict]) -> None:
+        """
+        Add legislation references to the index
+        :param legislation_dicts: legislation dictionaries, in document order
+        """
+        for legislation_dict in legislation_dicts:
+            insort(self._positions, (legislation_dict["para"], legislation_dict["para_pos"][0]))
+            self._first_at_position.setdefault(legislation_dict["para_pos"][0], legislation_dict)
+            self._first_of_year.setdefault(legislation_dict["year"], legislation_dict)
+
+    def first_of_year(self, year: str) -> LegislationDict | None:
+        """
+        The first legislation reference of a year
+        :param year: year of the legislation
+        :returns: matched legislation dictionary
+        """
+        return self._first_of_year.get(year)
+
+    def nearest_preceding(self, paragraph_number: int, position: int) -> LegislationDict | None:
+        """
+        The legislation reference closest before a position in the judgment
+        :param paragraph_number: paragraph number of the position
+        :param position: position in the paragraph
+        :returns: matched legislation dictionary
+        """
+        index = bisect_left(self._positions, (paragraph_number, position))
+        if index == 0:
+            return None
+        # the first reference at the same position in its paragraph, which need not be the closest one
+        return self._first_at_position[self._positions[index - 1][1]]
+
+
 def create_legislation_dict(
     legislation_references: list[LegislationReference],
     paragraph_number: int,
+    paragraph_markup: MarkupMap | None = None,
 ) -> list[LegislationDict]:
     """
     Create a dictionary containing metadata of the detected 'legislation' reference
     :param legislation_references: list of legislation references found in the judgment
         and their location
     :param paragraph_number: paragraph number the legislation reference was found in
+    :param paragraph_markup: markup map of the paragraph the references were found in, to read each
+        reference from its parsed element rather than parse it again
     :returns: list of legislation dictionaries
     """
     legislation_dicts: list[LegislationDict] = []
 
     for legislation_reference in legislation_references:
-        soup = BeautifulSoup(legislation_reference[1], "xml")
-        ref = soup.ref
-        if not ref:
-            continue
-        legislation_name = ref.text if not None else ""
-
-        href = ref.get("href")
-        canonical = ref.get("uk:canonical") or ref.get("canonical")
+        element = paragraph_markup.element_at(*legislation_reference[0]) if paragraph_markup else None
+        if element is None or qualified_name(element) != "ref":
+            soup = BeautifulSoup(legislation_reference[1], "xml")
+            ref = soup.ref
+            if not ref:
+                continue
+            legislation_name = ref.text if not None else ""
+
+            href = ref.get("href")
+            canonical = ref.get("uk:canonical") or ref.get("canonical")
+        else:
+            legislation_name = element_text(element)
+            attributes = qualified_attributes(element)
+            href = attributes.get("href")
+            canonical = attributes.get("uk:canonical") or attributes.get("canonical")
 
         if not isinstance(href, str):
             msg = f"Legislation reference {legislation_reference!r} does not have exactly one 'href', paragraph {paragraph_number}"
@@ -114,61 +171,44 @@ def _get_legislation_year(legislation_name: str) -> str:
     return legislation_year_match.group()
 
 
+def _legislation_index(
+    legislation_dicts: PrecedingLegislationIndex | Sequence[LegislationDict],
+) -> PrecedingLegislationIndex:
+    if isinstance(legislation_dicts, PrecedingLegislationIndex):
+        return legislation_dicts
+    return PrecedingLegislationIndex(legislation_dicts)
+
+
 def match_numbered_act(
     detected_numbered_act: LegislationReference,
-    legislation_dicts: list[LegislationDict],
+    legislation_dicts: PrecedingLegislationIndex | Sequence[LegislationDict],
 ) -> LegislationDict | None:
     """
     Match oblique references containing a year
     :param detected_numbered_act: detected oblique reference
-    :param legislation_dicts: list of legislation dictionaries
+    :param legislation_dicts: index or list of legislation dictionaries
     :returns: matched legislation dictionary
     """
     act_year_match = re.search(r"\d{4}", detected_numbered_act[1])
     if not act_year_match:
         return None
 
-    act_year = act_year_match.group(0)
-    for leg_dict in legislation_dicts:
-        if leg_dict["year"] == act_year:
-            return leg_dict
-    return None
+    return _legislation_index(legislation_dicts).first_of_year(act_year_match.group(0))
 
 
 def match_act(
     oblique_act: LegislationReference,
-    legislation_dicts: list[LegislationDict],
+    legislation_dicts: PrecedingLegislationIndex | Sequence[LegislationDict],
     paragraph_number: int,
 ) -> LegislationDict | None:
     """
     Match oblique references without a year
     :param detected_act: detected oblique reference
-    :param legislation_dicts: list of legislation dictionaries
+    :param legislation_dicts: index or list of legislation dictionaries
     :param paragraph_number: paragraph number the legislation reference was found in
     :returns: matched legislation dictionary
     """
-    oblique_act_para_pos = oblique_act[0][0]
-    eligible_legislation = [
-        leg_dict
-        for leg_dict in legislation_dicts
-        if (
-            leg_dict["para"] < paragraph_number
-            or (leg_dict["para"] == paragraph_number and leg_dict["para_pos"][0] < oblique_act_para_pos)
-        )
-    ]
-
-    if not eligible_legislation:
-        return None
-
-    legislation_to_match = eligible_legislation[-1]
-    legislation_to_match_position = legislation_to_match["para_pos"][0]
-
-    # TODO: filter because we could have multiple??? is this true or unneeded?
-    return next(
-        legislation
-        for legislation in eligible_legislation
-        if legislation["para_pos"][0] == legislation_to_match_position
-    )
+    return _legislation_index(legislation_dicts).nearest_preceding(paragraph_number, oblique_act[0][0])
 
 
 def create_section_ref_tag(replacement_dict: LegislationDict, match: str) -> str:
@@ -195,7 +235,7 @@ def create_section_ref_tag(replacement_dict: LegislationDict, match: str) -> str
 
 def get_replacements(
     detected_acts: list[LegislationReference],
-    legislation_dicts: list[LegislationDict],
+    legislation_dicts: PrecedingLegislationIndex | Sequence[LegislationDict],
     numbered_act: bool,
     replacements: list[LegislationReferenceReplacement],
     paragraph_number: int,
@@ -204,11 +244,12 @@ def get_replacements(
     Create replacement string for detected oblique reference
     :param detected_acts: detected oblique references
     :param numbered_act: detected numbered oblique reference
-    :param legislation_dicts: list of legislation dictionaries
+    :param legislation_dicts: index or list of legislation dictionaries
     :param replacements: list of replacements
     :param paragraph_number: paragraph number the legislation reference was found in
     :returns: list of replacements
     """
+    legislation_dicts = _legislation_index(legislation_dicts)
     for detected_act in detected_acts:
         match = detected_act[1]
         if numbered_act:
@@ -239,42 +280,79 @@ def get_oblique_reference_replacements_by_paragraph(
     :returns: list of dictionaries containing detected oblique
         references and replacement strings
     """
-    soup = BeautifulSoup(file_content, "xml")
-    paragraphs = soup.find_all("p")
-    all_replacements: list[LegislationReferenceReplacement] = []
-    all_legislation_dicts = []
+    document = JudgmentDocument.parse(file_content)
+    return get_oblique_reference_replacements([markup_map(paragraph) for paragraph in document.paragraphs()])
 
-    for paragraph_number, paragraph in enumerate(paragraphs):
+
+class ObliqueReferenceResolver:
+    """
+    Determines the oblique references of a judgment one paragraph at a time, in order, matching them against
+    the legislation references of the paragraphs before and of the paragraph itself.
+    """
+
+    def __init__(self) -> None:
+        self.legislation_index = PrecedingLegislationIndex()
+
+    def resolve(
+        self,
+        paragraph_number: int,
+        paragraph_markup: MarkupMap,
+        detected_legislation: list[LegislationReference] | None = None,
+    ) -> list[LegislationReferenceReplacement]:
+        """
+        Determines oblique references and replacement strings in the next paragraph of the judgment
+        :param paragraph_number: number of the paragraph in the judgment
+        :param paragraph_markup: markup map of the paragraph
+        :param detected_legislation: legislation references detected in the markup of the paragraph,
+            if they have been already
+        :returns: list of dictionaries containing detected oblique
+            references and replacement strings
+        """
+        paragraph = paragraph_markup.markup
         replacements: list[LegislationReferenceReplacement] = []
-        detected_legislation = detect_reference(str(paragraph), "legislation")
-        legislation_dicts = create_legislation_dict(detected_legislation, paragraph_number)
-        all_legislation_dicts.extend(legislation_dicts)
+        if detected_legislation is None:
+            detected_legislation = detect_reference(paragraph, "legislation")
+        legislation_dicts = create_legislation_dict(detected_legislation, paragraph_number, paragraph_markup)
+        self.legislation_index.extend(legislation_dicts)
 
-        detected_acts = detect_reference(str(paragraph), "act")
+        detected_acts = detect_reference(paragraph, "act")
         if detected_acts:
             replacements = get_replacements(
                 detected_acts,
-                all_legislation_dicts,
+                self.legislation_index,
                 False,
                 replacements,
                 paragraph_number,
             )
 
-        detected_numbered_acts = detect_reference(str(paragraph), "numbered_act")
+        detected_numbered_acts = detect_reference(paragraph, "numbered_act")
         if detected_numbered_acts:
             replacements = get_replacements(
                 detected_numbered_acts,
-                all_legislation_dicts,
+                self.legislation_index,
                 True,
                 replacements,
                 paragraph_number,
             )
 
-        all_replacements.extend(replacements)
+        for replacement in replacements:
+            print(
+                f"  => {replacement['detected_ref']} \t {replacement['ref_tag']} \t Paragraph: {replacement['ref_para']} \t Position: {replacement['ref_position']}",
+            )
 
-    for replacement in all_replacements:
-        print(
-            f"  => {replacement['detected_ref']} \t {replacement['ref_tag']} \t Paragraph: {replacement['ref_para']} \t Position: {replacement['ref_position']}",
-        )
+        return replacements
 
-    return all_replacements
+
+def get_oblique_reference_replacements(paragraphs: Sequence[MarkupMap]) -> list[LegislationReferenceReplacement]:
+    """
+    Determines oblique references and replacement strings in the paragraphs of a judgment
+    :param paragraphs: markup map of every paragraph of the judgment, in order
+    :returns: list of dictionaries containing detected oblique
+        references and replacement strings
+    """
+    resolver = ObliqueReferenceResolver()
+    return [
+        replacement
+        for paragraph_number, paragraph_markup in enumerate(paragraphs)
+        for replacement in resolver.resolve(paragraph_number, paragraph_markup)
+    ]
@@ -13,6 +13,8 @@ from utils.custom_types import (
     Replacement,
     XMLFragmentAsString,
 )
+from utils.proper_xml import namespaces
+from utils.source_map import document_text_nodes
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.DEBUG)
@@ -45,6 +47,13 @@ xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">
 </xsl:stylesheet>
 """
 
+SANITIZE_NAMESPACES = {"akn": namespaces[None], "uk": namespaces["uk"]}
+OLD_ENRICHMENT_REFERENCES = "//akn:ref[@uk:origin='TNA' or not(@uk:origin)]"
+OLD_ENRICHMENT_METADATA = "//*[local-name()='FRBRdate'][@name='tna-enriched'] | //uk:tna-enrichment-engine"
+UNWRAPPED_TAG = f"{{{namespaces['uk']}}}unwrapped-reference"
+DELETED_TAG = f"{{{namespaces['uk']}}}deleted-metadata"
+XML_WHITESPACE = " \t\r\n"
+
 
 def apply_replacements(content: XMLFragmentAsString, replacement_patterns: str) -> XMLFragmentAsString:
     """
@@ -98,14 +107,6 @@ def detect_reference(text: str, etype: Literal["legislation"]) -> Reference:
     return references
 
 
-def split_xml_declaration(content: str) -> tuple[str, str]:
-    match = re.match(r"\s*(<\?xml[^>]*\?>)", content)
-    if not match:
-        return "", content
-
-    return match.group(1), content[match.end() :].lstrip()
-
-
 def sanitize_judgment(file_content: DocumentAsXMLString) -> DocumentAsXMLString:
     file_content = _remove_old_enrichment_references(file_content)
 
@@ -135,6 +136,44 @@ def _remove_old_enrichment_references(
     return DocumentAsXMLString(lxml.etree.tostring(result).decode("utf-8"))
 
 
+def sanitize_document(root: lxml.etree._Element) -> None:
+    """
+    Remove the enrichment of previous runs from a parsed judgment, in place, like `sanitize_judgment`:
+    the ref tags created by enrichment or vCite are unwrapped, leaving their text, the enrichment metadata
+    is deleted, and so is the whitespace between elements.
+    :param root: root element of the judgment
+    """
+    for reference in root.xpath(OLD_ENRICHMENT_REFERENCES, namespaces=SANITIZE_NAMESPACES):
+        reference.tag = UNWRAPPED_TAG
+    lxml.etree.strip_tags(root, UNWRAPPED_TAG)
+
+    remove_enrichment_metadata(root)
+
+
+def remove_enrichment_metadata(root: lxml.etree._Element) -> None:
+    """
+    Delete the enrichment date and engine version stamped on a judgment by a previous run, in place
+    :param root: root element of the judgment
+    """
+    for element in root.xpath(OLD_ENRICHMENT_METADATA, namespaces=SANITIZE_NAMESPACES):
+        element.tag = DELETED_TAG
+    lxml.etree.strip_elements(root, DELETED_TAG, with_tail=False)
+
+
+def strip_whitespace_text(root: lxml.etree._Element) -> None:
+    """
+    Delete the text nodes made only of whitespace, in place, as `xsl:strip-space` does when sanitizing
+    :param root: root element of the judgment
+    """
+    for owner, is_tail in document_text_nodes(root):
+        text = owner.tail if is_tail else owner.text
+        if text is not None and not text.strip(XML_WHITESPACE):
+            if is_tail:
+                owner.tail = None
+            else:
+                owner.text = None
+
+
 def split_text_by_closing_header_tag(
     content: DocumentAsXMLString,
 ) -> tuple[XMLFragmentAsString, XMLFragmentAsString, XMLFragmentAsString]:
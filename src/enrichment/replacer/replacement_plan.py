@@ -0,0 +1,127 @@
+"""
+Replacer logic for first phase enrichment, by position.
+
+The extractors return the offsets in the judgment content text of the references they detected. Rather than
+searching the XML for the detected strings, each reference is located with the `SourceMap` of that text, and
+all of them are tagged from a single plan, sorted by position, in which no two replacements overlap.
+"""
+
+import logging
+from collections.abc import Callable, Iterable
+from typing import NamedTuple
+
+import lxml.etree
+
+from enrichment.replacer.replacer_pipeline import abbr_attributes, caselaw_attributes, leg_attributes
+from utils.custom_types import DetectedReference, Replacement
+from utils.proper_xml import expand_namespace, namespaces
+from utils.source_map import SourceMap, SourceSpan, TextNode, document_text_nodes
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+
+class PlannedReplacement(NamedTuple):
+    span: SourceSpan
+    tag: str
+    attributes: dict[str, str]
+
+
+def _header_text_nodes(root: lxml.etree._Element) -> set[TextNode]:
+    """
+    The text nodes up to the end of the first header element, which are not enriched.
+    A document without a header is enriched in full.
+    """
+    header = next(root.iter("{*}header"), None)
+    if header is None:
+        return set()
+
+    header_text_nodes = set()
+    end_of_header = TextNode(header, True)
+    for node in document_text_nodes(root):
+        if node == end_of_header:
+            break
+        header_text_nodes.add(node)
+    return header_text_nodes
+
+
+def build_replacement_plan(
+    source_map: SourceMap,
+    caselaw_references: Iterable[DetectedReference],
+    legislation_references: Iterable[DetectedReference],
+    abbreviation_references: Iterable[DetectedReference],
+) -> list[PlannedReplacement]:
+    """
+    Locate the detected references in the XML, and resolve the conflicts between them.
+
+    Case law citations take precedence over legislation references, which take precedence over abbreviations,
+    and earlier and then longer references over the others of the same type. A reference overlapping one that
+    takes precedence over it is dropped, and so is a reference in the header, or which is not in a single text node.
+    :param source_map: source map of the text the references were detected in
+    :param caselaw_references: detected case law citations
+    :param legislation_references: detected legislation references
+    :param abbreviation_references: detected abbreviations
+    :return: the replacements to make, sorted by position
+    """
+    header_text_nodes = _header_text_nodes(source_map.root)
+    planned: dict[TextNode, list[PlannedReplacement]] = {}
+
+    reference_types: list[tuple[str, Callable[[Replacement], dict[str, str]], Iterable[DetectedReference]]] = [
+        ("ref", caselaw_attributes, caselaw_references),
+        ("ref", leg_attributes, legislation_references),
+        ("abbr", abbr_attributes, abbreviation_references),
+    ]
+    for tag, attributes, references in reference_types:
+        for reference in sorted(references, key=lambda reference: (reference.start, -reference.end)):
+            span = source_map.locate(reference.start, reference.end)
+            if span is None or span.node in header_text_nodes:
+                continue
+            node_text = span.node.text or ""
+            if node_text[span.start : span.end] != reference.replacement[0]:
+                LOGGER.warning("Detected %r but found %r", reference.replacement[0], node_text[span.start : span.end])
+                continue
+            node_replacements = planned.setdefault(span.node, [])
+            if any(span.start < other.span.end and other.span.start < span.end for other in node_replacements):
+                continue
+            node_replacements.append(PlannedReplacement(span, tag, attributes(reference.replacement)))
+
+    return [
+        replacement
+        for node_replacements in planned.values()
+        for replacement in sorted(node_replacements, key=lambda replacement: replacement.span.start)
+    ]
+
+
+def apply_replacement_plan(root: lxml.etree._Element, plan: Iterable[PlannedReplacement]) -> None:
+    """
+    Tag the planned replacements in the XML, in place.
+
+    The tags are in the default namespace of the document, as they would be if written in its XML.
+    :param root: root element of the document the plan was built for
+    :param plan: replacements built by `build_replacement_plan`
+    """
+    namespace = root.nsmap.get(None)
+    by_node: dict[TextNode, list[PlannedReplacement]] = {}
+    for replacement in plan:
+        by_node.setdefault(replacement.span.node, []).append(replacement)
+
+    for node, replacements in by_node.items():
+        text = node.text or ""
+        # from the end of the text node, so the offsets of the replacements before stay valid
+        for replacement in sorted(replacements, key=lambda replacement: replacement.span.start, reverse=True):
+            _, start, end = replacement.span
+            element = lxml.etree.Element(lxml.etree.QName(namespace, replacement.tag), nsmap={"uk": namespaces["uk"]})
+            for attribute, value in replacement.attributes.items():
+                element.set(expand_namespace(attribute), value)
+            element.text = text[start:end]
+            element.tail = text[end:] or None
+            text = text[:start]
+            if node.is_tail:
+                node.owner.addnext(element)
+            else:
+                node.owner.insert(0, element)
+
+        if node.is_tail:
+            node.owner.tail = text or None
+        else:
+            node.owner.text = text or None
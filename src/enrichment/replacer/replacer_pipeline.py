@@ -7,7 +7,7 @@ import html
 import re
 
 from utils.custom_types import Replacement, XMLFragmentAsString
-from utils.proper_xml import create_tag_string, replace_string_with_tag
+from utils.proper_xml import create_tag_string, replace_strings_with_tags
 
 JUNK_REGEX = r"</judgment>\s*</akomaNtoso>\s*$"
 BAD = '="<'
@@ -19,7 +19,7 @@ def assert_not_bad(s):
         raise RuntimeError(msg)
 
 
-def _replace_string_with_tag_handling_junk(file_data, string, tag):
+def _replace_strings_with_tags_handling_junk(file_data, replacements):
     """The XML might contain </judgment></akomaNtoso> at the end; remove and replace if so."""
 
     junk = re.search(JUNK_REGEX, file_data)
@@ -30,7 +30,7 @@ def _replace_string_with_tag_handling_junk(file_data, string, tag):
         good = file_data
         tail = ""
 
-    new = replace_string_with_tag(XMLFragmentAsString(good), string, tag)
+    new = replace_strings_with_tags(XMLFragmentAsString(good), replacements)
     return new + tail
 
 
@@ -46,14 +46,12 @@ def fixed_year(year: str) -> str | None:
         return None
 
 
-def replacer_caselaw(file_data: XMLFragmentAsString, replacement: Replacement) -> XMLFragmentAsString:
+def caselaw_attributes(replacement: Replacement) -> dict[str, str]:
     """
-    String replacement in the XML
-    :param file_data: XML file
+    Attributes of the tag replacing a case law citation
     :param replacement: tuple of citation match and corrected citation
-    :return: enriched XML file data
+    :return: attributes of the ref tag
     """
-
     year = fixed_year(replacement[2])
     attribs = {
         "uk:type": "case",
@@ -64,10 +62,67 @@ def replacer_caselaw(file_data: XMLFragmentAsString, replacement: Replacement) -
     if year:
         attribs["uk:year"] = year
     attribs["uk:origin"] = "TNA"
+    return attribs
+
+
+def leg_attributes(replacement: Replacement) -> dict[str, str]:
+    """
+    Attributes of the tag replacing a legislation reference
+    :param replacement: tuple of legislation match, href and canonical form
+    :return: attributes of the ref tag
+    """
+    return {
+        "uk:type": "legislation",
+        "href": replacement[1],
+        "uk:canonical": replacement[2],
+        "uk:origin": "TNA",
+    }
+
+
+def abbr_attributes(replacement: Replacement) -> dict[str, str]:
+    """
+    Attributes of the tag replacing an abbreviation
+    :param replacement: tuple of abbreviation match and its long form
+    :return: attributes of the abbr tag
+    """
+    return {"title": replacement[1], "uk:origin": "TNA"}
+
+
+def caselaw_tag(replacement: Replacement) -> str:
+    """
+    Build the tag replacing a case law citation
+    :param replacement: tuple of citation match and corrected citation
+    :return: ref tag
+    """
+    return create_tag_string("ref", html.escape(replacement[0]), caselaw_attributes(replacement))
+
+
+def leg_tag(replacement: Replacement) -> str:
+    """
+    Build the tag replacing a legislation reference
+    :param replacement: tuple of legislation match, href and canonical form
+    :return: ref tag
+    """
+    return create_tag_string("ref", html.escape(replacement[0]), leg_attributes(replacement))
 
-    replacement_tag = create_tag_string("ref", html.escape(replacement[0]), attribs)
-    output = _replace_string_with_tag_handling_junk(file_data, replacement[0], replacement_tag)
 
+def abbr_tag(replacement: Replacement) -> str:
+    """
+    Build the tag replacing an abbreviation
+    :param replacement: tuple of abbreviation match and its long form
+    :return: abbr tag
+    """
+    return f'<abbr title="{replacement[1]}" uk:origin="TNA">{replacement[0]}</abbr>'
+
+
+def replacer_caselaw(file_data: XMLFragmentAsString, replacement: Replacement) -> XMLFragmentAsString:
+    """
+    String replacement in the XML
+    :param file_data: XML file
+    :param replacement: tuple of citation match and corrected citation
+    :return: enriched XML file data
+    """
+    output = _replace_strings_with_tags_handling_junk(file_data, [(replacement[0], caselaw_tag(replacement))])
     assert_not_bad(file_data)
     return output
 
@@ -79,14 +134,7 @@ def replacer_leg(file_data: XMLFragmentAsString, replacement: Replacement) -> XM
     :param replacement: tuple of citation match and corrected citation
     :return: enriched XML file data
     """
-    attribs = {
-        "uk:type": "legislation",
-        "href": replacement[1],
-        "uk:canonical": replacement[2],
-        "uk:origin": "TNA",
-    }
-    replacement_tag = create_tag_string("ref", html.escape(replacement[0]), attribs)
-    output = _replace_string_with_tag_handling_junk(file_data, replacement[0], replacement_tag)
+    output = _replace_strings_with_tags_handling_junk(file_data, [(replacement[0], leg_tag(replacement))])
     assert_not_bad(file_data)
     return output
 
@@ -98,13 +146,16 @@ def replacer_abbr(file_data: XMLFragmentAsString, replacement: Replacement) -> X
     :param replacement: tuple of citation match and corrected citation
     :return: enriched XML file data
     """
-    replacement_tag = f'<abbr title="{replacement[1]}" uk:origin="TNA">{replacement[0]}</abbr>'
-
-    output = _replace_string_with_tag_handling_junk(file_data, replacement[0], replacement_tag)
+    output = _replace_strings_with_tags_handling_junk(file_data, [(replacement[0], abbr_tag(replacement))])
     assert_not_bad(file_data)
     return output
 
 
+def _ordered_unique(replacements: list[Replacement]) -> list[Replacement]:
+    """Unique replacements, longest match first so it takes precedence over the matches it contains."""
+    return sorted(dict.fromkeys(replacements), key=lambda replacement: len(replacement[0]), reverse=True)
+
+
 def replacer_pipeline(
     file_data: XMLFragmentAsString,
     REPLACEMENTS_CASELAW: list[Replacement],
@@ -122,16 +173,14 @@ def replacer_pipeline(
 
     assert_not_bad(file_data)
 
-    for replacement in list(set(REPLACEMENTS_CASELAW)):
-        file_data = replacer_caselaw(file_data, replacement)
-    assert_not_bad(file_data)
-
-    for replacement in list(set(REPLACEMENTS_LEG)):
-        file_data = replacer_leg(file_data, replacement)
-    assert_not_bad(file_data)
+    # case law first, then legislation, then abbreviations: all applied in one pass over the XML
+    replacements = [(replacement[0], caselaw_tag(replacement)) for replacement in _ordered_unique(REPLACEMENTS_CASELAW)]
+    replacements += [(replacement[0], leg_tag(replacement)) for replacement in _ordered_unique(REPLACEMENTS_LEG)]
+    replacements += [(replacement[0], abbr_tag(replacement)) for replacement in _ordered_unique(REPLACEMENTS_ABBR)]
+    if not replacements:
+        return file_data
 
-    for replacement in list(set(REPLACEMENTS_ABBR)):
-        file_data = replacer_abbr(file_data, replacement)
+    file_data = _replace_strings_with_tags_handling_junk(file_data, replacements)
     assert_not_bad(file_data)
 
     return file_data
@@ -0,0 +1,95 @@
+"""
+Second phase enrichment in a single walk over the paragraphs of a judgment.
+Links oblique references and legislation provisions, detecting the legislation references of each paragraph once.
+"""
+
+from typing import NamedTuple
+
+import lxml.etree
+
+from enrichment.legislation_provisions_extraction.legislation_provisions import ProvisionResolver
+from enrichment.oblique_references.oblique_references import ObliqueReferenceResolver, detect_reference
+from enrichment.replacer.second_stage_replacer import LegislationReferenceReplacement, ParagraphPatcher
+from utils.judgment_document import JudgmentDocument, markup_map
+
+
+class SecondStageCounts(NamedTuple):
+    oblique_references: int
+    provisions: int
+
+
+def paragraph_groups(paragraphs: list[lxml.etree._Element]) -> list[list[int]]:
+    """
+    Numbers of the paragraphs of a judgment, grouped with the paragraphs nested in them, such as
+    the paragraphs of a footnote
+    :param paragraphs: the paragraphs of the judgment, in document order
+    :return: the numbers of each outermost paragraph and of the paragraphs inside it, in document order
+    """
+    paragraph_set = set(paragraphs)
+    groups: list[list[int]] = []
+    for paragraph_number, paragraph in enumerate(paragraphs):
+        if groups and any(ancestor in paragraph_set for ancestor in paragraph.iterancestors()):
+            groups[-1].append(paragraph_number)
+        else:
+            groups.append([paragraph_number])
+    return groups
+
+
+def link_second_stage_references(document: JudgmentDocument) -> SecondStageCounts:
+    """
+    Links the oblique references and the legislation provisions of a parsed judgment, in place
+
+    The provisions of a paragraph are resolved in its markup with its oblique references linked, which
+    count as legislation references for them, so each group of nested paragraphs has its oblique references
+    linked before its provisions are resolved. The markup of a paragraph is only written again, and its
+    legislation references detected again, when oblique references were linked in its group.
+    :param document: the parsed judgment
+    :return: number of oblique references and of provisions linked
+    """
+    paragraphs = document.paragraphs()
+    # the markup of every paragraph, before any of them is patched
+    paragraph_markup = [markup_map(paragraph) for paragraph in paragraphs]
+    detected_legislation = [detect_reference(markup.markup, "legislation") for markup in paragraph_markup]
+
+    oblique_resolver = ObliqueReferenceResolver()
+    provision_resolver = ProvisionResolver()
+    patcher = ParagraphPatcher(document)
+    counts = SecondStageCounts(0, 0)
+
+    for group in paragraph_groups(paragraphs):
+        oblique_references: list[LegislationReferenceReplacement] = [
+            replacement
+            for paragraph_number in group
+            for replacement in oblique_resolver.resolve(
+                paragraph_number,
+                paragraph_markup[paragraph_number],
+                detected_legislation[paragraph_number],
+            )
+        ]
+        if oblique_references:
+            patcher.patch_paragraphs(paragraphs, oblique_references)
+            for paragraph_number in group:
+                paragraph_markup[paragraph_number] = markup_map(paragraphs[paragraph_number])
+                detected_legislation[paragraph_number] = detect_reference(
+                    paragraph_markup[paragraph_number].markup,
+                    "legislation",
+                )
+
+        provisions: list[LegislationReferenceReplacement] = [
+            replacement
+            for paragraph_number in group
+            for replacement in provision_resolver.resolve(
+                paragraph_number,
+                paragraph_markup[paragraph_number].markup,
+                detected_legislation[paragraph_number],
+            )
+        ]
+        if provisions:
+            patcher.patch_paragraphs(paragraphs, provisions)
+
+        counts = SecondStageCounts(
+            counts.oblique_references + len(oblique_references),
+            counts.provisions + len(provisions),
+        )
+
+    return counts
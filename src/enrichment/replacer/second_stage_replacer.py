@@ -3,14 +3,21 @@ Replacer logic for second and third phase enrichment.
 Handles the replacements of oblique references and legislation provisions.
 """
 
+import copy
+import logging
 import re
-from collections.abc import Iterable
+from bisect import bisect_right
+from collections.abc import Iterator
 from itertools import groupby
 from typing import TypedDict
 
-from bs4 import BeautifulSoup, Tag
+import lxml.etree
 
-from utils.custom_types import DocumentAsXMLString
+from utils.judgment_document import JudgmentDocument, markup_map, unescape
+from utils.source_map import TextNode
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
 
 LegislationReference = tuple[tuple[int, int], str]
 
@@ -65,39 +72,123 @@ def replace_references(text: str, reference_replacements: list[LegislationRefere
     return enriched_text
 
 
-def create_replacement_paragraph(
-    paragraph_string: str,
-    paragraph_reference_replacements: Iterable[LegislationReferenceReplacement],
-) -> Tag:
-    replacement_paragraph_string = replace_references(paragraph_string, list(paragraph_reference_replacements))
-    wrapper = f'<xml xmlns:uk="placeholder">{replacement_paragraph_string}</xml>'
-    replacement_paragraph = BeautifulSoup(wrapper, "xml").p
-    if replacement_paragraph is None:
-        msg = f"No paragraphs found in {replacement_paragraph_string}"
-        raise RuntimeError(msg)
-    return replacement_paragraph
-
-
-def replace_references_by_paragraph(
-    file_data: BeautifulSoup,
+def _replacement_occurrences(
+    markup: str,
     reference_replacements: list[LegislationReferenceReplacement],
-) -> DocumentAsXMLString:
+) -> Iterator[tuple[int, int, str]]:
     """
-    Replaces references in the file_data xml by paragraph
-    :param file_data: XML file
-    :param reference_replacements: list of dict of detected references
-    :return: enriched XML file data string
+    The (start, end, ref_tag) of every occurrence of a detected reference that `replace_references` replaces in
+    the markup: each detected reference, at its position or after it, up to the position of the next one.
     """
+    reference_replacements = sorted(reference_replacements, key=lambda x: x["ref_position"])
+    positions = [reference_replacement["ref_position"] for reference_replacement in reference_replacements]
+    for index, reference_replacement in enumerate(reference_replacements):
+        detected_ref = reference_replacement["detected_ref"]
+        ref_tag = reference_replacement["ref_tag"]
+        if not isinstance(detected_ref, str) or not isinstance(ref_tag, str) or not detected_ref:
+            continue
+        chunk_end = positions[index + 1] if index + 1 < len(positions) else len(markup)
+        start = markup.find(detected_ref, positions[index], chunk_end)
+        while start != -1:
+            end = start + len(detected_ref)
+            yield start, end, ref_tag
+            start = markup.find(detected_ref, end, chunk_end)
 
-    def key_func(k: LegislationReferenceReplacement) -> int:
-        return k["ref_para"]
 
-    paragraphs = file_data.find_all("p")
-    ordered_reference_replacements = sorted(reference_replacements, key=key_func)
+class ParagraphPatcher:
+    """
+    Inserts the ref tags of the references replaced in paragraphs into their text nodes, parsing each
+    distinct ref tag once.
+    """
 
-    for paragraph_number, paragraph_reference_replacements in groupby(ordered_reference_replacements, key=key_func):
-        paragraph_string = str(paragraphs[paragraph_number])
-        paragraphs[paragraph_number].replace_with(
-            create_replacement_paragraph(paragraph_string, paragraph_reference_replacements),
-        )
-    return DocumentAsXMLString(str(file_data))
+    def __init__(self, document: JudgmentDocument) -> None:
+        self.document = document
+        self._tags: dict[tuple[str, tuple], lxml.etree._Element] = {}
+
+    def _tag(self, ref_tag: str, paragraph: lxml.etree._Element, scope: tuple) -> lxml.etree._Element:
+        key = (ref_tag, scope)
+        if key not in self._tags:
+            self._tags[key] = self.document.parse_fragment(ref_tag, paragraph)
+        return copy.deepcopy(self._tags[key])
+
+    def patch(
+        self,
+        paragraph: lxml.etree._Element,
+        reference_replacements: list[LegislationReferenceReplacement],
+    ) -> None:
+        """
+        Replace references in a paragraph in place, as `replace_references` replaces them in its markup.
+        An occurrence of a reference which is not in the text of the paragraph, such as in an attribute,
+        is not replaced.
+        """
+        markup, text_nodes, _ = markup_map(paragraph)
+        text_node_starts = [text_node.start for text_node in text_nodes]
+
+        by_node: dict[TextNode, list[tuple[int, int, str]]] = {}
+        for start, end, ref_tag in _replacement_occurrences(markup, reference_replacements):
+            index = bisect_right(text_node_starts, start) - 1
+            text_start, node, text_markup = text_nodes[index] if index >= 0 else (0, None, "")
+            if node is None or end > text_start + len(text_markup) or "&" in markup[start:end]:
+                LOGGER.warning("Detected %r outside the text of a paragraph", markup[start:end])
+                continue
+            # offsets in the text, from offsets in its escaped markup
+            text_offset = len(unescape(text_markup[: start - text_start]))
+            by_node.setdefault(node, []).append((text_offset, text_offset + end - start, ref_tag))
+
+        # the namespaces in scope, which the prefixes of the ref tags are resolved in
+        scope = tuple(sorted(paragraph.nsmap.items(), key=lambda item: item[0] or ""))
+        for node, occurrences in by_node.items():
+            text = node.text or ""
+            # from the end of the text node, so the offsets of the occurrences before stay valid
+            for start, end, ref_tag in reversed(occurrences):
+                element = self._tag(ref_tag, paragraph, scope)
+                element.tail = (element.tail or "") + text[end:] or None
+                text = text[:start]
+                if node.is_tail:
+                    node.owner.addnext(element)
+                else:
+                    node.owner.insert(0, element)
+            if node.is_tail:
+                node.owner.tail = text or None
+            else:
+                node.owner.text = text or None
+
+    def patch_paragraphs(
+        self,
+        paragraphs: list[lxml.etree._Element],
+        reference_replacements: list[LegislationReferenceReplacement],
+    ) -> None:
+        """
+        Replace references in paragraphs in place
+        :param paragraphs: the paragraphs of the judgment, as `JudgmentDocument.paragraphs` numbers them
+        :param reference_replacements: list of dict of detected references, positioned in the markup
+            of their paragraph as `element_markup` writes it
+        """
+
+        def key_func(k: LegislationReferenceReplacement) -> int:
+            return k["ref_para"]
+
+        ordered_reference_replacements = sorted(reference_replacements, key=key_func)
+        patched: set[lxml.etree._Element] = set()
+
+        for paragraph_number, paragraph_reference_replacements in groupby(ordered_reference_replacements, key=key_func):
+            paragraph = paragraphs[paragraph_number]
+            # the references of a paragraph inside one already patched were replaced with it
+            if any(ancestor in patched for ancestor in paragraph.iterancestors()):
+                continue
+            self.patch(paragraph, list(paragraph_reference_replacements))
+            patched.add(paragraph)
+
+
+def replace_references_in_document(
+    document: JudgmentDocument,
+    reference_replacements: list[LegislationReferenceReplacement],
+) -> None:
+    """
+    Replaces references in the paragraphs of a parsed judgment, in place
+    :param document: parsed judgment
+    :param reference_replacements: list of dict of detected references, numbering
+        the paragraphs as `JudgmentDocument.paragraphs` does, and positioned in their markup
+        as `element_markup` writes it
+    """
+    ParagraphPatcher(document).patch_paragraphs(document.paragraphs(), reference_replacements)
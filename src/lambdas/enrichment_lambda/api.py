@@ -1,62 +1,158 @@
+import gzip
 import json
 import logging
-from typing import Any
+import os
+import threading
+import time
+from typing import Any, NamedTuple
 
-import requests
 import urllib3
-from requests.auth import HTTPBasicAuth
 
-from utils.custom_types import APIEndpointBaseURL, DocumentAsXMLString
+from utils.custom_types import APIEndpointBaseURL, DocumentAsXMLBytes
+from utils.environment_helpers import positive_int_env_variable
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+# Timeouts of calls to the Privileged API, in seconds, unless set in the environment
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+# Idempotent calls (GET, PUT and DELETE) are retried with exponential backoff after connection errors and
+# responses with these statuses; a patch is never retried, as it unlocks the judgment once it succeeds.
+RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class CallMetrics(NamedTuple):
+    """Number of calls of one kind made to the API, and their latencies in seconds."""
+
+    calls: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def add(self, seconds: float) -> "CallMetrics":
+        return CallMetrics(self.calls + 1, self.total_seconds + seconds, max(self.max_seconds, seconds))
+
+
+class APIClient:
+    """
+    Client of the Privileged API, keeping its connections alive in one pool for the lifetime of the container.
+
+    Responses are requested gzipped. Request bodies are only gzipped when `gzip_requests` is set, as the
+    API has to accept them. The latency of every call is logged and added up by kind in `metrics`.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        retries: int = RETRIES,
+        backoff_factor: float = RETRY_BACKOFF_FACTOR,
+        gzip_requests: bool = False,
+    ) -> None:
+        self.gzip_requests = gzip_requests
+        self.metrics: dict[str, CallMetrics] = {}
+        # the records of a batch are enriched in several threads
+        self._metrics_lock = threading.Lock()
+        self.http = urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+            retries=urllib3.Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=urllib3.Retry.DEFAULT_ALLOWED_METHODS,
+                # a response with a retried status is returned once the retries run out, to be reported
+                raise_on_status=False,
+            ),
+        )
 
-def fetch_judgment(api_endpoint: APIEndpointBaseURL, query: str, username: str, password: str) -> DocumentAsXMLString:
-    http = urllib3.PoolManager()
-    url = f"{api_endpoint}judgment/{query}"
-    headers = urllib3.make_headers(basic_auth=username + ":" + password)
-    response = http.request("GET", url, headers=headers)
+    @classmethod
+    def from_environment(cls) -> "APIClient":
+        """
+        The client with the timeouts set in `API_CONNECT_TIMEOUT` and `API_READ_TIMEOUT`, in seconds,
+        gzipping request bodies if `API_GZIP_REQUESTS` is "true"
+        """
+        return cls(
+            connect_timeout=positive_int_env_variable("API_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=positive_int_env_variable("API_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+            gzip_requests=os.environ.get("API_GZIP_REQUESTS") == "true",
+        )
 
-    if response.status != 200:
+    def request(
+        self,
+        call: str,
+        method: str,
+        url: str,
+        username: str,
+        password: str,
+        body: bytes | None = None,
+    ) -> urllib3.BaseHTTPResponse:
+        """
+        Makes a call to the API, retrying it if it is idempotent
+        :param call: kind of call, such as "fetch", which its latency is recorded under
+        :param method: HTTP method
+        :param url: URL of the call
+        :param username: API username
+        :param password: API password
+        :param body: request body
+        :return: the response, with its body decompressed
+        """
+        headers = urllib3.make_headers(basic_auth=username + ":" + password, accept_encoding="gzip")
+        if body is not None and self.gzip_requests:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, url, headers=headers, body=body)
+        except urllib3.exceptions.HTTPError as exc:
+            message = f"Failed to {call} judgment at {url}: {exc}"
+            LOGGER.error(message)
+            raise RuntimeError(message) from exc
+        finally:
+            seconds = time.perf_counter() - start
+            with self._metrics_lock:
+                self.metrics[call] = self.metrics.get(call, CallMetrics()).add(seconds)
+
+        LOGGER.info("API %s call took %.3fs, status code: %s", call, seconds, response.status)
+        return response
+
+
+API_CLIENT = APIClient.from_environment()
+
+
+def _check_status(call: str, url: str, response: urllib3.BaseHTTPResponse, expected: tuple[int, ...]) -> None:
+    if response.status not in expected:
         message = (
-            f"Failed to fetch judgment from {url}, status code: {response.status}, response: {response.data.decode()}"
+            f"Failed to {call} judgment from {url}, status code: {response.status}, response: {response.data.decode()}"
         )
         LOGGER.error(message)
         raise RuntimeError(message)
 
+
+def fetch_judgment(api_endpoint: APIEndpointBaseURL, query: str, username: str, password: str) -> DocumentAsXMLBytes:
+    url = f"{api_endpoint}judgment/{query}"
+    response = API_CLIENT.request("fetch", "GET", url, username, password)
+    _check_status("fetch", url, response, (200,))
+
     LOGGER.info("Successfully fetched judgment at %s", query)
-    return DocumentAsXMLString(response.data.decode())
+    # UTF-8 encoded, as it is parsed and patched back
+    return DocumentAsXMLBytes(response.data)
 
 
 def lock_judgment(api_endpoint: APIEndpointBaseURL, query: str, username: str, password: str) -> None:
-    http = urllib3.PoolManager()
     url = f"{api_endpoint}lock/{query}?unlock=3600"
-    headers = urllib3.make_headers(basic_auth=username + ":" + password)
-    response = http.request("PUT", url, headers=headers)
-
-    if response.status != 201:
-        message = (
-            f"Failed to lock judgment from {url}, status code: {response.status}, response: {response.data.decode()}"
-        )
-        LOGGER.error(message)
-        raise RuntimeError(message)
+    response = API_CLIENT.request("lock", "PUT", url, username, password)
+    _check_status("lock", url, response, (201,))
 
     LOGGER.info("Judgment locked successfully")
 
 
 def unlock_judgment(api_endpoint: APIEndpointBaseURL, query: str, username: str, password: str) -> None:
-    http = urllib3.PoolManager()
     url = f"{api_endpoint}lock/{query}"
-    headers = urllib3.make_headers(basic_auth=username + ":" + password)
-    response = http.request("DELETE", url, headers=headers)
-
-    if response.status not in (200, 204):
-        message = (
-            f"Failed to unlock judgment from {url}, status code: {response.status}, response: {response.data.decode()}"
-        )
-        LOGGER.error(message)
-        raise RuntimeError(message)
+    response = API_CLIENT.request("unlock", "DELETE", url, username, password)
+    _check_status("unlock", url, response, (200, 204))
 
     LOGGER.info("Judgment unlocked successfully")
 
@@ -64,25 +160,16 @@ def unlock_judgment(api_endpoint: APIEndpointBaseURL, query: str, username: str,
 def patch_judgment(
     api_endpoint: APIEndpointBaseURL,
     document_uri: str,
-    data: str,
+    data: bytes,
     username: str,
     password: str,
 ) -> None:
-    response = requests.patch(
-        f"{api_endpoint}judgment/{document_uri}",
-        auth=HTTPBasicAuth(username, password),
-        data=data.encode(),
-        params={"unlock": True},
-        timeout=10,
-    )
-    try:
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as exc:
-        message = (
-            f"Failed to patch judgment {document_uri}, status code: {response.status_code}, response: {response.text}"
-        )
+    url = f"{api_endpoint}judgment/{document_uri}?unlock=True"
+    response = API_CLIENT.request("patch", "PATCH", url, username, password, body=data)
+    if not 200 <= response.status < 300:
+        message = f"Failed to patch judgment {document_uri}, status code: {response.status}, response: {response.data.decode()}"
         LOGGER.error(message)
-        raise RuntimeError(message) from exc
+        raise RuntimeError(message)
 
 
 def read_message(message_dict: dict[Any, Any]) -> tuple[str, str]:
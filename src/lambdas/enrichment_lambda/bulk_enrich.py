@@ -0,0 +1,221 @@
+"""
+Enrich a directory of judgments offline, such as to enrich a corpus again after the rules have changed.
+
+The citation rules are read from a local file and the lookup tables from local files or a local database, so the
+enrichment makes no network calls: nothing is fetched from or sent to the API, S3 or Secrets Manager. The judgments
+are enriched in a pool of worker processes, each loading the models once and then enriching judgment after
+judgment. Every judgment is written to the same relative path under the output directory, along with the timing
+of each judgment (`timings.csv`) and the throughput of the run (`summary.json`).
+
+    python -m lambdas.enrichment_lambda.bulk_enrich INPUT_DIR OUTPUT_DIR [--rules PATH]
+        [--manifest PATH --legislation PATH | --database DSN] [--workers N] [--model NAME]
+"""
+
+import argparse
+import csv
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import psycopg2
+
+from lambdas.enrichment_lambda import steps
+from lambdas.enrichment_lambda.citation_rules import CitationRules, read_rules_file
+from lambdas.enrichment_lambda.enrich_xml import enrich_xml
+from lambdas.enrichment_lambda.lookup_tables import (
+    DatabaseLookupTables,
+    LocalLookupTables,
+    LookupTables,
+    use_lookup_tables,
+)
+from lambdas.enrichment_lambda.nlp_models import BASE_MODEL_NAME, NLPModelRegistry
+from utils.custom_types import DocumentAsXMLBytes
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+RULES_DIR = Path(__file__).parent.parent.parent / "enrichment" / "caselaw_extraction" / "rules"
+DEFAULT_RULES = RULES_DIR / "citation_patterns.jsonl"
+DEFAULT_MANIFEST = RULES_DIR / "2022_06_30_Citation_Manifest.csv"
+TIMINGS_FILE = "timings.csv"
+SUMMARY_FILE = "summary.json"
+
+# the citation rules of this worker process, set once by `_init_worker`
+_RULES: CitationRules | None = None
+
+
+class DocumentTiming(NamedTuple):
+    path: str
+    bytes: int
+    seconds: float
+    worker: int
+    error: str | None = None
+
+
+def _init_worker(model_name: str, rules: CitationRules, lookup_tables: LookupTables) -> None:
+    """
+    Load the models of a worker process once, before it enriches its first judgment
+    :param model_name: name of the spaCy pipeline to load
+    :param rules: the citation rules
+    :param lookup_tables: the lookup tables to resolve references with
+    """
+    global _RULES
+    _RULES = rules
+    use_lookup_tables(lookup_tables)
+    steps.MODEL_REGISTRY = NLPModelRegistry(model_name=model_name)
+    steps.MODEL_REGISTRY.warm_up(rules.pattern_list, rules.version)
+    steps.MODEL_REGISTRY.legislation_matcher(lookup_tables.legislation())
+
+
+def enrich_file(path: Path, input_dir: Path, output_dir: Path) -> DocumentTiming:
+    """
+    Enrich a judgment in this worker process, and write it to the output directory
+    :param path: the judgment XML
+    :param input_dir: the directory the judgments are read from
+    :param output_dir: the directory the judgment is written to, under its path relative to `input_dir`
+    :return: how long the enrichment took, with the error if it failed
+    """
+    if _RULES is None:
+        msg = "The worker was not initialised, see _init_worker"
+        raise RuntimeError(msg)
+    relative_path = path.relative_to(input_dir)
+    xml = DocumentAsXMLBytes(path.read_bytes())
+    start = time.perf_counter()
+    try:
+        enriched = enrich_xml(xml, _RULES.pattern_list, rules_version=_RULES.version, stage_workers=1)
+    except Exception as exception:  # noqa: BLE001
+        LOGGER.warning("Failed to enrich %s: %r", relative_path, exception)
+        return DocumentTiming(str(relative_path), len(xml), time.perf_counter() - start, os.getpid(), repr(exception))
+    seconds = time.perf_counter() - start
+
+    output_path = output_dir / relative_path
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(enriched)
+    return DocumentTiming(str(relative_path), len(xml), seconds, os.getpid())
+
+
+def summarise(timings: list[DocumentTiming], wall_seconds: float, workers: int, model_name: str) -> dict:
+    """
+    Summarise the throughput of a run
+    :param timings: the timing of every judgment
+    :param wall_seconds: how long the whole run took, loading the models included
+    :param workers: the number of worker processes
+    :param model_name: name of the spaCy pipeline
+    :return: the number of judgments enriched and failed, the throughput and the spread of the timings
+    """
+    enriched = [timing for timing in timings if timing.error is None]
+    seconds = sorted(timing.seconds for timing in enriched)
+    total_bytes = sum(timing.bytes for timing in enriched)
+    return {
+        "documents": len(enriched),
+        "failed": len(timings) - len(enriched),
+        "bytes": total_bytes,
+        "workers": workers,
+        "model": model_name,
+        "wall_seconds": round(wall_seconds, 3),
+        "documents_per_second": round(len(enriched) / wall_seconds, 3) if wall_seconds else None,
+        "bytes_per_second": round(total_bytes / wall_seconds) if wall_seconds else None,
+        "seconds_per_document": {
+            "mean": round(statistics.mean(seconds), 3),
+            "median": round(statistics.median(seconds), 3),
+            "p95": round(seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))], 3),
+            "max": round(seconds[-1], 3),
+        }
+        if seconds
+        else None,
+    }
+
+
+def bulk_enrich(
+    paths: Iterable[Path],
+    input_dir: Path,
+    output_dir: Path,
+    rules: CitationRules,
+    lookup_tables: LookupTables,
+    workers: int = 1,
+    model_name: str = BASE_MODEL_NAME,
+) -> dict:
+    """
+    Enrich judgments across a pool of worker processes
+    :param paths: the judgments to enrich, under `input_dir`
+    :param input_dir: the directory the judgments are read from
+    :param output_dir: the directory the enriched judgments, their timings and the summary are written to
+    :param rules: the citation rules
+    :param lookup_tables: the lookup tables to resolve references with
+    :param workers: the number of worker processes, or 1 to enrich the judgments in this process
+    :param model_name: name of the spaCy pipeline to load
+    :return: the summary of the run
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    enrich = functools.partial(enrich_file, input_dir=input_dir, output_dir=output_dir)
+    initargs = (model_name, rules, lookup_tables)
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(*initargs)
+        timings = [enrich(path) for path in paths]
+    else:
+        # forked, so the workers start with the modules already imported
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=initargs,
+        ) as pool:
+            timings = list(pool.map(enrich, paths))
+    wall_seconds = time.perf_counter() - start
+
+    timings.sort(key=lambda timing: timing.path)
+    with (output_dir / TIMINGS_FILE).open("w", newline="", encoding="utf-8") as timings_file:
+        writer = csv.writer(timings_file)
+        writer.writerow(DocumentTiming._fields)
+        writer.writerows(timings)
+    summary = summarise(timings, wall_seconds, workers, model_name)
+    (output_dir / SUMMARY_FILE).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def _lookup_tables(args: argparse.Namespace) -> LookupTables:
+    if args.database:
+        return DatabaseLookupTables(functools.partial(psycopg2.connect, args.database))
+    return LocalLookupTables.from_files(args.manifest, args.legislation)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", type=Path, help="directory of judgment XML files, searched recursively")
+    parser.add_argument("output_dir", type=Path, help="directory to write the enriched judgments to")
+    parser.add_argument("--rules", type=Path, default=DEFAULT_RULES, help="citation rules, one pattern per line")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="citation rules manifest CSV")
+    parser.add_argument("--legislation", type=Path, help="legislation lookup table, as CSV or gzipped JSON")
+    parser.add_argument("--database", help="DSN of a local database to read the lookup tables from instead")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--model", default=BASE_MODEL_NAME, help="spaCy model, e.g. blank:en")
+    args = parser.parse_args(argv)
+    if not args.database and args.legislation is None:
+        parser.error("either --legislation or --database is required")
+
+    paths = sorted(args.input_dir.rglob("*.xml"))
+    summary = bulk_enrich(
+        paths,
+        args.input_dir,
+        args.output_dir,
+        read_rules_file(args.rules),
+        _lookup_tables(args),
+        workers=max(1, min(args.workers, len(paths))),
+        model_name=args.model,
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+"""
+Container-lifetime cache of the citation rules file, keyed by the ETag of its S3 object.
+
+The rules file is only downloaded and parsed when it has changed: every refresh is a conditional GET,
+so a warm container gets a bodiless `304 Not Modified` and keeps its parsed patterns (and the citation
+entity ruler compiled from them, see `NLPModelRegistry.citation_ruler`). The file and its ETag are also
+written to `/tmp`, which survives runtime restarts within the same execution environment.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from botocore.exceptions import ClientError
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_CACHE_DIR = Path("/tmp/citation_rules")  # noqa: S108
+RULES_FILENAME = "citation_patterns.jsonl"
+ETAG_FILENAME = "etag"
+
+
+class CitationRules(NamedTuple):
+    version: str
+    pattern_list: list[dict]
+
+
+def _parse_rules(patterns: str) -> list[dict]:
+    return [json.loads(line) for line in patterns.splitlines()]
+
+
+def read_rules_file(path: Path) -> CitationRules:
+    """
+    Read the citation rules from a local file, such as when enriching judgments offline
+    :param path: the rules file, one entity ruler pattern per line
+    :return: the rules, versioned by a hash of the contents of the file in place of an ETag
+    """
+    patterns = path.read_bytes()
+    return CitationRules(hashlib.sha256(patterns).hexdigest(), _parse_rules(patterns.decode("utf-8")))
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = error.response.get("Error", {}).get("Code")
+    return status == 304 or code in ("304", "NotModified")
+
+
+class CitationRulesCache:
+    """
+    Holds the latest citation rules fetched from S3, refreshed with conditional GETs on their ETag.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+        self._rules: CitationRules | None = None
+
+    def _load_from_disk(self) -> CitationRules | None:
+        try:
+            etag = (self.cache_dir / ETAG_FILENAME).read_text(encoding="utf-8")
+            patterns = (self.cache_dir / RULES_FILENAME).read_text(encoding="utf-8")
+        except OSError:
+            return None
+        return CitationRules(etag, _parse_rules(patterns))
+
+    def _save_to_disk(self, etag: str, patterns: str) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # write the rules before the ETag, so an interrupted write is never mistaken for a valid cache
+            (self.cache_dir / ETAG_FILENAME).unlink(missing_ok=True)
+            (self.cache_dir / RULES_FILENAME).write_text(patterns, encoding="utf-8")
+            (self.cache_dir / ETAG_FILENAME).write_text(etag, encoding="utf-8")
+        except OSError as exc:
+            LOGGER.warning("Could not persist citation rules to %s: %s", self.cache_dir, exc)
+
+    def get(self, s3_client: Any, bucket: str, key: str) -> CitationRules:
+        """
+        Return the current citation rules, downloading them only if the S3 object has changed.
+        :param s3_client: boto3 S3 client
+        :param bucket: bucket holding the rules file
+        :param key: key of the rules file
+        :return: the rules version (the S3 ETag) and the parsed entity ruler patterns
+        """
+        if self._rules is None:
+            self._rules = self._load_from_disk()
+
+        request: dict[str, str] = {"Bucket": bucket, "Key": key}
+        if self._rules is not None:
+            request["IfNoneMatch"] = self._rules.version
+
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as error:
+            if self._rules is not None and _is_not_modified(error):
+                LOGGER.info("Citation rules unchanged (ETag %s)", self._rules.version)
+                return self._rules
+            raise
+
+        etag = response["ETag"]
+        patterns = response["Body"].read().decode("utf-8")
+        LOGGER.info("Fetched citation rules with ETag %s", etag)
+        self._rules = CitationRules(etag, _parse_rules(patterns))
+        self._save_to_disk(etag, patterns)
+        return self._rules
+
+
+CITATION_RULES_CACHE = CitationRulesCache()
@@ -20,6 +20,8 @@ def enrich_judgment(
     pattern_list: list[dict],
     vcite_enabled: bool = False,
     vcite_bucket: str = "",
+    rules_version: str | None = None,
+    stage_workers: int | None = None,
 ) -> None:
     LOGGER.info("Enriching judgment: %s", uri_reference)
 
@@ -32,14 +34,21 @@ def enrich_judgment(
         xml_content = fetch_judgment(api_endpoint, uri_reference, api_username, api_password)
 
         LOGGER.info("Enriching judgment content for: %s", uri_reference)
-        enriched_xml = enrich_xml(xml_content, pattern_list, enrichment_version="7.4.0")
+        enriched_xml = enrich_xml(
+            xml_content,
+            pattern_list,
+            enrichment_version="7.4.0",
+            rules_version=rules_version,
+            stage_workers=stage_workers,
+            uri_reference=uri_reference,
+        )
 
         if vcite_enabled:
             # May delete this block if we don't want to support vCite callback events in the enrichment lambda
             source_key = f"{uri_reference}.xml"
             LOGGER.info("vCite is on; uploading XML content to vCite input bucket: %s/%s", vcite_bucket, source_key)
             s3 = boto3.resource("s3")
-            s3.Object(vcite_bucket, source_key).put(Body=xml_content.encode("utf-8"))
+            s3.Object(vcite_bucket, source_key).put(Body=xml_content)
             LOGGER.info("Uploaded to vCite input for: %s", uri_reference)
         else:
             LOGGER.info("Patching enriched judgment back to API endpoint: %s", api_endpoint)
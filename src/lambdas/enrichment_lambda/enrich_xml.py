@@ -1,50 +1,310 @@
 """Module for enriching XML files with caselaw, legislation, and abbreviation replacements, as well as oblique references and metadata."""
 
+import hashlib
+import json
 import logging
 
+from database.judgment_signatures import JudgmentSignature, JudgmentSignatureStore, patterns_vocabulary
+from enrichment.abbreviation_extraction.abbreviations_matcher import AbbreviationDefinition, unique_definitions
+from lambdas.enrichment_lambda import lookup_tables
+from lambdas.enrichment_lambda.paragraph_memo import (
+    PARAGRAPH_MEMO,
+    ParagraphReferences,
+    context_start,
+    paragraph_key,
+    references_in_paragraph,
+    shift_reference,
+)
+from lambdas.enrichment_lambda.result_cache import RESULT_CACHE, result_key
+from lambdas.enrichment_lambda.stage_graph import Stage, StageGraph, configured_workers
 from lambdas.enrichment_lambda.steps import (
-    add_timestamp_and_engine_version,
+    abbreviations_enabled,
+    add_document_timestamp_and_engine_version,
+    determine_abbreviation_definitions_by_paragraph,
+    determine_abbreviation_occurrences,
     determine_abbreviation_replacements,
     determine_caselaw_replacements,
+    determine_caselaw_replacements_by_paragraph,
+    determine_judgment_years,
     determine_legislation_replacements,
-    enrich_oblique_references,
-    make_post_header_replacements,
-    make_replacements_input,
-    replace_legislation_provisions,
+    determine_legislation_replacements_by_paragraph,
+    determine_lookup_tables_version,
+    determine_paragraph_lookback,
+    enrich_document_second_stage,
+    make_planned_replacements,
+    map_judgment_content,
+    parse_judgment,
+    reuse_enriched_judgment,
+    tokenize_judgment,
+    tokenize_paragraphs,
 )
-from utils.custom_types import DocumentAsXMLString
-from utils.helper import parse_file
+from utils.custom_types import DetectedReference, DocumentAsXMLBytes, DocumentAsXMLString
+from utils.source_map import ContentText, SourceMap
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+JUDGMENT_SIGNATURES = JudgmentSignatureStore.from_environment()
+
+
+def determine_replacements_by_paragraph(
+    source_map: SourceMap,
+    pattern_list: list[dict],
+    rules_version: str,
+    lookup_tables_version: str,
+    stage_workers: int = 1,
+) -> dict[str, list[DetectedReference]]:
+    """
+    Detect the first-stage references of a judgment paragraph by paragraph, running the extractors only on
+    the paragraphs whose references are not in the paragraph memo.
 
-def enrich_xml(xml: str, pattern_list: list[dict], enrichment_version: str = "7.4.0") -> str:
-    """Orchestrate the enrichment pipeline: replacements, oblique references, legislation provisions, and metadata."""
-    # all run on original XML sequentially, so that replacements are applied before enrichment
-    parsed_xml = parse_file(DocumentAsXMLString(xml))
-    caselaw_replacements = determine_caselaw_replacements(parsed_xml, pattern_list)
+    Each of those paragraphs is read after its context, the judgment text before it as far back as the
+    extractors look (see `determine_paragraph_lookback`), and only the references starting in the paragraph are
+    kept: one running across paragraphs cannot be tagged. The legislation titles looked for are those of the
+    years mentioned anywhere in the judgment, which are therefore part of the key of every paragraph.
+    The abbreviations defined in the judgment are then resolved from the definitions memoized for every
+    paragraph, and looked for in the paragraphs that may hold one, unless memoized for the same definitions.
+    :param source_map: source map of the judgment content, from `map_judgment_content`
+    :param pattern_list: entity ruler patterns generated from the citation rules manifest
+    :param rules_version: ETag of the citation rules file
+    :param lookup_tables_version: version of the manifest and legislation lookup tables
+    :param stage_workers: number of worker processes to run the extractors in
+    :return: the caselaw, legislation and abbreviation references, with offsets in the judgment content text
+    """
+    lookback = determine_paragraph_lookback()
+    # the legislation titles looked for in a paragraph are those of the years mentioned anywhere in the judgment
+    years = determine_judgment_years(source_map.text)
+    years_version = ",".join(str(year) for year in sorted(years))
+    contents = []
+    keys = []
+    contexts = []
+    for content in source_map.contents:
+        if content.text:
+            context = source_map.text[
+                context_start(source_map.text, content.start, lookback, tokenize_judgment) : content.start
+            ]
+            contents.append(content)
+            keys.append(paragraph_key(context, content.text, rules_version, lookup_tables_version, years_version))
+            contexts.append(context)
 
-    legislation_replacements = determine_legislation_replacements(parsed_xml)
-    abbreviation_replacements = determine_abbreviation_replacements(parsed_xml)
+    memoized: dict[str, ParagraphReferences] = {}
+    for key in keys:
+        references = PARAGRAPH_MEMO.get(key)
+        if references is not None:
+            memoized[key] = references
+    changed = {
+        key: (context, content.text)
+        for key, context, content in zip(keys, contexts, contents, strict=True)
+        if key not in memoized
+    }
+    LOGGER.info("Running the extractors on %s of %s paragraphs", len(changed), len(keys))
 
-    # create a single JSON string of all replacements to pass to the replacer
-    replacement_file_content = make_replacements_input(
-        caselaw_replacements,
-        abbreviation_replacements,
-        legislation_replacements,
+    if changed:
+        texts = [context + text for context, text in changed.values()]
+        # each worker tokenizes the paragraphs itself, rather than being sent Docs pickled with their Vocab
+        first_stage = StageGraph(
+            [
+                Stage("docs", tokenize_paragraphs, ("texts",), local=True),
+                Stage(
+                    "caselaw",
+                    determine_caselaw_replacements_by_paragraph,
+                    ("docs", "pattern_list", "rules_version"),
+                ),
+                Stage("legislation", determine_legislation_replacements_by_paragraph, ("docs", "years")),
+                Stage("abbreviation_definitions", determine_abbreviation_definitions_by_paragraph, ("docs",)),
+            ],
+        )
+        detected = first_stage.run(
+            {"texts": texts, "years": years, "pattern_list": pattern_list, "rules_version": rules_version},
+            stage_workers,
+        ).values
+        for position, (key, (context, _)) in enumerate(changed.items()):
+            references = ParagraphReferences(
+                *(
+                    references_in_paragraph(detected[name][position], len(context))
+                    for name in ParagraphReferences._fields
+                ),
+            )
+            memoized[key] = references
+            PARAGRAPH_MEMO.put(key, references)
+
+    paragraph_references = [memoized[key] for key in keys]
+    replacements = {
+        name: [
+            shift_reference(reference, content.start)
+            for content, references in zip(contents, paragraph_references, strict=True)
+            for reference in getattr(references, name)
+        ]
+        for name in ("caselaw", "legislation", "abbreviation_definitions")
+    }
+    definitions = unique_definitions(
+        reference.replacement for reference in replacements.pop("abbreviation_definitions")
     )
+    replacements["abbreviation"] = determine_abbreviation_replacements_from_definitions(contents, definitions)
+    return replacements
 
-    # appply the basic replacements to the XML, before enriching with oblique references and legislation provisions
-    xml_with_replacements = make_post_header_replacements(DocumentAsXMLString(xml), replacement_file_content)
 
-    # then enrich with oblique references and legislation provisions
-    xml_with_oblique_references = enrich_oblique_references(xml_with_replacements)
-    fully_enriched_xml = replace_legislation_provisions(xml_with_oblique_references)
+def determine_abbreviation_replacements_from_definitions(
+    contents: list[ContentText],
+    definitions: list[AbbreviationDefinition],
+) -> list[DetectedReference]:
+    """
+    Find the occurrences of the abbreviations defined in a judgment in its paragraphs, as
+    `determine_abbreviation_replacements` finds them in the whole judgment, reusing the occurrences memoized
+    for a paragraph with the same definitions
+    :param contents: the paragraphs of the judgment, from its source map
+    :param definitions: the definitions that apply to the judgment, from `unique_definitions`
+    :return: the abbreviation references, with offsets in the judgment content text
+    """
+    if not definitions:
+        return []
+    definitions_version = hashlib.sha256(json.dumps(definitions).encode("utf-8")).hexdigest()
+    # a paragraph without the first word of any short form holds no occurrence
+    first_words = {definition.short_form_words[0] for definition in definitions}
+    candidates = [content for content in contents if any(word in content.text for word in first_words)]
 
-    # add timestamp and engine version to the fully enriched XML
-    fully_enriched_xml_with_timestamp = add_timestamp_and_engine_version(
-        fully_enriched_xml,
-        enrichment_version,
+    keys = [paragraph_key("", content.text, "abbreviations", definitions_version) for content in candidates]
+    memoized: dict[str, list[DetectedReference]] = {}
+    for key in keys:
+        occurrences = PARAGRAPH_MEMO.get(key)
+        if occurrences is not None:
+            memoized[key] = occurrences
+    unmatched = {key: content.text for key, content in zip(keys, candidates, strict=True) if key not in memoized}
+    if unmatched:
+        docs = tokenize_paragraphs(list(unmatched.values()))
+        for key, occurrences in zip(unmatched, determine_abbreviation_occurrences(docs, definitions), strict=True):
+            memoized[key] = occurrences
+            PARAGRAPH_MEMO.put(key, occurrences)
+
+    return [
+        shift_reference(reference, content.start)
+        for content, key in zip(candidates, keys, strict=True)
+        for reference in memoized[key]
+    ]
+
+
+def cached_enrichment(cache_key: str, uri_reference: str | None) -> DocumentAsXMLBytes | None:
+    """
+    The enrichment of a judgment cached under `cache_key`, if any. When the judgment signatures are on and the
+    judgment URI is known, the signature cached with it is recorded as if the judgment was enriched, or the
+    judgment is enriched again if its enrichment was cached without one
+    :param cache_key: key of the judgment in the result cache, from `result_key`
+    :param uri_reference: URI of the judgment, if known
+    :return: the cached enrichment, or None if the judgment is to be enriched
+    """
+    cached_xml = RESULT_CACHE.get(cache_key)
+    if cached_xml is None or not JUDGMENT_SIGNATURES.enabled or uri_reference is None:
+        return cached_xml
+    cached_signature = RESULT_CACHE.get_signature(cache_key)
+    if cached_signature is None:
+        return None
+    JUDGMENT_SIGNATURES.put(uri_reference, cached_signature)
+    return cached_xml
+
+
+def enrich_xml(
+    xml: DocumentAsXMLBytes | DocumentAsXMLString,
+    pattern_list: list[dict],
+    enrichment_version: str = "7.4.0",
+    rules_version: str | None = None,
+    stage_workers: int | None = None,
+    uri_reference: str | None = None,
+) -> DocumentAsXMLBytes:
+    """Orchestrate the enrichment pipeline: replacements, oblique references, legislation provisions, and metadata.
+
+    `rules_version` identifies the citation rules `pattern_list` was loaded from (the ETag of the rules file),
+    so the compiled citation ruler can be reused for as long as the rules do not change.
+
+    When the result cache is on and the rules version is known, a judgment enriched before with the same
+    content, rules, lookup tables and engine is not enriched again: its cached enrichment is stamped again.
+
+    When the paragraph memo is on and the rules version is known, the first-stage extractors only run on the
+    paragraphs changed since the judgment was last enriched, see `determine_replacements_by_paragraph`.
+
+    The first-stage extractors are independent of each other, and run concurrently in `stage_workers` worker
+    processes, by default the number set in `ENRICHMENT_STAGE_WORKERS`, or one after another if it is not set.
+
+    When the judgment signatures are on and the judgment URI is known, the signature of what its enrichment
+    depended on is recorded, so a change to the lookup tables only has the judgments it could affect enriched
+    again, see `database.judgment_signatures`. It is cached with the enrichment, and recorded on a cache hit too.
+
+    The judgment is parsed once, every step updates the parsed judgment in place, and it is serialized once.
+    It is taken and returned UTF-8 encoded, as the API sends and receives it, so the enrichment makes no
+    decoded copy of the whole judgment.
+    """
+    document = parse_judgment(xml)
+    # the lookup tables are read once for the judgment, whichever steps read them
+    with lookup_tables.LOOKUP_TABLES.for_judgment():
+        # the version of the lookup tables the result cache and the paragraph memo are keyed by
+        lookup_tables_version = ""
+        if rules_version is not None and (RESULT_CACHE.enabled or PARAGRAPH_MEMO.enabled):
+            lookup_tables_version = determine_lookup_tables_version()
+
+        cache_key = None
+        if RESULT_CACHE.enabled and rules_version is not None:
+            # whether abbreviations are marked up changes the enrichment as much as the engine version does
+            engine = f"{enrichment_version}+abbreviations" if abbreviations_enabled() else enrichment_version
+            cache_key = result_key(document, rules_version, lookup_tables_version, engine)
+            cached_xml = cached_enrichment(cache_key, uri_reference)
+            if cached_xml is not None:
+                return reuse_enriched_judgment(document, cached_xml, enrichment_version)
+
+        # the source map keeps where every character of the content text is in the parsed XML
+        source_map = map_judgment_content(document)
+        if PARAGRAPH_MEMO.enabled and rules_version is not None:
+            replacements = determine_replacements_by_paragraph(
+                source_map,
+                pattern_list,
+                rules_version,
+                lookup_tables_version,
+                stage_workers or configured_workers(),
+            )
+        else:
+            # tokenize once in each process and share the Doc between the first-stage extractors run in it
+            first_stage = StageGraph(
+                [
+                    Stage("doc", tokenize_judgment, ("text",), local=True),
+                    Stage("caselaw", determine_caselaw_replacements, ("doc", "pattern_list", "rules_version")),
+                    Stage("legislation", determine_legislation_replacements, ("doc",)),
+                    Stage("abbreviation", determine_abbreviation_replacements, ("doc",)),
+                ],
+            )
+            replacements = first_stage.run(
+                {"text": source_map.text, "pattern_list": pattern_list, "rules_version": rules_version},
+                stage_workers or configured_workers(),
+            ).values
+
+        signature = None
+        if JUDGMENT_SIGNATURES.enabled:
+            signature = JudgmentSignature.from_replacements(
+                source_map.text,
+                replacements["caselaw"],
+                replacements["abbreviation"],
+                patterns_vocabulary(pattern["pattern"] for pattern in pattern_list),
+            )
+            if uri_reference is not None:
+                JUDGMENT_SIGNATURES.put(uri_reference, signature)
+
+    # appply the basic replacements to the XML where they were detected,
+    # before enriching with oblique references and legislation provisions
+    make_planned_replacements(
+        document,
+        source_map,
+        replacements["caselaw"],
+        replacements["legislation"],
+        replacements["abbreviation"],
     )
-    return fully_enriched_xml_with_timestamp
+
+    # then enrich with oblique references and legislation provisions, in one walk over the paragraphs
+    enrich_document_second_stage(document)
+
+    # add timestamp and engine version to the fully enriched XML
+    add_document_timestamp_and_engine_version(document, enrichment_version)
+
+    fully_enriched_xml = document.serialize_bytes()
+    LOGGER.info("Judgment parsed and serialized during enrichment: %s", document.metrics.as_dict())
+    if cache_key is not None:
+        RESULT_CACHE.put(cache_key, fully_enriched_xml)
+        if signature is not None:
+            RESULT_CACHE.put_signature(cache_key, signature)
+    return fully_enriched_xml
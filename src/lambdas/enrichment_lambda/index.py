@@ -2,21 +2,36 @@
 
 import json
 import logging
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import Any
 
 import boto3
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 from lambdas.enrichment_lambda.api import read_message
+from lambdas.enrichment_lambda.citation_rules import CITATION_RULES_CACHE, CitationRules
 from lambdas.enrichment_lambda.enrich_judgment import enrich_judgment
+from lambdas.enrichment_lambda.nlp_models import MODEL_REGISTRY
 from lambdas.enrichment_lambda.patch_from_vcite_callback import patch_from_vcite_callback
 from utils.custom_types import APIEndpointBaseURL
-from utils.environment_helpers import validate_env_variable
+from utils.environment_helpers import positive_int_env_variable, validate_env_variable
 from utils.secrets_manager import resolve_secret_value
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+# Synthetic events such as {"warm_up": true} only load the NLP models, so a scheduled
+# invocation can keep a container warm without enriching anything.
+WARM_UP_EVENT_KEY = "warm_up"
+
+# The records of a batch are enriched one after another, unless set to enrich this many at a time in threads.
+# Threads only overlap the calls to the API: spaCy holds the GIL, and every thread holds a judgment in memory.
+RECORD_CONCURRENCY_VARIABLE = "ENRICHMENT_RECORD_CONCURRENCY"
+DEFAULT_RECORD_CONCURRENCY = 1
+
+# No record is started with less than this left before the Lambda times out.
+MIN_REMAINING_TIME_MS = 120_000
+
 
 def _resolve_api_credentials() -> tuple[str, str]:
     """Resolve API username and password from combined secret."""
@@ -30,6 +45,10 @@ def _is_vcite_callback_event(event: dict[str, Any], vcite_enriched_bucket: str)
     return bool(records) and "s3" in records[0] and records[0]["s3"]["bucket"]["name"] == vcite_enriched_bucket
 
 
+def _is_warm_up_event(event: dict[str, Any]) -> bool:
+    return bool(event.get(WARM_UP_EVENT_KEY))
+
+
 def _is_test_event(record: dict[str, Any]) -> bool:
     return "Event" in record and record["Event"] == "s3:TestEvent"
 
@@ -55,6 +74,53 @@ def _process_vcite_callback_event(
     LOGGER.info("Successfully processed all %d S3 callback records", num_records)
 
 
+def _has_time_for_record(context: LambdaContext | None) -> bool:
+    return context is None or context.get_remaining_time_in_millis() >= MIN_REMAINING_TIME_MS
+
+
+def _failed_records(running: dict[Future, int], return_when: str) -> list[int]:
+    """Waits for records being enriched to finish, as `return_when`, and returns the numbers of those that failed."""
+    done, _ = wait(running, return_when=return_when)
+    return [running.pop(future) for future in done if not future.result()]
+
+
+def _enrich_sqs_record(
+    sqs_rec: dict[str, Any],
+    api_endpoint: APIEndpointBaseURL,
+    api_username: str,
+    api_password: str,
+    rules: CitationRules,
+    vcite_enabled: bool,
+    vcite_bucket: str,
+    stage_workers: int | None = None,
+) -> None:
+    LOGGER.info("Processing SQS record: %s", sqs_rec.get("messageId", "unknown"))
+    message = json.loads(sqs_rec["body"])
+    _status, uri_reference = read_message(message)
+
+    enrich_judgment(
+        uri_reference,
+        api_endpoint,
+        api_username,
+        api_password,
+        rules.pattern_list,
+        vcite_enabled,
+        vcite_bucket,
+        rules_version=rules.version,
+        stage_workers=stage_workers,
+    )
+
+
+def _try_enrich_sqs_record(sqs_rec: dict[str, Any], *args: Any) -> bool:
+    """Enrich an SQS record as `_enrich_sqs_record`, logging its failure with the traceback rather than raising it."""
+    try:
+        _enrich_sqs_record(sqs_rec, *args)
+    except Exception:
+        LOGGER.exception("Failed to process SQS record %s", sqs_rec.get("messageId"))
+        return False
+    return True
+
+
 def _process_sqs_enrichment_event(
     event: dict[str, Any],
     api_endpoint: APIEndpointBaseURL,
@@ -64,39 +130,69 @@ def _process_sqs_enrichment_event(
     rules_key: str,
     vcite_enabled: bool,
     vcite_bucket: str,
-) -> None:
-    """Process SQS enrichment event and enrich judgments."""
+    context: LambdaContext | None = None,
+) -> dict[str, list[dict[str, str]]]:
+    """
+    Process SQS enrichment event and enrich judgments, one after another or, if `ENRICHMENT_RECORD_CONCURRENCY`
+    is set, up to that many at a time in threads sharing the models, which are loaded before the threads start.
+    Records enriched concurrently run their stages in process, as stage workers forked from a process running
+    threads could start with a lock held.
+
+    A record that fails does not stop the others. No record is started once the Lambda has less than
+    `MIN_REMAINING_TIME_MS` left, and those records count as failed, so that SQS delivers them again.
+
+    Returns the partial batch response, listing the message ids of the failed records, so that only they are retried.
+    """
     LOGGER.info("Detected SQS enrichment event; processing SQS records for enrichment")
 
     LOGGER.info("Fetching rules from S3 bucket: %s, key: %s", rules_bucket, rules_key)
     s3 = boto3.client("s3")
-    patterns_resp = s3.get_object(Bucket=rules_bucket, Key=rules_key)
-    patterns = patterns_resp["Body"].read().decode("utf-8")
-    pattern_list = [json.loads(line) for line in patterns.splitlines()]
-
-    num_records = len(event.get("Records", []))
-    for sqs_rec in event.get("Records", []):
-        if _is_test_event(sqs_rec):
-            continue
-
-        LOGGER.info("Processing SQS record: %s", sqs_rec.get("messageId", "unknown"))
-        message = json.loads(sqs_rec["body"])
-        _status, uri_reference = read_message(message)
-
-        enrich_judgment(
-            uri_reference,
-            api_endpoint,
-            api_username,
-            api_password,
-            pattern_list,
-            vcite_enabled,
-            vcite_bucket,
-        )
-
-    LOGGER.info("Successfully processed all %d SQS records", num_records)
-
+    rules = CITATION_RULES_CACHE.get(s3, rules_bucket, rules_key)
+
+    records = [sqs_rec for sqs_rec in event.get("Records", []) if not _is_test_event(sqs_rec)]
+    concurrency = positive_int_env_variable(RECORD_CONCURRENCY_VARIABLE, DEFAULT_RECORD_CONCURRENCY)
+    # records enriched concurrently run their stages in process, see above
+    stage_workers = None if concurrency == 1 else 1
+    enrich_args = (api_endpoint, api_username, api_password, rules, vcite_enabled, vcite_bucket, stage_workers)
+    failed: list[int] = []
+
+    if concurrency == 1:
+        for record_number, sqs_rec in enumerate(records):
+            if not _has_time_for_record(context):
+                LOGGER.warning("Running out of time; leaving %d SQS records to retry", len(records) - record_number)
+                failed.extend(range(record_number, len(records)))
+                break
+            if not _try_enrich_sqs_record(sqs_rec, *enrich_args):
+                failed.append(record_number)
+    else:
+        # load the models before the threads share them
+        MODEL_REGISTRY.warm_up(rules.pattern_list, rules.version)
+        with ThreadPoolExecutor(max(min(concurrency, len(records)), 1)) as executor:
+            running: dict[Future, int] = {}
+            for record_number, sqs_rec in enumerate(records):
+                if len(running) >= concurrency:
+                    failed.extend(_failed_records(running, FIRST_COMPLETED))
+                if not _has_time_for_record(context):
+                    LOGGER.warning("Running out of time; leaving %d SQS records to retry", len(records) - record_number)
+                    failed.extend(range(record_number, len(records)))
+                    break
+                running[executor.submit(_try_enrich_sqs_record, sqs_rec, *enrich_args)] = record_number
+            failed.extend(_failed_records(running, ALL_COMPLETED))
+
+    LOGGER.info("Processed %d SQS records, %d failed", len(records), len(failed))
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": records[record_number]["messageId"]} for record_number in sorted(failed)
+        ],
+    }
+
+
+def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any] | None:
+    if _is_warm_up_event(event):
+        LOGGER.info("Received warm-up event; loading NLP models")
+        MODEL_REGISTRY.warm_up()
+        return None
 
-def handler(event: dict[str, Any], context: LambdaContext) -> None:
     records = event.get("Records", [])
     LOGGER.info("Received event with %d records", len(records))
 
@@ -122,9 +218,9 @@ def handler(event: dict[str, Any], context: LambdaContext) -> None:
         # May delete this block if we don't want to support vCite callback events in the enrichment lambda
         if _is_vcite_callback_event(event, vcite_enriched_bucket):
             _process_vcite_callback_event(event, api_endpoint, api_username, api_password)
-            return
+            return None
 
-        _process_sqs_enrichment_event(
+        return _process_sqs_enrichment_event(
             event,
             api_endpoint,
             api_username,
@@ -133,6 +229,7 @@ def handler(event: dict[str, Any], context: LambdaContext) -> None:
             rules_key,
             vcite_enabled,
             vcite_bucket,
+            context,
         )
     except Exception as exc:
         LOGGER.error("Failed to process event: %s", exc)
@@ -0,0 +1,163 @@
+"""
+The lookup tables the first-stage extractors resolve references with: the citation rules manifest and the
+legislation lookup table (`ukpga_lookup`).
+
+The enrichment lambda reads them from the enrichment database, revalidating its in-memory copies against the
+table signatures once for every judgment (see `database.manifest_index` and `database.legislation_index`). Offline,
+the bulk enrichment reads them from a local database or from local files instead, see `use_lookup_tables`.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from database import db_connection
+from database.db_connection import MatchedRule, _matched_rule_from_row
+from database.legislation_index import LEGISLATION_INDEX_CACHE, LegislationIndex
+from database.manifest_index import MANIFEST_INDEX
+from utils.initialise_db import init_db_connection
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+
+class DatabaseLookupTables:
+    """
+    The lookup tables of a Postgres database, by default the enrichment database set in the environment.
+
+    Every read of the lookup tables opens a connection to revalidate both of them, unless it is made for the
+    enrichment of a judgment, see `for_judgment`.
+    """
+
+    def __init__(self, connect: Callable[[], Any] = init_db_connection) -> None:
+        self.connect = connect
+        # the lookup tables read for the judgment each thread is enriching, see `for_judgment`
+        self._judgment = threading.local()
+
+    @contextmanager
+    def for_judgment(self) -> Iterator[None]:
+        """
+        Read the lookup tables at most once for the enrichment of a judgment, over a single connection: until
+        the context exits, the manifest, legislation index and version are those read first in the thread.
+        Stages run in worker processes read them again.
+        """
+        self._judgment.tables = None
+        try:
+            yield
+        finally:
+            del self._judgment.tables
+
+    def _read(self) -> "LocalLookupTables":
+        db_conn = self.connect()
+        try:
+            rules, manifest_signature = MANIFEST_INDEX.get_with_signature(db_conn)
+            legislation_index = LEGISLATION_INDEX_CACHE.get(db_conn)
+        finally:
+            db_connection.close_connection(db_conn)
+        # versioned by the signatures the tables were revalidated against, so the version is that of what was read
+        version = json.dumps([manifest_signature, legislation_index.signature], default=str)
+        return LocalLookupTables(rules, legislation_index, version)
+
+    def _tables(self) -> "LocalLookupTables":
+        if not hasattr(self._judgment, "tables"):
+            return self._read()
+        if self._judgment.tables is None:
+            self._judgment.tables = self._read()
+        return self._judgment.tables
+
+    def manifest(self) -> Mapping[str, MatchedRule]:
+        """
+        The rules of the manifest, reloaded only if the manifest table has changed
+        :return: read-only mapping of rule id to MatchedRule
+        """
+        return self._tables().manifest()
+
+    def legislation(self) -> LegislationIndex:
+        """
+        The legislation index, reloaded only if the legislation lookup table has changed
+        :return: the legislation index
+        """
+        return self._tables().legislation()
+
+    def version(self) -> str:
+        """
+        Version of the lookup tables, which changes with their contents
+        :return: the signatures of the manifest and of the legislation lookup table
+        """
+        return self._tables().version()
+
+
+class LocalLookupTables:
+    """
+    Lookup tables held in memory, read from local files by `from_files`.
+    """
+
+    def __init__(self, rules: Mapping[str, MatchedRule], legislation_index: LegislationIndex, version: str) -> None:
+        self.rules = rules
+        self.legislation_index = legislation_index
+        self._version = version
+
+    @classmethod
+    def from_files(cls, manifest_path: Path, legislation_path: Path) -> "LocalLookupTables":
+        """
+        Read the lookup tables from local files
+        :param manifest_path: the manifest, as the CSV file the rules are updated from
+        :param legislation_path: the legislation lookup table, as a CSV file of its candidate_titles, ref,
+            citation, year and for_fuzzy columns, or as gzipped JSON persisted by `LegislationIndex.to_file`
+        :return: the lookup tables, versioned by a hash of the contents of both files
+        """
+        manifest = pd.read_csv(manifest_path).astype(object)
+        # empty cells are read from the database as NULL, not NaN
+        rows = manifest.where(manifest.notna(), None).to_dict("records")
+        rules: dict[str, MatchedRule] = {}
+        for row in rows:
+            # the first row wins if an id is repeated, as in `get_matched_rules`
+            rules.setdefault(row["id"], _matched_rule_from_row(row))
+
+        digest = hashlib.sha256(manifest_path.read_bytes())
+        digest.update(b"\0" + legislation_path.read_bytes())
+        version = digest.hexdigest()
+        if legislation_path.suffix == ".gz":
+            legislation_index = LegislationIndex.from_file(legislation_path)
+            legislation_index.signature = (version,)
+        else:
+            legislation = pd.read_csv(legislation_path, keep_default_na=False)
+            legislation_index = LegislationIndex.from_dataframe(legislation, signature=(version,))
+
+        LOGGER.info("Read %s rules and %s legislation titles from local files", len(rules), len(legislation_index))
+        return cls(rules, legislation_index, version)
+
+    @contextmanager
+    def for_judgment(self) -> Iterator[None]:
+        """Lookup tables held in memory are read once already"""
+        yield
+
+    def manifest(self) -> Mapping[str, MatchedRule]:
+        return self.rules
+
+    def legislation(self) -> LegislationIndex:
+        return self.legislation_index
+
+    def version(self) -> str:
+        return self._version
+
+
+LookupTables = DatabaseLookupTables | LocalLookupTables
+
+LOOKUP_TABLES: LookupTables = DatabaseLookupTables()
+
+
+def use_lookup_tables(lookup_tables: LookupTables) -> None:
+    """
+    Resolve references with other lookup tables from now on, in this process
+    :param lookup_tables: the lookup tables, such as local files read by `LocalLookupTables.from_files`
+    """
+    global LOOKUP_TABLES
+    LOOKUP_TABLES = lookup_tables
@@ -0,0 +1,173 @@
+"""
+Container-lifetime registry of the spaCy models used by the first-stage enrichment steps.
+
+Loading `en_core_web_sm` is by far the most expensive part of starting an enrichment, so the base
+pipeline is loaded once per container. Each judgment is then tokenized once with it, and the caselaw
+entity ruler and the abbreviation detector are applied directly to that shared Doc, so warm
+invocations pay no model-load cost at all.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import spacy
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.pipeline import EntityRuler
+from spacy.tokens import Doc
+
+from database.legislation_index import LegislationIndex
+from enrichment.abbreviation_extraction.abbreviations import AbbreviationDetector
+from enrichment.legislation_extraction.legislation_matcher_hybrid import build_exact_matcher, fuzzy_lookback
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+BASE_MODEL_NAME = "en_core_web_sm"
+EXCLUDED_COMPONENTS = ["tok2vec", "attribute_ruler", "lemmatizer", "ner"]
+
+MAX_DOCUMENT_LENGTH = 2500000
+
+
+def _fingerprint_patterns(pattern_list: list[dict]) -> str:
+    """
+    Cheap, stable fingerprint of a list of entity ruler patterns.
+    :param pattern_list: list of entity ruler patterns
+    :return: hex digest identifying the pattern list
+    """
+    return hashlib.sha256(json.dumps(pattern_list, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class NLPModelRegistry:
+    """
+    Loads the base spaCy pipeline once and hands out the components built on top of it.
+
+    Everything is built lazily on first use and then kept for the lifetime of the registry,
+    which for the module-level `MODEL_REGISTRY` is the lifetime of the Lambda container.
+    Load and build times (in seconds) are recorded in `load_times`. Building is locked, so records enriched
+    in threads build every model once between them.
+    """
+
+    def __init__(self, model_name: str = BASE_MODEL_NAME) -> None:
+        self.model_name = model_name
+        self.load_times: dict[str, float] = {}
+        self._base: Language | None = None
+        self._abbreviation_detector: AbbreviationDetector | None = None
+        self._citation_ruler: EntityRuler | None = None
+        self._citation_ruler_version: str | None = None
+        self._legislation_matcher: PhraseMatcher | None = None
+        self._legislation_matcher_version: tuple | None = None
+        self._legislation_lookback: int | None = None
+        self._legislation_lookback_version: tuple | None = None
+        # reentrant, as the components are built on the base pipeline
+        self._lock = threading.RLock()
+
+    @property
+    def base(self) -> Language:
+        """The base pipeline, loaded from disk on first access only."""
+        if self._base is None:
+            with self._lock:
+                if self._base is None:
+                    start = time.perf_counter()
+                    base = spacy.load(self.model_name, exclude=EXCLUDED_COMPONENTS)
+                    base.max_length = MAX_DOCUMENT_LENGTH
+                    self._base = base
+                    self._record_load_time("base", start)
+        return self._base
+
+    def _record_load_time(self, name: str, start: float) -> None:
+        self.load_times[name] = time.perf_counter() - start
+        LOGGER.info("Built %s NLP model in %.3fs", name, self.load_times[name])
+
+    def tokenize(self, text: str) -> Doc:
+        """
+        Tokenize a judgment once, producing the Doc shared by every first-stage extractor.
+
+        None of the extractors use tags or dependencies (citation patterns and the legislation and
+        abbreviation matchers only look at lexical attributes), so only the tokenizer is run.
+        :param text: judgment content text
+        :return: the tokenized judgment
+        """
+        return self.base.make_doc(text)
+
+    def abbreviation_detector(self) -> AbbreviationDetector:
+        """The abbreviation detector, sharing the vocab of the base pipeline."""
+        with self._lock:
+            if self._abbreviation_detector is None:
+                start = time.perf_counter()
+                self._abbreviation_detector = AbbreviationDetector(self.base)
+                self._record_load_time("abbreviation", start)
+            return self._abbreviation_detector
+
+    def citation_ruler(self, pattern_list: list[dict], rules_version: str | None = None) -> EntityRuler:
+        """
+        The entity ruler detecting case law citations, holding `pattern_list`.
+
+        The ruler is only rebuilt when the citation rules change. Callers that know the version of
+        the rules (the ETag of the rules file) should pass it, which saves fingerprinting the patterns.
+        :param pattern_list: entity ruler patterns generated from the citation rules manifest
+        :param rules_version: identifier of the version of the rules `pattern_list` was loaded from
+        :return: the citation entity ruler
+        """
+        version = rules_version or _fingerprint_patterns(pattern_list)
+        with self._lock:
+            if self._citation_ruler is None or version != self._citation_ruler_version:
+                start = time.perf_counter()
+                citation_ruler = EntityRuler(self.base, name="entity_ruler")
+                citation_ruler.add_patterns(pattern_list)
+                self._citation_ruler = citation_ruler
+                self._citation_ruler_version = version
+                self._record_load_time("caselaw", start)
+            return self._citation_ruler
+
+    def legislation_matcher(self, legislation_index: LegislationIndex) -> PhraseMatcher:
+        """
+        The phrase matcher detecting every legislation title to be matched exactly, in a single pass.
+
+        The matcher is only rebuilt when the legislation lookup table changes, as identified by the
+        signature of `legislation_index`; an index without a signature always gets a new matcher.
+        :param legislation_index: in-memory index of the legislation lookup table
+        :return: the legislation phrase matcher
+        """
+        version = legislation_index.signature
+        with self._lock:
+            if self._legislation_matcher is None or version is None or version != self._legislation_matcher_version:
+                start = time.perf_counter()
+                self._legislation_matcher = build_exact_matcher(self.base, legislation_index.exact_titles())
+                self._legislation_matcher_version = version
+                self._record_load_time("legislation", start)
+            return self._legislation_matcher
+
+    def legislation_lookback(self, legislation_index: LegislationIndex) -> int:
+        """
+        Furthest the legislation matcher reads before a reference, in tokens, from the longest fuzzy matched title.
+
+        It is only counted again when the legislation lookup table changes, as for `legislation_matcher`.
+        :param legislation_index: in-memory index of the legislation lookup table
+        :return: the number of tokens
+        """
+        version = legislation_index.signature
+        with self._lock:
+            if self._legislation_lookback is None or version is None or version != self._legislation_lookback_version:
+                self._legislation_lookback = fuzzy_lookback(self.base, legislation_index.fuzzy_titles())
+                self._legislation_lookback_version = version
+            return self._legislation_lookback
+
+    def warm_up(self, pattern_list: list[dict] | None = None, rules_version: str | None = None) -> dict[str, float]:
+        """
+        Load the models so the next enrichment pays no model-load cost.
+        :param pattern_list: optional citation patterns to build the citation ruler with
+        :param rules_version: identifier of the version of the rules `pattern_list` was loaded from
+        :return: the load time in seconds of every model built so far
+        """
+        self.abbreviation_detector()
+        if pattern_list is not None:
+            self.citation_ruler(pattern_list, rules_version)
+        LOGGER.info("NLP model registry warm, load times: %s", self.load_times)
+        return dict(self.load_times)
+
+
+MODEL_REGISTRY = NLPModelRegistry()
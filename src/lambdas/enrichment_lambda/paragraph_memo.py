@@ -0,0 +1,150 @@
+"""
+Memo of the references the first-stage extractors detect in each paragraph of a judgment, so a judgment
+republished with a small correction only has the paragraphs that changed run through the extractors again.
+
+The references of a paragraph are keyed by a hash of its text as the extractors read it, of its context, the
+judgment text before it as far back as the extractors look, of the years mentioned in the judgment, whose
+legislation titles are looked for, and of the versions of the citation rules and of the lookup tables. Editing a paragraph therefore changes the keys of that paragraph and of the paragraphs
+that start within that many tokens after it.
+What depends on the whole judgment, the abbreviations defined in it, is resolved again from the memoized
+definitions of every paragraph (see `enrich_xml.determine_replacements_by_paragraph`); the oblique references
+and legislation provisions of the second stage are linked over the whole judgment as before.
+
+The memo is kept in memory for the lifetime of the container, holding up to `ENRICHMENT_PARAGRAPH_MEMO_SIZE`
+entries, the least recently used being dropped first. It is off when the variable is not set.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from spacy.tokens import Doc
+
+from lambdas.enrichment_lambda.result_cache import CacheMetrics
+from utils.custom_types import DetectedReference
+from utils.environment_helpers import positive_int_env_variable
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+PARAGRAPH_MEMO_VARIABLE = "ENRICHMENT_PARAGRAPH_MEMO_SIZE"
+
+
+class ParagraphReferences(NamedTuple):
+    """The references detected in a paragraph, with offsets in the paragraph text, by extractor."""
+
+    caselaw: list[DetectedReference]
+    legislation: list[DetectedReference]
+    abbreviation_definitions: list[DetectedReference]
+
+
+def paragraph_key(context: str, text: str, *versions: str) -> str:
+    """
+    Key of the references detected in a paragraph
+    :param context: text before the paragraph the extractors look back into, from `context_start`
+    :param text: text of the paragraph, as the extractors read it from the source map
+    :param versions: versions of everything else the references depend on, such as the citation rules
+    :return: hex digest of the texts and the versions
+    """
+    digest = hashlib.sha256(context.encode("utf-8"))
+    for part in (text, *versions):
+        digest.update(b"\0" + part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def context_start(text: str, start: int, lookback: int, tokenize: Callable[[str], Doc]) -> int:
+    """
+    Where the context of a paragraph starts in the judgment text, which the extractors look back into
+    :param text: judgment content text, from the source map
+    :param start: offset of the paragraph in `text`
+    :param lookback: number of tokens before a paragraph the extractors read
+    :param tokenize: tokenizer of the extractors
+    :return: offset of the `lookback`th token before the paragraph, 0 if the judgment has fewer
+    """
+    # a token takes a character at least, and the first token of the window may be cut
+    window = 8 * (lookback + 1)
+    while True:
+        window_start = max(start - window, 0)
+        doc = tokenize(text[window_start:start])
+        if len(doc) > lookback:
+            return window_start + doc[len(doc) - lookback].idx if lookback else start
+        if window_start == 0:
+            return 0
+        window *= 4
+
+
+def references_in_paragraph(references: list[DetectedReference], start: int) -> list[DetectedReference]:
+    """
+    The references detected in a paragraph read after its context, with offsets in the paragraph text
+    :param references: references detected in the context and the paragraph
+    :param start: offset of the paragraph after its context
+    :return: the references starting in the paragraph
+    """
+    return [shift_reference(reference, -start) for reference in references if reference.start >= start]
+
+
+def shift_reference(reference: DetectedReference, offset: int) -> DetectedReference:
+    return DetectedReference(reference.start + offset, reference.end + offset, reference.replacement)
+
+
+class ParagraphMemo:
+    """
+    Memoized references by `paragraph_key`, least recently used first.
+
+    The memo is shared by the records of a batch, which are enriched in several threads.
+    """
+
+    def __init__(self, max_entries: int = 0) -> None:
+        self.max_entries = max_entries
+        self.metrics = CacheMetrics()
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "ParagraphMemo":
+        """
+        The memo holding up to the number of entries set in `ENRICHMENT_PARAGRAPH_MEMO_SIZE`, off if it is not set
+        """
+        return cls(positive_int_env_variable(PARAGRAPH_MEMO_VARIABLE, 0))
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        """
+        The entry memoized under a key
+        :param key: key of the entry, from `paragraph_key`
+        :return: the entry, or None if it is not in the memo
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics.misses += 1
+            else:
+                self.metrics.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: Any) -> None:
+        """
+        Memoize an entry, dropping the least recently used entries past the size of the memo
+        :param key: key of the entry, from `paragraph_key`
+        :param entry: the entry
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+PARAGRAPH_MEMO = ParagraphMemo.from_environment()
@@ -27,7 +27,7 @@ def patch_from_vcite_callback(
     file_content = s3_client.get_object(Bucket=source_bucket, Key=source_key)["Body"].read()
 
     tree = etree.fromstring(file_content)
-    canonical_xml = etree.tostring(tree, method="c14n").decode("utf-8")
+    canonical_xml = etree.tostring(tree, method="c14n")
     document_uri = source_key.replace(".xml", "")
 
     patch_judgment(api_endpoint, document_uri, canonical_xml, api_username, api_password)
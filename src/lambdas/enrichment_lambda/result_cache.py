@@ -0,0 +1,288 @@
+"""
+Content-addressed cache of enriched judgments, so a judgment republished unchanged is not enriched again.
+
+A result is keyed by a hash of the judgment without the enrichment of previous runs and without its `meta`
+element, which enrichment only stamps, together with everything else its enrichment depends on: the version
+of the citation rules (the ETag of the rules file), of the lookup tables and of the enrichment engine. A
+judgment whose metadata alone was edited keeps its key; its cached enrichment is given the current metadata
+and stamped again (see `steps.reuse_enriched_judgment`).
+
+When the judgment signatures are on, the signature of each enrichment is stored beside it, so a judgment
+served from the cache has its signature recorded too (see `database.judgment_signatures`).
+
+Results are stored in a local directory, an S3 bucket or the Postgres database, as set in
+`ENRICHMENT_RESULT_CACHE`. The cache is off when the variable is not set.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import urllib.parse
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import boto3
+import lxml.etree
+from botocore.exceptions import ClientError
+
+from database.judgment_signatures import JudgmentSignature
+from utils.custom_types import DocumentAsXMLBytes
+from utils.initialise_db import init_db_connection
+from utils.judgment_document import JudgmentDocument, find_element
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+RESULT_CACHE_VARIABLE = "ENRICHMENT_RESULT_CACHE"
+RESULTS_TABLE = "enrichment_results"
+
+
+def result_key(
+    document: JudgmentDocument,
+    rules_version: str,
+    lookup_tables_version: str,
+    enrichment_version: str,
+) -> str:
+    """
+    Key of the enrichment of a judgment
+    :param document: the judgment, without the enrichment of previous runs, from `parse_judgment`
+    :param rules_version: ETag of the citation rules file
+    :param lookup_tables_version: version of the manifest and legislation lookup tables
+    :param enrichment_version: version of the enrichment engine
+    :return: hex digest of the judgment content and the versions
+    """
+    meta = find_element(document.root, "meta")
+    excluded_tags = [] if meta is None else [lxml.etree.QName(meta).text]
+    content = lxml.etree.canonicalize(document.root, exclude_tags=excluded_tags)
+    digest = hashlib.sha256(content.encode("utf-8"))
+    for version in (rules_version, lookup_tables_version, enrichment_version):
+        digest.update(b"\0" + version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def signature_key(key: str) -> str:
+    """Key of the signature of the enrichment stored under `key`"""
+    return f"{key}.signature"
+
+
+class DirectoryResultStore:
+    """
+    Enriched judgments stored as files of a local directory, named after their key.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            return (self.directory / f"{key}.xml").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, enriched: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{key}.xml"
+        # replaced atomically, so a result is never read half written
+        temporary_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        temporary_path.write_bytes(enriched)
+        os.replace(temporary_path, path)
+
+
+class S3ResultStore:
+    """
+    Enriched judgments stored as objects of an S3 bucket, named after their key under a prefix.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", s3_client: Any = None) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self._s3_client = s3_client
+
+    @property
+    def s3_client(self) -> Any:
+        if self._s3_client is None:
+            self._s3_client = boto3.client("s3")
+        return self._s3_client
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.xml")
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") == "NoSuchKey":
+                return None
+            raise
+        return response["Body"].read()
+
+    def put(self, key: str, enriched: bytes) -> None:
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{key}.xml",
+            Body=enriched,
+            ContentType="application/xml",
+        )
+
+
+class PostgresResultStore:
+    """
+    Enriched judgments stored in a table of the Postgres database, created on first use.
+    """
+
+    def __init__(self, connect: Callable[[], Any] = init_db_connection) -> None:
+        self.connect = connect
+        self._table_created = False
+
+    def _execute(self, query: str, params: tuple) -> tuple | None:
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                if not self._table_created:
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} "
+                        "(key TEXT PRIMARY KEY, enriched BYTEA NOT NULL, stored_at TIMESTAMPTZ NOT NULL DEFAULT now())",
+                    )
+                cursor.execute(query, params)
+                row = cursor.fetchone() if cursor.description else None
+            conn.commit()
+            self._table_created = True
+            return row
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> bytes | None:
+        row = self._execute(f"SELECT enriched FROM {RESULTS_TABLE} WHERE key = %s", (key,))  # noqa: S608
+        return None if row is None else bytes(row[0])
+
+    def put(self, key: str, enriched: bytes) -> None:
+        self._execute(
+            f"INSERT INTO {RESULTS_TABLE} (key, enriched) VALUES (%s, %s) "  # noqa: S608
+            "ON CONFLICT (key) DO UPDATE SET enriched = EXCLUDED.enriched, stored_at = now()",
+            (key, enriched),
+        )
+
+
+ResultStore = DirectoryResultStore | S3ResultStore | PostgresResultStore
+
+
+class CacheMetrics:
+    """
+    Number of enrichments found in the cache, not found in it, and of calls to its store that failed.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class EnrichmentResultCache:
+    """
+    Enriched judgments by `result_key`, in a store shared by every container.
+
+    The cache never fails an enrichment: a store that cannot be read is a miss, and one that cannot be
+    written to is logged and left.
+    """
+
+    def __init__(self, store: ResultStore | None = None) -> None:
+        self.store = store
+        self.metrics = CacheMetrics()
+        # the records of a batch are enriched in several threads
+        self._metrics_lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "EnrichmentResultCache":
+        """
+        The cache set in `ENRICHMENT_RESULT_CACHE`: "s3://bucket/prefix/" for an S3 bucket, "postgres" for the
+        enrichment database, or the path of a local directory. The cache is off if the variable is not set.
+        """
+        location = os.environ.get(RESULT_CACHE_VARIABLE, "")
+        if not location:
+            return cls()
+        if location == "postgres":
+            return cls(PostgresResultStore())
+        if location.startswith("s3://"):
+            url = urllib.parse.urlparse(location)
+            return cls(S3ResultStore(url.netloc, url.path.lstrip("/")))
+        return cls(DirectoryResultStore(Path(location)))
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def _count(self, outcome: str) -> None:
+        with self._metrics_lock:
+            setattr(self.metrics, outcome, getattr(self.metrics, outcome) + 1)
+
+    def get(self, key: str) -> DocumentAsXMLBytes | None:
+        """
+        The enriched judgment stored under a key
+        :param key: key of the enrichment, from `result_key`
+        :return: the enriched judgment, or None if it is not in the cache
+        """
+        if self.store is None:
+            return None
+        try:
+            enriched = self.store.get(key)
+        except Exception as exception:  # noqa: BLE001
+            LOGGER.warning("Could not read enrichment result %s from the cache: %s", key, exception)
+            self._count("errors")
+            enriched = None
+
+        self._count("misses" if enriched is None else "hits")
+        LOGGER.info(
+            "Enrichment result cache %s for %s: %s",
+            "miss" if enriched is None else "hit",
+            key,
+            self.metrics.as_dict(),
+        )
+        return None if enriched is None else DocumentAsXMLBytes(enriched)
+
+    def put(self, key: str, enriched: DocumentAsXMLBytes) -> None:
+        """
+        Store an enriched judgment
+        :param key: key of the enrichment, from `result_key`
+        :param enriched: the enriched judgment
+        """
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, enriched)
+        except Exception as exception:  # noqa: BLE001
+            LOGGER.warning("Could not store enrichment result %s in the cache: %s", key, exception)
+            self._count("errors")
+
+    def get_signature(self, key: str) -> JudgmentSignature | None:
+        """
+        The signature of the enrichment stored under a key
+        :param key: key of the enrichment, from `result_key`
+        :return: the signature, or None if it is not in the cache
+        """
+        if self.store is None:
+            return None
+        try:
+            signature = self.store.get(signature_key(key))
+            return None if signature is None else JudgmentSignature.from_json(signature)
+        except Exception as exception:  # noqa: BLE001
+            LOGGER.warning("Could not read the signature of enrichment result %s from the cache: %s", key, exception)
+            return None
+
+    def put_signature(self, key: str, signature: JudgmentSignature) -> None:
+        """
+        Store the signature of an enrichment beside it
+        :param key: key of the enrichment, from `result_key`
+        :param signature: the signature
+        """
+        if self.store is None:
+            return
+        try:
+            self.store.put(signature_key(key), signature.to_json().encode("utf-8"))
+        except Exception as exception:  # noqa: BLE001
+            LOGGER.warning("Could not store the signature of enrichment result %s in the cache: %s", key, exception)
+            self._count("errors")
+
+
+RESULT_CACHE = EnrichmentResultCache.from_environment()
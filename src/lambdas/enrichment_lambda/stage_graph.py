@@ -0,0 +1,324 @@
+"""
+Runs the steps of an enrichment as a graph of the stages they depend on.
+
+Stages that do not depend on each other run concurrently in worker processes, as the spaCy extractors hold
+the GIL. The workers are forked processes, each sent its stages over a pipe: unlike a process pool, which
+needs the POSIX semaphores of /dev/shm, processes and pipes can be started on AWS Lambda. With a single
+worker, or where worker processes cannot be started, every stage runs in the invoking process, one after
+another, in the order the stages were declared, as they do if a worker dies.
+
+The workers are shared by every thread of the process, and run the stages of a single graph at a time.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable, Sequence
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+from typing import Any, NamedTuple, cast
+
+from utils.environment_helpers import positive_int_env_variable
+
+LOGGER = logging.getLogger()
+LOGGER.setLevel(logging.INFO)
+
+STAGE_WORKERS_VARIABLE = "ENRICHMENT_STAGE_WORKERS"
+
+# Workers live as long as the container, so each worker keeps the models it loaded warm between
+# enrichments. They are forked, so workers started once the models are loaded share them.
+_WORKERS: dict[int, list["_Worker"]] = {}
+# held for the whole run of a graph in the workers, as the results of two runs would interleave in their pipes
+_WORKERS_LOCK = threading.Lock()
+
+# identifies a run of a graph to the workers, which keep the values of its local stages until the next run
+_RUN_IDS = itertools.count()
+
+
+class Stage(NamedTuple):
+    """
+    A step of the enrichment, called with the values of the inputs and stages it requires, in that order.
+
+    A local stage is never sent between processes: it runs in every process running a stage that requires
+    it, once per run of the graph, such as the Doc a text is tokenized into, which would be pickled with its
+    whole Vocab. A local stage can only require inputs and stages that are not local, and its value is not
+    returned by the graph.
+    """
+
+    name: str
+    func: Callable[..., Any]
+    requires: tuple[str, ...] = ()
+    local: bool = False
+
+
+class StageResults(NamedTuple):
+    """
+    The value returned by each stage but the local ones, and how long each stage took in seconds, in the order
+    the stages were declared. A local stage run in several workers takes the longest of its timings.
+    """
+
+    values: dict[str, Any]
+    timings: dict[str, float]
+
+
+class StageWorkerError(RuntimeError):
+    """A worker process died, so the stages of the run are run again in the invoking process."""
+
+
+class _LocalValue(NamedTuple):
+    """The arguments of a local stage, sent in place of its value for the worker to run it."""
+
+    name: str
+    func: Callable[..., Any]
+    args: tuple
+
+
+class _Worker(NamedTuple):
+    process: BaseProcess
+    connection: Connection
+
+
+def configured_workers() -> int:
+    """
+    Number of worker processes to run the stages of an enrichment in, from `ENRICHMENT_STAGE_WORKERS`
+    :return: the number of workers, 1 (every stage in the invoking process) if the variable is not set
+    """
+    return positive_int_env_variable(STAGE_WORKERS_VARIABLE, 1)
+
+
+def _serve(connection: Connection) -> None:
+    """Runs the stages sent to a worker process, until the invoking process closes its end of the pipe."""
+    run = None
+    local_values: dict[str, tuple[Any, float]] = {}
+    while True:
+        try:
+            run_id, func, args = connection.recv()
+        except (EOFError, OSError):
+            return
+        if run_id != run:
+            run = run_id
+            local_values = {}
+        try:
+            arguments = []
+            local_timings = {}
+            for arg in args:
+                if isinstance(arg, _LocalValue):
+                    if arg.name not in local_values:
+                        local_values[arg.name] = _run_stage(arg.func, arg.args)
+                    value, local_timings[arg.name] = local_values[arg.name]
+                    arguments.append(value)
+                else:
+                    arguments.append(arg)
+            value, seconds = _run_stage(func, tuple(arguments))
+            response: tuple = (True, value, seconds, local_timings)
+        except Exception as exception:  # noqa: BLE001
+            response = (False, exception, 0.0, {})
+        try:
+            connection.send(response)
+        except Exception as exception:  # noqa: BLE001
+            # such as a value or an exception that cannot be pickled
+            connection.send((False, RuntimeError(f"Cannot send the result of a stage: {exception!r}"), 0.0, {}))
+
+
+def _start_worker(context: multiprocessing.context.BaseContext) -> _Worker:
+    parent_connection, child_connection = context.Pipe()
+    process = context.Process(target=_serve, args=(child_connection,), daemon=True)  # type: ignore[attr-defined]
+    process.start()
+    child_connection.close()
+    return _Worker(process, parent_connection)
+
+
+def stage_workers(workers: int) -> list[_Worker] | None:
+    """
+    The `workers` worker processes, started on first use and started again if one of them died. Called with
+    `_WORKERS_LOCK` held.
+    :param workers: number of worker processes
+    :return: the workers, or None where worker processes cannot be started
+    """
+    if workers in _WORKERS and not all(worker.process.is_alive() for worker in _WORKERS[workers]):
+        LOGGER.warning("A stage worker died, starting %s stage workers again", workers)
+        _stop(_WORKERS.pop(workers))
+    if workers not in _WORKERS:
+        context = multiprocessing.get_context("fork")
+        started: list[_Worker] = []
+        try:
+            for _ in range(workers):
+                started.append(_start_worker(context))
+        except (OSError, ValueError) as exception:
+            LOGGER.warning("Cannot start %s stage workers, running stages in process: %s", workers, exception)
+            _stop(started)
+            return None
+        _WORKERS[workers] = started
+    return _WORKERS[workers]
+
+
+def _stop(workers: list[_Worker]) -> None:
+    for worker in workers:
+        worker.connection.close()
+    for worker in workers:
+        worker.process.join(timeout=5)
+        if worker.process.is_alive():
+            worker.process.kill()
+
+
+def stop_stage_workers() -> None:
+    """Stops every worker process, so the next run of a graph with workers starts new ones."""
+    with _WORKERS_LOCK:
+        while _WORKERS:
+            _stop(_WORKERS.popitem()[1])
+
+
+def _send_stage(worker: _Worker, message: tuple) -> Exception | None:
+    """
+    Sends a stage to a worker
+    :param worker: the worker
+    :param message: the run, the function of the stage and its arguments
+    :return: the error sending the stage, such as an argument that cannot be pickled, which is not written to the pipe
+    """
+    try:
+        worker.connection.send(message)
+    except OSError as exception:
+        msg = f"Stage worker {worker.process.pid} died before running a stage"
+        raise StageWorkerError(msg) from exception
+    except Exception as exception:  # noqa: BLE001
+        return exception
+    return None
+
+
+def _run_stage(func: Callable[..., Any], args: tuple) -> tuple[Any, float]:
+    start = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - start
+
+
+class StageGraph:
+    """
+    Stages of an enrichment, declared with the inputs and stages each of them requires.
+
+    A stage can only require inputs and stages declared before it, so the graph has no cycles. Stages run in
+    worker processes are sent their arguments, and send back their values, pickled: an argument sent to a
+    worker is its own copy, which the invoking process does not see updated.
+    """
+
+    def __init__(self, stages: Sequence[Stage]) -> None:
+        self.stages = list(stages)
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            msg = f"Stage names must be unique: {names}"
+            raise ValueError(msg)
+        self._local_stages = {stage.name: stage for stage in self.stages if stage.local}
+
+    def run(self, inputs: dict[str, Any], workers: int = 1) -> StageResults:
+        """
+        Runs every stage once the inputs and stages it requires are available
+        :param inputs: values of the inputs of the graph, by name
+        :param workers: number of worker processes to run independent stages in concurrently
+        :return: the value and timing of every stage
+        """
+        self._check_requirements(inputs)
+        results = None
+        if workers > 1:
+            with _WORKERS_LOCK:
+                started = stage_workers(workers)
+                if started is not None:
+                    try:
+                        results = self._run_in_workers(inputs, started)
+                    except StageWorkerError:
+                        LOGGER.exception("A stage worker died, running the stages in process")
+                        _stop(_WORKERS.pop(workers, []))
+        ran_in_workers = results is not None
+        if results is None:
+            results = self._run_in_process(inputs)
+
+        # declaration order, whichever order the stages finished in
+        timings = {stage.name: results[stage.name][1] for stage in self.stages if stage.name in results}
+        LOGGER.info("Enrichment stage timings with %s workers: %s", workers if ran_in_workers else 1, timings)
+        values = {stage.name: results[stage.name][0] for stage in self.stages if not stage.local}
+        return StageResults(values, timings)
+
+    def _check_requirements(self, inputs: dict[str, Any]) -> None:
+        available = set(inputs)
+        for stage in self.stages:
+            missing = [name for name in stage.requires if name not in available]
+            if missing:
+                msg = f"Stage {stage.name} requires {missing}, which are not inputs or stages declared before it"
+                raise ValueError(msg)
+            if stage.local and any(name in self._local_stages for name in stage.requires):
+                msg = f"Local stage {stage.name} cannot require local stages"
+                raise ValueError(msg)
+            available.add(stage.name)
+
+    def _arguments(self, stage: Stage, inputs: dict[str, Any], results: dict[str, tuple[Any, float]]) -> tuple:
+        return tuple(results[name][0] if name in results else inputs[name] for name in stage.requires)
+
+    def _worker_arguments(
+        self,
+        stage: Stage,
+        inputs: dict[str, Any],
+        results: dict[str, tuple[Any, float]],
+    ) -> tuple:
+        return tuple(
+            _LocalValue(name, self._local_stages[name].func, self._arguments(self._local_stages[name], inputs, results))
+            if name in self._local_stages
+            else results[name][0]
+            if name in results
+            else inputs[name]
+            for name in stage.requires
+        )
+
+    def _is_ready(self, stage: Stage, inputs: dict[str, Any], results: dict[str, tuple[Any, float]]) -> bool:
+        requires = list(stage.requires)
+        for name in stage.requires:
+            if name in self._local_stages:
+                requires.remove(name)
+                requires.extend(self._local_stages[name].requires)
+        return all(name in inputs or name in results for name in requires)
+
+    def _run_in_process(self, inputs: dict[str, Any]) -> dict[str, tuple[Any, float]]:
+        results: dict[str, tuple[Any, float]] = {}
+        for stage in self.stages:
+            results[stage.name] = _run_stage(stage.func, self._arguments(stage, inputs, results))
+        return results
+
+    def _run_in_workers(self, inputs: dict[str, Any], workers: list[_Worker]) -> dict[str, tuple[Any, float]]:
+        run_id = next(_RUN_IDS)
+        results: dict[str, tuple[Any, float]] = {}
+        local_timings: dict[str, float] = {}
+        waiting = [stage for stage in self.stages if not stage.local]
+        idle = list(workers)
+        running: dict[Connection, tuple[_Worker, Stage]] = {}
+        error: Exception | None = None
+        while waiting or running:
+            # no stage is started once one failed, but those running are waited for, so their results are not
+            # left in the pipes for the next run
+            ready = [stage for stage in waiting if self._is_ready(stage, inputs, results)] if error is None else []
+            for stage in ready[: len(idle)]:
+                waiting.remove(stage)
+                worker = idle.pop()
+                error = _send_stage(worker, (run_id, stage.func, self._worker_arguments(stage, inputs, results)))
+                if error is not None:
+                    idle.append(worker)
+                    break
+                running[worker.connection] = (worker, stage)
+            if not running:
+                break
+            for connection in wait(list(running)):
+                worker, stage = running.pop(cast("Connection", connection))
+                try:
+                    succeeded, value, seconds, timings = worker.connection.recv()
+                except (EOFError, OSError) as exception:
+                    msg = f"Stage worker {worker.process.pid} died running stage {stage.name}"
+                    raise StageWorkerError(msg) from exception
+                idle.append(worker)
+                if not succeeded:
+                    error = error or value
+                    continue
+                results[stage.name] = (value, seconds)
+                for name, local_seconds in timings.items():
+                    local_timings[name] = max(local_timings.get(name, 0.0), local_seconds)
+        if error is not None:
+            raise error
+        results.update({name: (None, seconds) for name, seconds in local_timings.items()})
+        return results
@@ -3,68 +3,213 @@
 import datetime
 import json
 import logging
-
-import lxml
-import spacy
-from bs4 import BeautifulSoup
-
-from database import db_connection
-from enrichment.abbreviation_extraction.abbreviations_matcher import abb_pipeline
-from enrichment.caselaw_extraction.caselaw_matcher import case_pipeline
-from enrichment.legislation_extraction.legislation_matcher_hybrid import leg_pipeline
-from enrichment.legislation_provisions_extraction.legislation_provisions import provisions_pipeline
-from enrichment.oblique_references.oblique_references import (
-    get_oblique_reference_replacements_by_paragraph,
+import os
+
+import lxml.etree
+from spacy.tokens import Doc
+
+from enrichment.abbreviation_extraction.abbreviations import LONG_FORM_LOOKBACK
+from enrichment.abbreviation_extraction.abbreviations_matcher import (
+    AbbreviationDefinition,
+    abb_definitions,
+    abb_occurrences,
+    abb_references,
+    build_definitions_matcher,
+)
+from enrichment.caselaw_extraction.caselaw_matcher import case_references
+from enrichment.legislation_extraction.legislation_matcher_hybrid import (
+    detect_leg_references,
+    detect_year_span,
+    leg_references,
 )
+from enrichment.legislation_provisions_extraction.legislation_provisions import resolve_provisions
+from enrichment.oblique_references.oblique_references import get_oblique_reference_replacements
 from enrichment.replacer.make_replacements import (
     apply_replacements,
+    remove_enrichment_metadata,
+    sanitize_document,
     sanitize_judgment,
     split_text_by_closing_header_tag,
+    strip_whitespace_text,
+)
+from enrichment.replacer.replacement_plan import apply_replacement_plan, build_replacement_plan
+from enrichment.replacer.second_stage_pipeline import SecondStageCounts, link_second_stage_references
+from enrichment.replacer.second_stage_replacer import replace_references_in_document
+from lambdas.enrichment_lambda import lookup_tables
+from lambdas.enrichment_lambda.nlp_models import MODEL_REGISTRY
+from utils.custom_types import DetectedReference, DocumentAsXMLBytes, DocumentAsXMLString
+from utils.judgment_document import (
+    JudgmentDocument,
+    element_markup,
+    find_element,
+    markup_map,
     split_xml_declaration,
 )
-from enrichment.replacer.second_stage_replacer import replace_references_by_paragraph
-from utils.custom_types import DocumentAsXMLString
-from utils.initialise_db import init_db_connection
+from utils.proper_xml import namespaces
+from utils.source_map import SourceMap
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.INFO)
 
+ABBREVIATIONS_VARIABLE = "ENRICHMENT_ABBREVIATIONS"
+
 
 class SourceXMLMissingElement(RuntimeError):
     """The provided XML document is missing an expected element, and we are choosing to fail."""
 
 
-def determine_abbreviation_replacements(file_content: str):
-    nlp = spacy.load("en_core_web_sm", exclude=["tok2vec", "attribute_ruler", "lemmatizer", "ner"])
-    nlp.max_length = 2500000
-    return abb_pipeline(file_content, nlp)
+def parse_judgment(original_content: DocumentAsXMLString | DocumentAsXMLBytes) -> JudgmentDocument:
+    """
+    Parse the judgment once, without the enrichment of previous runs; every step then updates the parsed judgment.
+    :param original_content: the judgment, as a string or UTF-8 encoded
+    :return: the parsed judgment
+    """
+    document = JudgmentDocument.parse(original_content)
+    sanitize_document(document.root)
+    return document
+
+
+def map_judgment_content(document: JudgmentDocument) -> SourceMap:
+    """
+    Map the content text of the judgment back to the XML.
+    :param document: the parsed judgment
+    :return: source map of the judgment content text, as `parse_file` would read it
+    """
+    return SourceMap(document.root)
+
+
+def tokenize_judgment(file_content: str) -> Doc:
+    """
+    Tokenize the judgment content once; the resulting Doc is shared by every first-stage extractor.
+    :param file_content: judgment content text, as returned by `parse_file`
+    :return: the tokenized judgment
+    """
+    return MODEL_REGISTRY.tokenize(file_content)
+
+
+def abbreviations_enabled() -> bool:
+    """
+    Whether abbreviations are marked up, which is off unless `ENRICHMENT_ABBREVIATIONS` is "true": the detector
+    found no abbreviation for a long time, so the markup it adds again is not turned on in production by default.
+    """
+    return os.environ.get(ABBREVIATIONS_VARIABLE, "").lower() == "true"
 
 
-def determine_caselaw_replacements(file_content: str, pattern_list: list[dict]):
-    db_conn = init_db_connection()
-    try:
-        nlp = _init_caselaw_nlp(pattern_list)
-        LOGGER.info("Loaded caselaw NLP model")
-        doc = nlp(file_content)
-        replacements = case_pipeline(doc, db_conn)
-        LOGGER.info("Caselaw replacements identified: %s", len(replacements))
-        return replacements
-    finally:
-        db_connection.close_connection(db_conn)
+def determine_abbreviation_replacements(doc: Doc) -> list[DetectedReference]:
+    if not abbreviations_enabled():
+        return []
+    return abb_references(doc, MODEL_REGISTRY.abbreviation_detector())
 
 
-def determine_legislation_replacements(file_content: str):
-    db_conn = init_db_connection()
-    try:
-        nlp = spacy.load("en_core_web_sm", exclude=["tok2vec", "attribute_ruler", "lemmatizer", "ner"])
-        nlp.max_length = 2500000
-        doc = nlp(file_content)
-        leg_titles = db_connection.get_legtitles(db_conn)
-        replacements = leg_pipeline(leg_titles, nlp, doc, db_conn)
-        LOGGER.info("Legislation replacements identified: %s", len(replacements))
-        return replacements
-    finally:
-        db_connection.close_connection(db_conn)
+def determine_caselaw_replacements(
+    doc: Doc,
+    pattern_list: list[dict],
+    rules_version: str | None = None,
+) -> list[DetectedReference]:
+    citation_ruler = MODEL_REGISTRY.citation_ruler(pattern_list, rules_version)
+    replacements = case_references(citation_ruler(doc), lookup_tables.LOOKUP_TABLES.manifest())
+    LOGGER.info("Caselaw replacements identified: %s", len(replacements))
+    return replacements
+
+
+def determine_legislation_replacements(doc: Doc) -> list[DetectedReference]:
+    legislation_index = lookup_tables.LOOKUP_TABLES.legislation()
+    phrase_matcher = MODEL_REGISTRY.legislation_matcher(legislation_index)
+    replacements = leg_references(legislation_index, MODEL_REGISTRY.base, doc, phrase_matcher)
+    LOGGER.info("Legislation replacements identified: %s", len(replacements))
+    return replacements
+
+
+def tokenize_paragraphs(texts: list[str]) -> list[Doc]:
+    """
+    Tokenize parts of the judgment content, such as changed paragraphs, for the extractors to run on them only.
+    :param texts: the parts of the judgment content text
+    :return: the tokenized parts
+    """
+    return [MODEL_REGISTRY.tokenize(text) for text in texts]
+
+
+def determine_caselaw_replacements_by_paragraph(
+    docs: list[Doc],
+    pattern_list: list[dict],
+    rules_version: str | None = None,
+) -> list[list[DetectedReference]]:
+    """
+    Detect case law citations in parts of the judgment, as `determine_caselaw_replacements` does in the whole of it
+    :param docs: the tokenized parts, from `tokenize_paragraphs`
+    :param pattern_list: entity ruler patterns generated from the citation rules manifest
+    :param rules_version: identifier of the version of the rules `pattern_list` was loaded from
+    :return: the citations detected in each part, with offsets in that part
+    """
+    citation_ruler = MODEL_REGISTRY.citation_ruler(pattern_list, rules_version)
+    manifest = lookup_tables.LOOKUP_TABLES.manifest()
+    return [case_references(citation_ruler(doc), manifest) for doc in docs]
+
+
+def determine_judgment_years(file_content: str) -> set[int]:
+    """
+    The years mentioned in the judgment, whose legislation titles are looked for in every part of it
+    :param file_content: judgment content text, as returned by `parse_file`
+    :return: the years
+    """
+    return detect_year_span(MODEL_REGISTRY.tokenize(file_content), MODEL_REGISTRY.base)
+
+
+def determine_legislation_replacements_by_paragraph(docs: list[Doc], years: set[int]) -> list[list[DetectedReference]]:
+    """
+    Detect legislation references in parts of the judgment, as `determine_legislation_replacements` does in the
+    whole of it, each part looked for the titles of the years mentioned anywhere in the judgment
+    :param docs: the tokenized parts, from `tokenize_paragraphs`
+    :param years: the years mentioned in the judgment, from `determine_judgment_years`
+    :return: the references detected in each part, with offsets in that part
+    """
+    legislation_index = lookup_tables.LOOKUP_TABLES.legislation()
+    phrase_matcher = MODEL_REGISTRY.legislation_matcher(legislation_index)
+    return [detect_leg_references(legislation_index, MODEL_REGISTRY.base, doc, phrase_matcher, years) for doc in docs]
+
+
+def determine_abbreviation_definitions_by_paragraph(docs: list[Doc]) -> list[list[DetectedReference]]:
+    """
+    Find the abbreviations defined in parts of the judgment, without looking for their occurrences
+    :param docs: the tokenized parts, from `tokenize_paragraphs`
+    :return: the definitions found in each part, with the offsets of their short form in that part
+    """
+    if not abbreviations_enabled():
+        return [[] for _ in docs]
+    detector = MODEL_REGISTRY.abbreviation_detector()
+    return [abb_definitions(doc, detector) for doc in docs]
+
+
+def determine_abbreviation_occurrences(
+    docs: list[Doc],
+    definitions: list[AbbreviationDefinition],
+) -> list[list[DetectedReference]]:
+    """
+    Find the occurrences of the abbreviations defined in the judgment in parts of it
+    :param docs: the tokenized parts, from `tokenize_paragraphs`
+    :param definitions: the definitions that apply to the judgment, from `unique_definitions`
+    :return: the occurrences found in each part, with offsets in that part
+    """
+    matcher = build_definitions_matcher(MODEL_REGISTRY.base.vocab, definitions)
+    return [abb_occurrences(doc, matcher) for doc in docs]
+
+
+def determine_lookup_tables_version() -> str:
+    """
+    Version of the lookup tables the extractors resolve references with, which changes with their contents
+    :return: the version of the lookup tables in use, for the database the signatures of its tables
+    """
+    return lookup_tables.LOOKUP_TABLES.version()
+
+
+def determine_paragraph_lookback() -> int:
+    """
+    Furthest the first-stage extractors read before a reference, in tokens: the long form of an abbreviation
+    defined after it, or the segment of the longest legislation title fuzzy matched
+    :return: the number of tokens of the judgment before a paragraph its references depend on
+    """
+    legislation_lookback = MODEL_REGISTRY.legislation_lookback(lookup_tables.LOOKUP_TABLES.legislation())
+    return max(LONG_FORM_LOOKBACK, legislation_lookback)
 
 
 def make_replacements_input(caselaw_replacements, abbreviation_replacements, legislation_replacements) -> str:
@@ -81,54 +226,133 @@ def make_replacements_input(caselaw_replacements, abbreviation_replacements, leg
     return tuple_file
 
 
-def replace_legislation_provisions(xml: DocumentAsXMLString) -> DocumentAsXMLString:
-    resolved_refs = provisions_pipeline(xml)
-
+def replace_document_legislation_provisions(document: JudgmentDocument) -> int:
+    """
+    Links the provisions of the legislation referred to in the judgment, in place
+    :param document: the parsed judgment
+    :return: number of provisions linked
+    """
+    resolved_refs = resolve_provisions([element_markup(paragraph) for paragraph in document.paragraphs()])
     if resolved_refs:
-        soup = BeautifulSoup(xml, "xml")
-        output_file_data = replace_references_by_paragraph(soup, resolved_refs)
-        return DocumentAsXMLString(str(output_file_data))
+        replace_references_in_document(document, resolved_refs)
+    return len(resolved_refs)
+
+
+def replace_legislation_provisions(xml: DocumentAsXMLString) -> DocumentAsXMLString:
+    document = JudgmentDocument.parse(xml)
+    if replace_document_legislation_provisions(document):
+        return document.serialize()
     return xml
 
 
-def add_timestamp_and_engine_version(
-    file_data: DocumentAsXMLString,
+def add_document_timestamp_and_engine_version(
+    document: JudgmentDocument,
     enrichment_version: str = "7.4.0",
-) -> DocumentAsXMLString:
+) -> None:
     """
-    Add today's timestamp and version at time of enrichment
+    Add today's timestamp and version at time of enrichment, in place
     """
-    soup = BeautifulSoup(file_data, "xml")
     today = datetime.datetime.now(tz=datetime.UTC)
     today_str = today.strftime("%Y-%m-%dT%H:%M:%S")
-    enriched_date = soup.new_tag(f'FRBRdate date="{today_str}" name="tna-enriched"')
-    enrichment_version_tag = soup.new_tag(
-        "uk:tna-enrichment-engine",
-        attrs={"xmlns:uk": "https://caselaw.nationalarchives.gov.uk/akn"},
-    )
-    enrichment_version_tag.string = enrichment_version
-    if not soup.proprietary:
+
+    proprietary = find_element(document.root, "proprietary")
+    if proprietary is None:
         msg = "This document does not have a <proprietary> element."
         raise SourceXMLMissingElement(msg)
 
-    soup.proprietary.append(enrichment_version_tag)
+    enrichment_version_tag = lxml.etree.SubElement(
+        proprietary,
+        f"{{{namespaces['uk']}}}tna-enrichment-engine",
+        nsmap={"uk": namespaces["uk"]},
+    )
+    enrichment_version_tag.text = enrichment_version
 
-    if not soup.FRBRManifestation or not soup.FRBRManifestation.FRBRdate:
+    manifestation = find_element(document.root, "FRBRManifestation")
+    manifestation_date = None if manifestation is None else find_element(manifestation, "FRBRdate")
+    if manifestation_date is None:
         msg = "This document does not already have a manifestation date."
         raise SourceXMLMissingElement(msg)
 
-    soup.FRBRManifestation.FRBRdate.insert_after(enriched_date)
+    enriched_date = lxml.etree.Element(lxml.etree.QName(lxml.etree.QName(manifestation_date).namespace, "FRBRdate"))
+    enriched_date.set("date", today_str)
+    enriched_date.set("name", "tna-enriched")
+    # directly after the manifestation date, before the whitespace following it
+    enriched_date.tail = manifestation_date.tail
+    manifestation_date.tail = None
+    manifestation_date.addnext(enriched_date)
+
+
+def reuse_enriched_judgment(
+    document: JudgmentDocument,
+    enriched: DocumentAsXMLBytes,
+    enrichment_version: str = "7.4.0",
+) -> DocumentAsXMLBytes:
+    """
+    Reuse a previous enrichment of the judgment, with the metadata the judgment has now, stamped again.
+    Enrichment only changes the metadata to stamp it, so the rest of the previous enrichment is as the
+    judgment would be enriched again.
+    :param document: the judgment, from `parse_judgment`
+    :param enriched: a previous enrichment of the same judgment, from `enrich_xml`
+    :param enrichment_version: version of the enrichment engine
+    :return: the enriched judgment
+    """
+    enriched_document = JudgmentDocument.parse(enriched)
+    enriched_document.xml_declaration = document.xml_declaration
+    meta = find_element(document.root, "meta")
+    enriched_meta = find_element(enriched_document.root, "meta")
+    if meta is not None and enriched_meta is not None:
+        # as the rest of the judgment was when it was enriched
+        strip_whitespace_text(meta)
+        enriched_meta.attrib.clear()
+        enriched_meta.attrib.update(meta.attrib)
+        enriched_meta.text = meta.text
+        enriched_meta[:] = list(meta)
+    remove_enrichment_metadata(enriched_document.root)
+    add_document_timestamp_and_engine_version(enriched_document, enrichment_version)
+    return enriched_document.serialize_bytes()
+
 
-    return DocumentAsXMLString(str(soup))
+def add_timestamp_and_engine_version(
+    file_data: DocumentAsXMLString,
+    enrichment_version: str = "7.4.0",
+) -> DocumentAsXMLString:
+    """
+    Add today's timestamp and version at time of enrichment
+    """
+    document = JudgmentDocument.parse(file_data)
+    add_document_timestamp_and_engine_version(document, enrichment_version)
+    return document.serialize()
 
 
-def _init_caselaw_nlp(pattern_list: list[dict]) -> spacy.language.Language:
-    nlp = spacy.load("en_core_web_sm", exclude=["tok2vec", "attribute_ruler", "lemmatizer", "ner"])
-    nlp.max_length = 5000000
+def enrich_document_oblique_references(document: JudgmentDocument) -> int:
+    """
+    Determines oblique references in the judgment and links them, in place
+    :param document: the parsed judgment
+    :return: number of oblique references linked
+    """
+    oblique_reference_replacements = get_oblique_reference_replacements(
+        [markup_map(paragraph) for paragraph in document.paragraphs()],
+    )
+    if oblique_reference_replacements:
+        replace_references_in_document(document, oblique_reference_replacements)
+    return len(oblique_reference_replacements)
 
-    citation_ruler = nlp.add_pipe("entity_ruler")
-    citation_ruler.add_patterns(pattern_list)
-    return nlp
+
+def enrich_document_second_stage(document: JudgmentDocument) -> SecondStageCounts:
+    """
+    Links the oblique references and then the legislation provisions of the judgment in one walk
+    over its paragraphs, in place, as `enrich_document_oblique_references` followed by
+    `replace_document_legislation_provisions` would
+    :param document: the parsed judgment
+    :return: number of oblique references and of provisions linked
+    """
+    counts = link_second_stage_references(document)
+    LOGGER.info(
+        "Second stage references linked: %s oblique references, %s provisions",
+        counts.oblique_references,
+        counts.provisions,
+    )
+    return counts
 
 
 def enrich_oblique_references(file_content: DocumentAsXMLString) -> DocumentAsXMLString:
@@ -138,11 +362,10 @@ def enrich_oblique_references(file_content: DocumentAsXMLString) -> DocumentAsXM
     :param file_content: original file content
     :return: updated file content with enriched oblique references
     """
-    oblique_reference_replacements = get_oblique_reference_replacements_by_paragraph(file_content)
-    if not oblique_reference_replacements:
+    document = JudgmentDocument.parse(file_content)
+    if not enrich_document_oblique_references(document):
         return file_content
-    soup = BeautifulSoup(file_content, "xml")
-    return replace_references_by_paragraph(soup, oblique_reference_replacements)
+    return document.serialize()
 
 
 def make_post_header_replacements(
@@ -181,3 +404,32 @@ def make_post_header_replacements(
         full_replaced_text_content = f"{xml_declaration}\n{full_replaced_text_content}"
 
     return DocumentAsXMLString(full_replaced_text_content)
+
+
+def make_planned_replacements(
+    document: JudgmentDocument,
+    source_map: SourceMap,
+    caselaw_replacements: list[DetectedReference],
+    legislation_replacements: list[DetectedReference],
+    abbreviation_replacements: list[DetectedReference],
+) -> None:
+    """
+    Tags the references detected in the content text of a legal document where they were detected,
+    in the content following the header. This updates the parsed document in place.
+
+    Args:
+        document (JudgmentDocument): The parsed legal document, from `parse_judgment`
+        source_map (SourceMap): The source map of the legal document, from `map_judgment_content`
+        caselaw_replacements (list): The detected case law citations
+        legislation_replacements (list): The detected legislation references
+        abbreviation_replacements (list): The detected abbreviations
+    """
+    plan = build_replacement_plan(
+        source_map,
+        caselaw_replacements,
+        legislation_replacements,
+        abbreviation_replacements,
+    )
+    strip_whitespace_text(document.root)
+    apply_replacement_plan(document.root, plan)
+    LOGGER.info("Applied %s planned replacements", len(plan))
@@ -1,12 +1,16 @@
 import json
 import logging
 
+import pandas as pd
+import sqlalchemy
 from aws_lambda_powertools.utilities.data_classes import (
     EventBridgeEvent,
     event_source,
 )
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from database.db_connection import get_legislation_lookup
+from database.judgment_signatures import JudgmentSignatureStore, legislation_change
 from lambdas.update_legislation_table.database import remove_duplicates
 from lambdas.update_legislation_table.fetch_legislation import fetch_legislation
 from utils.initialise_db import init_db_engine
@@ -40,6 +44,43 @@ def handler(event: EventBridgeEvent, context: LambdaContext) -> None:
         raise
 
 
+def plan_reenrichment(engine: sqlalchemy.Engine, legislation_data_frame: pd.DataFrame) -> int:
+    """
+    Plans the judgments whose enrichment the fetched legislation could change to be enriched again, if judgment
+    signatures are recorded. A failure to plan is logged and does not stop the legislation table from being updated.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.Engine
+        Engine of the database holding the legislation table and the judgment signatures
+    legislation_data_frame : pd.DataFrame
+        The legislation about to be appended to the legislation table
+
+    Returns
+    -------
+    int
+        The number of judgments planned
+    """
+    store = JudgmentSignatureStore.from_environment(engine.raw_connection)
+    if not store.enabled:
+        return 0
+    try:
+        old_legislation = None
+        if sqlalchemy.inspect(engine).has_table(LEGISLATION_TABLE_NAME):
+            with engine.connect() as db_conn:
+                old_legislation = get_legislation_lookup(db_conn)
+        new_legislation = (
+            legislation_data_frame if old_legislation is None else pd.concat([old_legislation, legislation_data_frame])
+        )
+        change = legislation_change(old_legislation, new_legislation)
+    except Exception:
+        LOGGER.exception(
+            "Could not compare the legislation table with the fetched legislation, so no judgment is planned",
+        )
+        return 0
+    return store.plan_reenrichment(change, LEGISLATION_TABLE_NAME)
+
+
 def update_legislation_table(trigger_date: int | None):
     """
     Updates the legislation database table with data fetched from the
@@ -62,6 +103,9 @@ def update_legislation_table(trigger_date: int | None):
         trigger_date,
     )
 
+    # plan before appending, so that a failed update plans again when retried
+    plan_reenrichment(engine, legislation_data_frame)
+
     legislation_data_frame.to_sql(LEGISLATION_TABLE_NAME, engine, if_exists="append", index=False)
     with engine.connect() as db_conn:
         remove_duplicates(db_conn, LEGISLATION_TABLE_NAME)
@@ -6,9 +6,11 @@ from io import StringIO
 import boto3
 import pandas as pd
 import spacy
+import sqlalchemy
 from aws_lambda_powertools.utilities.data_classes import S3Event, event_source
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from database.judgment_signatures import JudgmentSignatureStore, manifest_change
 from utils.initialise_db import init_db_engine
 
 LOGGER = logging.getLogger()
@@ -74,6 +76,31 @@ def test_manifest(df: pd.DataFrame, patterns: list[str]) -> None:
         raise MismatchedIdShapeError
 
 
+def read_manifest(engine: sqlalchemy.Engine) -> pd.DataFrame | None:
+    """
+    Read the rules of the manifest table, before they are replaced
+    """
+    if not sqlalchemy.inspect(engine).has_table("manifest"):
+        return None
+    return pd.read_sql("SELECT * FROM manifest", engine)
+
+
+def plan_reenrichment(engine: sqlalchemy.Engine, df: pd.DataFrame) -> int:
+    """
+    Plan the judgments whose enrichment the new rules could change to be enriched again, if judgment signatures
+    are recorded. A failure to plan is logged and does not stop the rules from being updated.
+    """
+    store = JudgmentSignatureStore.from_environment(engine.raw_connection)
+    if not store.enabled:
+        return 0
+    try:
+        change = manifest_change(read_manifest(engine), df)
+    except Exception:
+        LOGGER.exception("Could not compare the manifest with the new rules, so no judgment is planned")
+        return 0
+    return store.plan_reenrichment(change, "manifest")
+
+
 @event_source(data_class=S3Event)
 def lambda_handler(event: S3Event, context: LambdaContext) -> None:
     """
@@ -115,6 +142,9 @@ def lambda_handler(event: S3Event, context: LambdaContext) -> None:
             engine = init_db_engine()
             LOGGER.info("Engine created")
 
+            # plan before replacing the rules, so that a failed update plans again when retried
+            plan_reenrichment(engine, df)
+
             # push rules to database --> if_exists="replace" as we're pushing full ruleset
             df.to_sql("manifest", engine, if_exists="replace", index=False)
 
@@ -9,18 +9,23 @@ also test for. If this is updated, this will need to be reflected in the tests.
 import unittest
 
 import spacy
-from spacy.language import Language
 
 from enrichment.abbreviation_extraction.abbreviations import (
+    MAX_PARENTHESIS_TOKENS,
     AbbreviationDetector,
     filter_matches,
     find_abbreviation,
+    find_parentheses,
+    verify_match_format,
 )
-
-
-@Language.factory("abbreviation_detector")
-def create_abbreviation_detector(nlp, name: str):
-    return AbbreviationDetector(nlp)
+from enrichment.abbreviation_extraction.abbreviations_matcher import (
+    abb_definitions,
+    abb_occurrences,
+    abb_references,
+    build_definitions_matcher,
+    unique_definitions,
+)
+from utils.custom_types import DetectedReference
 
 
 class TestFindAbbreviation(unittest.TestCase):
@@ -256,3 +261,120 @@ class TestFilterMatches(unittest.TestCase):
         doc = self.nlp(text)
         filtered = filter_matches([(1, 5, 9)], doc)
         assert len(filtered) == 0
+
+
+class TestFindParentheses(unittest.TestCase):
+    """Unit Tests for `find_parentheses`"""
+
+    def setUp(self):
+        self.nlp = spacy.blank("en")
+
+    def test_parentheses_are_bounded(self):
+        """
+        Given a long judgment with many bracketed asides
+        When find_parentheses is called with it
+        Then only brackets short enough to hold a definition are found, each once
+        """
+        paragraph = (
+            "The Act (as amended) applies to all of the appeals before the tribunal ( see below ) here, "
+            "and (for the reasons given by the judge at first instance in his judgment) there."
+        )
+        doc = self.nlp.make_doc(" ".join([paragraph] * 500))
+
+        matches = find_parentheses(doc)
+
+        assert len(matches) == 1000
+        assert all(end - start - 2 <= MAX_PARENTHESIS_TOKENS for _, start, end in matches)
+        assert {doc[start:end].text for _, start, end in matches} == {"(as amended)", "( see below )"}
+
+    def test_innermost_brackets(self):
+        doc = self.nlp.make_doc('Tax (the "Finance Act" ("FA")) and the Upper Tribunal ("UT") ("Tribunal")')
+
+        spans = [doc[start:end].text for _, start, end in find_parentheses(doc)]
+
+        assert spans == ['("FA")', '("UT")', '("Tribunal")']
+
+
+class TestVerifyMatchFormat(unittest.TestCase):
+    """Unit Tests for `verify_match_format`"""
+
+    def test_every_unquoted_match_is_dropped(self):
+        """
+        Given consecutive matches that are not wrapped in quotes
+        When verify_match_format is called with them
+        Then none of them are kept
+        """
+        doc = spacy.blank("en").make_doc('(a) (b) (c) ("UT")')
+
+        assert verify_match_format(find_parentheses(doc), doc) == [(-1, 9, 14)]
+
+
+class TestAbbreviationDetector(unittest.TestCase):
+    """Unit Tests for `AbbreviationDetector` over a whole judgment"""
+
+    def setUp(self):
+        self.nlp = spacy.blank("en")
+        self.detector = AbbreviationDetector(self.nlp)
+
+    def test_occurrences_across_the_judgment(self):
+        """
+        Given a judgment defining abbreviations and using them before and after their definitions
+        When the detector is called with it
+        Then every occurrence of each abbreviation is found, with the long form of its definition
+        """
+        text = (
+            'The UTC heard the appeal. The Upper Tribunal Chamber ("UTC") and the Finance Act 2004 ("FA2004") '
+            + "are relevant. " * 200
+            + "Under the FA2004 the UTC allowed the appeal."
+        )
+        doc = self.detector(self.nlp.make_doc(text))
+
+        abbreviations = sorted((abrv.start_char, str(abrv), str(abrv._.long_form)) for abrv in doc._.abbreviations)
+
+        assert [(abrv, long_form) for _, abrv, long_form in abbreviations] == [
+            ("UTC", "Upper Tribunal Chamber"),
+            ("UTC", "Upper Tribunal Chamber"),
+            ("FA2004", "Finance Act 2004"),
+            ("FA2004", "Finance Act 2004"),
+            ("UTC", "Upper Tribunal Chamber"),
+        ]
+        assert all(text[start : start + len(abrv)] == abrv for start, abrv, _ in abbreviations)
+
+    def test_abbreviations_are_not_shared_between_docs(self):
+        first = self.detector(self.nlp.make_doc('The Upper Tribunal Chamber ("UTC")'))
+        second = self.detector(self.nlp.make_doc("No abbreviations here"))
+
+        assert len(first._.abbreviations) == 1
+        assert second._.abbreviations == []
+
+    def test_definitions_and_occurrences_found_by_paragraph(self):
+        """
+        Given a judgment whose paragraphs define abbreviations, one of them twice
+        When the definitions of each paragraph are found, and the ones that apply looked for in every paragraph
+        Then the occurrences found are the ones found in the whole judgment at once
+        """
+        paragraphs = [
+            'The Upper Tribunal Chamber ("UTC") heard the appeal.',
+            'Having heard both parties at length, it held that the Finance Act 2004 ("FA2004") applies to the UTC.',
+            'Under the FA2004, the Unfair Terms Clause ("UTC") is not relevant.',
+        ]
+        whole = abb_references(self.nlp.make_doc(" ".join(paragraphs)), self.detector)
+
+        definitions = unique_definitions(
+            definition.replacement
+            for paragraph in paragraphs
+            for definition in abb_definitions(self.nlp.make_doc(paragraph), self.detector)
+        )
+        matcher = build_definitions_matcher(self.nlp.vocab, definitions)
+        by_paragraph = []
+        start = 0
+        for paragraph in paragraphs:
+            by_paragraph += [
+                DetectedReference(reference.start + start, reference.end + start, reference.replacement)
+                for reference in abb_occurrences(self.nlp.make_doc(paragraph), matcher)
+            ]
+            start += len(paragraph) + 1
+
+        assert [definition.long_form for definition in definitions] == ["Upper Tribunal Chamber", "Finance Act 2004"]
+        assert by_paragraph == whole
+        assert len(whole) == 5
@@ -0,0 +1,135 @@
+"""
+Testing the in-memory index of the rules manifest, and resolving detected citations against it.
+"""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from database.db_connection import _matched_rule_from_row, get_matched_rule, get_matched_rules
+from database.manifest_index import ManifestIndex
+from enrichment.caselaw_extraction.caselaw_matcher import case, case_pipeline, case_references
+
+MANIFEST_CSV = "src/enrichment/caselaw_extraction/rules/2022_06_30_Citation_Manifest.csv"
+
+
+@pytest.fixture(scope="module")
+def manifest():
+    # empty cells come back from the database as NULL, not NaN
+    manifest_df = pd.read_csv(MANIFEST_CSV).astype(object)
+    rows = manifest_df.where(manifest_df.notna(), None).to_dict("records")
+    return {row["id"]: _matched_rule_from_row(row) for row in rows}
+
+
+class CountingManifest(dict):
+    """Manifest mapping recording how many times each rule is looked up."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = []
+
+    def __getitem__(self, rule_id):
+        self.lookups.append(rule_id)
+        return super().__getitem__(rule_id)
+
+
+class TestCasePipeline:
+    def test_resolves_citations_from_the_manifest(self, nlp, manifest):
+        doc = nlp("See [2022] UKSC 12 and [2004] 1 WLR 123.")
+
+        replacements = case_pipeline(doc, manifest)
+
+        assert replacements == [
+            case(
+                "[2022] UKSC 12",
+                "[2022] UKSC 12",
+                "2022",
+                "https://caselaw.nationalarchives.gov.uk/uksc/2022/12",
+                True,
+                "uksc",
+            ),
+            case("[2004] 1 WLR 123", "[2004] 1 WLR 123", "2004", "#", False, "wlr"),
+        ]
+
+    def test_identical_citations_resolved_once(self, nlp, manifest):
+        counting_manifest = CountingManifest(manifest)
+        doc = nlp("[2022] UKSC 12 was followed in [2023] UKSC 1, applying [2022] UKSC 12.")
+
+        replacements = case_pipeline(doc, counting_manifest)
+
+        assert [replacement.citation_match for replacement in replacements] == [
+            "[2022] UKSC 12",
+            "[2023] UKSC 1",
+            "[2022] UKSC 12",
+        ]
+        assert len(counting_manifest.lookups) == 2
+
+    def test_references_keep_offsets_of_citations(self, nlp, manifest):
+        text = "[2022] UKSC 12 was followed in [2023] UKSC 1, applying [2022] UKSC 12."
+        doc = nlp(text)
+
+        references = case_references(doc, manifest)
+
+        assert [text[reference.start : reference.end] for reference in references] == [
+            "[2022] UKSC 12",
+            "[2023] UKSC 1",
+            "[2022] UKSC 12",
+        ]
+        assert [reference.start for reference in references] == [0, 31, 55]
+        assert references[0].replacement is references[2].replacement
+
+    def test_unknown_rule_raises(self, nlp):
+        doc = nlp("See [2022] UKSC 12.")
+
+        with pytest.raises(KeyError):
+            case_pipeline(doc, {})
+
+
+class TestManifestIndex:
+    @patch("database.manifest_index.get_matched_rules")
+    @patch("database.manifest_index.get_table_signature")
+    def test_manifest_loaded_once_while_unchanged(self, mock_signature, mock_rules, manifest):
+        mock_signature.return_value = (1234, 197, 42)
+        mock_rules.return_value = dict(manifest)
+        index = ManifestIndex()
+
+        first = index.get(conn=None)
+        second = index.get(conn=None)
+
+        assert second is first
+        assert first["uksc"] == manifest["uksc"]
+        mock_rules.assert_called_once()
+        assert mock_signature.call_count == 2
+
+    @patch("database.manifest_index.get_matched_rules")
+    @patch("database.manifest_index.get_table_signature")
+    def test_manifest_reloaded_when_table_changes(self, mock_signature, mock_rules, manifest):
+        mock_signature.side_effect = [(1234, 197, 42), (5678, 197, 43)]
+        mock_rules.return_value = dict(manifest)
+        index = ManifestIndex()
+
+        first = index.get(conn=None)
+        second = index.get(conn=None)
+
+        assert second is not first
+        assert mock_rules.call_count == 2
+
+    @patch("database.manifest_index.get_matched_rules", return_value={})
+    @patch("database.manifest_index.get_table_signature", return_value=(1, 0, None))
+    def test_manifest_is_read_only(self, _mock_signature, _mock_rules):
+        rules = ManifestIndex().get(conn=None)
+
+        with pytest.raises(TypeError):
+            rules["new"] = None  # type: ignore[index]
+
+
+@pytest.mark.integration
+class TestManifestQueries:
+    def test_bulk_load_matches_single_rule_queries(self, db_connection, manifest_table):
+        rules = get_matched_rules(db_connection)
+
+        assert len(rules) == 197
+        for rule_id in ("uksc", "aller_a", "acd"):
+            # compare the string forms, as empty columns may be read back as NaN, which is never equal to itself
+            assert str(rules[rule_id]) == str(get_matched_rule(db_connection, rule_id))
@@ -311,8 +311,8 @@ def _configure_enrichment_handler_env(monkeypatch, cfg: E2EConfig) -> None:
         monkeypatch.setenv("API_SECRET_NAME", cfg.api_secret_name)
 
 
-def _latest_tna_enriched_date(xml: str) -> str | None:
-    dates = re.findall(r'<FRBRdate date="([^"]+)" name="tna-enriched"', xml)
+def _latest_tna_enriched_date(xml: bytes) -> bytes | None:
+    dates = re.findall(rb'<FRBRdate date="([^"]+)" name="tna-enriched"', xml)
     return max(dates) if dates else None
 
 
@@ -321,9 +321,9 @@ def _wait_for_enrichment(
     uri: str,
     username: str,
     password: str,
-    before_xml: str,
+    before_xml: bytes,
     timeout_seconds: int = 180,
-) -> str:
+) -> bytes:
     before_latest_enriched_date = _latest_tna_enriched_date(before_xml)
 
     deadline = time.time() + timeout_seconds
@@ -336,7 +336,7 @@ def _wait_for_enrichment(
             return current_xml
 
         # Fallback for docs where timestamp extraction is unavailable.
-        if current_xml != before_xml and "<uk:tna-enrichment-engine" in current_xml:
+        if current_xml != before_xml and b"<uk:tna-enrichment-engine" in current_xml:
             return current_xml
         time.sleep(5)
 
@@ -407,8 +407,8 @@ def test_enrichment_lambda_triggers_and_updates_marklogic(monkeypatch):
             before_xml,
             cfg.timeout_seconds,
         )
-        assert "<akomaNtoso" in after_xml
-        assert "<uk:tna-enrichment-engine" in after_xml
+        assert b"<akomaNtoso" in after_xml
+        assert b"<uk:tna-enrichment-engine" in after_xml
         assert after_xml != before_xml
     finally:
         if fixture_was_created:
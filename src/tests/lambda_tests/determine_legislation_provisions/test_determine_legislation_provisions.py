@@ -18,15 +18,14 @@ def test_replace_legislation_provisions_no_refs_returns_valid_xml():
 
 
 def test_replace_legislation_provisions_updates_xml_when_resolved_refs(monkeypatch):
-    def fake_provisions_pipeline(_xml):
+    def fake_resolve_provisions(_paragraphs):
         return [((1, 2), "dummy-ref")]
 
-    def fake_replace_references_by_paragraph(soup, _resolved_refs):
-        soup.find("p").string = "Updated with provisions"
-        return soup
+    def fake_replace_references_in_document(document, _resolved_refs):
+        document.paragraphs()[0].text = "Updated with provisions"
 
-    monkeypatch.setattr(steps, "provisions_pipeline", fake_provisions_pipeline)
-    monkeypatch.setattr(steps, "replace_references_by_paragraph", fake_replace_references_by_paragraph)
+    monkeypatch.setattr(steps, "resolve_provisions", fake_resolve_provisions)
+    monkeypatch.setattr(steps, "replace_references_in_document", fake_replace_references_in_document)
 
     xml_in = "<xml><judgmentBody><p>Original text</p></judgmentBody></xml>"
     xml_output = steps.replace_legislation_provisions(xml_in)
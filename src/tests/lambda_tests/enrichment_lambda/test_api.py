@@ -1,67 +1,206 @@
+import gzip
 import json
-from unittest.mock import Mock, patch
+import threading
+from email.message import Message
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
 
 import pytest
-import requests
 
 from lambdas.enrichment_lambda import api
 
 
-@patch("lambdas.enrichment_lambda.api.urllib3.PoolManager")
-def test_fetch_judgment_success(mock_pool_manager):
-    response = Mock()
-    response.status = 200
-    response.data.decode.return_value = "<xml/>"
-    mock_pool_manager.return_value.request.return_value = response
+class StubRequest(NamedTuple):
+    method: str
+    path: str
+    headers: Message
+    body: bytes
+    client_port: int
 
-    result = api.fetch_judgment("https://api.example/", "uksc/2024/1", "user", "pass")
 
-    assert result == "<xml/>"
+class StubAPI:
+    """A local HTTP server answering each request with the next of the responses queued for its method."""
 
+    def __init__(self) -> None:
+        self.requests: list[StubRequest] = []
+        self.responses: dict[str, list[tuple[int, bytes]]] = {}
+        stub = self
 
-@patch("lambdas.enrichment_lambda.api.urllib3.PoolManager")
-def test_fetch_judgment_non_200_raises(mock_pool_manager):
-    response = Mock()
-    response.status = 404
-    response.data.decode.return_value = "missing"
-    mock_pool_manager.return_value.request.return_value = response
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append(
+                    StubRequest(self.command, self.path, self.headers, body, self.client_address[1]),
+                )
+                status, data = stub.responses[self.command].pop(0)
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    data = gzip.compress(data)
+                self.send_response(status)
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_PUT = do_DELETE = do_PATCH = _respond
+
+            def log_message(self, *_args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def queue(self, method: str, *responses: tuple[int, bytes]) -> None:
+        self.responses.setdefault(method, []).extend(responses)
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    stub = StubAPI()
+    monkeypatch.setattr(api, "API_CLIENT", api.APIClient(backoff_factor=0))
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def test_fetch_judgment_success(stub_api):
+    stub_api.queue("GET", (200, b"<xml/>"))
+
+    result = api.fetch_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+
+    assert result == b"<xml/>"
+    request = stub_api.requests[0]
+    assert request.path == "/judgment/uksc/2024/1"
+    assert request.headers["Authorization"] == "Basic dXNlcjpwYXNz"
+
+
+def test_fetch_judgment_non_200_raises(stub_api):
+    stub_api.queue("GET", (404, b"missing"))
 
     with pytest.raises(RuntimeError, match="Failed to fetch judgment"):
-        api.fetch_judgment("https://api.example/", "not-found", "user", "pass")
+        api.fetch_judgment(stub_api.endpoint, "not-found", "user", "pass")
 
 
-@patch("lambdas.enrichment_lambda.api.urllib3.PoolManager")
-def test_lock_judgment_non_201_raises(mock_pool_manager):
-    response = Mock()
-    response.status = 500
-    response.data.decode.return_value = "error"
-    mock_pool_manager.return_value.request.return_value = response
+def test_lock_judgment_non_201_raises(stub_api):
+    stub_api.queue("PUT", (500, b"error"))
 
     with pytest.raises(RuntimeError, match="Failed to lock judgment"):
-        api.lock_judgment("https://api.example/", "uksc/2024/1", "user", "pass")
+        api.lock_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
 
 
-@patch("lambdas.enrichment_lambda.api.urllib3.PoolManager")
-def test_unlock_judgment_non_204_or_200_raises(mock_pool_manager):
-    response = Mock()
-    response.status = 500
-    response.data.decode.return_value = "error"
-    mock_pool_manager.return_value.request.return_value = response
+def test_unlock_judgment_non_204_or_200_raises(stub_api):
+    stub_api.queue("DELETE", (500, b"error"))
 
     with pytest.raises(RuntimeError, match="Failed to unlock judgment"):
-        api.unlock_judgment("https://api.example/", "uksc/2024/1", "user", "pass")
+        api.unlock_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+
+
+def test_patch_judgment_http_error_raises_runtime_error(stub_api):
+    stub_api.queue("PATCH", (500, b"patch-failed"))
+
+    with pytest.raises(RuntimeError, match="Failed to patch judgment.*patch-failed"):
+        api.patch_judgment(stub_api.endpoint, "uksc/2024/1", b"<xml/>", "user", "pass")
+
+
+def test_patch_judgment_sends_the_judgment_and_unlocks_it(stub_api):
+    stub_api.queue("PATCH", (200, b""))
+
+    api.patch_judgment(stub_api.endpoint, "uksc/2024/1", "<xml>é</xml>".encode(), "user", "pass")
+
+    request = stub_api.requests[0]
+    assert request.path == "/judgment/uksc/2024/1?unlock=True"
+    assert request.body == "<xml>é</xml>".encode()
+
+
+def test_connections_are_kept_alive(stub_api):
+    stub_api.queue("PUT", (201, b""))
+    stub_api.queue("GET", (200, b"<xml/>"))
+    stub_api.queue("DELETE", (204, b""))
+
+    api.lock_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+    api.fetch_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+    api.unlock_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+
+    assert len({request.client_port for request in stub_api.requests}) == 1
+
+
+def test_idempotent_calls_are_retried(stub_api):
+    stub_api.queue("GET", (503, b"busy"), (502, b"bad gateway"), (200, b"<xml/>"))
+
+    assert api.fetch_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass") == b"<xml/>"
+    assert len(stub_api.requests) == 3
+
+
+def test_retries_run_out(stub_api):
+    stub_api.queue("DELETE", *[(503, b"busy")] * (api.RETRIES + 1))
+
+    with pytest.raises(RuntimeError, match="status code: 503"):
+        api.unlock_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+    assert len(stub_api.requests) == api.RETRIES + 1
+
+
+def test_patch_is_not_retried(stub_api):
+    stub_api.queue("PATCH", (503, b"busy"), (200, b""))
+
+    with pytest.raises(RuntimeError, match="status code: 503"):
+        api.patch_judgment(stub_api.endpoint, "uksc/2024/1", b"<xml/>", "user", "pass")
+    assert len(stub_api.requests) == 1
+
+
+def test_responses_are_gzipped(stub_api):
+    stub_api.queue("GET", (200, b"<xml>" + b"<p>text</p>" * 100 + b"</xml>"))
+
+    result = api.fetch_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+
+    assert "gzip" in stub_api.requests[0].headers["Accept-Encoding"]
+    assert result.startswith(b"<xml><p>text</p>")
+
+
+def test_request_bodies_are_gzipped_when_enabled(stub_api, monkeypatch):
+    monkeypatch.setattr(api, "API_CLIENT", api.APIClient(gzip_requests=True))
+    stub_api.queue("PATCH", (200, b""))
+
+    api.patch_judgment(stub_api.endpoint, "uksc/2024/1", b"<xml/>", "user", "pass")
+
+    request = stub_api.requests[0]
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(request.body) == b"<xml/>"
+
+
+def test_connection_errors_raise_runtime_error(monkeypatch):
+    monkeypatch.setattr(api, "API_CLIENT", api.APIClient(connect_timeout=1, retries=0))
+
+    # nothing listens on the discard port
+    with pytest.raises(RuntimeError, match="Failed to fetch judgment"):
+        api.fetch_judgment("http://127.0.0.1:9/", "uksc/2024/1", "user", "pass")
+
+
+def test_latency_is_recorded_for_every_call(stub_api):
+    stub_api.queue("GET", (200, b"<xml/>"), (404, b"missing"))
+
+    api.fetch_judgment(stub_api.endpoint, "uksc/2024/1", "user", "pass")
+    with pytest.raises(RuntimeError):
+        api.fetch_judgment(stub_api.endpoint, "not-found", "user", "pass")
+
+    metrics = api.API_CLIENT.metrics["fetch"]
+    assert metrics.calls == 2
+    assert 0 < metrics.max_seconds <= metrics.total_seconds
+
 
+def test_client_from_environment(monkeypatch):
+    monkeypatch.setenv("API_CONNECT_TIMEOUT", "2")
+    monkeypatch.setenv("API_READ_TIMEOUT", "120")
+    monkeypatch.setenv("API_GZIP_REQUESTS", "true")
 
-@patch("lambdas.enrichment_lambda.api.requests.patch")
-def test_patch_judgment_http_error_raises_runtime_error(mock_patch):
-    response = Mock()
-    response.status_code = 500
-    response.text = "patch-failed"
-    response.raise_for_status.side_effect = requests.exceptions.HTTPError("bad status")
-    mock_patch.return_value = response
+    client = api.APIClient.from_environment()
 
-    with pytest.raises(RuntimeError, match="Failed to patch judgment"):
-        api.patch_judgment("https://api.example/", "uksc/2024/1", "<xml/>", "user", "pass")
+    assert client.http.connection_pool_kw["timeout"].connect_timeout == 2
+    assert client.http.connection_pool_kw["timeout"].read_timeout == 120
+    assert client.gzip_requests
 
 
 def test_read_message_parses_nested_message_body():
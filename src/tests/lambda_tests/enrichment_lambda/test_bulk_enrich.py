@@ -0,0 +1,123 @@
+import csv
+import json
+import shutil
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from lambdas.enrichment_lambda import bulk_enrich, lookup_tables, steps
+from lambdas.enrichment_lambda.bulk_enrich import DEFAULT_MANIFEST, DEFAULT_RULES, main
+from lambdas.enrichment_lambda.citation_rules import read_rules_file
+from lambdas.enrichment_lambda.lookup_tables import LocalLookupTables
+
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "fixtures/"
+JUDGMENTS = ["ewhc-ch-2023-257_original.xml", "rwanda.xml"]
+LEGISLATION_CSV = """candidate_titles,ref,citation,year,for_fuzzy
+Finance Act 2004,ukpga/2004/12,2004 c. 12,2004,true
+Finance Act 2004,ukpga/2004/12,2004 c. 12,2004,false
+Pensions Act 1995,ukpga/1995/26,1995 c. 26,1995,true
+"""
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "input"
+    (input_dir / "nested").mkdir(parents=True)
+    shutil.copy(FIXTURE_DIR / JUDGMENTS[0], input_dir)
+    shutil.copy(FIXTURE_DIR / JUDGMENTS[1], input_dir / "nested")
+    return input_dir
+
+
+@pytest.fixture
+def legislation_csv(tmp_path):
+    path = tmp_path / "ukpga_lookup.csv"
+    path.write_text(LEGISLATION_CSV)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def restore_process_state():
+    """The bulk enrichment sets the models and lookup tables of the process it enriches judgments in."""
+    with (
+        patch.object(steps, "MODEL_REGISTRY", steps.MODEL_REGISTRY),
+        patch.object(
+            lookup_tables,
+            "LOOKUP_TABLES",
+            lookup_tables.LOOKUP_TABLES,
+        ),
+        patch.object(bulk_enrich, "_RULES", None),
+    ):
+        yield
+
+
+def test_rules_file_is_versioned_by_its_contents(tmp_path):
+    rules = read_rules_file(DEFAULT_RULES)
+    copy = tmp_path / "rules.jsonl"
+    copy.write_text(DEFAULT_RULES.read_text() + json.dumps({"label": "citation", "pattern": "X"}) + "\n")
+
+    assert len(rules.pattern_list) == len(DEFAULT_RULES.read_text().splitlines())
+    assert read_rules_file(copy).version != rules.version
+
+
+def test_lookup_tables_from_files(legislation_csv):
+    tables = LocalLookupTables.from_files(DEFAULT_MANIFEST, legislation_csv)
+
+    assert tables.manifest()["uksc"].URItemplate
+    assert tables.legislation().exact_titles() == ["Finance Act 2004"]
+    assert tables.legislation().signature == (tables.version(),)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bulk_enrich(input_dir, legislation_csv, tmp_path, workers):
+    output_dir = tmp_path / "output"
+
+    exit_code = main(
+        [
+            str(input_dir),
+            str(output_dir),
+            "--legislation",
+            str(legislation_csv),
+            "--workers",
+            str(workers),
+            "--model",
+            "blank:en",
+        ],
+    )
+
+    assert exit_code == 0
+    original = (input_dir / JUDGMENTS[0]).read_bytes()
+    enriched = (output_dir / JUDGMENTS[0]).read_bytes()
+    assert b"tna-enrichment-engine" in enriched
+    assert enriched.count(b'uk:type="legislation"') > original.count(b'uk:type="legislation"')
+    assert (output_dir / "nested" / JUDGMENTS[1]).exists()
+
+    with (output_dir / "timings.csv").open() as timings_file:
+        timings = list(csv.DictReader(timings_file))
+    assert [timing["path"] for timing in timings] == [JUDGMENTS[0], f"nested/{JUDGMENTS[1]}"]
+    assert all(timing["error"] == "" for timing in timings)
+
+    summary = json.loads((output_dir / "summary.json").read_text())
+    assert summary["documents"] == 2
+    assert summary["failed"] == 0
+    assert summary["workers"] == workers
+    assert summary["documents_per_second"] > 0
+
+
+def test_failed_judgment_is_recorded(input_dir, legislation_csv, tmp_path):
+    (input_dir / "broken.xml").write_bytes(b"<akomaNtoso><judgment>")
+
+    exit_code = main(
+        [str(input_dir), str(tmp_path / "output"), "--legislation", str(legislation_csv), "--model", "blank:en"],
+    )
+
+    summary = json.loads((tmp_path / "output" / "summary.json").read_text())
+    assert exit_code == 1
+    assert summary["documents"] == 2
+    assert summary["failed"] == 1
+    assert not (tmp_path / "output" / "broken.xml").exists()
+
+
+def test_legislation_or_database_is_required(input_dir, tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(input_dir), str(tmp_path / "output")])
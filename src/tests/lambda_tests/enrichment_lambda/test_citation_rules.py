@@ -0,0 +1,74 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from lambdas.enrichment_lambda.citation_rules import CitationRulesCache
+
+BUCKET = "rules-bucket"
+KEY = "citation_patterns.jsonl"
+RULES = '{"label": "CITATION", "pattern": [{"ORTH": "UKSC"}], "id": "rule-1"}\n'
+UPDATED_RULES = RULES + '{"label": "CITATION", "pattern": [{"ORTH": "EWCA"}], "id": "rule-2"}\n'
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=KEY, Body=RULES)
+        yield client
+
+
+class CountingS3Client:
+    """Wraps an S3 client, recording the keyword arguments of every get_object call."""
+
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+
+    def get_object(self, **kwargs):
+        self.requests.append(kwargs)
+        return self.client.get_object(**kwargs)
+
+
+class TestCitationRulesCache:
+    def test_first_get_downloads_and_parses_rules(self, s3_client, tmp_path):
+        rules = CitationRulesCache(tmp_path).get(s3_client, BUCKET, KEY)
+
+        assert rules.version == s3_client.head_object(Bucket=BUCKET, Key=KEY)["ETag"]
+        assert rules.pattern_list == [{"label": "CITATION", "pattern": [{"ORTH": "UKSC"}], "id": "rule-1"}]
+
+    def test_unchanged_rules_are_not_downloaded_again(self, s3_client, tmp_path):
+        cache = CitationRulesCache(tmp_path)
+        counting_client = CountingS3Client(s3_client)
+        first = cache.get(counting_client, BUCKET, KEY)
+
+        second = cache.get(counting_client, BUCKET, KEY)
+
+        assert second is first
+        assert counting_client.requests[1]["IfNoneMatch"] == first.version
+
+    def test_changed_rules_are_downloaded(self, s3_client, tmp_path):
+        cache = CitationRulesCache(tmp_path)
+        first = cache.get(s3_client, BUCKET, KEY)
+        s3_client.put_object(Bucket=BUCKET, Key=KEY, Body=UPDATED_RULES)
+
+        second = cache.get(s3_client, BUCKET, KEY)
+
+        assert second.version != first.version
+        assert [pattern["id"] for pattern in second.pattern_list] == ["rule-1", "rule-2"]
+
+    def test_rules_persisted_to_disk_are_revalidated_not_downloaded(self, s3_client, tmp_path):
+        first = CitationRulesCache(tmp_path).get(s3_client, BUCKET, KEY)
+        counting_client = CountingS3Client(s3_client)
+
+        restarted = CitationRulesCache(tmp_path).get(counting_client, BUCKET, KEY)
+
+        assert restarted == first
+        assert counting_client.requests == [{"Bucket": BUCKET, "Key": KEY, "IfNoneMatch": first.version}]
+
+    def test_missing_rules_file_raises(self, s3_client, tmp_path):
+        with pytest.raises(ClientError):
+            CitationRulesCache(tmp_path).get(s3_client, BUCKET, "missing.jsonl")
@@ -9,9 +9,9 @@ from utils.custom_types import APIEndpointBaseURL
 class TestEnrichJudgment:
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_happy_path(
         self,
         mock_fetch,
@@ -37,22 +37,25 @@ class TestEnrichJudgment:
         mock_fetch.assert_called_once_with(endpoint, "uksc/2024/1", "user", "pass")
         mock_lock.assert_called_once_with(endpoint, "uksc/2024/1", "user", "pass")
         mock_enrich.assert_called_once_with(
-            "<xml/>",
+            b"<xml/>",
             [
                 {"pattern": "value"},
                 {"pattern2": "value2"},
             ],
             enrichment_version="7.4.0",
+            rules_version=None,
+            stage_workers=None,
+            uri_reference="uksc/2024/1",
         )
-        mock_patch.assert_called_once_with(endpoint, "uksc/2024/1", "<enriched/>", "user", "pass")
+        mock_patch.assert_called_once_with(endpoint, "uksc/2024/1", b"<enriched/>", "user", "pass")
         mock_unlock.assert_not_called()
 
     @patch("boto3.resource")
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_vcite_enabled(
         self,
         mock_fetch,
@@ -80,13 +83,13 @@ class TestEnrichJudgment:
         mock_lock.assert_called_once()
         mock_enrich.assert_called_once()
         mock_s3_resource.return_value.Object.assert_called_once_with("vcite-bucket", "uksc/2024/1.xml")
-        mock_s3_object.put.assert_called_once()
+        mock_s3_object.put.assert_called_once_with(Body=b"<xml/>")
         mock_patch.assert_not_called()
         mock_unlock.assert_not_called()
 
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment")
     def test_enrich_judgment_fetch_failure(self, mock_fetch, mock_lock, mock_enrich, mock_patch, mock_unlock):
@@ -104,9 +107,9 @@ class TestEnrichJudgment:
 
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_patch_failure(self, mock_fetch, mock_lock, mock_enrich, mock_patch, mock_unlock):
         mock_patch.side_effect = Exception("Patch failed")
         uri_reference = "uksc/2024/1"
@@ -118,15 +121,15 @@ class TestEnrichJudgment:
         mock_fetch.assert_called_once()
         mock_lock.assert_called_once()
         mock_enrich.assert_called_once()
-        mock_patch.assert_called_once_with(endpoint, "uksc/2024/1", "<enriched/>", "user", "pass")
+        mock_patch.assert_called_once_with(endpoint, "uksc/2024/1", b"<enriched/>", "user", "pass")
         mock_unlock.assert_called_once_with(endpoint, "uksc/2024/1", "user", "pass")
 
     @patch("boto3.resource")
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_vcite_upload_failure(
         self,
         mock_fetch,
@@ -157,9 +160,9 @@ class TestEnrichJudgment:
 
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_lock_failure(self, mock_fetch, mock_lock, mock_enrich, mock_patch, mock_unlock):
         mock_lock.side_effect = Exception("Lock failed")
         uri_reference = "uksc/2024/1"
@@ -177,7 +180,7 @@ class TestEnrichJudgment:
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_enrich_failure(self, mock_fetch, mock_lock, mock_enrich, mock_patch, mock_unlock):
         mock_enrich.side_effect = Exception("Enrichment pipeline failed")
         uri_reference = "uksc/2024/1"
@@ -195,7 +198,7 @@ class TestEnrichJudgment:
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_unlock_failure_does_not_mask_original_error(
         self,
         mock_fetch,
@@ -219,9 +222,9 @@ class TestEnrichJudgment:
 
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_with_empty_pattern_list(self, mock_fetch, mock_lock, mock_enrich, mock_patch, mock_unlock):
         uri_reference = "uksc/2024/1"
         endpoint = APIEndpointBaseURL("https://api.example/")
@@ -236,16 +239,23 @@ class TestEnrichJudgment:
 
         mock_fetch.assert_called_once()
         mock_lock.assert_called_once()
-        mock_enrich.assert_called_once_with("<xml/>", [], enrichment_version="7.4.0")
+        mock_enrich.assert_called_once_with(
+            b"<xml/>",
+            [],
+            enrichment_version="7.4.0",
+            rules_version=None,
+            stage_workers=None,
+            uri_reference=uri_reference,
+        )
         mock_patch.assert_called_once()
         mock_unlock.assert_not_called()
 
     @patch("boto3.resource")
     @patch("lambdas.enrichment_lambda.enrich_judgment.unlock_judgment")
     @patch("lambdas.enrichment_lambda.enrich_judgment.patch_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value="<enriched/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.enrich_xml", return_value=b"<enriched/>")
     @patch("lambdas.enrichment_lambda.enrich_judgment.lock_judgment")
-    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value="<xml/>")
+    @patch("lambdas.enrichment_lambda.enrich_judgment.fetch_judgment", return_value=b"<xml/>")
     def test_enrich_judgment_vcite_enabled_with_empty_bucket_name(
         self,
         mock_fetch,
@@ -270,6 +280,6 @@ class TestEnrichJudgment:
         )
 
         mock_s3_resource.return_value.Object.assert_called_once_with("", "uksc/2024/1.xml")
-        mock_s3_object.put.assert_called_once()
+        mock_s3_object.put.assert_called_once_with(Body=b"<xml/>")
         mock_patch.assert_not_called()
         mock_unlock.assert_not_called()
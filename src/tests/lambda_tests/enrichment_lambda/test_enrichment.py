@@ -1,80 +1,293 @@
-from unittest.mock import patch
+import re
+from pathlib import Path
+from unittest.mock import Mock, patch
 
+import pandas as pd
+import pytest
+
+from database.legislation_index import LegislationIndex
+from enrichment.caselaw_extraction.caselaw_matcher import case
+from lambdas.enrichment_lambda import lookup_tables, steps
 from lambdas.enrichment_lambda.enrich_xml import enrich_xml
+from lambdas.enrichment_lambda.lookup_tables import LocalLookupTables
+from lambdas.enrichment_lambda.nlp_models import NLPModelRegistry
+from lambdas.enrichment_lambda.paragraph_memo import ParagraphMemo
+from lambdas.enrichment_lambda.result_cache import DirectoryResultStore, EnrichmentResultCache
+from lambdas.enrichment_lambda.steps import parse_judgment
+from utils.custom_types import Abbreviation, DetectedReference
+
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "fixtures/"
+
+
+PATTERNS = [{"label": "citation", "pattern": [{"ORTH": "["}, {"SHAPE": "dddd"}, {"ORTH": "]"}, {"ORTH": "UKSC"}]}]
+
+
+def without_enriched_date(xml: bytes) -> bytes:
+    return re.sub(rb'<FRBRdate date="[^"]*" name="tna-enriched"/>', b"", xml)
 
 
 class TestEnrichXmlFile:
-    @patch("lambdas.enrichment_lambda.enrich_xml.add_timestamp_and_engine_version")
-    @patch("lambdas.enrichment_lambda.enrich_xml.replace_legislation_provisions")
-    @patch("lambdas.enrichment_lambda.enrich_xml.enrich_oblique_references")
-    @patch("lambdas.enrichment_lambda.enrich_xml.make_post_header_replacements")
-    @patch("lambdas.enrichment_lambda.enrich_xml.make_replacements_input")
+    @patch("lambdas.enrichment_lambda.enrich_xml.add_document_timestamp_and_engine_version")
+    @patch("lambdas.enrichment_lambda.enrich_xml.enrich_document_second_stage")
+    @patch("lambdas.enrichment_lambda.enrich_xml.make_planned_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements")
-    @patch("lambdas.enrichment_lambda.enrich_xml.parse_file")
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    @patch("lambdas.enrichment_lambda.enrich_xml.map_judgment_content")
+    @patch("lambdas.enrichment_lambda.enrich_xml.parse_judgment")
     def test_enrich_xml_file_orchestrates_pipeline(
         self,
         mock_parse,
+        mock_map,
+        mock_tokenize,
         mock_caselaw,
         mock_legislation,
         mock_abbreviation,
-        mock_make_replacements,
-        mock_post_header,
-        mock_oblique,
-        mock_legislation_provisions,
+        mock_planned_replacements,
+        mock_second_stage,
         mock_timestamp,
     ):
-        mock_parse.return_value = "<parsed/>"
+        mock_map.return_value.text = "parsed text"
         mock_caselaw.return_value = [{"caselaw": "ref"}]
         mock_legislation.return_value = [{"legislation": "ref"}]
         mock_abbreviation.return_value = [{"abbreviation": "ref"}]
-        mock_make_replacements.return_value = '{"replacement": "json"}'
-        mock_post_header.return_value = "<with_replacements/>"
-        mock_oblique.return_value = "<with_oblique/>"
-        mock_legislation_provisions.return_value = "<with_provisions/>"
-        mock_timestamp.return_value = "<final_enriched/>"
-
-        result = enrich_xml("<xml/>", [{"pattern": "test"}], "7.4.0")
-
-        assert result == "<final_enriched/>"
-        mock_parse.assert_called_once()
-        mock_caselaw.assert_called_once()
-        mock_legislation.assert_called_once()
-        mock_abbreviation.assert_called_once()
-        mock_timestamp.assert_called_once_with("<with_provisions/>", "7.4.0")
-
-    @patch("lambdas.enrichment_lambda.enrich_xml.add_timestamp_and_engine_version")
-    @patch("lambdas.enrichment_lambda.enrich_xml.replace_legislation_provisions")
-    @patch("lambdas.enrichment_lambda.enrich_xml.enrich_oblique_references")
-    @patch("lambdas.enrichment_lambda.enrich_xml.make_post_header_replacements")
-    @patch("lambdas.enrichment_lambda.enrich_xml.make_replacements_input")
+        document = mock_parse.return_value
+        document.serialize_bytes.return_value = b"<final_enriched/>"
+
+        result = enrich_xml(b"<xml/>", [{"pattern": "test"}], "7.4.0")
+
+        assert result == b"<final_enriched/>"
+        mock_parse.assert_called_once_with(b"<xml/>")
+        mock_map.assert_called_once_with(document)
+        mock_tokenize.assert_called_once_with("parsed text")
+        doc = mock_tokenize.return_value
+        mock_caselaw.assert_called_once_with(doc, [{"pattern": "test"}], None)
+        mock_legislation.assert_called_once_with(doc)
+        mock_abbreviation.assert_called_once_with(doc)
+        mock_planned_replacements.assert_called_once_with(
+            document,
+            mock_map.return_value,
+            [{"caselaw": "ref"}],
+            [{"legislation": "ref"}],
+            [{"abbreviation": "ref"}],
+        )
+        mock_second_stage.assert_called_once_with(document)
+        mock_timestamp.assert_called_once_with(document, "7.4.0")
+        document.serialize_bytes.assert_called_once_with()
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.add_document_timestamp_and_engine_version")
+    @patch("lambdas.enrichment_lambda.enrich_xml.enrich_document_second_stage")
+    @patch("lambdas.enrichment_lambda.enrich_xml.make_planned_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements")
     @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements")
-    @patch("lambdas.enrichment_lambda.enrich_xml.parse_file")
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    @patch("lambdas.enrichment_lambda.enrich_xml.map_judgment_content")
+    @patch("lambdas.enrichment_lambda.enrich_xml.parse_judgment")
     def test_enrich_xml_file_with_empty_pattern_list(
         self,
         mock_parse,
+        mock_map,
+        mock_tokenize,
         mock_caselaw,
         mock_legislation,
         mock_abbreviation,
-        mock_make_replacements,
-        mock_post_header,
-        mock_oblique,
-        mock_legislation_provisions,
+        mock_planned_replacements,
+        mock_second_stage,
         mock_timestamp,
     ):
-        mock_parse.return_value = "<parsed/>"
+        mock_map.return_value.text = ""
         mock_caselaw.return_value = []
         mock_legislation.return_value = []
         mock_abbreviation.return_value = []
-        mock_make_replacements.return_value = "{}"
-        mock_post_header.return_value = "<no_replacements/>"
-        mock_oblique.return_value = "<no_oblique/>"
-        mock_legislation_provisions.return_value = "<final/>"
-        mock_timestamp.return_value = "<final_with_timestamp/>"
+        mock_parse.return_value.serialize_bytes.return_value = b"<final_with_timestamp/>"
+
+        result = enrich_xml(b"<xml/>", [], "7.4.0")
+
+        assert result == b"<final_with_timestamp/>"
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    @patch("lambdas.enrichment_lambda.enrich_xml.parse_judgment")
+    def test_enrich_xml_parses_and_serializes_judgment_once(
+        self,
+        mock_parse,
+        _mock_tokenize,
+        _mock_caselaw,
+        _mock_legislation,
+        _mock_abbreviation,
+    ):
+        documents = []
+
+        def parse(xml):
+            documents.append(parse_judgment(xml))
+            return documents[-1]
+
+        mock_parse.side_effect = parse
+        xml = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_bytes()
+
+        enrich_xml(xml, [], "7.4.0")
+
+        (document,) = documents
+        assert document.metrics.parses == 1
+        assert document.metrics.serializations == 1
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_lookup_tables_version", return_value="tables-1")
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    def test_enrich_xml_reuses_cached_enrichment_of_unchanged_judgment(
+        self,
+        mock_tokenize,
+        _mock_caselaw,
+        _mock_legislation,
+        _mock_abbreviation,
+        _mock_tables_version,
+        tmp_path,
+    ):
+        cache = EnrichmentResultCache(DirectoryResultStore(tmp_path))
+        xml = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_bytes()
+
+        with patch("lambdas.enrichment_lambda.enrich_xml.RESULT_CACHE", cache):
+            enriched = enrich_xml(xml, [], "7.4.0", rules_version="rules-etag")
+            # republished after a metadata edit
+            reused = enrich_xml(
+                xml.replace(b'name="transform"', b'name="transform" edited="true"'),
+                [],
+                "7.4.0",
+                rules_version="rules-etag",
+            )
+            enrich_xml(xml, [], "7.4.0", rules_version="updated-rules-etag")
+
+        assert mock_tokenize.call_count == 2
+        assert cache.metrics.as_dict() == {"hits": 1, "misses": 2, "errors": 0}
+        assert without_enriched_date(reused) == without_enriched_date(enriched).replace(
+            b'name="transform"',
+            b'name="transform" edited="true"',
+        )
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_lookup_tables_version", return_value="tables-1")
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_replacements_by_paragraph")
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    def test_enrich_xml_detects_references_by_paragraph_when_memo_is_on(
+        self,
+        mock_tokenize,
+        mock_by_paragraph,
+        mock_tables_version,
+        tmp_path,
+    ):
+        mock_by_paragraph.return_value = {"caselaw": [], "legislation": [], "abbreviation": []}
+        xml = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_bytes()
+
+        with (
+            patch("lambdas.enrichment_lambda.enrich_xml.PARAGRAPH_MEMO", ParagraphMemo(100)),
+            patch(
+                "lambdas.enrichment_lambda.enrich_xml.RESULT_CACHE",
+                EnrichmentResultCache(DirectoryResultStore(tmp_path)),
+            ),
+        ):
+            enrich_xml(xml, [{"pattern": "test"}], "7.4.0", rules_version="rules-etag", stage_workers=1)
+
+        mock_tokenize.assert_not_called()
+        source_map, *arguments = mock_by_paragraph.call_args.args
+        assert source_map.contents
+        assert arguments == [[{"pattern": "test"}], "rules-etag", "tables-1", 1]
+        # read once for the result cache and the paragraph memo
+        mock_tables_version.assert_called_once()
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements")
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements")
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    def test_enrich_xml_records_signature_of_judgment(
+        self,
+        _mock_tokenize,
+        mock_caselaw,
+        _mock_legislation,
+        mock_abbreviation,
+    ):
+        mock_caselaw.return_value = [
+            DetectedReference(0, 13, case("[2022] UKSC 3", "[2022] UKSC 3", "2022", "#", True, "uksc")),
+        ]
+        mock_abbreviation.return_value = [DetectedReference(20, 24, Abbreviation("HMRC", "Revenue and Customs"))]
+        xml = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_bytes()
+        store = Mock(enabled=True)
+
+        with patch("lambdas.enrichment_lambda.enrich_xml.JUDGMENT_SIGNATURES", store):
+            enrich_xml(xml, PATTERNS, "7.4.0")
+            enrich_xml(xml, PATTERNS, "7.4.0", uri_reference="ewhc/ch/2023/257")
+
+        ((uri, signature),) = [put.args for put in store.put.call_args_list]
+        assert uri == "ewhc/ch/2023/257"
+        assert signature.rule_ids == {"uksc"}
+        assert signature.abbreviations == {"HMRC"}
+        assert {2022, 2023} <= signature.years
+        # the capitalised words of the judgment held by a pattern only
+        assert signature.tokens == {"UKSC"}
+
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_lookup_tables_version", return_value="tables-1")
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_abbreviation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_legislation_replacements", return_value=[])
+    @patch("lambdas.enrichment_lambda.enrich_xml.determine_caselaw_replacements")
+    @patch("lambdas.enrichment_lambda.enrich_xml.tokenize_judgment")
+    def test_enrich_xml_records_signature_of_judgment_served_from_the_cache(
+        self,
+        mock_tokenize,
+        mock_caselaw,
+        _mock_legislation,
+        _mock_abbreviation,
+        _mock_tables_version,
+        tmp_path,
+    ):
+        mock_caselaw.return_value = [
+            DetectedReference(0, 13, case("[2022] UKSC 3", "[2022] UKSC 3", "2022", "#", True, "uksc")),
+        ]
+        xml = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_bytes()
+        cache = EnrichmentResultCache(DirectoryResultStore(tmp_path))
+        store = Mock(enabled=False)
+
+        with (
+            patch("lambdas.enrichment_lambda.enrich_xml.RESULT_CACHE", cache),
+            patch("lambdas.enrichment_lambda.enrich_xml.JUDGMENT_SIGNATURES", store),
+        ):
+            # cached while the signatures were off, so enriched again to record its signature
+            enrich_xml(xml, PATTERNS, "7.4.0", rules_version="rules-etag", uri_reference="first")
+            store.enabled = True
+            enrich_xml(xml, PATTERNS, "7.4.0", rules_version="rules-etag", uri_reference="second")
+            enrich_xml(xml, PATTERNS, "7.4.0", rules_version="rules-etag", uri_reference="third")
+
+        assert mock_tokenize.call_count == 2
+        assert cache.metrics.hits == 2
+        (second, signature), (third, cached_signature) = [put.args for put in store.put.call_args_list]
+        assert (second, third) == ("second", "third")
+        assert cached_signature == signature
+        assert signature.rule_ids == {"uksc"}
+
+
+RWANDA_ABBREVIATIONS = {
+    (b"IAGCI", b"Independent Advisory Group on Country Information"),
+    (b"ICCPR", b"International Covenant on Civil and Political Rights of 1966"),
+    (b"MEDP", b"Migration and Economic Development Partnership"),
+    (b"MOU", b"Memorandum of Understanding"),
+    # the long form is cut to the window of words the detector looks back over before the short form
+    (b"UNCAT", b"Cruel, Inhuman or Degrading Treatment or Punishment of 1984"),
+    (b"UNHCR", b"United Nations High Commissioner for Refugees"),
+}
+
+
+@pytest.mark.parametrize(("enabled", "abbreviations"), [("", set()), ("true", RWANDA_ABBREVIATIONS)])
+def test_abbreviation_markup_of_judgment(monkeypatch, enabled, abbreviations):
+    monkeypatch.setenv(steps.ABBREVIATIONS_VARIABLE, enabled)
+    monkeypatch.setattr(steps, "MODEL_REGISTRY", NLPModelRegistry(model_name="blank:en"))
+    legislation = pd.DataFrame([], columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"])
+    tables = LocalLookupTables({}, LegislationIndex.from_dataframe(legislation, signature=("empty",)), "tables")
+    monkeypatch.setattr(lookup_tables, "LOOKUP_TABLES", tables)
 
-        result = enrich_xml("<xml/>", [], "7.4.0")
+    enriched_xml = enrich_xml((FIXTURE_DIR / "rwanda.xml").read_bytes(), [])
 
-        assert result == "<final_with_timestamp/>"
+    markup = re.findall(rb'<abbr title="([^"]*)" uk:origin="TNA">([^<]*)</abbr>', enriched_xml)
+    assert {(short_form, long_form) for long_form, short_form in markup} == abbreviations
@@ -1,15 +1,17 @@
 import json
-from unittest.mock import patch
+import threading
+from unittest.mock import MagicMock, patch
 
 import boto3
 from moto import mock_aws
 
 from lambdas.enrichment_lambda import index
+from lambdas.enrichment_lambda.citation_rules import CitationRulesCache
 
 
-def _sqs_record(body: str, event_value: str | None = None) -> dict:
+def _sqs_record(body: str, event_value: str | None = None, message_id: str = "1") -> dict:
     record = {
-        "messageId": "1",
+        "messageId": message_id,
         "receiptHandle": "rh",
         "body": body,
         "attributes": {
@@ -36,7 +38,9 @@ class TestHandler:
         self,
         mock_enrich_judgment,
         monkeypatch,
+        tmp_path,
     ):
+        monkeypatch.setattr(index, "CITATION_RULES_CACHE", CitationRulesCache(tmp_path))
         env_values = {
             "API_SECRET_NAME": "api-credentials-secret",
             "API_ENDPOINT": "staging-api-endpoint",
@@ -85,7 +89,7 @@ class TestHandler:
             ],
         }
 
-        index.handler(event, None)
+        assert index.handler(event, None) == {"batchItemFailures": []}
 
         # Should skip the TestEvent and call enrich_judgment for the valid record
         assert mock_enrich_judgment.call_count == 1
@@ -100,6 +104,7 @@ class TestHandler:
         ]  # pattern_list
         assert call_args[0][5] is False  # vcite_enabled
         assert call_args[0][6] == "vcite-tna-files"  # vcite_bucket
+        assert call_args[1]["rules_version"]  # ETag of the rules file
 
     @mock_aws
     @patch("lambdas.enrichment_lambda.patch_from_vcite_callback.patch_judgment")
@@ -159,6 +164,143 @@ class TestHandler:
         called_endpoint, called_doc_uri, called_xml, called_user, called_password = mock_patch.call_args.args
         assert called_endpoint == "staging-api-endpoint"
         assert called_doc_uri == "ewhc/ch/2023/257"
-        assert "<akomaNtoso" in called_xml
+        assert b"<akomaNtoso" in called_xml
         assert called_user == "api-user"
         assert called_password == "api-credential"  # noqa: S105
+
+    @patch("lambdas.enrichment_lambda.index._resolve_api_credentials")
+    @patch("lambdas.enrichment_lambda.index.MODEL_REGISTRY")
+    def test_handler_warm_up_event_only_loads_models(self, mock_registry, mock_credentials):
+        index.handler({"warm_up": True}, context=None)
+
+        mock_registry.warm_up.assert_called_once_with()
+        mock_credentials.assert_not_called()
+
+
+def _enrichment_record(uri_reference: str) -> dict:
+    message = json.dumps({"status": "ready", "uri_reference": uri_reference})
+    return _sqs_record(json.dumps({"Message": message}), message_id=f"id-{uri_reference}")
+
+
+def _process(event: dict, context=None) -> dict:
+    return index._process_sqs_enrichment_event(
+        event,
+        "api-endpoint",
+        "api-user",
+        "api-credential",
+        "rules-bucket",
+        "rules-key",
+        False,
+        "vcite-bucket",
+        context,
+    )
+
+
+@patch("lambdas.enrichment_lambda.index.boto3")
+@patch("lambdas.enrichment_lambda.index.CITATION_RULES_CACHE")
+@patch("lambdas.enrichment_lambda.index.enrich_judgment")
+class TestProcessSQSEnrichmentEvent:
+    def test_only_failed_records_are_reported(self, mock_enrich_judgment, _mock_rules, _mock_boto3):
+        def enrich(uri_reference, *_args, **_kwargs):
+            if uri_reference.startswith("bad"):
+                msg = f"Cannot enrich {uri_reference}"
+                raise RuntimeError(msg)
+
+        mock_enrich_judgment.side_effect = enrich
+        event = {
+            "Records": [
+                _enrichment_record("bad/1"),
+                _enrichment_record("good/1"),
+                _sqs_record("not json", message_id="id-unreadable"),
+                _enrichment_record("good/2"),
+                _enrichment_record("bad/2"),
+            ],
+        }
+
+        response = _process(event)
+
+        assert response == {
+            "batchItemFailures": [
+                {"itemIdentifier": "id-bad/1"},
+                {"itemIdentifier": "id-unreadable"},
+                {"itemIdentifier": "id-bad/2"},
+            ],
+        }
+        assert mock_enrich_judgment.call_count == 4
+
+    def test_records_are_enriched_one_after_another_by_default(
+        self,
+        mock_enrich_judgment,
+        _mock_rules,
+        _mock_boto3,
+        monkeypatch,
+        caplog,
+    ):
+        monkeypatch.delenv(index.RECORD_CONCURRENCY_VARIABLE, raising=False)
+        threads = []
+
+        def enrich(uri_reference, *_args, **_kwargs):
+            threads.append(threading.current_thread())
+            if uri_reference.startswith("bad"):
+                msg = f"Cannot enrich {uri_reference}"
+                raise RuntimeError(msg)
+
+        mock_enrich_judgment.side_effect = enrich
+        event = {"Records": [_enrichment_record("bad/1"), _enrichment_record("good/1")]}
+
+        with patch.object(index, "ThreadPoolExecutor") as mock_executor:
+            assert _process(event) == {"batchItemFailures": [{"itemIdentifier": "id-bad/1"}]}
+
+        mock_executor.assert_not_called()
+        assert threads == [threading.current_thread()] * 2
+        (failure,) = [record for record in caplog.records if record.exc_info]
+        assert failure.getMessage() == "Failed to process SQS record id-bad/1"
+        assert "Cannot enrich bad/1" in caplog.text
+
+    @patch("lambdas.enrichment_lambda.index.MODEL_REGISTRY")
+    def test_records_are_enriched_concurrently_up_to_the_limit(
+        self,
+        mock_registry,
+        mock_enrich_judgment,
+        _mock_rules,
+        _mock_boto3,
+        monkeypatch,
+    ):
+        monkeypatch.setenv(index.RECORD_CONCURRENCY_VARIABLE, "3")
+        lock = threading.Lock()
+        in_flight = []
+        all_started = threading.Barrier(3, timeout=5)
+
+        def enrich(uri_reference, *_args, **_kwargs):
+            with lock:
+                in_flight.append(uri_reference)
+                peak = len(in_flight)
+            if uri_reference.startswith("first"):
+                # the first three records only finish once all three are being enriched at once
+                all_started.wait()
+            with lock:
+                in_flight.remove(uri_reference)
+            assert peak <= 3
+
+        mock_enrich_judgment.side_effect = enrich
+        event = {"Records": [_enrichment_record(f"first/{n}") for n in range(3)] + [_enrichment_record("last/1")]}
+
+        assert _process(event) == {"batchItemFailures": []}
+        assert mock_enrich_judgment.call_count == 4
+        # the models are loaded before the threads share them
+        mock_registry.warm_up.assert_called_once()
+        # the records running in threads do not fork stage workers
+        assert all(call.kwargs["stage_workers"] == 1 for call in mock_enrich_judgment.call_args_list)
+
+    def test_no_record_is_started_when_time_is_running_out(self, mock_enrich_judgment, _mock_rules, _mock_boto3):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.side_effect = [index.MIN_REMAINING_TIME_MS + 1, 1_000, 500]
+        event = {"Records": [_enrichment_record(f"judgment/{n}") for n in range(3)]}
+
+        response = _process(event, context)
+
+        assert response == {
+            "batchItemFailures": [{"itemIdentifier": "id-judgment/1"}, {"itemIdentifier": "id-judgment/2"}],
+        }
+        mock_enrich_judgment.assert_called_once()
+        assert mock_enrich_judgment.call_args.args[0] == "judgment/0"
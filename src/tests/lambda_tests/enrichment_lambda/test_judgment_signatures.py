@@ -0,0 +1,193 @@
+import json
+from unittest.mock import Mock
+
+import pandas as pd
+import pytest
+
+from database.judgment_signatures import (
+    JudgmentSignature,
+    JudgmentSignatureStore,
+    SignatureChange,
+    legislation_change,
+    manifest_change,
+    pattern_tokens,
+)
+from enrichment.caselaw_extraction.caselaw_matcher import case
+from lambdas.update_legislation_table import index as update_legislation_table
+from lambdas.update_rules_processor import index as update_rules_processor
+from utils.custom_types import Abbreviation, DetectedReference
+
+MANIFEST_CSV = "src/enrichment/caselaw_extraction/rules/2022_06_30_Citation_Manifest.csv"
+TEXT = 'See [2022] UKSC 3 and [2004] 1 WLR 123, under the Finance Act 2004 ("FA 2004").'
+LEGISLATION = pd.DataFrame(
+    [
+        ("Finance Act 2004", "ukpga/2004/12", "2004 c. 12", 2004, True),
+        ("Pensions Act 1995", "ukpga/1995/26", "1995 c. 26", 1995, True),
+    ],
+    columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+)
+
+
+@pytest.fixture(scope="module")
+def manifest():
+    return pd.read_csv(MANIFEST_CSV)
+
+
+def with_pattern(manifest, rule_id, pattern):
+    manifest = manifest.copy()
+    row = manifest.id == rule_id
+    rule = json.loads(manifest.loc[row, "pattern"].iloc[0])
+    manifest.loc[row, "pattern"] = json.dumps({**rule, "pattern": pattern})
+    return manifest
+
+
+@pytest.fixture
+def signature():
+    return JudgmentSignature.from_replacements(
+        TEXT,
+        [
+            DetectedReference(4, 17, case("[2022] UKSC 3", "[2022] UKSC 3", "2022", "#", True, "uksc")),
+            DetectedReference(22, 38, case("[2004] 1 WLR 123", "[2004] 1 WLR 123", "2004", "#", False, "wlr")),
+        ],
+        [DetectedReference(72, 79, Abbreviation("FA 2004", "Finance Act 2004"))],
+        frozenset({"UKSC", "WLR", "Act", "Civ"}),
+    )
+
+
+def test_signature_of_judgment(signature):
+    assert signature == JudgmentSignature(
+        frozenset({"uksc", "wlr"}),
+        frozenset({2022, 2004}),
+        frozenset({"UKSC", "WLR", "Act"}),
+        frozenset({"FA 2004"}),
+    )
+
+
+def test_signature_round_trips_through_json(signature):
+    assert JudgmentSignature.from_json(signature.to_json()) == signature
+
+
+def test_pattern_tokens_are_its_capitalised_words():
+    pattern = [{"ORTH": "["}, {"SHAPE": "dddd"}, {"ORTH": "]"}, {"ORTH": "All"}, {"ORTH": "ER"}, {"LIKE_NUM": True}]
+
+    assert pattern_tokens(pattern) == {"All", "ER"}
+    assert pattern_tokens([{"ORTH": "case"}, {"TEXT": {"REGEX": r"C-\d+\/\d+"}}]) == set()
+    assert pattern_tokens("Q.B.D.") == {"Q", "B", "D"}
+
+
+class TestManifestChange:
+    def test_unchanged_manifest_affects_no_judgment(self, manifest):
+        assert not manifest_change(manifest, manifest.copy())
+
+    def test_resolution_changed_affects_judgments_where_the_rule_fired(self, manifest, signature):
+        new_manifest = manifest.copy()
+        new_manifest.loc[new_manifest.id == "wlr", "uri_template"] = "https://example.com/wlr/year/d1"
+
+        change = manifest_change(manifest, new_manifest)
+
+        assert change == SignatureChange(rule_ids=frozenset({"wlr"}))
+        assert signature.affected_by(change)
+        assert not signature.affected_by(SignatureChange(rule_ids=frozenset({"aller"})))
+
+    def test_description_changed_affects_no_judgment(self, manifest):
+        new_manifest = manifest.copy()
+        new_manifest.loc[new_manifest.id == "wlr", "description"] = "Weekly Law Reports"
+
+        assert not manifest_change(manifest, new_manifest)
+
+    def test_rule_added_affects_judgments_holding_its_tokens(self, manifest, signature):
+        pattern = [{"ORTH": "["}, {"SHAPE": "dddd"}, {"ORTH": "]"}, {"ORTH": "UKSC"}, {"ORTH": "Civ"}]
+        new_rule = manifest[manifest.id == "uksc"].assign(id="uksc_civ", pattern=json.dumps({"pattern": pattern}))
+
+        change = manifest_change(manifest, pd.concat([manifest, new_rule]))
+
+        assert change == SignatureChange(token_sets=(frozenset({"UKSC", "Civ"}),))
+        assert not signature.affected_by(change)
+        assert signature._replace(tokens=signature.tokens | {"Civ"}).affected_by(change)
+
+    def test_pattern_changed_affects_judgments_where_it_fired_or_could_fire(self, manifest):
+        pattern = [{"ORTH": "["}, {"SHAPE": "dddd"}, {"ORTH": "]"}, {"ORTH": "AC"}, {"LIKE_NUM": True}]
+
+        change = manifest_change(manifest, with_pattern(manifest, "acd", pattern))
+
+        assert change == SignatureChange(rule_ids=frozenset({"acd"}), token_sets=(frozenset({"AC"}),))
+
+    def test_rule_with_words_of_no_pattern_affects_every_judgment(self, manifest):
+        pattern = [{"ORTH": "["}, {"SHAPE": "dddd"}, {"ORTH": "]"}, {"ORTH": "UKNEWCOURT"}, {"LIKE_NUM": True}]
+
+        assert manifest_change(manifest, with_pattern(manifest, "acd", pattern)).whole_corpus
+
+    def test_rule_without_capitalised_words_affects_every_judgment(self, manifest):
+        change = manifest_change(manifest, with_pattern(manifest, "acd", [{"SHAPE": "dddd"}, {"LIKE_NUM": True}]))
+
+        assert change.whole_corpus
+
+    def test_first_manifest_affects_every_judgment(self, manifest):
+        assert manifest_change(None, manifest).whole_corpus
+
+
+class TestLegislationChange:
+    def test_affects_judgments_mentioning_the_year_of_a_title_added_or_changed(self, signature):
+        new_legislation = LEGISLATION.copy()
+        new_legislation.loc[1, "ref"] = "ukpga/1995/27"
+        added = pd.DataFrame(
+            [("Income Tax Act 2007", "ukpga/2007/3", "2007 c. 3", 2007, True)],
+            columns=LEGISLATION.columns,
+        )
+
+        change = legislation_change(LEGISLATION, pd.concat([new_legislation, added]))
+
+        assert change == SignatureChange(years=frozenset({1995, 2007}))
+        assert not signature.affected_by(change)
+        assert signature.affected_by(legislation_change(LEGISLATION, LEGISLATION.iloc[1:]))
+
+    def test_duplicated_titles_affect_no_judgment(self):
+        assert not legislation_change(LEGISLATION, pd.concat([LEGISLATION, LEGISLATION]))
+
+
+def test_signature_store_is_off_without_the_variable(monkeypatch):
+    monkeypatch.delenv("ENRICHMENT_JUDGMENT_SIGNATURES", raising=False)
+
+    assert not JudgmentSignatureStore.from_environment().enabled
+
+
+def test_planner_errors_are_logged_not_raised(caplog):
+    store = JudgmentSignatureStore(Mock(side_effect=RuntimeError("database unavailable")))
+
+    assert store.plan_reenrichment(SignatureChange(whole_corpus=True), "manifest") == 0
+    assert "Could not plan the judgments affected by the manifest change" in caplog.text
+
+
+@pytest.mark.parametrize("update_lambda", [update_rules_processor, update_legislation_table])
+def test_update_lambdas_plan_nothing_with_signatures_off(monkeypatch, update_lambda):
+    monkeypatch.delenv("ENRICHMENT_JUDGMENT_SIGNATURES", raising=False)
+    engine = Mock()
+
+    assert update_lambda.plan_reenrichment(engine, LEGISLATION) == 0
+    assert not engine.mock_calls
+
+
+@pytest.mark.parametrize("update_lambda", [update_rules_processor, update_legislation_table])
+def test_update_lambdas_log_planning_errors(monkeypatch, caplog, update_lambda):
+    monkeypatch.setenv("ENRICHMENT_JUDGMENT_SIGNATURES", "true")
+    # not an engine, so reading the tables before the update fails
+    engine = Mock()
+
+    assert update_lambda.plan_reenrichment(engine, LEGISLATION) == 0
+    assert "so no judgment is planned" in caplog.text
+
+
+def test_postgres_store(db_engine, signature):
+    store = JudgmentSignatureStore(db_engine.raw_connection)
+    store.put("uksc/2022/3", signature)
+    store.put(
+        "ewca/civ/2020/1",
+        JudgmentSignature(frozenset({"ewca_civ"}), frozenset({2020}), frozenset(), frozenset()),
+    )
+
+    assert store.get("uksc/2022/3") == signature
+    assert store.affected_uris(SignatureChange(rule_ids=frozenset({"wlr"}))) == ["uksc/2022/3"]
+    assert store.affected_uris(SignatureChange(token_sets=(frozenset({"UKSC", "WLR"}),))) == ["uksc/2022/3"]
+    assert store.affected_uris(SignatureChange(years=frozenset({2020}))) == ["ewca/civ/2020/1"]
+    assert store.affected_uris(SignatureChange(whole_corpus=True)) == ["ewca/civ/2020/1", "uksc/2022/3"]
+    assert store.plan_reenrichment(SignatureChange(years=frozenset({2004, 2020})), "ukpga_lookup") == 2
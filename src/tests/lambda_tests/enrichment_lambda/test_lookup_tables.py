@@ -0,0 +1,63 @@
+import json
+from unittest.mock import Mock, patch
+
+import pandas as pd
+import pytest
+
+from database.legislation_index import LegislationIndexCache
+from database.manifest_index import ManifestIndex
+from lambdas.enrichment_lambda import lookup_tables
+from lambdas.enrichment_lambda.lookup_tables import DatabaseLookupTables
+
+LOOKUP = pd.DataFrame(
+    [("Finance Act 2004", "ukpga/2004/12", "2004 c. 12", 2004, True)],
+    columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+)
+MANIFEST_SIGNATURE = (1234, 197, 0, 0)
+LEGISLATION_SIGNATURE = (5678, 5, 0, 2)
+
+
+@pytest.fixture
+def database(tmp_path):
+    with (
+        patch.object(lookup_tables, "MANIFEST_INDEX", ManifestIndex()),
+        patch.object(lookup_tables, "LEGISLATION_INDEX_CACHE", LegislationIndexCache(tmp_path / "index.json.gz")),
+        patch("database.manifest_index.get_matched_rules", return_value={}),
+        patch("database.manifest_index.get_table_signature", return_value=MANIFEST_SIGNATURE) as manifest_signature,
+        patch("database.legislation_index.get_legislation_lookup", return_value=LOOKUP),
+        patch(
+            "database.legislation_index.get_table_signature",
+            return_value=LEGISLATION_SIGNATURE,
+        ) as legislation_signature,
+    ):
+        yield manifest_signature, legislation_signature
+
+
+def test_lookup_tables_are_read_once_for_a_judgment(database):
+    manifest_signature, legislation_signature = database
+    connect = Mock()
+    tables = DatabaseLookupTables(connect)
+
+    with tables.for_judgment():
+        version = tables.version()
+        tables.manifest()
+        assert tables.legislation().exact_titles() == []
+        assert tables.version() == version
+
+    connect.assert_called_once()
+    connect.return_value.close.assert_called_once()
+    assert manifest_signature.call_count == legislation_signature.call_count == 1
+    # versioned by the signatures the tables were revalidated against, with no other query
+    assert version == json.dumps([MANIFEST_SIGNATURE, LEGISLATION_SIGNATURE])
+
+
+def test_lookup_tables_are_read_again_outside_the_enrichment_of_a_judgment(database):
+    connect = Mock()
+    tables = DatabaseLookupTables(connect)
+
+    with tables.for_judgment():
+        tables.manifest()
+    tables.manifest()
+    tables.legislation()
+
+    assert connect.call_count == 3
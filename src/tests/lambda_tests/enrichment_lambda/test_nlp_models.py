@@ -0,0 +1,125 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pandas as pd
+import spacy
+
+from database.legislation_index import LegislationIndex
+from enrichment.abbreviation_extraction.abbreviations import AbbreviationDetector
+from lambdas.enrichment_lambda.nlp_models import MAX_DOCUMENT_LENGTH, NLPModelRegistry
+
+PATTERNS = [{"label": "CITATION", "pattern": [{"ORTH": "UKSC"}], "id": "rule-1"}]
+
+LEGISLATION = pd.DataFrame(
+    [
+        ("Adoption and Children Act 2002", "ukpga/2002/38", "2002 c. 38", 2002, True),
+        ("ACA 2002", "ukpga/2002/38", "2002 c. 38", 2002, False),
+        ("CFA 2014", "ukpga/2014/6", "2014 c. 6", 2014, False),
+    ],
+    columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+)
+
+
+class TestNLPModelRegistry:
+    def test_base_pipeline_is_loaded_once(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+
+        with patch("lambdas.enrichment_lambda.nlp_models.spacy.load", wraps=spacy.load) as mock_load:
+            registry.tokenize("first judgment")
+            registry.abbreviation_detector()
+            registry.citation_ruler(PATTERNS)
+            registry.warm_up(PATTERNS)
+            registry.tokenize("second judgment")
+
+        mock_load.assert_called_once()
+        assert registry.base.max_length == MAX_DOCUMENT_LENGTH
+
+    def test_threads_build_each_model_once(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        started = threading.Barrier(4, timeout=5)
+        load = spacy.load
+
+        def slow_load(*args, **kwargs):
+            # let the other threads reach the registry while the model is loading
+            time.sleep(0.1)
+            return load(*args, **kwargs)
+
+        def build():
+            started.wait()
+            registry.citation_ruler(PATTERNS, "rules")
+
+        with patch("lambdas.enrichment_lambda.nlp_models.spacy.load", side_effect=slow_load) as mock_load:
+            threads = [threading.Thread(target=build) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        mock_load.assert_called_once()
+        assert set(registry.load_times) == {"base", "caselaw"}
+
+    def test_components_share_the_base_vocab(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+
+        assert registry.tokenize("text").vocab is registry.base.vocab
+        assert isinstance(registry.abbreviation_detector(), AbbreviationDetector)
+        assert registry.abbreviation_detector().vocab is registry.base.vocab
+        assert registry.citation_ruler(PATTERNS).nlp is registry.base
+
+    def test_citation_ruler_tags_the_shared_doc(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        doc = registry.tokenize("see [2022] UKSC 1")
+
+        registry.citation_ruler(PATTERNS)(doc)
+
+        assert [(ent.text, ent.ent_id_) for ent in doc.ents] == [("UKSC", "rule-1")]
+
+    def test_citation_ruler_reused_until_patterns_change(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        first = registry.citation_ruler(PATTERNS)
+
+        assert registry.citation_ruler([dict(pattern) for pattern in PATTERNS]) is first
+
+        changed = [*PATTERNS, {"label": "CITATION", "pattern": [{"ORTH": "EWCA"}], "id": "rule-2"}]
+        rebuilt = registry.citation_ruler(changed)
+
+        assert rebuilt is not first
+        doc = rebuilt(registry.tokenize("see [2022] EWCA 1"))
+        assert [ent.ent_id_ for ent in doc.ents] == ["rule-2"]
+
+    def test_warm_up_reports_load_times(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+
+        load_times = registry.warm_up(PATTERNS)
+
+        assert set(load_times) == {"base", "abbreviation", "caselaw"}
+        assert all(seconds >= 0 for seconds in load_times.values())
+
+    def test_citation_ruler_keyed_by_rules_version(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        first = registry.citation_ruler(PATTERNS, rules_version='"etag-1"')
+
+        with patch("lambdas.enrichment_lambda.nlp_models._fingerprint_patterns") as mock_fingerprint:
+            assert registry.citation_ruler(PATTERNS, rules_version='"etag-1"') is first
+        mock_fingerprint.assert_not_called()
+
+        assert registry.citation_ruler(PATTERNS, rules_version='"etag-2"') is not first
+
+    def test_legislation_matcher_holds_every_exact_title(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        matcher = registry.legislation_matcher(LegislationIndex.from_dataframe(LEGISLATION, signature=(1, 3, 10)))
+
+        matches = matcher(registry.tokenize("under the ACA 2002 and the CFA 2014"))
+
+        assert [registry.base.vocab.strings[match_id] for match_id, _, _ in matches] == ["ACA 2002", "CFA 2014"]
+
+    def test_legislation_matcher_reused_until_table_changes(self):
+        registry = NLPModelRegistry(model_name="blank:en")
+        first = registry.legislation_matcher(LegislationIndex.from_dataframe(LEGISLATION, signature=(1, 3, 10)))
+
+        assert registry.legislation_matcher(LegislationIndex.from_dataframe(LEGISLATION, signature=(1, 3, 10))) is first
+        assert (
+            registry.legislation_matcher(LegislationIndex.from_dataframe(LEGISLATION, signature=(1, 4, 11)))
+            is not first
+        )
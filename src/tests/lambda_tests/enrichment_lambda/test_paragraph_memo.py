@@ -0,0 +1,201 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import lxml.etree
+import pandas as pd
+import pytest
+
+from database.db_connection import MatchedRule
+from database.legislation_index import LegislationIndex
+from lambdas.enrichment_lambda import enrich_xml, lookup_tables, paragraph_memo, steps
+from lambdas.enrichment_lambda.enrich_xml import determine_replacements_by_paragraph
+from lambdas.enrichment_lambda.lookup_tables import LocalLookupTables
+from lambdas.enrichment_lambda.nlp_models import NLPModelRegistry
+from lambdas.enrichment_lambda.paragraph_memo import (
+    ParagraphMemo,
+    context_start,
+    paragraph_key,
+    references_in_paragraph,
+)
+from lambdas.enrichment_lambda.steps import map_judgment_content, parse_judgment
+from utils.custom_types import DetectedReference
+from utils.proper_xml import qualified_name
+
+REPO_ROOT = Path(__file__).parent.parent.parent.parent.parent.resolve()
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "fixtures/"
+ORIGINAL = (FIXTURE_DIR / "ewhc-ch-2023-257_original.xml").read_bytes()
+PATTERNS = [
+    json.loads(line)
+    for line in (REPO_ROOT / "src/enrichment/caselaw_extraction/rules/citation_patterns.jsonl").read_text().splitlines()
+]
+LEGISLATION = LegislationIndex.from_dataframe(
+    pd.DataFrame(
+        [
+            ("Finance Act 2004", "ukpga/2004/12", "2004 c. 12", 2004, True),
+            ("Finance Act 2004", "ukpga/2004/12", "2004 c. 12", 2004, False),
+            ("Pensions Act 1995", "ukpga/1995/26", "1995 c. 26", 1995, True),
+            ("FA 2004", "ukpga/2004/12", "2004 c. 12", 2004, False),
+        ],
+        columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+    ),
+    signature=("legislation", 1),
+)
+
+
+class Manifest(dict):
+    """Every citation rule of the patterns, resolving its citations to a URI made of their first number."""
+
+    def __missing__(self, rule_id):
+        return MatchedRule(rule_id, "https://example.com/d1", False, True, "Number", None)
+
+
+@pytest.fixture
+def extractors():
+    """The extractors of the enrichment, with a blank spaCy pipeline and lookup tables held in memory."""
+    registry = NLPModelRegistry(model_name="blank:en")
+    with (
+        patch.object(steps, "MODEL_REGISTRY", registry),
+        patch.object(lookup_tables, "LOOKUP_TABLES", LocalLookupTables(Manifest(), LEGISLATION, "tables")),
+    ):
+        yield
+
+
+@pytest.fixture
+def memo(monkeypatch):
+    memo = ParagraphMemo(10000)
+    monkeypatch.setattr(enrich_xml, "PARAGRAPH_MEMO", memo)
+    return memo
+
+
+def replacements_of_whole_judgment(xml):
+    doc = steps.tokenize_judgment(map_judgment_content(parse_judgment(xml)).text)
+    return {
+        "caselaw": steps.determine_caselaw_replacements(doc, PATTERNS, "rules"),
+        "legislation": sorted(steps.determine_legislation_replacements(doc)),
+        "abbreviation": steps.determine_abbreviation_replacements(doc),
+    }
+
+
+def replacements_by_paragraph(xml):
+    replacements = determine_replacements_by_paragraph(
+        map_judgment_content(parse_judgment(xml)),
+        PATTERNS,
+        "rules",
+        "tables",
+    )
+    return {**replacements, "legislation": sorted(replacements["legislation"])}
+
+
+def edit_paragraph(xml, paragraph, text):
+    document = parse_judgment(xml)
+    contents = [element for element in document.root.iter(lxml.etree.Element) if qualified_name(element) == "content"]
+    text_element = next(element for element in contents[paragraph].iter() if element.text and element.text.strip())
+    text_element.text = text
+    return document.serialize_bytes()
+
+
+class TestParagraphMemo:
+    def test_least_recently_used_entries_are_dropped(self):
+        memo = ParagraphMemo(2)
+        memo.put("first", [])
+        memo.put("second", [])
+        memo.get("first")
+        memo.put("third", [])
+
+        assert memo.get("second") is None
+        assert memo.get("first") == []
+        assert len(memo) == 2
+        assert memo.metrics.as_dict() == {"hits": 2, "misses": 1, "errors": 0}
+
+    def test_memo_is_off_without_a_size(self, monkeypatch):
+        monkeypatch.delenv(paragraph_memo.PARAGRAPH_MEMO_VARIABLE, raising=False)
+        memo = ParagraphMemo.from_environment()
+        memo.put("key", [])
+
+        assert not memo.enabled
+        assert memo.get("key") is None
+
+    def test_size_from_environment(self, monkeypatch):
+        monkeypatch.setenv(paragraph_memo.PARAGRAPH_MEMO_VARIABLE, "500")
+
+        assert ParagraphMemo.from_environment().max_entries == 500
+
+
+def test_paragraph_key_depends_on_the_paragraph_before():
+    assert paragraph_key("", "text", "rules") != paragraph_key("before", "text", "rules")
+    assert paragraph_key("", "text", "rules") != paragraph_key("", "text", "new rules")
+
+
+def test_context_starts_as_many_tokens_before_the_paragraph_as_the_extractors_read():
+    tokenize = NLPModelRegistry(model_name="blank:en").tokenize
+    text = "One two (three) four. Five"
+
+    assert text[context_start(text, 22, 4, tokenize) : 22] == "three) four. "
+    assert context_start(text, 22, 40, tokenize) == 0
+
+
+def test_references_in_paragraph_leave_out_its_context():
+    references = [DetectedReference(0, 4, "context"), DetectedReference(10, 14, "paragraph")]
+
+    assert references_in_paragraph(references, 8) == [DetectedReference(2, 6, "paragraph")]
+
+
+@pytest.mark.usefixtures("extractors")
+class TestDetermineReplacementsByParagraph:
+    def test_same_replacements_as_the_whole_judgment(self, memo):
+        assert replacements_by_paragraph(ORIGINAL) == replacements_of_whole_judgment(ORIGINAL)
+        assert memo.metrics.hits == 0
+
+    def test_only_changed_paragraphs_are_run_through_the_extractors(self, memo):
+        replacements_by_paragraph(ORIGINAL)
+        edited = edit_paragraph(ORIGINAL, 20, "The Finance Act 2004 applies, see [2020] UKSC 1.")
+
+        with patch.object(enrich_xml, "tokenize_paragraphs", wraps=steps.tokenize_paragraphs) as tokenize:
+            replacements = replacements_by_paragraph(edited)
+
+        # the edited paragraph and the paragraph after it, which reads back into it
+        changed_texts = tokenize.call_args_list[0].args[0]
+        assert len(changed_texts) == 2
+        assert changed_texts[0].endswith("The Finance Act 2004 applies, see [2020] UKSC 1.")
+        assert replacements == replacements_of_whole_judgment(edited)
+
+    def test_abbreviation_defined_in_a_changed_paragraph_applies_to_the_others(self, memo, monkeypatch):
+        monkeypatch.setenv(steps.ABBREVIATIONS_VARIABLE, "true")
+        replacements_by_paragraph(ORIGINAL)
+        edited = edit_paragraph(ORIGINAL, 20, 'Her Majesty\'s Revenue and Customs ("HMRC") is the respondent.')
+
+        abbreviations = replacements_by_paragraph(edited)["abbreviation"]
+
+        assert abbreviations == replacements_of_whole_judgment(edited)["abbreviation"]
+        assert len([reference for reference in abbreviations if reference.replacement.abb_match == "HMRC"]) > 1
+
+    def test_titles_of_the_years_mentioned_anywhere_in_the_judgment_are_looked_for(self, memo):
+        legislation = LegislationIndex.from_dataframe(
+            pd.DataFrame(
+                [("Magna Carta", "r", "c", 1297, False)],
+                columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+            ),
+            signature=("legislation", 2),
+        )
+        edited = edit_paragraph(ORIGINAL, 5, "Confirmed in 1297.")
+        edited = edit_paragraph(edited, 30, "As Magna Carta provides.")
+
+        with patch.object(lookup_tables, "LOOKUP_TABLES", LocalLookupTables(Manifest(), legislation, "magna")):
+            replacements = replacements_by_paragraph(edited)
+            whole_judgment = replacements_of_whole_judgment(edited)
+
+        assert replacements == whole_judgment
+        assert [reference.replacement.href for reference in replacements["legislation"]] == ["r"]
+
+    def test_same_replacements_as_the_whole_judgment_across_empty_and_one_word_paragraphs(self, memo, monkeypatch):
+        monkeypatch.setenv(steps.ABBREVIATIONS_VARIABLE, "true")
+        edited = ORIGINAL
+        # the long form of the abbreviation is two paragraphs before its short form, across an empty one
+        for paragraph, text in enumerate(["Her Majesty's Revenue and Customs", "", '("HMRC")', "Pensions"], 20):
+            edited = edit_paragraph(edited, paragraph, text)
+
+        replacements = replacements_by_paragraph(edited)
+
+        assert replacements == replacements_of_whole_judgment(edited)
+        assert any(reference.replacement.abb_match == "HMRC" for reference in replacements["abbreviation"])
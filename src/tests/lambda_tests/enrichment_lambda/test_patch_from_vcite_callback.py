@@ -31,6 +31,7 @@ class TestPatchFromVciteCallback:
         call_args = mock_patch_judgment.call_args
         assert call_args[0][0] == api_endpoint
         assert call_args[0][1] == "uksc/2024/1"
+        assert call_args[0][2] == b"<xml></xml>"
         assert call_args[0][3] == "user"
         assert call_args[0][4] == "pass"
 
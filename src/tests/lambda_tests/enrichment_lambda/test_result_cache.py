@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from lambdas.enrichment_lambda import result_cache
+from lambdas.enrichment_lambda.result_cache import (
+    DirectoryResultStore,
+    EnrichmentResultCache,
+    PostgresResultStore,
+    S3ResultStore,
+    result_key,
+)
+from lambdas.enrichment_lambda.steps import (
+    add_document_timestamp_and_engine_version,
+    parse_judgment,
+    reuse_enriched_judgment,
+)
+from utils.judgment_document import JudgmentDocument
+
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "fixtures/"
+ORIGINAL = (FIXTURE_DIR / "ewhc-ch-2023-257_original.xml").read_bytes()
+VERSIONS = ("rules-etag", "tables-1", "7.4.0")
+
+
+def edited_metadata(xml: bytes) -> bytes:
+    return xml.replace(b'date="2023-02-12T18:47:49" name="transform"', b'date="2024-01-01T00:00:00" name="transform"')
+
+
+class TestResultKey:
+    def test_previous_enrichment_and_metadata_do_not_change_the_key(self):
+        document = parse_judgment(ORIGINAL)
+        add_document_timestamp_and_engine_version(document, "7.3.0")
+        republished = edited_metadata(document.serialize_bytes())
+
+        assert result_key(parse_judgment(republished), *VERSIONS) == result_key(parse_judgment(ORIGINAL), *VERSIONS)
+
+    def test_content_changes_the_key(self):
+        document = parse_judgment(ORIGINAL)
+        document.paragraphs()[-1].text = "Corrected."
+
+        assert result_key(document, *VERSIONS) != result_key(parse_judgment(ORIGINAL), *VERSIONS)
+
+    @pytest.mark.parametrize("changed", range(len(VERSIONS)))
+    def test_versions_change_the_key(self, changed):
+        versions = [*VERSIONS]
+        versions[changed] += "-updated"
+
+        assert result_key(parse_judgment(ORIGINAL), *versions) != result_key(parse_judgment(ORIGINAL), *VERSIONS)
+
+
+def test_reused_judgment_has_the_current_metadata_stamped_again():
+    enriched_document = parse_judgment(ORIGINAL)
+    enriched_document.paragraphs()[-1].set("class", "enriched")
+    add_document_timestamp_and_engine_version(enriched_document, "7.3.0")
+
+    reused_xml = reuse_enriched_judgment(
+        parse_judgment(edited_metadata(ORIGINAL)),
+        enriched_document.serialize_bytes(),
+        "7.4.0",
+    )
+
+    assert JudgmentDocument.parse(reused_xml).paragraphs()[-1].get("class") == "enriched"
+    assert b'date="2024-01-01T00:00:00" name="transform"' in reused_xml
+    assert reused_xml.count(b'name="tna-enriched"') == 1
+    assert reused_xml.count(b"tna-enrichment-engine") == 2
+    assert b">7.4.0</uk:tna-enrichment-engine>" in reused_xml
+
+
+class FailingStore:
+    def get(self, key):
+        raise OSError(key)
+
+    def put(self, key, enriched):
+        raise OSError(key)
+
+
+class TestEnrichmentResultCache:
+    def test_hits_and_misses_are_counted(self, tmp_path):
+        cache = EnrichmentResultCache(DirectoryResultStore(tmp_path / "results"))
+
+        assert cache.get("key") is None
+        cache.put("key", b"<enriched/>")
+
+        assert cache.get("key") == b"<enriched/>"
+        assert cache.metrics.as_dict() == {"hits": 1, "misses": 1, "errors": 0}
+
+    def test_store_failures_do_not_fail_enrichment(self):
+        cache = EnrichmentResultCache(FailingStore())
+
+        cache.put("key", b"<enriched/>")
+
+        assert cache.get("key") is None
+        assert cache.metrics.as_dict() == {"hits": 0, "misses": 1, "errors": 2}
+
+    def test_cache_is_off_without_a_store(self):
+        cache = EnrichmentResultCache()
+        cache.put("key", b"<enriched/>")
+
+        assert not cache.enabled
+        assert cache.get("key") is None
+
+    def test_s3_store(self, monkeypatch):
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        with mock_aws():
+            s3_client = boto3.client("s3")
+            s3_client.create_bucket(Bucket="results-bucket")
+            store = S3ResultStore("results-bucket", "enriched/", s3_client)
+
+            assert store.get("key") is None
+            store.put("key", b"<enriched/>")
+
+            assert store.get("key") == b"<enriched/>"
+            assert s3_client.head_object(Bucket="results-bucket", Key="enriched/key.xml")
+
+    @pytest.mark.parametrize(
+        ("location", "store_type"),
+        [("", type(None)), ("postgres", PostgresResultStore), ("s3://bucket/prefix/", S3ResultStore)],
+    )
+    def test_from_environment(self, monkeypatch, location, store_type):
+        monkeypatch.setenv(result_cache.RESULT_CACHE_VARIABLE, location)
+
+        assert isinstance(EnrichmentResultCache.from_environment().store, store_type)
+
+    def test_directory_from_environment(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(result_cache.RESULT_CACHE_VARIABLE, str(tmp_path))
+
+        store = EnrichmentResultCache.from_environment().store
+
+        assert isinstance(store, DirectoryResultStore)
+        assert store.directory == tmp_path
+
+
+def test_postgres_store(db_engine):
+    store = PostgresResultStore(db_engine.raw_connection)
+
+    assert store.get("key") is None
+    store.put("key", b"<enriched/>")
+    store.put("key", b"<enriched again/>")
+
+    assert store.get("key") == b"<enriched again/>"
@@ -0,0 +1,175 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from lambdas.enrichment_lambda import stage_graph, steps
+from lambdas.enrichment_lambda.nlp_models import NLPModelRegistry
+from lambdas.enrichment_lambda.stage_graph import Stage, StageGraph, configured_workers
+from lambdas.enrichment_lambda.steps import determine_abbreviation_replacements, tokenize_judgment
+
+
+def process_id(*_):
+    return os.getpid()
+
+
+def exit_in_worker(parent):
+    if os.getpid() != parent:
+        os._exit(1)
+    return parent
+
+
+def add(first, second):
+    return first + second
+
+
+def double(value):
+    return value * 2
+
+
+GRAPH = StageGraph(
+    [
+        Stage("sum", add, ("first", "second")),
+        Stage("doubled", double, ("sum",)),
+        Stage("doubled input", double, ("first",)),
+    ],
+)
+
+
+class TestStageGraph:
+    def test_stages_run_with_what_they_require(self):
+        results = GRAPH.run({"first": 2, "second": 3})
+
+        assert results.values == {"sum": 5, "doubled": 10, "doubled input": 4}
+        assert list(results.timings) == ["sum", "doubled", "doubled input"]
+        assert all(timing >= 0 for timing in results.timings.values())
+
+    def test_same_values_in_the_same_order_with_workers(self):
+        results = GRAPH.run({"first": 2, "second": 3}, workers=2)
+
+        assert list(results.values.items()) == list(GRAPH.run({"first": 2, "second": 3}).values.items())
+        assert list(results.timings) == ["sum", "doubled", "doubled input"]
+
+    def test_independent_stages_run_in_worker_processes(self):
+        graph = StageGraph([Stage("first", process_id), Stage("second", process_id)])
+
+        assert os.getpid() not in graph.run({}, workers=2).values.values()
+        assert set(graph.run({}).values.values()) == {os.getpid()}
+
+    def test_stages_run_in_process_without_worker_processes(self):
+        graph = StageGraph([Stage("first", process_id)])
+
+        with (
+            patch.object(stage_graph, "_WORKERS", {}),
+            patch.object(stage_graph, "_start_worker", side_effect=OSError("Function not implemented")),
+        ):
+            assert graph.run({}, workers=4).values == {"first": os.getpid()}
+
+    def test_local_stage_runs_in_each_worker_and_is_not_returned(self):
+        graph = StageGraph(
+            [
+                Stage("process", process_id, local=True),
+                Stage("first", add, ("process", "offset")),
+                Stage("second", add, ("process", "offset")),
+            ],
+        )
+
+        in_workers = graph.run({"offset": 0}, workers=2)
+        in_process = graph.run({"offset": 0})
+
+        assert set(in_workers.values) == {"first", "second"}
+        assert in_workers.values["first"] != in_workers.values["second"]
+        assert os.getpid() not in in_workers.values.values()
+        assert in_process.values == {"first": os.getpid(), "second": os.getpid()}
+        assert list(in_workers.timings) == list(in_process.timings) == ["process", "first", "second"]
+
+    def test_local_stages_cannot_require_local_stages(self):
+        graph = StageGraph([Stage("first", process_id, local=True), Stage("second", double, ("first",), local=True)])
+
+        with pytest.raises(ValueError, match="cannot require local stages"):
+            graph.run({})
+
+    def test_stages_run_in_process_when_a_worker_dies_running_one(self):
+        graph = StageGraph([Stage("exit", exit_in_worker, ("parent",))])
+
+        with patch.object(stage_graph, "_WORKERS", {}) as workers:
+            assert graph.run({"parent": os.getpid()}, workers=2).values == {"exit": os.getpid()}
+            assert workers == {}
+            assert GRAPH.run({"first": 2, "second": 3}, workers=2).values["sum"] == 5
+            stage_graph.stop_stage_workers()
+
+    def test_worker_that_died_between_runs_is_replaced(self):
+        graph = StageGraph([Stage("first", process_id), Stage("second", process_id)])
+
+        with patch.object(stage_graph, "_WORKERS", {}) as workers:
+            graph.run({}, workers=2)
+            dead = workers[2][0].process
+            dead.kill()
+            dead.join()
+
+            assert os.getpid() not in graph.run({}, workers=2).values.values()
+            assert dead not in [worker.process for worker in workers[2]]
+            stage_graph.stop_stage_workers()
+
+    def test_graphs_run_concurrently_get_their_own_results(self):
+        graph = StageGraph([Stage("sum", add, ("first", "second")), Stage("doubled", double, ("first",))])
+
+        with patch.object(stage_graph, "_WORKERS", {}), ThreadPoolExecutor(4) as executor:
+            runs = [executor.submit(graph.run, {"first": n, "second": 1}, 2) for n in range(20)]
+            results = [run.result().values for run in runs]
+            stage_graph.stop_stage_workers()
+
+        assert results == [{"sum": n + 1, "doubled": 2 * n} for n in range(20)]
+
+    def test_stage_errors_are_raised(self):
+        graph = StageGraph([Stage("sum", add, ("first", "second"))])
+
+        with pytest.raises(TypeError):
+            graph.run({"first": 1, "second": "2"}, workers=2)
+        # the workers are left with no result of the failed run in their pipes
+        assert GRAPH.run({"first": 2, "second": 3}, workers=2).values["sum"] == 5
+
+    def test_requirements_must_be_declared_before(self):
+        graph = StageGraph([Stage("doubled", double, ("sum",)), Stage("sum", add, ("first", "second"))])
+
+        with pytest.raises(ValueError, match="Stage doubled requires"):
+            graph.run({"first": 2, "second": 3})
+
+    def test_stage_names_are_unique(self):
+        with pytest.raises(ValueError, match="unique"):
+            StageGraph([Stage("sum", add), Stage("sum", double)])
+
+
+def test_extractor_on_shared_doc_in_worker(monkeypatch):
+    monkeypatch.setenv(steps.ABBREVIATIONS_VARIABLE, "true")
+    registry = NLPModelRegistry(model_name="blank:en")
+    text = 'The Upper Tribunal Chamber ("UTC") heard it. The UTC allowed the appeal.'
+    graph = StageGraph(
+        [
+            Stage("doc", tokenize_judgment, ("text",), local=True),
+            Stage("abbreviation", determine_abbreviation_replacements, ("doc",)),
+        ],
+    )
+
+    # workers are forked with the registry patched in, and sent the text rather than the Doc
+    with (
+        patch.object(stage_graph, "_WORKERS", {}),
+        patch("lambdas.enrichment_lambda.steps.MODEL_REGISTRY", registry),
+    ):
+        in_worker = graph.run({"text": text}, workers=2).values
+        in_process = graph.run({"text": text}).values
+        stage_graph.stop_stage_workers()
+
+    assert in_worker == in_process
+    assert len(in_process["abbreviation"]) == 2
+
+
+@pytest.mark.parametrize(("value", "workers"), [(None, 1), ("", 1), ("4", 4), ("0", 1), ("many", 1)])
+def test_configured_workers(monkeypatch, value, workers):
+    if value is None:
+        monkeypatch.delenv(stage_graph.STAGE_WORKERS_VARIABLE, raising=False)
+    else:
+        monkeypatch.setenv(stage_graph.STAGE_WORKERS_VARIABLE, value)
+
+    assert configured_workers() == workers
@@ -1,34 +1,48 @@
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
 import lxml.etree
+import pytest
 
 from lambdas.enrichment_lambda.steps import (
+    SourceXMLMissingElement,
+    add_document_timestamp_and_engine_version,
+    enrich_document_second_stage,
+    make_planned_replacements,
     make_post_header_replacements,
+    map_judgment_content,
+    parse_judgment,
     replace_legislation_provisions,
 )
 from utils.compare_xml import assert_equal_xml
+from utils.custom_types import DetectedReference
+from utils.helper import parse_file
+from utils.judgment_document import JudgmentDocument
 
 
-@patch("lambdas.enrichment_lambda.steps.provisions_pipeline", return_value=[])
+@patch("lambdas.enrichment_lambda.steps.resolve_provisions", return_value=[])
 def test_replace_legislation_provisions_returns_original_when_no_refs(_mock_pipeline):
     xml = "<akomaNtoso><judgment><p>No refs</p></judgment></akomaNtoso>"
 
     assert replace_legislation_provisions(xml) == xml
 
 
-@patch("lambdas.enrichment_lambda.steps.replace_references_by_paragraph")
-@patch("lambdas.enrichment_lambda.steps.provisions_pipeline", return_value=[((1, 2), "ref")])
-def test_replace_legislation_provisions_applies_replacements(_mock_pipeline, mock_replace):
-    replaced = Mock()
-    replaced.__str__ = Mock(return_value="<akomaNtoso><judgment><p>Updated</p></judgment></akomaNtoso>")
-    mock_replace.return_value = replaced
+@patch("lambdas.enrichment_lambda.steps.replace_references_in_document")
+@patch("lambdas.enrichment_lambda.steps.resolve_provisions", return_value=[((1, 2), "ref")])
+def test_replace_legislation_provisions_applies_replacements(mock_pipeline, mock_replace):
+    def replace(document, _resolved_refs):
+        document.paragraphs()[0].text = "Updated"
+
+    mock_replace.side_effect = replace
 
     xml = "<akomaNtoso><judgment><p>Original</p></judgment></akomaNtoso>"
 
     result = replace_legislation_provisions(xml)
 
-    assert result == "<akomaNtoso><judgment><p>Updated</p></judgment></akomaNtoso>"
+    assert (
+        result == '<?xml version="1.0" encoding="utf-8"?>\n<akomaNtoso><judgment><p>Updated</p></judgment></akomaNtoso>'
+    )
+    mock_pipeline.assert_called_once_with(["<p>Original</p>"])
     assert mock_replace.call_count == 1
 
 
@@ -84,3 +98,105 @@ class TestMakePostHeaderReplacements:
         """.strip()
         expected_file_content = '<?xml version="1.0" encoding="utf-8"?>\n<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" xmlns:html="http://www.w3.org/1999/xhtml" xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"><judgment name="judgment"><header/><judgmentBody><ref xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" uk:type="case" href="#" uk:isNeutral="true" uk:canonical="b" uk:year="2008" uk:origin="TNA">a</ref></judgmentBody></judgment></akomaNtoso>'
         assert make_post_header_replacements(original_file_content, replacement_content) == expected_file_content
+
+
+class TestMakePlannedReplacements:
+    def test_map_judgment_content_reads_parse_file_text(self):
+        original_file_content = (FIXTURE_DIR / "ewhc-ch-2023-257_original.xml").read_text(encoding="utf-8")
+
+        assert map_judgment_content(parse_judgment(original_file_content)).text == parse_file(original_file_content)
+
+    def test_replaces_detected_references_after_header(self):
+        original_file_content = (FIXTURE_DIR / "uksc-2022-14-press-summary.xml").read_text(encoding="utf-8")
+        document = parse_judgment(original_file_content)
+        source_map = map_judgment_content(document)
+        start = source_map.text.index("Competition Act 1998")
+        legislation = DetectedReference(
+            start,
+            start + len("Competition Act 1998"),
+            ("Competition Act 1998", "https://www.legislation.gov.uk/ukpga/1998/41/contents", "Competition Act 1998"),
+        )
+
+        make_planned_replacements(document, source_map, [], [legislation], [])
+
+        references = document.root.findall(
+            ".//{*}ref[@{https://caselaw.nationalarchives.gov.uk/akn}type='legislation']",
+        )
+        assert [reference.text for reference in references] == ["Competition Act 1998"]
+
+    def test_replaces_previously_enriched_document(self):
+        original_file_content = """<?xml version="1.0" encoding="utf-8"?>
+<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">
+<judgment name="judgment">
+<header><p>a</p></header><judgmentBody><content><p>a <ref uk:type="case" href="#" uk:origin="TNA">a</ref></p></content></judgmentBody></judgment></akomaNtoso>
+"""
+        document = parse_judgment(original_file_content)
+        source_map = map_judgment_content(document)
+        case = ("a", "b", "2008", "#", True)
+
+        make_planned_replacements(
+            document,
+            source_map,
+            [DetectedReference(2, 3, case)],
+            [],
+            [],
+        )
+
+        expected_file_content = '<?xml version="1.0" encoding="utf-8"?>\n<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"><judgment name="judgment"><header><p>a</p></header><judgmentBody><content><p>a <ref uk:type="case" href="#" uk:isNeutral="true" uk:canonical="b" uk:year="2008" uk:origin="TNA">a</ref></p></content></judgmentBody></judgment></akomaNtoso>'
+        assert source_map.text == "a a"
+        assert document.serialize() == expected_file_content
+
+
+class TestAddDocumentTimestampAndEngineVersion:
+    def test_adds_engine_version_and_enriched_date(self):
+        original_file_content = (FIXTURE_DIR / "ewhc-ch-2023-257_original.xml").read_text(encoding="utf-8")
+        document = parse_judgment(original_file_content)
+
+        add_document_timestamp_and_engine_version(document, "1.2.3")
+
+        engine = document.root.find(
+            ".//{*}proprietary/{https://caselaw.nationalarchives.gov.uk/akn}tna-enrichment-engine",
+        )
+        assert engine is not None
+        assert engine.text == "1.2.3"
+        manifestation_dates = document.root.findall(".//{*}FRBRManifestation/{*}FRBRdate")
+        assert manifestation_dates[1].get("name") == "tna-enriched"
+
+    def test_missing_proprietary_raises(self):
+        document = JudgmentDocument.parse("<akomaNtoso><judgment><p>a</p></judgment></akomaNtoso>")
+
+        with pytest.raises(SourceXMLMissingElement):
+            add_document_timestamp_and_engine_version(document)
+
+
+class TestParseOnce:
+    def test_second_stage_does_not_parse_or_serialize(self):
+        original_file_content = (FIXTURE_DIR / "ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml").read_text(
+            encoding="utf-8",
+        )
+        document = parse_judgment(original_file_content)
+
+        enrich_document_second_stage(document)
+        add_document_timestamp_and_engine_version(document)
+        document.serialize()
+
+        assert document.metrics.parses == 1
+        assert document.metrics.serializations == 1
+
+    @pytest.mark.parametrize(
+        "filename",
+        ["ewhc-ch-2023-257_original.xml", "uksc-2022-14-press-summary.xml", "rwanda.xml"],
+    )
+    def test_encoded_judgment_round_trips_as_the_decoded_one(self, filename):
+        encoded = (FIXTURE_DIR / filename).read_bytes()
+        decoded = encoded.decode("utf-8")
+
+        assert JudgmentDocument.parse(encoded).serialize_bytes() == JudgmentDocument.parse(decoded).serialize().encode()
+
+    def test_encoded_judgment_keeps_its_xml_declaration(self):
+        document = JudgmentDocument.parse("<?xml version='1.0' encoding='UTF-8'?>\n<akomaNtoso>é</akomaNtoso>".encode())
+
+        assert (
+            document.serialize_bytes() == "<?xml version='1.0' encoding='UTF-8'?>\n<akomaNtoso>é</akomaNtoso>".encode()
+        )
+        assert JudgmentDocument.parse(b"<akomaNtoso/>").serialize_bytes().startswith(b'<?xml version="1.0"')
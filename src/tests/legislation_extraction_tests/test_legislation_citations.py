@@ -3,9 +3,19 @@ Testing the matching of legislation based on the data found in the lookup table.
 These are independent unit tests.
 """
 
+import random
+
+import pytest
+
+from database.db_connection import get_legislation_lookup
+from database.legislation_index import LegislationIndex
 from enrichment.legislation_extraction.legislation_matcher_hybrid import (
+    PAD,
+    build_exact_matcher,
     detect_candidates,
     detect_year_span,
+    exact_match_titles,
+    fuzzy_match_titles,
     lookup_pipe,
     resolve_overlap,
     search_for_act_fuzzy,
@@ -161,6 +171,54 @@ class TestResolveOlverlap:
             ],
         }
 
+    def test_resolve_overlap_keeps_best_of_partially_overlapping(self):
+        results = {
+            "Children Act 1989": [("Children Act 1989", 10, 13, 95, "ukpga/1989/41", "1989 c. 41")],
+            "Children and Families Act 2014": [("and Children Act 1989", 8, 12, 91, "ukpga/2014/6", "2014 c. 6")],
+            "Care Act 2014": [("Care Act 2014", 40, 43, 92, "ukpga/2014/23", "2014 c. 23")],
+        }
+
+        assert resolve_overlap(results) == {
+            "Care Act 2014": [("Care Act 2014", 40, 43, 92, "ukpga/2014/23", "2014 c. 23")],
+            "Children Act 1989": [("Children Act 1989", 10, 13, 95, "ukpga/1989/41", "1989 c. 41")],
+        }
+
+    def test_resolve_overlap_keeps_best_nested_reference(self):
+        results = {
+            "Adoption and Children Act 2002": [
+                ("the Adoption and Children Act 2002", 10, 16, 92, "ukpga/2002/38", "2002 c. 38"),
+            ],
+            "ACA 2002": [("ACA 2002", 12, 14, 100, "ukpga/2002/38", "2002 c. 38")],
+        }
+
+        assert resolve_overlap(results) == {"ACA 2002": [("ACA 2002", 12, 14, 100, "ukpga/2002/38", "2002 c. 38")]}
+
+    def test_resolve_overlap_keeps_references_overlapping_only_through_a_dropped_one(self):
+        results = {
+            "Children Act 1989": [("Children Act 1989", 0, 10, 95, "ukpga/1989/41", "1989 c. 41")],
+            "Children and Families Act 2014": [("Act 1989 and Families", 8, 20, 90, "ukpga/2014/6", "2014 c. 6")],
+            "Care Act 2014": [("Families and Care Act 2014", 18, 30, 92, "ukpga/2014/23", "2014 c. 23")],
+        }
+
+        assert resolve_overlap(results) == {
+            "Care Act 2014": [("Families and Care Act 2014", 18, 30, 92, "ukpga/2014/23", "2014 c. 23")],
+            "Children Act 1989": [("Children Act 1989", 0, 10, 95, "ukpga/1989/41", "1989 c. 41")],
+        }
+
+    def test_resolve_overlap_keeps_separate_references_inside_a_worse_one(self):
+        results = {
+            "Children and Families Act 2014": [
+                ("Children Act 1989 and the Care Act 2014", 0, 30, 80, "ukpga/2014/6", "2014 c. 6"),
+            ],
+            "Children Act 1989": [("Children Act 1989", 2, 5, 100, "ukpga/1989/41", "1989 c. 41")],
+            "Care Act 2014": [("Care Act 2014", 20, 25, 100, "ukpga/2014/23", "2014 c. 23")],
+        }
+
+        assert resolve_overlap(results) == {
+            "Care Act 2014": [("Care Act 2014", 20, 25, 100, "ukpga/2014/23", "2014 c. 23")],
+            "Children Act 1989": [("Children Act 1989", 2, 5, 100, "ukpga/1989/41", "1989 c. 41")],
+        }
+
 
 def test_lookup_pipe(nlp, db_connection, seed_ukpga_lookup):
     text = (
@@ -178,7 +236,7 @@ def test_lookup_pipe(nlp, db_connection, seed_ukpga_lookup):
         doc,
         nlp,
         hybrid,
-        db_connection,
+        LegislationIndex.from_dataframe(get_legislation_lookup(db_connection)),
         cutoff,
     )
 
@@ -234,6 +292,19 @@ def test_search_for_act(nlp):
     assert matched_text == []
 
 
+def test_exact_match_titles_in_a_single_pass(nlp):
+    doc = nlp("Under the ACA 2002, read with the CA 1989 and the ACA 2002, but not the CFA 2014")
+    phrase_matcher = build_exact_matcher(nlp, ["CA 1989", "ACA 2002", "CFA 2014"])
+
+    matched_text = exact_match_titles(["ACA 2002", "CA 1989"], doc, nlp, phrase_matcher)
+
+    # titles that are not relevant to the judgement are left out
+    assert matched_text == {
+        "ACA 2002": [("ACA 2002", 2, 4, 100), ("ACA 2002", 12, 14, 100)],
+        "CA 1989": [("CA 1989", 8, 10, 100)],
+    }
+
+
 def test_search_for_act_fuzzy(nlp):
     text = "In their skeleton argument in support of the first ground, Mr Goodwin and Mr Redmond remind the court that the welfare checklist in s.1(4) of the Adoption Children Act 2002 requires the court, inter alia"
     doc = nlp(text)
@@ -263,3 +334,80 @@ def test_hybrid(nlp):
     ) == [
         ("Adoption Children Act 2002", 28, 32, 91),
     ]
+
+
+# ---------------- fuzzy matcher equivalence ----------------
+
+EQUIVALENCE_TITLES = [
+    "Adoption and Children Act 2002",
+    "Children Act 2002",
+    "Education Act 2002",
+    "Nationality, Immigration and Asylum Act 2002",
+    "Proceeds of Crime Act 2002",
+    "Children and Families Act 2014",
+    "Care Act 2014",
+    "Immigration Act 2014",
+    "Finance 2014",
+]
+
+
+def reference_fuzzy_matcher(title, docobj, nlp, cutoff, candidates):
+    """The fuzzy matcher as it was before titles were batched: a spaczz matcher per title and candidate."""
+    act, year = title[:-4], title[-4:]
+    act_span = len(nlp.make_doc(title)) + PAD
+    all_matches = []
+    for _, end in candidates:
+        segment = docobj[max(end - act_span, 0) : end - 1].as_doc()
+        dyear = docobj[end - 1 : end].text
+        matches = search_for_act_fuzzy(act, segment, nlp, cutoff=cutoff)
+        if (len(matches) > 0) & (dyear == year):
+            all_matches.extend(
+                [(docobj[end - 1 - e + s : end].text, end - 1 - e + s, end, ratio) for text, s, e, ratio in matches],
+            )
+    return all_matches
+
+
+def mangle(title, rng):
+    """Returns a well-formed or malformed reference to `title`, as found in judgments."""
+    words = title[:-5].split()
+    mangling = rng.randrange(6)
+    if mangling == 0 and len(words) > 2:
+        del words[rng.randrange(len(words) - 1)]
+    elif mangling == 1:
+        word = rng.randrange(len(words))
+        letter = rng.randrange(len(words[word]))
+        words[word] = words[word][:letter] + words[word][letter + 1 :]
+    elif mangling == 2:
+        words.insert(rng.randrange(len(words)), rng.choice(["the", "of", "and"]))
+    elif mangling == 3 and len(words) > 2:
+        words[0], words[1] = words[1], words[0]
+    elif mangling == 4:
+        words = [word.lower() for word in words]
+    return " ".join(words) + title[-5:]
+
+
+@pytest.mark.parametrize("cutoff", [80, 90])
+def test_fuzzy_match_titles_matches_reference_matcher(nlp, cutoff):
+    rng = random.Random(cutoff)  # noqa: S311
+    sentences = [
+        f"As set out in s.{rng.randrange(1, 99)} of the {mangle(rng.choice(EQUIVALENCE_TITLES), rng)}, the court held"
+        for _ in range(150)
+    ]
+    # a reference at the very start of the judgment has a truncated candidate segment
+    doc = nlp(f"{mangle(EQUIVALENCE_TITLES[0], rng)} applies. " + " ".join(sentences))
+    candidates = detect_candidates(nlp, doc)
+
+    matches = fuzzy_match_titles(EQUIVALENCE_TITLES, doc, nlp, cutoff, candidates)
+
+    assert matches == {
+        title: reference_fuzzy_matcher(title, doc, nlp, cutoff, candidates) for title in EQUIVALENCE_TITLES
+    }
+    assert any(matches.values())
+
+
+def test_fuzzy_match_titles_at_the_start_of_the_text(nlp):
+    doc = nlp("The Adoption Children Act 2002 applies.")
+
+    matches = fuzzy_match_titles(["Adoption and Children Act 2002"], doc, nlp, 90, detect_candidates(nlp, doc))
+
+    assert matches == {"Adoption and Children Act 2002": [("Adoption Children Act 2002", 1, 5, 91)]}
@@ -0,0 +1,116 @@
+"""
+Testing the in-memory index of the legislation lookup table.
+"""
+
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from database.db_connection import get_legislation_lookup
+from database.legislation_index import LegislationIndex, LegislationIndexCache, LegislationTitle
+
+LOOKUP = pd.DataFrame(
+    [
+        ("Children and Families Act 2014", "ukpga/2014/6", "2014 c. 6", 2014, True),
+        ("Adoption and Children Act 2002", "ukpga/2002/38", "2002 c. 38", 2002, True),
+        ("ACA 2002", "ukpga/2002/38", "2002 c. 38", 2002, False),
+        ("Children Act 1989", "ukpga/1989/41", "1989 c. 41", 1989, True),
+        ("Adoption and Children Act 2002", "ukpga/2002/99", "2002 c. 99", 2002, True),
+    ],
+    columns=["candidate_titles", "ref", "citation", "year", "for_fuzzy"],
+)
+
+
+class TestLegislationIndex:
+    def test_candidate_titles_bucketed_by_year_and_approach(self):
+        index = LegislationIndex.from_dataframe(LOOKUP)
+
+        assert index.candidate_titles({2002}, for_fuzzy=True) == ["Adoption and Children Act 2002"]
+        assert index.candidate_titles({2002}, for_fuzzy=False) == ["ACA 2002"]
+        assert index.candidate_titles({1999}, for_fuzzy=True) == []
+
+    def test_candidate_titles_keep_table_order(self):
+        index = LegislationIndex.from_dataframe(LOOKUP)
+
+        assert index.candidate_titles([1989, 2002, 2014], for_fuzzy=True) == [
+            "Children and Families Act 2014",
+            "Adoption and Children Act 2002",
+            "Children Act 1989",
+        ]
+
+    def test_exact_titles_of_every_year(self):
+        index = LegislationIndex.from_dataframe(LOOKUP)
+
+        assert index.exact_titles() == ["ACA 2002"]
+
+    def test_fuzzy_titles_of_every_year(self):
+        index = LegislationIndex.from_dataframe(LOOKUP)
+
+        assert set(index.fuzzy_titles()) == set(index.candidate_titles(LOOKUP.year, for_fuzzy=True))
+        assert "ACA 2002" not in index.fuzzy_titles()
+
+    def test_title_resolves_to_its_first_row(self):
+        index = LegislationIndex.from_dataframe(LOOKUP)
+
+        assert index["Adoption and Children Act 2002"] == LegislationTitle(
+            "Adoption and Children Act 2002",
+            "ukpga/2002/38",
+            "2002 c. 38",
+        )
+        with pytest.raises(KeyError):
+            index["Unknown Act 2000"]
+
+    def test_round_trips_through_file(self, tmp_path):
+        index = LegislationIndex.from_dataframe(LOOKUP, signature=(1, 5, 100))
+        path = tmp_path / "legislation_index.json.gz"
+
+        index.to_file(path)
+        loaded = LegislationIndex.from_file(path)
+
+        assert loaded.signature == (1, 5, 100)
+        assert len(loaded) == len(index)
+        assert loaded.candidate_titles([1989, 2002, 2014], True) == index.candidate_titles([1989, 2002, 2014], True)
+        assert loaded["ACA 2002"] == index["ACA 2002"]
+
+
+@patch("database.legislation_index.get_legislation_lookup", return_value=LOOKUP)
+@patch("database.legislation_index.get_table_signature")
+class TestLegislationIndexCache:
+    def test_loaded_once_while_table_unchanged(self, mock_signature, mock_lookup, tmp_path):
+        mock_signature.return_value = (1, 5, 100)
+        cache = LegislationIndexCache(tmp_path / "index.json.gz")
+
+        first = cache.get(conn=None)
+
+        assert cache.get(conn=None) is first
+        mock_lookup.assert_called_once()
+
+    def test_reloaded_when_table_changes(self, mock_signature, mock_lookup, tmp_path):
+        mock_signature.side_effect = [(1, 5, 100), (1, 6, 101)]
+        cache = LegislationIndexCache(tmp_path / "index.json.gz")
+
+        first = cache.get(conn=None)
+        second = cache.get(conn=None)
+
+        assert second is not first
+        assert second.signature == (1, 6, 101)
+        assert mock_lookup.call_count == 2
+
+    def test_restart_loads_persisted_index_without_querying_the_table(self, mock_signature, mock_lookup, tmp_path):
+        mock_signature.return_value = (1, 5, 100)
+        LegislationIndexCache(tmp_path / "index.json.gz").get(conn=None)
+
+        restarted = LegislationIndexCache(tmp_path / "index.json.gz").get(conn=None)
+
+        assert restarted.candidate_titles({2002}, True) == ["Adoption and Children Act 2002"]
+        mock_lookup.assert_called_once()
+
+
+@pytest.mark.integration
+def test_index_from_lookup_table(db_connection, seed_ukpga_lookup):
+    index = LegislationIndex.from_dataframe(get_legislation_lookup(db_connection))
+
+    assert index.candidate_titles({2002}, True) == ["Adoption and Children Act 2002"]
+    assert index.candidate_titles({2002}, False) == ["ghi"]
+    assert index["def"] == LegislationTitle("def", "ref_def", "citation_def")
@@ -1,11 +1,37 @@
+import random
+
+import numpy as np
+import pytest
+
+from enrichment.legislation_provisions_extraction import legislation_provisions
 from enrichment.legislation_provisions_extraction.legislation_provisions import (
+    SectionDefinitions,
     detect_reference,
     find_closest_legislation,
     get_clean_section_number,
     provision_resolver,
+    read_ref_attributes,
+    save_section_to_dict,
 )
 
 
+def definition(para_number, section_position, href="h"):
+    return {"para_number": para_number, "section_position": section_position, "section_href": href}
+
+
+def closest_by_argmin(section_matches, cur_para_number, cur_pos):
+    """The definition `get_correct_section_def` returned before it used `SectionDefinitions`"""
+    pos_refs = np.asarray([(match["para_number"], match["section_position"]) for match in section_matches])
+    para_numbers = pos_refs[:, 0]
+    idx = (np.abs(para_numbers - cur_para_number)).argmin()
+    candidates = [match for match in section_matches if match["para_number"] == para_numbers[idx]]
+    if len(candidates) == 1:
+        return candidates[0]
+    positions = pos_refs[:, 1]
+    idx = (np.abs(positions - cur_pos)).argmin()
+    return next(match for match in section_matches if match["section_position"] == positions[idx])
+
+
 class TestLegislationProvisionProcessors:
     """
     This class focuses on testing the Legislation Provision processor, which detects references to sections and links them to the
@@ -245,3 +271,112 @@ class TestLegislationProvisionProcessors:
         resolved_ref = provision_resolver(section_dict, match, para_number)
 
         assert ex_resolved_ref == resolved_ref
+
+
+class TestFindClosestLegislation:
+    @pytest.mark.parametrize("numpy_pairs", [0, 10_000])
+    def test_with_and_without_numpy(self, monkeypatch, numpy_pairs):
+        """The sections close to legislation are the same whether the distances are computed with numpy or not"""
+        monkeypatch.setattr(legislation_provisions, "NUMPY_PAIRS", numpy_pairs)
+        rng = random.Random(0)  # noqa: S311
+        for _ in range(50):
+            sections = [((start, start + 10), f"section {start}") for start in rng.sample(range(1000), 12)]
+            legislations = [((start, start + 40), f"<ref>{start}</ref>") for start in rng.sample(range(1000), 8)]
+
+            expected = [
+                (section, legislation, section_position[0])
+                for section_position, section in sections
+                for legislation_position, legislation in legislations
+                if max(section_position[0] - legislation_position[1], 0)
+                + max(legislation_position[0] - section_position[1], 0)
+                < 30
+            ]
+            assert find_closest_legislation(legislations, sections) == expected
+
+
+class TestReadRefAttributes:
+    def test_undeclared_prefixes_are_left_out(self):
+        ref = '<ref href="h" uk:canonical="1977 c. 37" uk:type="legislation">Patents Act 1977</ref>'
+
+        assert read_ref_attributes(ref) == {"href": "h", "canonical": "1977 c. 37", "type": "legislation"}
+
+    def test_declared_prefixes_are_kept(self):
+        ref = '<ref xmlns:uk="urn:uk" href="a &amp; b" uk:canonical=\'say "x"\'>the Act</ref>'
+
+        assert read_ref_attributes(ref) == {"xmlns:uk": "urn:uk", "href": "a & b", "uk:canonical": 'say "x"'}
+
+    @pytest.mark.parametrize(
+        "ref",
+        [
+            '<ref href="&#104;">Act</ref>',
+            '<ref canonical="a" uk:canonical="b">Act</ref>',
+            '<ref xmlns="urn:a" xmlns:uk="urn:a" uk:canonical="b">Act</ref>',
+            '<reference href="h">Act</reference>',
+        ],
+    )
+    def test_refs_to_parse(self, ref):
+        assert read_ref_attributes(ref) is None
+
+    def test_same_as_parsing_the_ref(self):
+        section_dict = save_section_to_dict(
+            [
+                ("section 1", '<ref canonical="a" href="h">A</ref>', 10),
+                ("section 2", '<ref href="&#104;" uk:canonical="b">B</ref>', 20),
+                ("section 3", '<ref xmlns:uk="urn:uk" href="h" uk:canonical="c">C</ref>', 30),
+            ],
+            1,
+            {},
+        )
+
+        assert [section_dict[f"section {number}"][0]["canonical"] for number in (1, 2, 3)] == ["a", "b", None]
+        assert [section_dict[f"section {number}"][0]["section_href"] for number in (1, 2, 3)] == [
+            "h/section/1",
+            "h/section/2",
+            "h/section/3",
+        ]
+
+
+class TestSectionDefinitions:
+    def test_closest_paragraph(self):
+        definitions = SectionDefinitions([definition(2, 50, "a"), definition(7, 10, "b"), definition(9, 900, "c")])
+
+        assert definitions.closest(8, 0)["section_href"] == "b"
+        assert definitions.closest(12, 0)["section_href"] == "c"
+        assert len(definitions) == 3
+        assert definitions[0]["section_href"] == "a"
+
+    def test_closest_position_when_redefined_in_paragraph(self):
+        definitions = SectionDefinitions([definition(2, 50, "a"), definition(5, 100, "b"), definition(5, 400, "c")])
+
+        assert definitions.closest(5, 120)["section_href"] == "b"
+        assert definitions.closest(6, 380)["section_href"] == "c"
+
+    def test_first_found_of_two_as_close(self):
+        definitions = SectionDefinitions([definition(5, 300, "a"), definition(5, 100, "b"), definition(3, 100, "c")])
+
+        # paragraphs 3 and 5 are as close to 4, and position 100 is the closest to 0 of those in paragraph 5
+        assert definitions.closest(4, 0)["section_href"] == "b"
+        # positions 100 and 300 are as close to 200
+        assert definitions.closest(5, 200)["section_href"] == "a"
+        assert definitions.closest(5, 100)["section_href"] == "b"
+
+    def test_same_as_argmin(self):
+        rng = random.Random(0)  # noqa: S311
+        for _ in range(200):
+            section_matches = [
+                definition(rng.randint(0, 8), rng.randint(0, 30), str(index)) for index in range(rng.randint(1, 10))
+            ]
+            definitions = SectionDefinitions(section_matches)
+            for _ in range(10):
+                cur_para_number, cur_pos = rng.randint(0, 10), rng.randint(0, 40)
+                assert definitions.closest(cur_para_number, cur_pos) is closest_by_argmin(
+                    section_matches,
+                    cur_para_number,
+                    cur_pos,
+                )
+
+    def test_append(self):
+        definitions = SectionDefinitions([definition(1, 10, "a")])
+        definitions.append(definition(4, 10, "b"))
+
+        assert definitions.closest(4, 10)["section_href"] == "b"
@@ -9,6 +9,7 @@ from caselawclient.content_hash import get_hash_from_document
 from enrichment.oblique_references.oblique_references import (
     LegislationReferenceReplacement,
     NotExactlyOneRefTag,
+    PrecedingLegislationIndex,
     create_legislation_dict,
     detect_reference,
     get_oblique_reference_replacements_by_paragraph,
@@ -18,6 +19,7 @@ from enrichment.replacer.second_stage_replacer import replace_references
 from lambdas.enrichment_lambda.steps import (
     enrich_oblique_references,
 )
+from utils.judgment_document import JudgmentDocument, markup_map
 
 FIXTURE_DIR = Path(__file__).parent.parent.resolve() / "fixtures/"
 
@@ -282,6 +284,64 @@ class TestDetectReference:
         assert detected_act[1][1] == "the Act"
         assert detected_act[2][1] == "that Act"
 
+    @pytest.mark.parametrize("filename", ["rwanda.xml", "ewhc-ch-2023-257_enriched_stage_1.xml"])
+    def test_create_legislation_dict_from_parsed_elements(self, filename):
+        """
+        Given the markup maps of the paragraphs of a judgment
+        When `create_legislation_dict` is passed the markup map of the paragraph
+        Then the LegislationDicts read from the parsed elements are the same as the ones
+            read by parsing each detected reference again
+        """
+        document = JudgmentDocument.parse((FIXTURE_DIR / filename).read_text(encoding="utf-8"))
+
+        for paragraph_number, paragraph in enumerate(map(markup_map, document.paragraphs())):
+            detected_legislation = detect_reference(paragraph.markup, "legislation")
+            assert create_legislation_dict(detected_legislation, paragraph_number, paragraph) == (
+                create_legislation_dict(detected_legislation, paragraph_number)
+            )
+
+
+class TestLegislationIndex:
+    """Tests the `PrecedingLegislationIndex` class"""
+
+    legislation_dicts = [
+        {"para_pos": (10, 50), "para": 1, "detected_leg": "A Act 1990", "href": "a", "canonical": "a", "year": "1990"},
+        {"para_pos": (80, 120), "para": 1, "detected_leg": "B Act 2000", "href": "b", "canonical": "b", "year": "2000"},
+        {"para_pos": (10, 50), "para": 3, "detected_leg": "C Act 1990", "href": "c", "canonical": "c", "year": "1990"},
+        {"para_pos": (200, 240), "para": 3, "detected_leg": "D Act", "href": "d", "canonical": "d", "year": ""},
+    ]
+
+    def test_nearest_preceding(self):
+        index = PrecedingLegislationIndex(self.legislation_dicts)
+
+        assert index.nearest_preceding(0, 500) is None
+        assert index.nearest_preceding(1, 10) is None
+        assert index.nearest_preceding(1, 60)["href"] == "a"
+        assert index.nearest_preceding(2, 0)["href"] == "b"
+        assert index.nearest_preceding(3, 500)["href"] == "d"
+
+    def test_nearest_preceding_at_same_position_as_earlier_reference(self):
+        """
+        The first reference at the same position in its paragraph is matched, as it was
+        when the references were scanned in order
+        """
+        index = PrecedingLegislationIndex(self.legislation_dicts)
+
+        assert index.nearest_preceding(3, 100)["href"] == "a"
+
+    def test_first_of_year(self):
+        index = PrecedingLegislationIndex(self.legislation_dicts)
+
+        assert index.first_of_year("1990")["href"] == "a"
+        assert index.first_of_year("2000")["href"] == "b"
+        assert index.first_of_year("2010") is None
+
+    def test_extend(self):
+        index = PrecedingLegislationIndex(self.legislation_dicts[:2])
+        index.extend(self.legislation_dicts[2:])
+
+        assert index.nearest_preceding(3, 500)["href"] == "d"
+
 
 class TestGetReplacements:
     """Tests the `get_replacements` function"""
@@ -1,8 +1,11 @@
+import lxml.etree
 import pytest
 
 from enrichment.replacer.make_replacements import (
     _remove_old_enrichment_references,
+    sanitize_document,
     split_text_by_closing_header_tag,
+    strip_whitespace_text,
 )
 
 
@@ -46,3 +49,28 @@ class TestRemoveOldEnrichmentReferences:
             <ref></ref>
             </xml>""",
         )
+
+
+class TestSanitizeDocument:
+    def test_unwraps_old_references_and_removes_enrichment_metadata(self):
+        root = lxml.etree.fromstring(
+            """<xml xmlns='http://docs.oasis-open.org/legaldocml/ns/akn/3.0' xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">
+<FRBRdate date="2023-01-01" name="tna-enriched"/><FRBRdate date="2022-01-01" name="transform"/>
+<uk:tna-enrichment-engine>7.4.0</uk:tna-enrichment-engine>
+<a><e><ref uk:origin="TNA"><ref><b>AAA</b></ref><c/></ref>D <ref uk:origin="not-TNA">E</ref></e></a></xml>""",
+        )
+
+        sanitize_document(root)
+        output = lxml.etree.tostring(root, encoding="unicode")
+
+        assert '<a><e><b>AAA</b><c/>D <ref uk:origin="not-TNA">E</ref></e></a>' in output
+        assert "tna-enriched" not in output
+        assert "tna-enrichment-engine" not in output
+        assert 'name="transform"' in output
+
+    def test_strip_whitespace_text(self):
+        root = lxml.etree.fromstring("<a>\n <b> x </b>\t<c>\xa0</c> <!-- c -->\n</a>")
+
+        strip_whitespace_text(root)
+
+        assert lxml.etree.tostring(root, encoding="unicode") == "<a><b> x </b><c>\xa0</c><!-- c --></a>"
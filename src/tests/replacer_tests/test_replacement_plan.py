@@ -0,0 +1,92 @@
+import lxml.etree
+
+from enrichment.replacer.replacement_plan import apply_replacement_plan, build_replacement_plan
+from utils.custom_types import DetectedReference
+from utils.source_map import SourceMap
+
+DOCUMENT = """<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">
+<judgment><header><intro><p>Human Rights Act 1998 (HRA)</p></intro></header><judgmentBody><content><p>The Human Rights Act 1998 (HRA) applies, but <i>the HRA</i> does not.</p></content></judgmentBody></judgment></akomaNtoso>"""
+
+LEGISLATION = ("Human Rights Act 1998", "http://www.legislation.gov.uk/ukpga/1998/42", "Human Rights Act 1998")
+ABBREVIATION = ("HRA", "Human Rights Act 1998")
+CASE = ("Rights Act 1998", "Rights Act 1998", "1998", "#", False)
+
+
+def detected(source_map, string, replacement, occurrence=-1):
+    """The reference detected at an occurrence of a string in the text"""
+    starts = [index for index in range(len(source_map.text)) if source_map.text.startswith(string, index)]
+    start = starts[occurrence]
+    return DetectedReference(start, start + len(string), replacement)
+
+
+def replace(source_map, caselaw, legislation, abbreviations):
+    apply_replacement_plan(source_map.root, build_replacement_plan(source_map, caselaw, legislation, abbreviations))
+    return lxml.etree.tostring(source_map.root, encoding="unicode")
+
+
+class TestReplacementPlan:
+    def test_only_detected_occurrences_are_replaced(self):
+        source_map = SourceMap(lxml.etree.fromstring(DOCUMENT))
+        abbreviation = detected(source_map, "HRA", ABBREVIATION, occurrence=1)
+
+        output = replace(source_map, [], [], [abbreviation])
+
+        assert '(<abbr title="Human Rights Act 1998" uk:origin="TNA">HRA</abbr>) applies' in output
+        assert "<i>the HRA</i>" in output
+
+    def test_references_in_header_are_not_replaced(self):
+        source_map = SourceMap(lxml.etree.fromstring(DOCUMENT))
+        references = [detected(source_map, "HRA", ABBREVIATION, occurrence) for occurrence in range(3)]
+
+        plan = build_replacement_plan(source_map, [], [], references)
+
+        assert [replacement.span.node.owner.tag for replacement in plan] == [
+            "{http://docs.oasis-open.org/legaldocml/ns/akn/3.0}p",
+            "{http://docs.oasis-open.org/legaldocml/ns/akn/3.0}i",
+        ]
+
+    def test_overlapping_references_resolved_by_precedence(self):
+        source_map = SourceMap(lxml.etree.fromstring(DOCUMENT))
+        legislation = detected(source_map, "Human Rights Act 1998", LEGISLATION)
+        case = detected(source_map, "Rights Act 1998", CASE)
+        abbreviations = [detected(source_map, "HRA", ABBREVIATION, occurrence) for occurrence in (1, 2)]
+
+        plan = build_replacement_plan(source_map, [case], [legislation], abbreviations)
+
+        assert [(replacement.tag, replacement.attributes["uk:origin"]) for replacement in plan] == [
+            ("ref", "TNA"),
+            ("abbr", "TNA"),
+            ("abbr", "TNA"),
+        ]
+        assert plan[0].attributes["uk:type"] == "case"
+
+    def test_replacements_in_one_text_node(self):
+        source_map = SourceMap(lxml.etree.fromstring(DOCUMENT))
+        legislation = detected(source_map, "Human Rights Act 1998", LEGISLATION)
+        abbreviation = detected(source_map, "HRA", ABBREVIATION, occurrence=1)
+
+        output = replace(source_map, [], [legislation], [abbreviation])
+
+        assert (
+            '<p>The <ref uk:type="legislation" href="http://www.legislation.gov.uk/ukpga/1998/42" '
+            'uk:canonical="Human Rights Act 1998" uk:origin="TNA">Human Rights Act 1998</ref> '
+            '(<abbr title="Human Rights Act 1998" uk:origin="TNA">HRA</abbr>) applies, but <i>the HRA</i> does not.</p>'
+        ) in output
+
+    def test_reference_not_matching_the_xml_is_dropped(self):
+        source_map = SourceMap(lxml.etree.fromstring(DOCUMENT))
+        abbreviation = detected(source_map, "HRA", ABBREVIATION, occurrence=1)
+
+        plan = build_replacement_plan(source_map, [], [], [abbreviation._replace(replacement=("ABC", "A B C"))])
+
+        assert plan == []
+
+    def test_document_without_namespace(self):
+        source_map = SourceMap(lxml.etree.fromstring("<judgment><content><p>The HRA</p></content></judgment>"))
+
+        output = replace(source_map, [], [], [detected(source_map, "HRA", ABBREVIATION)])
+
+        assert output == (
+            '<judgment><content><p>The <abbr xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn" '
+            'title="Human Rights Act 1998" uk:origin="TNA">HRA</abbr></p></content></judgment>'
+        )
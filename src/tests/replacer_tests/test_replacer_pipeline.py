@@ -3,6 +3,7 @@ from enrichment.replacer.replacer_pipeline import (
     replacer_abbr,
     replacer_caselaw,
     replacer_leg,
+    replacer_pipeline,
 )
 
 
@@ -136,6 +137,37 @@ class TestReplacerAbbr:
         assert replacer_abbr(text, replacement_entry) == expected
 
 
+class TestReplacerPipeline:
+    def test_replacer_pipeline_applies_all_replacements(self):
+        text = "<z>The ACA 2002 was considered in [2022] UKSC 3.</z></judgment></akomaNtoso>"
+        caselaw = [("[2022] UKSC 3", "[2022] UKSC 3", "2022", "#", True)]
+        legislation = [("ACA 2002", "http://www.legislation.gov.uk/ukpga/2002/38", "2002 c. 38")]
+        abbreviations = [("ACA", "Adoption and Children Act")]
+
+        assert replacer_pipeline(text, caselaw, legislation, abbreviations) == (
+            '<z>The <ref xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" uk:type="legislation" '
+            'href="http://www.legislation.gov.uk/ukpga/2002/38" uk:canonical="2002 c. 38" uk:origin="TNA">'
+            '<abbr title="Adoption and Children Act" uk:origin="TNA">ACA</abbr> 2002</ref> was considered in '
+            '<ref xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" uk:type="case" href="#" uk:isNeutral="true" '
+            'uk:canonical="[2022] UKSC 3" uk:year="2022" uk:origin="TNA">[2022] UKSC 3</ref>.</z></judgment></akomaNtoso>'
+        )
+
+    def test_replacer_pipeline_ignores_duplicate_replacements(self):
+        text = "<z>the Children Act 1989</z>"
+        legislation = [("Children Act 1989", "http://www.legislation.gov.uk/ukpga/1989/41", "1989 c. 41")] * 2
+
+        assert replacer_pipeline(text, [], legislation, []) == (
+            '<z>the <ref xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" uk:type="legislation" '
+            'href="http://www.legislation.gov.uk/ukpga/1989/41" uk:canonical="1989 c. 41" uk:origin="TNA">'
+            "Children Act 1989</ref></z>"
+        )
+
+    def test_replacer_pipeline_without_replacements(self):
+        text = "<z a='1'>unchanged</z>"
+
+        assert replacer_pipeline(text, [], [], []) == text
+
+
 class TestFixedYear:
     def test_no_year(self):
         assert fixed_year(None) is None
@@ -0,0 +1,85 @@
+"""Unit Tests for the `second_stage_pipeline` module"""
+
+from pathlib import Path
+
+import pytest
+
+from enrichment.replacer.second_stage_pipeline import link_second_stage_references, paragraph_groups
+from lambdas.enrichment_lambda.steps import (
+    enrich_document_oblique_references,
+    replace_document_legislation_provisions,
+)
+from utils.judgment_document import JudgmentDocument
+
+FIXTURE_DIR = Path(__file__).parent.parent.resolve() / "fixtures"
+
+LEGISLATION_REF = (
+    '<ref href="http://www.legislation.gov.uk/id/ukpga/{year}/12" uk:canonical="{year} c. 12" '
+    'uk:origin="TNA" uk:type="legislation">Finance Act {year}</ref>'
+)
+
+NESTED_JUDGMENT = (
+    '<akomaNtoso xmlns="http://docs.oasis-open.org/legaldocml/ns/akn/3.0" '
+    'xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"><judgment><judgmentBody><decision>'
+    f"<p>Under {LEGISLATION_REF.format(year=2004)}, section 12 of the Act applies."
+    '<authorialNote class="footnote" marker="1"><p>See section 3 of that Act and the 2004 Act.</p></authorialNote>'
+    " Section 12 is not in dispute.</p>"
+    f"<p>Under {LEGISLATION_REF.format(year=2010)}, this Act and section 4 of it.</p>"
+    '<p>Nothing<authorialNote class="footnote" marker="2"><p>but section 12 of the Act.</p></authorialNote></p>'
+    "</decision></judgmentBody></judgment></akomaNtoso>"
+)
+
+
+def enrich_in_two_steps(xml):
+    document = JudgmentDocument.parse(xml)
+    oblique_references = enrich_document_oblique_references(document)
+    provisions = replace_document_legislation_provisions(document)
+    return document.serialize(), (oblique_references, provisions)
+
+
+class TestLinkSecondStageReferences:
+    @pytest.mark.parametrize(
+        "filename",
+        ["ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml", "ewhc-ch-2023-257_enriched_stage_1.xml", "rwanda.xml"],
+    )
+    def test_same_as_oblique_references_then_provisions(self, filename):
+        """
+        Given a judgment with legislation references
+        When `link_second_stage_references` is called with it
+        Then it is enriched as linking its oblique references and then its provisions does
+        """
+        xml = (FIXTURE_DIR / filename).read_text(encoding="utf-8")
+        document = JudgmentDocument.parse(xml)
+
+        counts = link_second_stage_references(document)
+
+        assert (document.serialize(), tuple(counts)) == enrich_in_two_steps(xml)
+        assert counts.oblique_references
+        assert counts.provisions
+
+    def test_nested_paragraphs(self):
+        """
+        The provisions of a paragraph are resolved with the oblique references of the paragraphs
+        nested in it linked
+        """
+        document = JudgmentDocument.parse(NESTED_JUDGMENT)
+
+        counts = link_second_stage_references(document)
+
+        assert (document.serialize(), tuple(counts)) == enrich_in_two_steps(NESTED_JUDGMENT)
+        # the references in a footnote are detected in its paragraph and in the paragraph it is in
+        assert counts == (8, 7)
+
+    def test_judgment_without_references(self):
+        xml = "<akomaNtoso><judgment><p>No refs</p></judgment></akomaNtoso>"
+        document = JudgmentDocument.parse(xml)
+
+        assert link_second_stage_references(document) == (0, 0)
+        assert document.serialize().endswith(xml)
+        assert document.metrics.fragment_parses == 0
+
+
+def test_paragraph_groups():
+    paragraphs = JudgmentDocument.parse(NESTED_JUDGMENT).paragraphs()
+
+    assert paragraph_groups(paragraphs) == [[0, 1], [2], [3, 4]]
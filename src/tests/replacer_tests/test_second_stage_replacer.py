@@ -2,16 +2,42 @@
 
 from pathlib import Path
 
-from bs4 import BeautifulSoup
+import lxml.etree
+import pytest
 
+from enrichment.legislation_provisions_extraction.legislation_provisions import resolve_provisions
+from enrichment.oblique_references.oblique_references import get_oblique_reference_replacements
 from enrichment.replacer.second_stage_replacer import (
-    create_replacement_paragraph,
-    replace_references_by_paragraph,
+    replace_references,
+    replace_references_in_document,
 )
 from utils.compare_xml import assert_equal_xml
+from utils.judgment_document import JudgmentDocument, element_markup, markup_map
 
 FIXTURE_DIR = Path(__file__).parent.parent.resolve() / "fixtures"
 
+UK_NAMESPACE = 'xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"'
+
+
+def replace_by_reparsing(document, reference_replacements):
+    """Replace each paragraph with references by its markup with the references replaced, parsed again"""
+    paragraphs = document.paragraphs()
+    for paragraph_number in sorted({replacement["ref_para"] for replacement in reference_replacements}):
+        paragraph = paragraphs[paragraph_number]
+        paragraph_replacements = [
+            replacement for replacement in reference_replacements if replacement["ref_para"] == paragraph_number
+        ]
+        replacement_paragraph = document.parse_fragment(
+            replace_references(element_markup(paragraph), paragraph_replacements),
+            paragraph,
+        )
+        replacement_paragraph.tail = paragraph.tail
+        paragraph.getparent().replace(paragraph, replacement_paragraph)
+
+
+def canonical(xml):
+    return lxml.etree.tostring(lxml.etree.fromstring(xml.encode("utf-8")), method="c14n2")
+
 
 class TestSecondStageReplacer:
     def test_replace_single_reference(self):
@@ -21,29 +47,31 @@ class TestSecondStageReplacer:
 
         It doesn't test whether the replacement actually works."""
         paragraph_string = """<p>Schedule 36 to the <ref uk:canonical="jam">FA 2004</ref>.<CamelCase/></p>"""
-        paragraph_replacements = (
+        document = JudgmentDocument.parse(f"<judgment {UK_NAMESPACE}>{paragraph_string}</judgment>")
+        paragraph_replacements = [
             {
                 "detected_ref": "the 2004 Act",
-                "ref_para": 100,
-                "ref_position": 487,
+                "ref_para": 0,
+                "ref_position": 40,
                 "ref_tag": '<ref uk:canonical="jam">the 2004 Act</ref>',
             },
-        )
-        replacement_paragraph = str(create_replacement_paragraph(paragraph_string, paragraph_replacements))
+        ]
+
+        replace_references_in_document(document, paragraph_replacements)
 
-        assert replacement_paragraph == '<p>Schedule 36 to the <ref uk:canonical="jam">FA 2004</ref>.<CamelCase/></p>'
+        assert element_markup(document.paragraphs()[0]) == paragraph_string
 
-    def test_replace_references_by_paragraph(self):
+    def test_replace_references_in_document(self):
         """
-        Given some file_data soup and references with ref_tag and positional info
-        When `replace_references_by_paragraph` is called with these
-        Then an enriched string is returned with the references replaced by the
+        Given a parsed judgment and references with ref_tag and positional info
+        When `replace_references_in_document` is called with these
+        Then the judgment is enriched with the references replaced by the
             corresponding ref tag
         """
         input_file_path = f"{FIXTURE_DIR}/ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml"
         with open(input_file_path, encoding="utf-8") as input_file:
             file_content = input_file.read()
-        file_data = BeautifulSoup(file_content, "xml")
+        document = JudgmentDocument.parse(file_content)
 
         references = [
             {
@@ -72,9 +100,64 @@ class TestSecondStageReplacer:
             },
         ]
 
-        enriched_content = replace_references_by_paragraph(file_data, references)
+        replace_references_in_document(document, references)
 
         expected_file_path = f"{FIXTURE_DIR}/ewhc-ch-2023-257_enriched_stage_2.xml"
         with open(expected_file_path, encoding="utf-8") as expected_file:
             expected_enriched_content = expected_file.read()
-        assert_equal_xml(expected_enriched_content, enriched_content)
+        assert_equal_xml(expected_enriched_content, document.serialize())
+        assert document.metrics.fragment_parses == 3
+
+    @pytest.mark.parametrize(
+        "filename",
+        ["ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml", "ewhc-ch-2023-257_enriched_stage_1.xml", "rwanda.xml"],
+    )
+    def test_same_as_reparsing_paragraphs(self, filename):
+        file_content = (FIXTURE_DIR / filename).read_text(encoding="utf-8")
+        in_place = JudgmentDocument.parse(file_content)
+        reparsed = JudgmentDocument.parse(file_content)
+        paragraphs = [markup_map(paragraph) for paragraph in in_place.paragraphs()]
+        references = get_oblique_reference_replacements(paragraphs) + resolve_provisions(
+            [paragraph.markup for paragraph in paragraphs],
+        )
+
+        replace_references_in_document(in_place, references)
+        replace_by_reparsing(reparsed, references)
+
+        assert references
+        assert [element_markup(paragraph) for paragraph in in_place.paragraphs()] == [
+            element_markup(paragraph) for paragraph in reparsed.paragraphs()
+        ]
+        assert canonical(in_place.serialize()) == canonical(reparsed.serialize())
+
+    def test_replaces_every_occurrence_up_to_next_reference(self):
+        document = JudgmentDocument.parse(
+            f"<judgment {UK_NAMESPACE}><p>the Act, <i>&amp; the Act</i> and the Act</p></judgment>",
+        )
+        markup = element_markup(document.paragraphs()[0])
+        references = [
+            {
+                "detected_ref": "the Act",
+                "ref_para": 0,
+                "ref_position": markup.index("the Act"),
+                "ref_tag": "<ref>A</ref>",
+            },
+            {"detected_ref": "and", "ref_para": 0, "ref_position": markup.index("and"), "ref_tag": "<ref>B</ref>"},
+        ]
+
+        replace_references_in_document(document, references)
+
+        assert element_markup(document.paragraphs()[0]) == (
+            "<p><ref>A</ref>, <i>&amp; <ref>A</ref></i> <ref>B</ref> the Act</p>"
+        )
+
+    def test_reference_in_attribute_is_not_replaced(self):
+        document = JudgmentDocument.parse(f'<judgment {UK_NAMESPACE}><p class="s1">See s1.</p></judgment>')
+        markup = element_markup(document.paragraphs()[0])
+        references = [
+            {"detected_ref": "s1", "ref_para": 0, "ref_position": markup.index("s1"), "ref_tag": "<ref>s1</ref>"},
+        ]
+
+        replace_references_in_document(document, references)
+
+        assert element_markup(document.paragraphs()[0]) == '<p class="s1">See <ref>s1</ref>.</p>'
@@ -9,6 +9,9 @@ Replacement = NewType("Replacement", tuple[str, str, str, str, bool])
 
 ReplacementList = NewType("ReplacementList", list[Replacement])
 
+DetectedReference = namedtuple("DetectedReference", ["start", "end", "replacement"])
+# The offsets of a detected reference in the judgment content text, and its replacement tuple.
+
 Reference = list[tuple[tuple[int, int], str]]
 # The first part is a span (from inter-character-position to another) and the second is the string found there
 
@@ -29,6 +29,23 @@ def validate_env_variable(env_var_name: str) -> str:
     return env_variable
 
 
+def positive_int_env_variable(env_var_name: str, default: int) -> int:
+    """
+    Value of an optional environment variable holding a positive integer, `default` if it is not set or not one
+    """
+    env_variable = os.environ.get(env_var_name, "")
+    if not env_variable:
+        return default
+    try:
+        value = int(env_variable)
+    except ValueError:
+        value = 0
+    if value < 1:
+        LOGGER.warning("Ignoring %s=%r, which is not a positive integer", env_var_name, env_variable)
+        return default
+    return value
+
+
 def get_aws_secret(aws_secret_name: str) -> str:
     """
     Get aws secret value from AWS Secrets Manager using boto3 client
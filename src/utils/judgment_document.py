@@ -0,0 +1,263 @@
+"""
+Parse-once document model of a judgment being enriched.
+
+Every enrichment step used to parse the judgment it was given and serialize the result for the next one.
+A `JudgmentDocument` is parsed once with lxml when enrichment starts, updated in place by every step and
+serialized once at the end. Each document counts how many times it was parsed and serialized, in its
+`metrics`, so that a step reintroducing a round trip shows up in the logs and in the tests.
+"""
+
+import re
+from typing import NamedTuple
+
+import lxml.etree
+
+from utils.custom_types import DocumentAsXMLBytes, DocumentAsXMLString, XMLFragmentAsString
+from utils.proper_xml import namespaces, qualified_name
+from utils.source_map import TextNode, soup_text
+
+DEFAULT_XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>'
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+# how far into an encoded judgment its XML declaration is looked for
+XML_DECLARATION_SEARCH_LENGTH = 256
+
+
+def split_xml_declaration(content: str) -> tuple[str, str]:
+    match = re.match(r"\s*(<\?xml[^>]*\?>)", content)
+    if not match:
+        return "", content
+
+    return match.group(1), content[match.end() :].lstrip()
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _quote(value: str) -> str:
+    value = _escape(value)
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"{}"'.format(value.replace('"', "&quot;"))
+
+
+def _attribute_name(element: lxml.etree._Element, name: str) -> str:
+    namespace, _, local_name = name[1:].partition("}") if name.startswith("{") else ("", "", name)
+    if not namespace:
+        return local_name
+    prefix = next((prefix for prefix, uri in element.nsmap.items() if uri == namespace and prefix), None)
+    if namespace == XML_NAMESPACE:
+        prefix = "xml"
+    return f"{prefix}:{local_name}" if prefix else local_name
+
+
+class MarkupTextNode(NamedTuple):
+    start: int
+    node: TextNode
+    markup: str
+
+
+class MarkupMap(NamedTuple):
+    """
+    The markup of an element, as `element_markup` writes it, and where its text nodes and elements are in it
+    """
+
+    markup: XMLFragmentAsString
+    # the offset in the markup and the escaped text of every text node inside the element, in document order,
+    # leaving out the whitespace-only text nodes collapsed by BeautifulSoup
+    text_nodes: list[MarkupTextNode]
+    # the end offset in the markup and the element itself, by start offset, for the element and every element inside it
+    elements: dict[int, tuple[int, lxml.etree._Element]]
+
+    def element_at(self, start: int, end: int) -> lxml.etree._Element | None:
+        """The element written exactly from `start` to `end` in the markup, if there is one"""
+        end_and_element = self.elements.get(start)
+        if end_and_element is None or end_and_element[0] != end:
+            return None
+        return end_and_element[1]
+
+
+class _MarkupWriter:
+    """
+    Writes the markup of an element as BeautifulSoup does, keeping where each of its text nodes and elements
+    is written.
+    """
+
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+        self.length = 0
+        self.text_nodes: list[MarkupTextNode] = []
+        self.elements: dict[int, tuple[int, lxml.etree._Element]] = {}
+
+    def _append(self, part: str) -> None:
+        self.parts.append(part)
+        self.length += len(part)
+
+    def _write_text(self, node: TextNode) -> None:
+        text = node.text
+        if not text:
+            return
+        read_text = soup_text(text)
+        markup = _escape(read_text)
+        # whitespace collapsed by BeautifulSoup is not the text of the node any more
+        if read_text == text:
+            self.text_nodes.append(MarkupTextNode(self.length, node, markup))
+        self._append(markup)
+
+    def write(self, element: lxml.etree._Element) -> None:
+        if isinstance(element, lxml.etree._Comment):
+            self._append(f"<!--{element.text or ''}-->")
+            return
+        if isinstance(element, lxml.etree._ProcessingInstruction):
+            self._append(f"<?{element.target} {element.text or ''}?>")
+            return
+
+        start = self.length
+        name = qualified_name(element)
+        attributes = list(qualified_attributes(element).items())
+        # namespaces declared on the element are attributes to BeautifulSoup
+        parent = element.getparent()
+        for prefix, uri in element.nsmap.items():
+            if parent is None or parent.nsmap.get(prefix) != uri:
+                attributes.append((f"xmlns:{prefix}" if prefix else "xmlns", uri))
+        self._append(f"<{name}" + "".join(f" {key}={_quote(value)}" for key, value in sorted(attributes)))
+
+        if element.text is None and len(element) == 0:
+            self._append("/>")
+        else:
+            self._append(">")
+            self._write_text(TextNode(element, False))
+            for child in element:
+                self.write(child)
+                self._write_text(TextNode(child, True))
+            self._append(f"</{name}>")
+        self.elements[start] = (self.length, element)
+
+
+def element_markup(element: lxml.etree._Element) -> XMLFragmentAsString:
+    """
+    The markup of an element, as `str()` of the same element parsed by BeautifulSoup.
+
+    The second-stage extractors find references by position in this markup, which is why it has to stay
+    the same as it was when the judgment was parsed with BeautifulSoup: attributes are sorted, whitespace-only
+    text is collapsed, and only the namespaces declared on an element are written on it.
+    """
+    return markup_map(element).markup
+
+
+def markup_map(element: lxml.etree._Element) -> MarkupMap:
+    """
+    The markup of an element, as `element_markup` writes it, and where its text nodes and elements are in it
+    :param element: the element
+    :return: the markup map of the element
+    """
+    writer = _MarkupWriter()
+    writer.write(element)
+    return MarkupMap(XMLFragmentAsString("".join(writer.parts)), writer.text_nodes, writer.elements)
+
+
+def qualified_attributes(element: lxml.etree._Element) -> dict[str, str]:
+    """The attributes of an element by their qualified name, such as `uk:canonical`, as BeautifulSoup reads them"""
+    return {_attribute_name(element, key): value for key, value in element.attrib.items()}
+
+
+def element_text(element: lxml.etree._Element) -> str:
+    """The text of an element, as `.text` of the same element parsed by BeautifulSoup"""
+    return "".join(soup_text(text) for text in element.itertext())
+
+
+def unescape(markup: str) -> str:
+    """The text of a text node from its escaped markup"""
+    return markup.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+
+def find_element(element: lxml.etree._Element, name: str) -> lxml.etree._Element | None:
+    """The first element of a subtree with a qualified name, as BeautifulSoup finds it"""
+    return next(
+        (descendant for descendant in element.iter(lxml.etree.Element) if qualified_name(descendant) == name),
+        None,
+    )
+
+
+class DocumentMetrics:
+    """
+    Number of times a judgment was parsed and serialized while being enriched.
+    """
+
+    def __init__(self) -> None:
+        self.parses = 0
+        self.serializations = 0
+        self.fragment_parses = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "parses": self.parses,
+            "serializations": self.serializations,
+            "fragment_parses": self.fragment_parses,
+        }
+
+
+class JudgmentDocument:
+    """
+    A judgment parsed with lxml, shared and updated in place by the enrichment steps.
+    """
+
+    def __init__(self, root: lxml.etree._Element, xml_declaration: str = "") -> None:
+        self.root = root
+        self.xml_declaration = xml_declaration
+        self.metrics = DocumentMetrics()
+
+    @classmethod
+    def parse(cls, xml: str | bytes) -> "JudgmentDocument":
+        """
+        Parse a judgment, keeping its XML declaration
+        :param xml: the judgment, as a string or UTF-8 encoded, which lxml parses without a decoded copy
+        :return: the parsed judgment
+        """
+        if isinstance(xml, bytes):
+            head = xml[:XML_DECLARATION_SEARCH_LENGTH].decode("utf-8", errors="replace")
+            xml_declaration, _ = split_xml_declaration(head)
+        else:
+            xml_declaration, _ = split_xml_declaration(xml)
+            xml = xml.encode("utf-8")
+        document = cls(lxml.etree.fromstring(xml), xml_declaration)
+        document.metrics.parses += 1
+        return document
+
+    def serialize(self) -> DocumentAsXMLString:
+        """
+        Serialize the judgment, with its original XML declaration or a UTF-8 one if it had none
+        :return: the judgment
+        """
+        self.metrics.serializations += 1
+        content = lxml.etree.tostring(self.root, encoding="unicode")
+        return DocumentAsXMLString(f"{self.xml_declaration or DEFAULT_XML_DECLARATION}\n{content}")
+
+    def serialize_bytes(self) -> DocumentAsXMLBytes:
+        """
+        Serialize the judgment UTF-8 encoded, as `serialize` would before encoding, without the decoded copy
+        :return: the judgment
+        """
+        self.metrics.serializations += 1
+        content = lxml.etree.tostring(self.root, encoding="utf-8", xml_declaration=False)
+        return DocumentAsXMLBytes(f"{self.xml_declaration or DEFAULT_XML_DECLARATION}\n".encode() + content)
+
+    def paragraphs(self) -> list[lxml.etree._Element]:
+        """The p elements of the judgment in document order, which the second-stage extractors number"""
+        return [element for element in self.root.iter(lxml.etree.Element) if qualified_name(element) == "p"]
+
+    def parse_fragment(self, markup: str, context: lxml.etree._Element) -> lxml.etree._Element:
+        """
+        Parse the markup of an element to be inserted in the judgment
+        :param markup: markup of a single element, with the namespace prefixes in scope at `context`
+        :param context: element of the judgment the new element is to be inserted at
+        :return: the parsed element
+        """
+        in_scope = {"uk": namespaces["uk"], **context.nsmap}
+        declarations = "".join(
+            f' xmlns:{prefix}="{uri}"' if prefix else f' xmlns="{uri}"' for prefix, uri in in_scope.items()
+        )
+        self.metrics.fragment_parses += 1
+        return lxml.etree.fromstring(f"<wrapper{declarations}>{markup}</wrapper>")[0]
@@ -1,76 +1,179 @@
+import copy
+import heapq
+import re
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any
+
 import lxml.etree
 
 from utils.custom_types import XMLFragmentAsString
 
-
-def xml_escape(text: str) -> str:
-    """Safely escape XML special characters"""
-    return (
-        text.replace("&", "&amp;")
-        .replace("<", "&amp;lt;")
-        .replace(">", "&amp;gt;")
-        .replace('"', "&amp;quot;")
-        .replace("'", "&amp;apos;")
-    )
-
-
 namespaces = {
     None: "http://docs.oasis-open.org/legaldocml/ns/akn/3.0",
     "uk": "https://caselaw.nationalarchives.gov.uk/akn",
 }
 
-XSLT_TEMPLATE = """
-<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0"
-  xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn">
-    <xsl:output method="xml" indent="yes"/>
-
-    <xsl:template match="xml">
-        <xsl:copy>
-            <xsl:apply-templates select="text()"/>
-        </xsl:copy>
-    </xsl:template>
-
-    <xsl:template match="text()[contains(., '{replaced_string}')]">
-        <xsl:value-of select="substring-before(., '{replaced_string}')"/>
-        {replacement_tag}
-        <xsl:value-of select="substring-after(., '{replaced_string}')"/>
-    </xsl:template>
-
-    <!-- Copy everything else as-is -->
-    <xsl:template match="@*|node()">
-        <xsl:copy>
-            <xsl:apply-templates select="@*|node()"/>
-        </xsl:copy>
-    </xsl:template>
-</xsl:stylesheet>
-"""
+UK_NAMESPACE_DECLARATIONS = (
+    'xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"',
+    "xmlns:uk='https://caselaw.nationalarchives.gov.uk/akn'",
+)
 
+_END = ""
 
-def replace_string_with_tag(xml: XMLFragmentAsString, string: str, tag: str) -> XMLFragmentAsString:
+
+class _StringFinder:
     """
-    Replace citations in running text, but not in XML attributes
-    This is probably quite inefficient, being called once per replacement! But we can make it better later
+    Finds which of a set of strings occur in a text, with a single regex scan of the text.
+
+    The strings are compiled into a trie-shaped regex which matches, at every position of the text, the longest
+    of the strings starting there; the strings that are a prefix of it are then looked up in the trie.
+    """
+
+    def __init__(self, strings: Iterable[str]) -> None:
+        self._trie: dict[str, Any] = {}
+        for string in strings:
+            node = self._trie
+            for char in string:
+                node = node.setdefault(char, {})
+            node[_END] = string
+        self._regex = re.compile(f"(?=({self._pattern(self._trie)}))", re.DOTALL) if self._trie else None
+        self._prefixes: dict[str, list[str]] = {}
+
+    def _pattern(self, node: dict[str, Any]) -> str:
+        alternatives = []
+        for char, child in node.items():
+            if char == _END:
+                continue
+            # collapse runs of characters that do not branch into a single literal
+            run = char
+            while len(child) == 1 and _END not in child:
+                ((next_char, child),) = child.items()
+                run += next_char
+            alternatives.append(re.escape(run) + self._pattern(child))
+        if not alternatives:
+            return ""
+        group = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        return f"(?:{group})?" if _END in node else group
+
+    def _prefixes_of(self, string: str) -> list[str]:
+        if string not in self._prefixes:
+            prefixes = []
+            node = self._trie
+            for char in string:
+                node = node[char]
+                if _END in node:
+                    prefixes.append(node[_END])
+            self._prefixes[string] = prefixes
+        return self._prefixes[string]
+
+    def find(self, text: str) -> set[str]:
+        """The strings occurring in `text`."""
+        found: set[str] = set()
+        if self._regex is not None:
+            for match in self._regex.finditer(text):
+                found.update(self._prefixes_of(match.group(1)))
+        return found
+
+
+def _parse_fragment(xml: XMLFragmentAsString) -> tuple[lxml.etree._Element, str, str]:
+    """
+    Add root tags to the XML, with uk namespace if not already present, and parse it
     """
-    # Add root tags to the XML, with uk namespace if not already present
-    uk_ns_1 = 'xmlns:uk="https://caselaw.nationalarchives.gov.uk/akn"'
-    uk_ns_2 = "xmlns:uk='https://caselaw.nationalarchives.gov.uk/akn'"
-    needs_wrapper = uk_ns_1 not in str(xml) and uk_ns_2 not in str(xml)
-    root_start = f"<root {uk_ns_1}>" if needs_wrapper else "<root>"
+    needs_wrapper = all(declaration not in str(xml) for declaration in UK_NAMESPACE_DECLARATIONS)
+    root_start = f"<root {UK_NAMESPACE_DECLARATIONS[0]}>" if needs_wrapper else "<root>"
     root_end = "</root>"
-    xml_wrapped = XMLFragmentAsString(root_start + str(xml) + root_end)
-    root = lxml.etree.fromstring(xml_wrapped)
+    root = lxml.etree.fromstring(root_start + str(xml) + root_end)
+    return root, root_start, root_end
 
-    # DRAGON: this currently isn't working but stops it crashing
-    sanitised_string = xml_escape(string)
 
-    stylesheet = lxml.etree.XML(XSLT_TEMPLATE.format(replaced_string=sanitised_string, replacement_tag=tag))
-    transformer = lxml.etree.XSLT(stylesheet)
-    output = lxml.etree.tostring(transformer(root))
-    decoded_output = output.decode("utf-8")
+def _text_slots(element: lxml.etree._Element) -> Iterator[tuple[lxml.etree._Element, bool]]:
+    """
+    The text nodes of an element and its descendants, as (owner, is_tail) pairs; comments are not running text
+    """
+    for descendant in element.iter():
+        if isinstance(descendant.tag, str):
+            yield descendant, False
+        if descendant is not element:
+            yield descendant, True
+
+
+def _get_text(owner: lxml.etree._Element, is_tail: bool) -> str | None:
+    return owner.tail if is_tail else owner.text
+
+
+def replace_strings_with_tags(
+    xml: XMLFragmentAsString,
+    replacements: Sequence[tuple[str, str]],
+) -> XMLFragmentAsString:
+    """
+    Replace strings in running text with tags, but not in XML attributes, parsing and serialising the XML once.
+
+    The (string, tag) replacements are applied in order, each to the first occurrence of its string in every text
+    node, including the text nodes created by the replacements before it. This gives the same result as calling
+    `replace_string_with_tag` once per replacement, but every text node is only scanned once, for all the strings.
+    """
+    root, root_start, root_end = _parse_fragment(xml)
+
+    strings = [string for string, _ in replacements]
+    tags = [lxml.etree.fromstring(f"<root {UK_NAMESPACE_DECLARATIONS[0]}>{tag}</root>")[0] for _, tag in replacements]
+    finder = _StringFinder(string for string in strings if string)
+    positions: dict[str, list[int]] = {}
+    for position, string in enumerate(strings):
+        positions.setdefault(string, []).append(position)
+
+    def candidates(texts: Iterable[str | None]) -> set[int]:
+        """Positions of the replacements whose strings occur in any of the texts."""
+        return {position for text in texts if text for string in finder.find(text) for position in positions[string]}
+
+    # the replacements that can apply to the text of each tag, once inserted
+    tag_candidates = [candidates(tag.itertext()) for tag in tags]
+
+    for owner, is_tail in list(_text_slots(root)):
+        pending = sorted(candidates([_get_text(owner, is_tail)]))
+        slots = [(owner, is_tail)]
+        while pending:
+            position = heapq.heappop(pending)
+            string, tag = strings[position], tags[position]
+            new_slots: list[tuple[lxml.etree._Element, bool]] = []
+            for slot_owner, slot_is_tail in slots:
+                text = _get_text(slot_owner, slot_is_tail)
+                if not text or string not in text:
+                    continue
+                before, _, after = text.partition(string)
+                element = copy.deepcopy(tag)
+                element.tail = after or None
+                if slot_is_tail:
+                    slot_owner.tail = before or None
+                    slot_owner.addnext(element)
+                else:
+                    slot_owner.text = before or None
+                    slot_owner.insert(0, element)
+                # text nodes created by this replacement are only open to the replacements after it
+                new_slots.extend(_text_slots(element))
+                new_slots.append((element, True))
+                for later in tag_candidates[position]:
+                    if later > position and later not in pending:
+                        heapq.heappush(pending, later)
+            slots.extend(new_slots)
+
+    output = lxml.etree.tostring(root).decode("utf-8")
+
+    # Remove the root tags that were added when parsing
+    return XMLFragmentAsString(output[len(root_start) : -len(root_end)])
+
+
+def replace_string_with_tag(xml: XMLFragmentAsString, string: str, tag: str) -> XMLFragmentAsString:
+    """
+    Replace citations in running text, but not in XML attributes
+    To make many replacements, use `replace_strings_with_tags` which parses the XML only once
+    """
+    return replace_strings_with_tags(xml, [(string, tag)])
+
 
-    # Remove the root tags that were added at the start of the function
-    final_output = decoded_output[len(root_start) : -len(root_end)]
-    return XMLFragmentAsString(final_output)
+def qualified_name(element: lxml.etree._Element) -> str:
+    """The name of an element with its namespace prefix, as BeautifulSoup names it"""
+    local_name = lxml.etree.QName(element).localname
+    return f"{element.prefix}:{local_name}" if element.prefix else local_name
 
 
 def expand_namespace(namespaced_name: str) -> str:
@@ -0,0 +1,120 @@
+"""
+Map from the judgment content text read by `parse_file` back to the text nodes of the XML it was read from.
+
+The first-stage extractors detect references in the plain text of the content, intro and wrapUp elements.
+A `SourceMap` builds that same text from an lxml tree and records which text node (the text or the tail of
+an element) every run of it comes from, so a detected span can be located in the XML by its offsets alone.
+"""
+
+import re
+from bisect import bisect_right
+from collections.abc import Iterator
+from typing import NamedTuple
+
+import lxml.etree
+
+from utils.proper_xml import qualified_name
+
+CONTENT_ELEMENTS = re.compile(r"(content|intro|wrapUp)")
+# BeautifulSoup reads a text node made only of these as a single newline or space
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class TextNode(NamedTuple):
+    owner: lxml.etree._Element
+    is_tail: bool
+
+    @property
+    def text(self) -> str | None:
+        return self.owner.tail if self.is_tail else self.owner.text
+
+
+class SourceSpan(NamedTuple):
+    node: TextNode
+    start: int
+    end: int
+
+
+class ContentText(NamedTuple):
+    """The text read from one content element, and its offset in the judgment content text"""
+
+    start: int
+    text: str
+
+
+def document_text_nodes(element: lxml.etree._Element) -> Iterator[TextNode]:
+    """
+    The text nodes inside an element in document order, leaving out its own tail and the text of comments
+    """
+    if isinstance(element.tag, str):
+        yield TextNode(element, False)
+    for child in element:
+        yield from document_text_nodes(child)
+        yield TextNode(child, True)
+
+
+def soup_text(text: str) -> str:
+    """The text of a text node as BeautifulSoup reads it, collapsing whitespace-only text to a newline or a space"""
+    if text.strip(ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+class SourceMap:
+    """
+    The judgment content text of a document, as returned by `parse_file`, and where each of its characters is in the XML.
+
+    The text is made of runs, each read from a single text node; the characters joining the content elements
+    and the whitespace between elements, which BeautifulSoup collapses, belong to no run. The text read from
+    each content element, usually a paragraph, is kept in `contents`.
+    """
+
+    def __init__(self, root: lxml.etree._Element) -> None:
+        self.root = root
+        # offset in the text of every run, then its length, text node and offset in that text node
+        self._run_starts: list[int] = []
+        self._runs: list[tuple[int, TextNode, int]] = []
+
+        self.contents: list[ContentText] = []
+        offset = 0
+        for element in root.iter(lxml.etree.Element):
+            if not CONTENT_ELEMENTS.search(qualified_name(element)):
+                continue
+            if self.contents:
+                # contents are joined with a single space
+                offset += 1
+            nodes = [(node, soup_text(node.text)) for node in document_text_nodes(element) if node.text]
+            text = "".join(node_text for _, node_text in nodes)
+            text_start = len(text) - len(text.lstrip())
+            text_end = len(text.rstrip())
+
+            position = 0
+            for node, node_text in nodes:
+                run_start = max(position, text_start)
+                run_end = min(position + len(node_text), text_end)
+                if node_text == node.text and run_start < run_end:
+                    self._run_starts.append(offset + run_start - text_start)
+                    self._runs.append((run_end - run_start, node, run_start - position))
+                position += len(node_text)
+
+            self.contents.append(ContentText(offset, text[text_start:text_end]))
+            offset += max(text_end - text_start, 0)
+
+        self.text = " ".join(content.text for content in self.contents)
+
+    def locate(self, start: int, end: int) -> SourceSpan | None:
+        """
+        Find a span of the text in the XML
+        :param start: offset of the first character of the span in the text
+        :param end: offset after the last character of the span in the text
+        :return: the text node holding the span and its offsets in that node, or None if the span is not
+            read from a single text node
+        """
+        run = bisect_right(self._run_starts, start) - 1
+        if run < 0 or end <= start:
+            return None
+        run_start = self._run_starts[run]
+        length, node, node_offset = self._runs[run]
+        if end > run_start + length:
+            return None
+        return SourceSpan(node, node_offset + start - run_start, node_offset + end - run_start)
@@ -0,0 +1,96 @@
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from utils.judgment_document import (
+    JudgmentDocument,
+    element_markup,
+    element_text,
+    find_element,
+    markup_map,
+    qualified_attributes,
+    split_xml_declaration,
+)
+
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "tests/fixtures/"
+
+
+@pytest.mark.parametrize(
+    "filename",
+    ["ewhc-ch-2023-257_enriched_stage_1_ORIGINAL.xml", "uksc-2022-14-press-summary.xml", "rwanda.xml"],
+)
+def test_paragraph_markup_is_beautifulsoup_markup(filename):
+    xml = (FIXTURE_DIR / filename).read_text(encoding="utf-8")
+
+    document = JudgmentDocument.parse(xml)
+
+    soup_paragraphs = [str(paragraph) for paragraph in BeautifulSoup(xml, "xml").find_all("p")]
+    assert [element_markup(paragraph) for paragraph in document.paragraphs()] == soup_paragraphs
+
+
+def test_element_markup_of_attributes_namespaces_and_whitespace():
+    xml = (
+        '<root xmlns="urn:a" xmlns:uk="urn:uk"><p z="1" a="&quot;x&quot; &amp; \'y\'" uk:b="&lt;">'
+        '<i xmlns:h="urn:h" h:c="2">x &amp; y</i>\n  <br/><!--note--><?pi data?></p></root>'
+    )
+
+    (paragraph,) = JudgmentDocument.parse(xml).paragraphs()
+
+    assert element_markup(paragraph) == str(BeautifulSoup(xml, "xml").p)
+
+
+def test_markup_map_elements():
+    xml = '<root xmlns:uk="urn:uk"><p>See <ref uk:canonical="x" href="y">the <b>A</b><!--c--> Act</ref>.</p></root>'
+    (paragraph,) = JudgmentDocument.parse(xml).paragraphs()
+
+    markup = markup_map(paragraph)
+
+    start = markup.markup.index("<ref")
+    end = markup.markup.index("</ref>") + len("</ref>")
+    ref = markup.element_at(start, end)
+    assert ref is not None
+    assert element_text(ref) == "the A Act"
+    assert qualified_attributes(ref) == {"uk:canonical": "x", "href": "y"}
+    assert markup.element_at(start, end - 1) is None
+    assert markup.element_at(0, len(markup.markup)) is paragraph
+
+
+def test_serialize_keeps_xml_declaration():
+    xml = "<?xml version='1.0' encoding='UTF-8'?>\n<root><p>a</p></root>"
+
+    document = JudgmentDocument.parse(xml)
+
+    assert document.serialize() == xml
+    assert document.metrics.as_dict() == {"parses": 1, "serializations": 1, "fragment_parses": 0}
+
+
+def test_serialize_without_xml_declaration_adds_one():
+    document = JudgmentDocument.parse(b"<root><p>a</p></root>")
+
+    assert document.serialize() == '<?xml version="1.0" encoding="utf-8"?>\n<root><p>a</p></root>'
+
+
+def test_parse_fragment_in_scope_of_context():
+    document = JudgmentDocument.parse('<root xmlns="urn:a"><p>a</p></root>')
+    (paragraph,) = document.paragraphs()
+
+    fragment = document.parse_fragment('<p>a <ref uk:origin="TNA">b</ref></p>', paragraph)
+
+    assert fragment.tag == "{urn:a}p"
+    assert fragment[0].get("{https://caselaw.nationalarchives.gov.uk/akn}origin") == "TNA"
+    assert document.metrics.fragment_parses == 1
+
+
+def test_find_element_by_qualified_name():
+    document = JudgmentDocument.parse('<root xmlns:uk="urn:uk"><uk:p>a</uk:p><p>b</p></root>')
+
+    assert find_element(document.root, "p").text == "b"
+    assert find_element(document.root, "uk:p").text == "a"
+    assert find_element(document.root, "q") is None
+    assert [paragraph.text for paragraph in document.paragraphs()] == ["b"]
+
+
+def test_split_xml_declaration():
+    assert split_xml_declaration('<?xml version="1.0"?>\n<root/>') == ('<?xml version="1.0"?>', "<root/>")
+    assert split_xml_declaration("<root/>") == ("", "<root/>")
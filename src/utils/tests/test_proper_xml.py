@@ -1,7 +1,7 @@
 import pytest
 
 from utils.compare_xml import assert_equal_xml
-from utils.proper_xml import create_tag_string, replace_string_with_tag
+from utils.proper_xml import create_tag_string, replace_string_with_tag, replace_strings_with_tags
 
 
 class TestReplaceStringWithTag:
@@ -27,9 +27,7 @@ class TestReplaceStringWithTag:
             b'<p>In <ref blah="blah">blah</ref> ...</p>',
         )
 
-    @pytest.mark.xfail
     def test_as_text_quotes(self):
-        """The quotes in Lloyd's fouls it up; investigate why later"""
         assert_equal_xml(
             replace_string_with_tag(
                 "<p>In [2013] 2 Lloyd's Rep 69 ...</p>",
@@ -78,6 +76,53 @@ class TestReplaceStringWithTag:
         )
 
 
+class TestReplaceStringsWithTags:
+    def test_replaces_every_string_in_one_pass(self):
+        assert_equal_xml(
+            replace_strings_with_tags(
+                "<p>In [2024] UKSC 1 and <i>[2023] UKSC 2</i>, see the Children Act 1989</p>",
+                [("[2024] UKSC 1", "<cite/>"), ("[2023] UKSC 2", "<cite2/>"), ("Children Act 1989", "<leg/>")],
+            ),
+            b"<p>In <cite/> and <i><cite2/></i>, see the <leg/></p>",
+        )
+
+    def test_earlier_replacements_take_precedence(self):
+        assert_equal_xml(
+            replace_strings_with_tags(
+                "<p>The ACA 2002 and the ACA</p>",
+                [("ACA 2002", "<ref>ACA 2002</ref>"), ("ACA", "<abbr>ACA</abbr>")],
+            ),
+            b"<p>The <ref><abbr>ACA</abbr> 2002</ref> and the <abbr>ACA</abbr></p>",
+        )
+
+    def test_only_first_occurrence_in_each_text_node(self):
+        assert_equal_xml(
+            replace_strings_with_tags(
+                "<p>[2024] UKSC 1 - [2024] UKSC 1<b/>then [2024] UKSC 1</p>",
+                [("[2024] UKSC 1", "<cite/>")],
+            ),
+            b"<p><cite/> - [2024] UKSC 1<b/>then <cite/></p>",
+        )
+
+    def test_not_in_comments_or_attributes(self):
+        assert_equal_xml(
+            replace_strings_with_tags(
+                "<p title='UKSC'><!-- UKSC -->UKSC</p>",
+                [("UKSC", "<cite/>")],
+            ),
+            b'<p title="UKSC"><!-- UKSC --><cite/></p>',
+        )
+
+    def test_strings_with_special_characters(self):
+        assert_equal_xml(
+            replace_strings_with_tags(
+                "<p>LR 1 A&amp;E 123 and [2013] 2 Lloyd's Rep 69</p>",
+                [("LR 1 A&E 123", "<cite/>"), ("[2013] 2 Lloyd's Rep 69", "<cite2/>")],
+            ),
+            b"<p><cite/> and <cite2/></p>",
+        )
+
+
 def test_simple_tag():
     assert_equal_xml(
         create_tag_string("kitten", "ocelot", {"panther": "cougar"}),
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import lxml.etree
+import pytest
+
+from utils.helper import parse_file
+from utils.source_map import SourceMap
+
+FIXTURE_DIR = Path(__file__).parent.parent.parent.resolve() / "tests/fixtures/"
+
+
+@pytest.mark.parametrize(
+    "filename",
+    ["ewhc-ch-2023-257_original.xml", "uksc-2022-14-press-summary.xml", "rwanda.xml"],
+)
+def test_text_is_parse_file_text(filename):
+    xml = (FIXTURE_DIR / filename).read_text(encoding="utf-8")
+
+    source_map = SourceMap(lxml.etree.fromstring(xml.encode("utf-8")))
+
+    assert source_map.text == parse_file(xml)
+
+
+def test_text_is_parse_file_text_with_whitespace_between_elements():
+    xml = "<judgment><intro>\n  <p>Intro</p>\n</intro><p>Not content</p><content> <p>a <i>b</i>\n\t<b>c</b> </p></content></judgment>"
+
+    source_map = SourceMap(lxml.etree.fromstring(xml))
+
+    assert source_map.text == parse_file(xml) == "Intro a b\nc"
+
+
+def test_locate_finds_text_node_of_span():
+    root = lxml.etree.fromstring("<content><p>  See <i>Smith</i> [2020] UKSC 1.</p></content>")
+    source_map = SourceMap(root)
+    start = source_map.text.index("[2020] UKSC 1")
+
+    span = source_map.locate(start, start + len("[2020] UKSC 1"))
+
+    assert span is not None
+    assert span.node.owner.tag == "i"
+    assert span.node.is_tail
+    assert span.node.text[span.start : span.end] == "[2020] UKSC 1"
+
+
+def test_locate_span_across_text_nodes_is_none():
+    source_map = SourceMap(lxml.etree.fromstring("<content><p>See <i>Smith</i> v Jones</p></content>"))
+    start = source_map.text.index("Smith v")
+
+    assert source_map.locate(start, start + len("Smith v")) is None
+
+
+def test_locate_span_across_contents_is_none():
+    source_map = SourceMap(lxml.etree.fromstring("<judgment><content>one</content><content>two</content></judgment>"))
+
+    assert source_map.text == "one two"
+    assert source_map.locate(2, 5) is None
@@ -208,6 +208,9 @@ resource "aws_lambda_event_source_mapping" "sqs_enrichment_trigger" {
   enabled          = true
   function_name    = module.lambda-enrichment.lambda_function_arn
   batch_size       = 1
+
+  # the handler reports the records that failed, so only they are delivered again
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 # ============================================================